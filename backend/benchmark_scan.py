@@ -0,0 +1,110 @@
+"""
+Benchmark de bipagens concorrentes no SQLite
+
+Compara a vazão de POST /orders/{id}/scan com N bipagens simultâneas:
+- fila:   escritor único (SQLITE_WRITE_QUEUE=1, padrão)
+- direto: cada requisição grava na sua própria conexão (SQLITE_WRITE_QUEUE=0)
+
+Cada modo roda num processo separado (a configuração é lida no import),
+com um banco SQLite novo numa pasta temporária, chamando o app em
+processo (sem rede) para medir só o servidor.
+
+Uso:
+    python benchmark_scan.py --pedidos 1000 --concorrencia 50
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+
+def rodar_modo(args) -> None:
+    """Executado no processo filho: cria os dados e bipa tudo em paralelo"""
+    os.environ.setdefault("GOOGLE_MAPS_API_KEY", "benchmark")
+    os.environ["TESTING"] = "true"  # Sem rate limiting
+
+    import httpx
+    from sqlmodel import Session
+    from database import engine, create_db_and_tables
+    from main import app
+    from models import Order, OrderStatus, Restaurant, User
+    from services.auth_service import create_access_token
+
+    create_db_and_tables()
+    with Session(engine) as session:
+        restaurante = Restaurant(name="Benchmark", slug="benchmark", email="b@b.com", address="x")
+        session.add(restaurante)
+        session.commit()
+        usuario = User(name="B", email="b@b.com", password_hash="-", role="OWNER", restaurant_id=restaurante.id)
+        pedidos = [
+            Order(customer_name=f"Cliente {i}", address_text="Rua X", lat=-23.55, lng=-46.63,
+                  status=OrderStatus.PREPARING, restaurant_id=restaurante.id)
+            for i in range(args.pedidos)
+        ]
+        session.add(usuario)
+        session.add_all(pedidos)
+        session.commit()
+        ids = [p.id for p in pedidos]
+        headers = {"Authorization": f"Bearer {create_access_token({'user_id': usuario.id})}"}
+
+    async def bipar_todos():
+        transporte = httpx.ASGITransport(app=app, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=transporte, base_url="http://benchmark") as client:
+            fila = list(ids)
+            status = []
+
+            async def cliente():
+                while fila:
+                    response = await client.post(f"/orders/{fila.pop()}/scan", headers=headers)
+                    status.append(response.status_code)
+
+            # Aquece (cache do token, pools) fora da medição
+            await client.get("/health")
+            inicio = time.perf_counter()
+            await asyncio.gather(*(cliente() for _ in range(args.concorrencia)))
+            return status, time.perf_counter() - inicio
+
+    status, duracao = asyncio.run(bipar_todos())
+    erros = sum(s != 200 for s in status)
+    print(
+        f"{args.modo:<8} {len(status) / duracao:8.1f} bipagens/s   "
+        f"{duracao:6.2f}s   erros {erros}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Benchmark de bipagens concorrentes no SQLite")
+    parser.add_argument("--pedidos", type=int, default=1000)
+    parser.add_argument("--concorrencia", type=int, default=50, help="bipagens simultâneas")
+    parser.add_argument("--modo", choices=["fila", "direto"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.modo:
+        rodar_modo(args)
+        return
+
+    print(f"{args.pedidos} pedidos, {args.concorrencia} bipagens simultâneas")
+    for modo, fila in (("fila", "1"), ("direto", "0")):
+        with tempfile.TemporaryDirectory(prefix="motoflash-bench-") as pasta:
+            env = {
+                **os.environ,
+                "DATA_DIR": pasta,
+                "TRACKS_DIR": os.path.join(pasta, "tracks"),
+                "SQLITE_WRITE_QUEUE": fila,
+            }
+            env.pop("DATABASE_URL", None)  # Sempre SQLite
+            subprocess.run(
+                [sys.executable, os.path.abspath(__file__), "--modo", modo,
+                 "--pedidos", str(args.pedidos), "--concorrencia", str(args.concorrencia)],
+                env=env,
+                cwd=os.path.dirname(os.path.abspath(__file__)),
+                stderr=subprocess.DEVNULL,
+                check=True
+            )
+
+
+if __name__ == "__main__":
+    main()
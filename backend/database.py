@@ -1,8 +1,84 @@
 """
 Configuração do banco de dados (PostgreSQL em produção, SQLite em desenvolvimento)
+
+Dois engines para o MESMO banco:
+- engine (síncrono, psycopg2/sqlite3): rotas `def`, que rodam no threadpool
+- async_engine (asyncpg/aiosqlite): rotas `async def` dos endpoints quentes,
+  que rodam direto no event loop sem ocupar uma thread por requisição
+
+SQLite (desenvolvimento / instalações pequenas de um servidor só): cada
+conexão nova recebe os PRAGMAs de SQLITE_PRAGMAS (WAL, synchronous=NORMAL,
+mmap, cache, busy_timeout). As transições de status são gravadas por um
+escritor único (services/writer_service.py), sem disputar o lock do arquivo.
+
+Réplica de leitura (opcional, DATABASE_REPLICA_URL): rotas que só leem
+(métricas, padrões, listagens, rastreio) usam get_read_session /
+get_async_read_session. Sem réplica configurada, elas caem no primário.
+
+Schema: versionado com Alembic (migrations/). Mudou um model? Gere a
+migração com `alembic revision --autogenerate -m "..."` - o app aplica as
+pendentes na inicialização.
 """
 import os
-from sqlmodel import SQLModel, create_engine, Session
+from typing import Optional
+from sqlalchemy import event, inspect
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine
+from sqlalchemy.engine import Engine
+from sqlmodel import create_engine, Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+# Pool de conexões do PostgreSQL (por engine: o síncrono e o async têm cada um o seu)
+POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "5"))
+POOL_MAX_OVERFLOW = int(os.environ.get("DB_MAX_OVERFLOW", "10"))
+POOL_TIMEOUT = float(os.environ.get("DB_POOL_TIMEOUT", "30"))  # Espera máx. por uma conexão livre
+POOL_RECYCLE = int(os.environ.get("DB_POOL_RECYCLE", "300"))   # Recicla conexões a cada N segundos
+
+_OPCOES_POOL = dict(
+    pool_size=POOL_SIZE,
+    max_overflow=POOL_MAX_OVERFLOW,
+    pool_timeout=POOL_TIMEOUT,
+    pool_recycle=POOL_RECYCLE,
+    pool_pre_ping=True,  # Verifica conexão antes de usar
+)
+
+
+# PRAGMAs aplicados em toda conexão SQLite
+SQLITE_PRAGMAS = {
+    # WAL: leitores não bloqueiam o escritor (nem o escritor os leitores)
+    "journal_mode": "WAL",
+    # Com WAL, NORMAL só sincroniza o disco no checkpoint - seguro contra
+    # queda do processo; numa queda de energia perde só os últimos commits
+    "synchronous": "NORMAL",
+    "mmap_size": int(os.environ.get("SQLITE_MMAP_SIZE", str(256 * 1024 * 1024))),
+    # Negativo = em KiB (64MB de cache de páginas por conexão)
+    "cache_size": int(os.environ.get("SQLITE_CACHE_SIZE", "-65536")),
+    # Espera até N ms pelo lock de escrita antes de "database is locked"
+    "busy_timeout": int(os.environ.get("SQLITE_BUSY_TIMEOUT_MS", "5000")),
+    "temp_store": "MEMORY",
+}
+
+
+def configurar_sqlite(engine_: Engine) -> None:
+    """Aplica SQLITE_PRAGMAS em cada conexão aberta pelo engine (síncrono ou async.sync_engine)"""
+    @event.listens_for(engine_, "connect")
+    def _aplicar_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for nome, valor in SQLITE_PRAGMAS.items():
+            cursor.execute(f"PRAGMA {nome}={valor}")
+        cursor.close()
+
+
+def _url_postgres(url: str) -> str:
+    """Railway usa 'postgres://' mas SQLAlchemy precisa de 'postgresql://'"""
+    if url.startswith("postgres://"):
+        return url.replace("postgres://", "postgresql://", 1)
+    return url
+
+
+def _url_asyncpg(url: str) -> str:
+    """URL para o asyncpg (que não entende "sslmode" do libpq - o equivalente é "ssl")"""
+    return url.replace("postgresql://", "postgresql+asyncpg://", 1).replace("sslmode=", "ssl=")
+
 
 # Pega DATABASE_URL do ambiente (Railway define automaticamente para PostgreSQL)
 DATABASE_URL = os.environ.get("DATABASE_URL")
@@ -10,16 +86,16 @@ DATABASE_URL = os.environ.get("DATABASE_URL")
 # Detecta se é PostgreSQL ou SQLite
 if DATABASE_URL and DATABASE_URL.startswith(("postgres://", "postgresql://")):
     # PostgreSQL (produção - Railway)
-    # Railway usa 'postgres://' mas SQLAlchemy precisa de 'postgresql://'
-    if DATABASE_URL.startswith("postgres://"):
-        DATABASE_URL = DATABASE_URL.replace("postgres://", "postgresql://", 1)
+    DATABASE_URL = _url_postgres(DATABASE_URL)
 
     engine = create_engine(
         DATABASE_URL,
         echo=False,  # Mude para True se quiser ver as queries SQL
-        pool_pre_ping=True,  # Verifica conexão antes de usar
-        pool_recycle=300,  # Recicla conexões a cada 5 minutos
+        **_OPCOES_POOL
     )
+
+    ASYNC_DATABASE_URL = _url_asyncpg(DATABASE_URL)
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False, **_OPCOES_POOL)
     print("🐘 Usando PostgreSQL")
 else:
     # SQLite (desenvolvimento local)
@@ -32,15 +108,139 @@ else:
         echo=False,
         connect_args={"check_same_thread": False}  # Necessário para SQLite com FastAPI
     )
+
+    ASYNC_DATABASE_URL = f"sqlite+aiosqlite:///{DATABASE_PATH}"
+    async_engine = create_async_engine(ASYNC_DATABASE_URL, echo=False)
+    configurar_sqlite(engine)
+    configurar_sqlite(async_engine.sync_engine)
     print("📁 Usando SQLite:", DATABASE_PATH)
 
 
+# Réplica de leitura (PostgreSQL) - sem ela, leitura vai no primário
+DATABASE_REPLICA_URL = os.environ.get("DATABASE_REPLICA_URL")
+
+read_engine: Engine = engine
+async_read_engine: AsyncEngine = async_engine
+
+if DATABASE_REPLICA_URL:
+    DATABASE_REPLICA_URL = _url_postgres(DATABASE_REPLICA_URL)
+    read_engine = create_engine(DATABASE_REPLICA_URL, echo=False, **_OPCOES_POOL)
+    async_read_engine = create_async_engine(_url_asyncpg(DATABASE_REPLICA_URL), echo=False, **_OPCOES_POOL)
+    print("📖 Réplica de leitura configurada")
+
+# Marca das sessões da réplica em session.info: quem precisa do dado mais
+# recente (ex: reconciliação do estado ao vivo) vai ao primário
+SESSAO_REPLICA = "replica"
+
+
+# ============ MIGRAÇÕES (Alembic) ============
+
+PASTA_BACKEND = os.path.dirname(os.path.abspath(__file__))
+
+# Revisão com o schema de antes das migrações (bancos criados pelo create_all)
+REVISAO_INICIAL = "0001"
+
+
+def aplicar_migracoes(engine_: Optional[Engine] = None) -> None:
+    """
+    Leva o banco até a última migração (migrations/versions)
+
+    Banco que já tinha as tabelas mas nunca passou pelo Alembic (criado
+    pelo antigo create_all) é marcado na REVISAO_INICIAL antes - assim só
+    as migrações novas rodam nele.
+    """
+    from alembic import command
+    from alembic.config import Config
+
+    config = Config(os.path.join(PASTA_BACKEND, "alembic.ini"))
+    with (engine_ or engine).begin() as conexao:
+        config.attributes["connection"] = conexao
+        tabelas = inspect(conexao).get_table_names()
+        if "alembic_version" not in tabelas and "orders" in tabelas:
+            command.stamp(config, REVISAO_INICIAL)
+        command.upgrade(config, "head")
+
+
 def create_db_and_tables():
-    """Cria o banco e as tabelas"""
-    SQLModel.metadata.create_all(engine)
+    """Cria o banco e as tabelas (aplicando as migrações pendentes)"""
+    aplicar_migracoes()
 
 
 def get_session():
     """Dependency para injetar sessão nas rotas"""
     with Session(engine) as session:
         yield session
+
+
+def get_read_session():
+    """
+    Dependency para rotas que SÓ LEEM (réplica, se configurada)
+
+    A réplica pode estar alguns instantes atrás do primário - não use
+    em rotas que gravam nem onde o usuário precisa ver o que acabou de salvar.
+    """
+    with Session(read_engine, info=_info_leitura()) as session:
+        yield session
+
+
+async def get_async_session():
+    """
+    Dependency para rotas `async def`
+
+    expire_on_commit=False: depois do commit os objetos continuam legíveis
+    sem nova ida ao banco (no async um lazy load implícito é erro).
+    Serviços síncronos rodam com `await session.run_sync(funcao, ...)`.
+    """
+    async with AsyncSession(async_engine, expire_on_commit=False) as session:
+        yield session
+
+
+async def get_async_read_session():
+    """get_read_session para rotas `async def`"""
+    async with AsyncSession(async_read_engine, expire_on_commit=False, info=_info_leitura()) as session:
+        yield session
+
+
+def _info_leitura() -> dict:
+    return {SESSAO_REPLICA: True} if read_engine is not engine else {}
+
+
+def sessao_e_replica(session: Session) -> bool:
+    """True se a sessão lê da réplica (pode estar atrasada)"""
+    return bool(session.info.get(SESSAO_REPLICA))
+
+
+# ============ ESTATÍSTICAS DO POOL ============
+
+def _estatisticas_engine(engine_: Engine) -> dict:
+    pool = engine_.pool
+    estatisticas = {"pool": type(pool).__name__}
+    # NullPool/StaticPool (SQLite, testes) não têm contadores
+    for nome, metodo in (
+        ("tamanho", "size"),
+        ("em_uso", "checkedout"),
+        ("livres", "checkedin"),
+        ("overflow", "overflow"),
+    ):
+        if hasattr(pool, metodo):
+            estatisticas[nome] = getattr(pool, metodo)()
+    return estatisticas
+
+
+def estatisticas_pool() -> dict:
+    """Uso atual dos pools de conexão (primário, async e réplica)"""
+    engines = {"primario": engine, "primario_async": async_engine.sync_engine}
+    if read_engine is not engine:
+        engines["replica"] = read_engine
+        engines["replica_async"] = async_read_engine.sync_engine
+
+    return {
+        "config": {
+            "pool_size": POOL_SIZE,
+            "max_overflow": POOL_MAX_OVERFLOW,
+            "pool_timeout": POOL_TIMEOUT,
+            "pool_recycle": POOL_RECYCLE,
+            "replica": read_engine is not engine,
+        },
+        **{nome: _estatisticas_engine(e) for nome, e in engines.items()}
+    }
@@ -0,0 +1,149 @@
+"""
+Teste de carga dos endpoints quentes - requisições/segundo sob concorrência
+
+Roda contra um servidor de pé (uvicorn) e mede cada cenário com N clientes
+simultâneos. Para comparar antes/depois de uma mudança, rode o mesmo comando
+nas duas versões do servidor (mesmo banco, mesmos workers).
+
+Uso:
+    uvicorn main:app --workers 1
+    python load_test.py --email admin@restaurante.com --password senha123
+
+O restaurante do usuário precisa ter ao menos um motoboy cadastrado (o
+primeiro é colocado como disponível). O script cria pela própria API
+--pedidos pedidos com lat/lng (sem geocoding):
+- transicao: bipa (scan) cada pedido criado uma vez → READY
+- depois roda o dispatch e mede, por --segundos cada: lotes ativos,
+  rastreio público, detalhes do rastreio e ping de GPS do motoboy
+"""
+import argparse
+import asyncio
+import random
+import time
+from typing import Awaitable, Callable, List
+
+import httpx
+
+
+async def medir(nome: str, concorrencia: int, requisicoes: List[Callable[[], Awaitable[httpx.Response]]]) -> None:
+    """Executa as requisições com `concorrencia` clientes e imprime req/s e latências"""
+    fila: asyncio.Queue = asyncio.Queue()
+    for requisicao in requisicoes:
+        fila.put_nowait(requisicao)
+
+    latencias: List[float] = []
+    erros = 0
+
+    async def cliente():
+        nonlocal erros
+        while not fila.empty():
+            requisicao = fila.get_nowait()
+            inicio = time.perf_counter()
+            response = await requisicao()
+            latencias.append(time.perf_counter() - inicio)
+            if response.status_code >= 400:
+                erros += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(concorrencia)))
+    _imprimir(nome, latencias, erros, time.perf_counter() - inicio)
+
+
+async def medir_por_tempo(
+    nome: str,
+    concorrencia: int,
+    segundos: float,
+    requisicao: Callable[[], Awaitable[httpx.Response]]
+) -> None:
+    """Repete a mesma requisição por `segundos` com `concorrencia` clientes"""
+    latencias: List[float] = []
+    erros = 0
+    fim = time.perf_counter() + segundos
+
+    async def cliente():
+        nonlocal erros
+        while time.perf_counter() < fim:
+            inicio = time.perf_counter()
+            response = await requisicao()
+            latencias.append(time.perf_counter() - inicio)
+            if response.status_code >= 400:
+                erros += 1
+
+    inicio = time.perf_counter()
+    await asyncio.gather(*(cliente() for _ in range(concorrencia)))
+    _imprimir(nome, latencias, erros, time.perf_counter() - inicio)
+
+
+def _imprimir(nome: str, latencias: List[float], erros: int, duracao: float) -> None:
+    if not latencias:
+        print(f"{nome:<20} sem requisições")
+        return
+    latencias.sort()
+    p50 = latencias[len(latencias) // 2] * 1000
+    p95 = latencias[int(len(latencias) * 0.95)] * 1000
+    print(
+        f"{nome:<20} {len(latencias) / duracao:8.1f} req/s   "
+        f"p50 {p50:6.1f}ms   p95 {p95:6.1f}ms   erros {erros}"
+    )
+
+
+async def main(args) -> None:
+    limites = httpx.Limits(max_connections=args.concorrencia, max_keepalive_connections=args.concorrencia)
+    async with httpx.AsyncClient(base_url=args.url, limits=limites, timeout=60) as client:
+        response = await client.post("/auth/login", json={"email": args.email, "password": args.password})
+        response.raise_for_status()
+        headers = {"Authorization": f"Bearer {response.json()['access_token']}"}
+        restaurante = (await client.get("/auth/me", headers=headers)).json()["restaurant"]
+        lat0, lng0 = restaurante.get("lat") or -23.5505, restaurante.get("lng") or -46.6333
+
+        # ---------- preparação ----------
+        couriers = (await client.get("/couriers", headers=headers)).json()
+        if not couriers:
+            raise SystemExit("Cadastre ao menos um motoboy no restaurante antes do teste de carga")
+        courier = couriers[0]
+        await client.post(f"/couriers/{courier['id']}/available")
+
+        pedidos = []
+        for i in range(args.pedidos):
+            response = await client.post("/orders", headers=headers, json={
+                "customer_name": f"Carga {i}",
+                "address_text": f"Rua do Teste de Carga, {i}",
+                "lat": lat0 + random.uniform(-0.01, 0.01),
+                "lng": lng0 + random.uniform(-0.01, 0.01),
+            })
+            response.raise_for_status()
+            pedidos.append(response.json())
+
+        print(f"Servidor: {args.url}   concorrência: {args.concorrencia}")
+
+        # ---------- transição de status ----------
+        await medir("scan (transição)", args.concorrencia, [
+            (lambda p=p: client.post(f"/orders/{p['id']}/scan", headers=headers)) for p in pedidos
+        ])
+
+        await client.post("/dispatch/run", headers=headers)
+        pedido = pedidos[0]
+
+        # ---------- leituras quentes ----------
+        await medir_por_tempo("dispatch/batches", args.concorrencia, args.segundos,
+                              lambda: client.get("/dispatch/batches", headers=headers))
+        await medir_por_tempo("track (público)", args.concorrencia, args.segundos,
+                              lambda: client.get(f"/orders/track/{pedido['tracking_code']}"))
+        await medir_por_tempo("tracking-details", args.concorrencia, args.segundos,
+                              lambda: client.get(f"/orders/{pedido['id']}/tracking-details", headers=headers))
+        await medir_por_tempo("location (GPS)", args.concorrencia, args.segundos,
+                              lambda: client.put(f"/couriers/{courier['id']}/location", params={
+                                  "lat": lat0 + random.uniform(-0.01, 0.01),
+                                  "lng": lng0 + random.uniform(-0.01, 0.01),
+                              }))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Teste de carga dos endpoints quentes do MotoFlash")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--email", required=True)
+    parser.add_argument("--password", required=True)
+    parser.add_argument("--concorrencia", type=int, default=100, help="clientes simultâneos")
+    parser.add_argument("--segundos", type=float, default=10, help="duração de cada leitura")
+    parser.add_argument("--pedidos", type=int, default=200, help="pedidos criados (e bipados)")
+    asyncio.run(main(parser.parse_args()))
@@ -14,12 +14,13 @@ from fastapi.responses import FileResponse, HTMLResponse, Response
 from slowapi import Limiter, _rate_limit_exceeded_handler
 from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
+import asyncio
 import os
 import uuid
 import shutil
 from pathlib import Path
 
-from database import create_db_and_tables, get_session
+from database import create_db_and_tables, get_session, async_engine, estatisticas_pool
 from sqlmodel import Session
 from fastapi import Depends
 from routers import orders_router, couriers_router, dispatch_router
@@ -28,8 +29,15 @@ from routers.customers import router as customers_router
 from routers.settings import router as settings_router
 from routers.auth import router as auth_router
 from routers.invites import router as invites_router
-from services.geocoding_service import geocode_address_detailed
+from routers.events import router as events_router
+from services.geocoding_service import geocode_address_detailed_async, metricas_consultas, encerrar_geocoding
+from services.geocode_cache_service import cache_geocoding, loop_limpeza_geocode_cache
 from services.dispatch_service import get_batch_route_polyline
+from services.location_service import loop_descarga_localizacoes, descarregar_localizacoes
+from services.credential_service import encerrar_pool
+from services.qrcode_service import loop_limpeza_qrcodes
+from services.writer_service import escritor
+from services.auth_service import get_current_user, AuthenticatedUser
 
 # Pasta para uploads de imagens
 # Em produção (Railway), usa /data/uploads para persistência
@@ -47,9 +55,20 @@ STATIC_DIR = Path(__file__).parent / "static"
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
-    """Cria o banco de dados na inicialização"""
+    """Cria o banco de dados na inicialização e roda a descarga do buffer de GPS e as limpezas (QR, geocoding)"""
     create_db_and_tables()
+    descarga_gps = asyncio.create_task(loop_descarga_localizacoes())
+    limpeza_qrcodes = asyncio.create_task(loop_limpeza_qrcodes())
+    limpeza_geocoding = asyncio.create_task(loop_limpeza_geocode_cache())
     yield
+    descarga_gps.cancel()
+    limpeza_qrcodes.cancel()
+    limpeza_geocoding.cancel()
+    descarregar_localizacoes()  # Não perde os últimos pings no desligamento
+    escritor.encerrar()         # Termina as escritas enfileiradas (SQLite)
+    encerrar_pool()             # Processos do bcrypt
+    await async_engine.dispose()  # Conexões das rotas async
+    await encerrar_geocoding()    # Conexões com o Google Geocoding
 
 
 # Rate Limiter - Proteção contra abuso de API
@@ -141,6 +160,7 @@ app.include_router(customers_router)
 app.include_router(settings_router)
 app.include_router(auth_router)
 app.include_router(invites_router)
+app.include_router(events_router)
 
 
 # ============ UPLOAD DE IMAGENS ============
@@ -208,17 +228,44 @@ def health():
     return {"status": "healthy"}
 
 
+# Métricas do pool de conexões do banco
+@app.get("/metrics/db", tags=["Root"])
+def db_metrics(current_user: AuthenticatedUser = Depends(get_current_user)):
+    """
+    Uso dos pools de conexão: tamanho, conexões em uso/livres e overflow
+    de cada engine (primário, async e réplica de leitura, se configurada)
+
+    Pool sempre cheio (em_uso = tamanho + overflow) = requisições esperando
+    conexão: aumente DB_POOL_SIZE / DB_MAX_OVERFLOW.
+    """
+    return estatisticas_pool()
+
+
+# Métricas do cache de geocoding
+@app.get("/metrics/geocoding", tags=["Root"])
+def geocoding_metrics(current_user: AuthenticatedUser = Depends(get_current_user)):
+    """
+    Cache de geocoding deste processo: acertos na memória e no banco,
+    acertos negativos (endereço já dado como não encontrado), misses (foram
+    ao Google), evictions da memória e falhas ao acessar a tabela.
+
+    Consultas ao Google: feitas, agrupadas (mesmo endereço pedido ao mesmo
+    tempo, respondido por uma consulta só) e em andamento.
+    """
+    return {**cache_geocoding.metricas(), **metricas_consultas()}
+
+
 # Endpoint de geocoding para testes
 @app.get("/geocode", tags=["Utilidades"])
-def geocode(address: str, city: str = "Ribeirão Preto", state: str = "SP"):
+async def geocode(address: str, city: str = "Ribeirão Preto", state: str = "SP"):
     """
     Converte um endereço em coordenadas (lat, lng)
     
-    Usa o Nominatim (OpenStreetMap) - gratuito!
+    Usa o Google Geocoding (com cache e consultas agrupadas)
     
     Exemplo: /geocode?address=Rua Visconde de Inhaúma, 2235
     """
-    result = geocode_address_detailed(address, city, state)
+    result = await geocode_address_detailed_async(address, city, state)
     return result
 
 
@@ -0,0 +1,53 @@
+"""
+Ambiente do Alembic
+
+Usa o schema dos models (SQLModel.metadata) e o banco de database.py.
+Quem chama por código (database.aplicar_migracoes) passa a conexão em
+config.attributes["connection"]; pela linha de comando (`alembic upgrade
+head`), a conexão sai do engine configurado pelas variáveis de ambiente.
+"""
+from alembic import context
+from sqlmodel import SQLModel
+
+import models  # noqa: F401 - registra as tabelas em SQLModel.metadata
+
+target_metadata = SQLModel.metadata
+
+
+def _rodar(conexao) -> None:
+    context.configure(
+        connection=conexao,
+        target_metadata=target_metadata,
+        # SQLite não tem ALTER de verdade: recria a tabela quando preciso
+        render_as_batch=conexao.dialect.name == "sqlite",
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def rodar_offline() -> None:
+    """Gera o SQL sem conectar (alembic upgrade head --sql)"""
+    from database import DATABASE_URL
+
+    context.configure(url=DATABASE_URL, target_metadata=target_metadata, literal_binds=True)
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def rodar_online() -> None:
+    conexao = context.config.attributes.get("connection")
+    if conexao is not None:
+        _rodar(conexao)
+        return
+
+    from database import engine
+
+    with engine.connect() as conexao:
+        _rodar(conexao)
+        conexao.commit()
+
+
+if context.is_offline_mode():
+    rodar_offline()
+else:
+    rodar_online()
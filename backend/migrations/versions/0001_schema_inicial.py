@@ -0,0 +1,293 @@
+"""schema inicial
+
+Tabelas como o create_all criava antes das migrações. Bancos que já
+existiam sem controle de versão são marcados nesta revisão (stamp) por
+database.aplicar_migracoes, sem recriar nada.
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-19 03:46:02.048917
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+revision: str = '0001'
+down_revision: Union[str, None] = None
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('restaurants',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('slug', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('email', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('phone', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('cnpj', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('logo_url', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('address', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('lat', sa.Float(), nullable=True),
+    sa.Column('lng', sa.Float(), nullable=True),
+    sa.Column('plan', sa.Enum('TRIAL', 'BASIC', 'PRO', name='plantype'), nullable=False),
+    sa.Column('trial_ends_at', sa.DateTime(), nullable=False),
+    sa.Column('blocked', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('restaurants', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_restaurants_email'), ['email'], unique=True)
+        batch_op.create_index(batch_op.f('ix_restaurants_slug'), ['slug'], unique=True)
+
+    op.create_table('settings',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('restaurant_name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('phone', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('address', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('lat', sa.Float(), nullable=True),
+    sa.Column('lng', sa.Float(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    op.create_table('categories',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('restaurant_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('order', sa.Integer(), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurants.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_categories_restaurant_id'), ['restaurant_id'], unique=False)
+
+    op.create_table('couriers',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('restaurant_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('last_name', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('phone', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('password_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('status', sa.Enum('AVAILABLE', 'BUSY', 'OFFLINE', name='courierstatus'), nullable=False),
+    sa.Column('last_lat', sa.Float(), nullable=True),
+    sa.Column('last_lng', sa.Float(), nullable=True),
+    sa.Column('push_token', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.Column('available_since', sa.DateTime(), nullable=True),
+    sa.Column('last_login', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurants.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('couriers', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_couriers_phone'), ['phone'], unique=False)
+        batch_op.create_index(batch_op.f('ix_couriers_restaurant_id'), ['restaurant_id'], unique=False)
+
+    op.create_table('customers',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('restaurant_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('phone', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('address', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('complement', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('reference', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('lat', sa.Float(), nullable=True),
+    sa.Column('lng', sa.Float(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurants.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_customers_phone'), ['phone'], unique=False)
+        batch_op.create_index(batch_op.f('ix_customers_restaurant_id'), ['restaurant_id'], unique=False)
+
+    op.create_table('padroes_demanda',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('restaurant_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('dia_semana', sa.Integer(), nullable=False),
+    sa.Column('hora', sa.Integer(), nullable=False),
+    sa.Column('media_pedidos_hora', sa.Float(), nullable=False),
+    sa.Column('media_tempo_preparo', sa.Float(), nullable=False),
+    sa.Column('media_tempo_rota', sa.Float(), nullable=False),
+    sa.Column('motoboys_recomendados', sa.Integer(), nullable=False),
+    sa.Column('amostras', sa.Integer(), nullable=False),
+    sa.Column('ultima_atualizacao', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurants.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('padroes_demanda', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_padroes_demanda_dia_semana'), ['dia_semana'], unique=False)
+        batch_op.create_index(batch_op.f('ix_padroes_demanda_hora'), ['hora'], unique=False)
+        batch_op.create_index(batch_op.f('ix_padroes_demanda_restaurant_id'), ['restaurant_id'], unique=False)
+
+    op.create_table('users',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('email', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('password_hash', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('restaurant_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('role', sa.Enum('OWNER', 'MANAGER', name='userrole'), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('last_login', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurants.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_email'), ['email'], unique=True)
+
+    op.create_table('batches',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('restaurant_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('courier_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('status', sa.Enum('ASSIGNED', 'IN_PROGRESS', 'DONE', name='batchstatus'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('completed_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['courier_id'], ['couriers.id'], ),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurants.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('batches', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_batches_restaurant_id'), ['restaurant_id'], unique=False)
+
+    op.create_table('invites',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('code', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('restaurant_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('used', sa.Boolean(), nullable=False),
+    sa.Column('used_at', sa.DateTime(), nullable=True),
+    sa.Column('used_by_courier_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurants.id'], ),
+    sa.ForeignKeyConstraint(['used_by_courier_id'], ['couriers.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('invites', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_invites_code'), ['code'], unique=True)
+        batch_op.create_index(batch_op.f('ix_invites_restaurant_id'), ['restaurant_id'], unique=False)
+
+    op.create_table('menu_items',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('restaurant_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('description', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('price', sa.Float(), nullable=False),
+    sa.Column('image_url', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('category_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('active', sa.Boolean(), nullable=False),
+    sa.Column('out_of_stock', sa.Boolean(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('updated_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['category_id'], ['categories.id'], ),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurants.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('menu_items', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_menu_items_restaurant_id'), ['restaurant_id'], unique=False)
+
+    op.create_table('password_resets',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('code', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('courier_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('expires_at', sa.DateTime(), nullable=False),
+    sa.Column('used', sa.Boolean(), nullable=False),
+    sa.Column('used_at', sa.DateTime(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.ForeignKeyConstraint(['courier_id'], ['couriers.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('password_resets', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_password_resets_code'), ['code'], unique=True)
+        batch_op.create_index(batch_op.f('ix_password_resets_courier_id'), ['courier_id'], unique=False)
+
+    op.create_table('orders',
+    sa.Column('id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('restaurant_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('short_id', sa.Integer(), nullable=True),
+    sa.Column('tracking_code', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('customer_name', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('address_text', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('lat', sa.Float(), nullable=False),
+    sa.Column('lng', sa.Float(), nullable=False),
+    sa.Column('prep_type', sa.Enum('SHORT', 'LONG', name='preptype'), nullable=False),
+    sa.Column('status', sa.Enum('CREATED', 'PREPARING', 'READY', 'ASSIGNED', 'PICKED_UP', 'DELIVERED', 'CANCELLED', name='orderstatus'), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=False),
+    sa.Column('ready_at', sa.DateTime(), nullable=True),
+    sa.Column('delivered_at', sa.DateTime(), nullable=True),
+    sa.Column('cancelled_at', sa.DateTime(), nullable=True),
+    sa.Column('batch_id', sqlmodel.sql.sqltypes.AutoString(), nullable=True),
+    sa.Column('stop_order', sa.Integer(), nullable=True),
+    sa.ForeignKeyConstraint(['batch_id'], ['batches.id'], ),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurants.id'], ),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_orders_restaurant_id'), ['restaurant_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_orders_short_id'), ['short_id'], unique=False)
+        batch_op.create_index(batch_op.f('ix_orders_tracking_code'), ['tracking_code'], unique=True)
+
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('orders', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_orders_tracking_code'))
+        batch_op.drop_index(batch_op.f('ix_orders_short_id'))
+        batch_op.drop_index(batch_op.f('ix_orders_restaurant_id'))
+
+    op.drop_table('orders')
+    with op.batch_alter_table('password_resets', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_password_resets_courier_id'))
+        batch_op.drop_index(batch_op.f('ix_password_resets_code'))
+
+    op.drop_table('password_resets')
+    with op.batch_alter_table('menu_items', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_menu_items_restaurant_id'))
+
+    op.drop_table('menu_items')
+    with op.batch_alter_table('invites', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_invites_restaurant_id'))
+        batch_op.drop_index(batch_op.f('ix_invites_code'))
+
+    op.drop_table('invites')
+    with op.batch_alter_table('batches', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_batches_restaurant_id'))
+
+    op.drop_table('batches')
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_email'))
+
+    op.drop_table('users')
+    with op.batch_alter_table('padroes_demanda', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_padroes_demanda_restaurant_id'))
+        batch_op.drop_index(batch_op.f('ix_padroes_demanda_hora'))
+        batch_op.drop_index(batch_op.f('ix_padroes_demanda_dia_semana'))
+
+    op.drop_table('padroes_demanda')
+    with op.batch_alter_table('customers', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_customers_restaurant_id'))
+        batch_op.drop_index(batch_op.f('ix_customers_phone'))
+
+    op.drop_table('customers')
+    with op.batch_alter_table('couriers', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_couriers_restaurant_id'))
+        batch_op.drop_index(batch_op.f('ix_couriers_phone'))
+
+    op.drop_table('couriers')
+    with op.batch_alter_table('categories', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_categories_restaurant_id'))
+
+    op.drop_table('categories')
+    op.drop_table('settings')
+    with op.batch_alter_table('restaurants', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_restaurants_slug'))
+        batch_op.drop_index(batch_op.f('ix_restaurants_email'))
+
+    op.drop_table('restaurants')
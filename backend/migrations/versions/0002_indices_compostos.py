@@ -0,0 +1,55 @@
+"""índices compostos das consultas quentes
+
+- orders (restaurant_id, status, batch_id, ready_at): pedidos READY sem lote do dispatch
+- orders (restaurant_id, created_at): listagem e métricas por data
+- orders (batch_id, stop_order): paradas de um lote (batch_id não tinha índice)
+- batches (courier_id, status, created_at): lote atual do motoboy
+- couriers (restaurant_id, status, available_since): fila de disponíveis
+- padroes_demanda (restaurant_id, dia_semana, hora) ÚNICO - antes de criar,
+  apaga duplicatas antigas (fica a atualização mais recente)
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-19 03:46:16.036364
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0002'
+down_revision: Union[str, None] = '0001'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index('ix_orders_restaurant_status_batch_ready', 'orders', ['restaurant_id', 'status', 'batch_id', 'ready_at'])
+    op.create_index('ix_orders_restaurant_created', 'orders', ['restaurant_id', 'created_at'])
+    op.create_index('ix_orders_batch_stop', 'orders', ['batch_id', 'stop_order'])
+    op.create_index('ix_batches_courier_status_created', 'batches', ['courier_id', 'status', 'created_at'])
+    op.create_index('ix_couriers_restaurant_status_available', 'couriers', ['restaurant_id', 'status', 'available_since'])
+
+    op.execute(sa.text("""
+        DELETE FROM padroes_demanda
+        WHERE EXISTS (
+            SELECT 1 FROM padroes_demanda AS outro
+            WHERE outro.restaurant_id = padroes_demanda.restaurant_id
+              AND outro.dia_semana = padroes_demanda.dia_semana
+              AND outro.hora = padroes_demanda.hora
+              AND (outro.ultima_atualizacao > padroes_demanda.ultima_atualizacao
+                   OR (outro.ultima_atualizacao = padroes_demanda.ultima_atualizacao
+                       AND outro.id > padroes_demanda.id))
+        )
+    """))
+    op.create_index('uq_padroes_demanda_restaurante_dia_hora', 'padroes_demanda', ['restaurant_id', 'dia_semana', 'hora'], unique=True)
+
+
+def downgrade() -> None:
+    op.drop_index('uq_padroes_demanda_restaurante_dia_hora', table_name='padroes_demanda')
+    op.drop_index('ix_couriers_restaurant_status_available', table_name='couriers')
+    op.drop_index('ix_batches_courier_status_created', table_name='batches')
+    op.drop_index('ix_orders_batch_stop', table_name='orders')
+    op.drop_index('ix_orders_restaurant_created', table_name='orders')
+    op.drop_index('ix_orders_restaurant_status_batch_ready', table_name='orders')
@@ -0,0 +1,39 @@
+"""contador de short_id por restaurante
+
+Cria contadores_pedidos já com o maior short_id de cada restaurante
+(restaurantes sem pedidos ganham o contador no primeiro pedido).
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-19 04:10:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+revision: str = '0003'
+down_revision: Union[str, None] = '0002'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('contadores_pedidos',
+    sa.Column('restaurant_id', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('ultimo_short_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['restaurant_id'], ['restaurants.id'], ),
+    sa.PrimaryKeyConstraint('restaurant_id')
+    )
+    op.execute(sa.text("""
+        INSERT INTO contadores_pedidos (restaurant_id, ultimo_short_id)
+        SELECT restaurant_id, MAX(short_id) FROM orders
+        WHERE restaurant_id IS NOT NULL AND short_id IS NOT NULL
+        GROUP BY restaurant_id
+    """))
+
+
+def downgrade() -> None:
+    op.drop_table('contadores_pedidos')
@@ -0,0 +1,41 @@
+"""número do restaurante no contador de pedidos
+
+Inteiro único por restaurante, usado no código de rastreio (com o short_id).
+Contadores existentes são numerados em ordem de restaurant_id.
+
+Revision ID: 0004
+Revises: 0003
+Create Date: 2026-10-19 04:40:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+revision: str = '0004'
+down_revision: Union[str, None] = '0003'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    with op.batch_alter_table('contadores_pedidos', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('numero', sa.Integer(), nullable=True))
+
+    op.execute(sa.text("""
+        UPDATE contadores_pedidos SET numero = (
+            SELECT COUNT(*) FROM contadores_pedidos AS anterior
+            WHERE anterior.restaurant_id <= contadores_pedidos.restaurant_id
+        )
+    """))
+
+    with op.batch_alter_table('contadores_pedidos', schema=None) as batch_op:
+        batch_op.alter_column('numero', existing_type=sa.Integer(), nullable=False)
+        batch_op.create_index('uq_contadores_pedidos_numero', ['numero'], unique=True)
+
+
+def downgrade() -> None:
+    with op.batch_alter_table('contadores_pedidos', schema=None) as batch_op:
+        batch_op.drop_index('uq_contadores_pedidos_numero')
+        batch_op.drop_column('numero')
@@ -0,0 +1,32 @@
+"""cache persistente de geocoding
+
+Revision ID: 0005
+Revises: 0004
+Create Date: 2026-10-19 05:20:00.000000
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+import sqlmodel
+
+
+revision: str = '0005'
+down_revision: Union[str, None] = '0004'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table('geocode_cache',
+    sa.Column('chave', sqlmodel.sql.sqltypes.AutoString(), nullable=False),
+    sa.Column('lat', sa.Float(), nullable=True),
+    sa.Column('lng', sa.Float(), nullable=True),
+    sa.Column('atualizado_em', sa.DateTime(), nullable=False),
+    sa.Column('expira_em', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('chave')
+    )
+
+
+def downgrade() -> None:
+    op.drop_table('geocode_cache')
@@ -9,6 +9,7 @@ MULTI-RESTAURANTE (SaaS)
 from datetime import datetime, timedelta
 from enum import Enum
 from typing import Optional, List
+from sqlalchemy import Index
 from sqlmodel import SQLModel, Field, Relationship
 import uuid
 
@@ -216,6 +217,14 @@ class MenuItem(SQLModel, table=True):
 class Order(SQLModel, table=True):
     """Pedido do restaurante"""
     __tablename__ = "orders"
+    __table_args__ = (
+        # Dispatch: READY sem lote do restaurante, na ordem em que ficaram prontos
+        Index("ix_orders_restaurant_status_batch_ready", "restaurant_id", "status", "batch_id", "ready_at"),
+        # Listagem e métricas: pedidos do restaurante por data
+        Index("ix_orders_restaurant_created", "restaurant_id", "created_at"),
+        # Paradas de um lote em ordem (também serve de índice para batch_id)
+        Index("ix_orders_batch_stop", "batch_id", "stop_order"),
+    )
 
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
 
@@ -247,6 +256,27 @@ class Order(SQLModel, table=True):
     stop_order: Optional[int] = None  # Ordem de parada no lote (1, 2, 3...)
 
 
+class ContadorPedidos(SQLModel, table=True):
+    """
+    Contador de short_id por restaurante
+
+    Guarda o último short_id entregue. O próximo pedido (ou um bloco, na
+    importação em lote) sai de um único UPDATE ... RETURNING - atômico e
+    sem MAX() sobre os pedidos (ver order_service.reservar_short_ids).
+
+    numero: inteiro único do restaurante, que entra no código de rastreio
+    junto com o short_id (ver order_service.codigo_rastreio).
+    """
+    __tablename__ = "contadores_pedidos"
+    __table_args__ = (
+        Index("uq_contadores_pedidos_numero", "numero", unique=True),
+    )
+
+    restaurant_id: str = Field(foreign_key="restaurants.id", primary_key=True)
+    ultimo_short_id: int = 1000
+    numero: int
+
+
 class Courier(SQLModel, table=True):
     """
     Motoqueiro
@@ -256,6 +286,10 @@ class Courier(SQLModel, table=True):
     - password_hash: senha com bcrypt
     """
     __tablename__ = "couriers"
+    __table_args__ = (
+        # Fila de motoboys disponíveis do restaurante (quem espera há mais tempo primeiro)
+        Index("ix_couriers_restaurant_status_available", "restaurant_id", "status", "available_since"),
+    )
     
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     
@@ -293,6 +327,10 @@ def get_courier_full_name(courier: Courier) -> str:
 class Batch(SQLModel, table=True):
     """Lote de entregas (conjunto de pedidos para um motoqueiro)"""
     __tablename__ = "batches"
+    __table_args__ = (
+        # Lote atual do motoboy (ASSIGNED/IN_PROGRESS mais recente)
+        Index("ix_batches_courier_status_created", "courier_id", "status", "created_at"),
+    )
     
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
     
@@ -304,6 +342,11 @@ class Batch(SQLModel, table=True):
     
     created_at: datetime = Field(default_factory=datetime.now)
     completed_at: Optional[datetime] = None
+    
+    # Pedidos na ordem da rota - só leitura (o vínculo é gravado em Order.batch_id)
+    orders: List[Order] = Relationship(
+        sa_relationship_kwargs={"order_by": "Order.stop_order", "viewonly": True}
+    )
 
 
 class Invite(SQLModel, table=True):
@@ -415,6 +458,9 @@ class OrderCreate(SQLModel):
     lng: Optional[float] = None  # Se não informado, usa geocoding
     prep_type: PrepType = PrepType.SHORT
     simulated_date: Optional[str] = None  # Para simulação: "2025-01-14"
+    # Cliente conhecido (por ID ou telefone): sem lat/lng, usa as coordenadas do cadastro
+    customer_id: Optional[str] = None
+    customer_phone: Optional[str] = None
 
 
 class OrderResponse(SQLModel):
@@ -436,6 +482,37 @@ class OrderResponse(SQLModel):
     stop_order: Optional[int] = None
 
 
+class OrderBulkItemResult(SQLModel):
+    """Resultado de um item da criação em lote (na mesma posição do envio)"""
+    index: int
+    ok: bool
+    order: Optional[OrderResponse] = None
+    error: Optional[str] = None
+
+
+class OrderBulkResponse(SQLModel):
+    """Resposta de POST /orders/bulk"""
+    created: int
+    failed: int
+    results: List[OrderBulkItemResult]
+
+
+class QRSheetRequest(SQLModel):
+    """Corpo de POST /orders/qrcodes/sheet (folha de etiquetas da cozinha)"""
+    order_ids: List[str] = Field(min_length=1, max_length=200)
+    format: str = Field(default="pdf", regex="^(pdf|png)$")
+    columns: int = Field(default=4, ge=1, le=8)
+
+
+class OrderEta(SQLModel):
+    """Previsão de chegada do pedido (só enquanto está em rota)"""
+    eta: datetime                # Horário previsto de chegada
+    minutes: int                 # Minutos restantes
+    stops_before: int            # Entregas antes desta no lote
+    based_on_gps: bool           # False = sem GPS recente, contado do restaurante
+    updated_at: datetime         # Quando foi recalculado
+
+
 class OrderTrackingResponse(SQLModel):
     """Schema de resposta pública do rastreamento (sem autenticação)"""
     short_id: Optional[int]
@@ -447,6 +524,7 @@ class OrderTrackingResponse(SQLModel):
     # Informações básicas para o cliente
     customer_name: str
     address_text: str
+    eta: Optional[OrderEta] = None
 
 
 class CourierCreate(SQLModel):
@@ -471,6 +549,29 @@ class CourierResponse(SQLModel):
     updated_at: Optional[datetime] = None  # Última atualização (usado para GPS)
 
 
+class NearbyCourier(SQLModel):
+    """Motoqueiro encontrado numa busca por proximidade"""
+    id: str
+    status: CourierStatus
+    lat: float
+    lng: float
+    distance_km: float
+    available_since: Optional[datetime] = None
+    updated_at: Optional[datetime] = None  # Quando o GPS leu a posição
+
+
+class LocationPing(SQLModel):
+    """Um ponto de GPS enviado pelo app do motoboy"""
+    lat: float = Field(ge=-90, le=90)
+    lng: float = Field(ge=-180, le=180)
+    timestamp: Optional[datetime] = None  # Quando o GPS leu (None = agora)
+
+
+class LocationBatchRequest(SQLModel):
+    """Vários pontos de GPS em um único request (app acumula e envia junto)"""
+    pings: List[LocationPing] = Field(min_length=1, max_length=1000)
+
+
 class CourierLoginRequest(SQLModel):
     """Schema para login do motoboy"""
     phone: str
@@ -791,6 +892,10 @@ class PadraoDemanda(SQLModel, table=True):
     - Sexta às 20h: média de 25 pedidos/hora, preparo 10min, rota 30min
     """
     __tablename__ = "padroes_demanda"
+    __table_args__ = (
+        # Um padrão por restaurante + dia da semana + hora
+        Index("uq_padroes_demanda_restaurante_dia_hora", "restaurant_id", "dia_semana", "hora", unique=True),
+    )
 
     id: str = Field(default_factory=lambda: str(uuid.uuid4()), primary_key=True)
 
@@ -813,10 +918,6 @@ class PadraoDemanda(SQLModel, table=True):
     amostras: int = 0                     # Quantidade de dados usados
     ultima_atualizacao: datetime = Field(default_factory=datetime.now)
 
-    class Config:
-        # Índice único composto: restaurant_id + dia_semana + hora
-        pass
-
 
 class PrevisaoHibrida(SQLModel):
     """
@@ -917,3 +1018,38 @@ class OrderTrackingDetails(SQLModel):
     batch: Optional[BatchInfo] = None
     courier: Optional[CourierInfo] = None
     route: Optional[RouteInfo] = None
+    eta: Optional[OrderEta] = None
+
+
+class TrackPoint(SQLModel):
+    """Ponto do trajeto real percorrido pelo motoboy"""
+    lat: float
+    lng: float
+    timestamp: datetime
+
+
+class BatchTrackResponse(SQLModel):
+    """Trajeto real de um lote (replay do caminho feito pelo motoboy)"""
+    batch_id: str
+    courier_id: str
+    start: datetime
+    end: datetime
+    points: List[TrackPoint]
+    distance_km: float
+    route_duration_min: Optional[float] = None  # Saída → volta ao restaurante (GPS)
+
+
+class GeocodeCache(SQLModel, table=True):
+    """
+    Cache persistente de geocoding (compartilhado por todos os workers)
+
+    lat/lng vazios = endereço não encontrado, guardado só até expira_em.
+    Ver services/geocode_cache_service.py.
+    """
+    __tablename__ = "geocode_cache"
+
+    chave: str = Field(primary_key=True)  # Endereço normalizado (com cidade/estado)
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    atualizado_em: datetime = Field(default_factory=datetime.now)
+    expira_em: Optional[datetime] = None  # None = não expira (coordenadas encontradas)
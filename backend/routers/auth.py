@@ -12,18 +12,20 @@ from datetime import datetime
 from functools import wraps
 from fastapi import APIRouter, Depends, HTTPException, status, Request
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
-from database import get_session
+from database import get_session, get_async_session
 from models import (
     Restaurant, User, PlanType, UserRole,
     RestaurantCreate, RestaurantResponse,
     UserResponse, LoginRequest, LoginResponse
 )
 from services.auth_service import (
-    hash_password, authenticate_user, create_access_token,
-    generate_unique_slug, get_current_user, get_current_restaurant
+    hash_password, authenticate_user_async, create_access_token,
+    generate_unique_slug, get_current_user, get_current_restaurant,
+    AuthenticatedUser
 )
 from services.geocoding_service import geocode_address_detailed
 
@@ -172,17 +174,20 @@ def register_restaurant(
 
 @router.post("/login", response_model=LoginResponse)
 @conditional_rate_limit("10/minute")  # Máximo 10 tentativas de login por minuto
-def login(
+async def login(
     request: Request,
     data: LoginRequest,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Faz login e retorna token JWT
+
+    async: o bcrypt roda no pool do credential_service e a rota só espera,
+    sem segurar uma thread do threadpool durante ~250ms por login.
     """
     
     # 1. Autentica
-    user = authenticate_user(session, data.email, data.password)
+    user = await authenticate_user_async(session, data.email, data.password)
     
     if not user:
         raise HTTPException(
@@ -197,7 +202,7 @@ def login(
         )
     
     # 2. Busca restaurante
-    restaurant = session.get(Restaurant, user.restaurant_id)
+    restaurant = await session.get(Restaurant, user.restaurant_id)
     
     if not restaurant:
         raise HTTPException(
@@ -209,12 +214,11 @@ def login(
     if restaurant.is_trial_expired() and not restaurant.blocked:
         restaurant.blocked = True
         session.add(restaurant)
-        session.commit()
     
-    # 4. Atualiza último login
+    # 4. Atualiza último login (um commit junto com o bloqueio do trial)
     user.last_login = datetime.now()
     session.add(user)
-    session.commit()
+    await session.commit()
     
     # 5. Gera token
     token = create_access_token({
@@ -262,7 +266,7 @@ def login(
 
 @router.get("/me", response_model=LoginResponse)
 def get_me(
-    user: User = Depends(get_current_user),
+    current_user: AuthenticatedUser = Depends(get_current_user),
     session: Session = Depends(get_session)
 ):
     """
@@ -272,6 +276,14 @@ def get_me(
     - Verificar se token ainda é válido
     - Obter dados atualizados do usuário/restaurante
     """
+    # Dados completos (nome, último login...) não ficam no cache do token
+    user = session.get(User, current_user.id)
+    if not user or not user.active:
+        raise HTTPException(
+            status_code=status.HTTP_401_UNAUTHORIZED,
+            detail="Usuário não encontrado ou inativo"
+        )
+    
     restaurant = session.get(Restaurant, user.restaurant_id)
     
     if not restaurant:
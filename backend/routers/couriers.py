@@ -8,16 +8,33 @@ from datetime import datetime
 from typing import List, Optional
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlmodel import Session, select, SQLModel
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database import get_session
+from database import get_session, get_read_session, get_async_session
 from models import (
     Courier, CourierCreate, CourierResponse, CourierStatus,
     Batch, BatchStatus, BatchResponse, Order, OrderStatus,
     Restaurant, CourierLoginRequest, CourierLoginResponse,
-    PasswordReset, User, get_courier_full_name
+    PasswordReset, LocationBatchRequest, NearbyCourier, get_courier_full_name
+)
+from services.dispatch_service import (
+    get_courier_current_batch,
+    get_batch_orders,
+    load_active_batches,
+    build_batch_response
+)
+from services.auth_service import (
+    hash_password_async,
+    verify_password_and_update_async,
+    get_current_user,
+    AuthenticatedUser
+)
+from services.location_service import registrar_pings, esquecer_motoboy
+from services.spatial_service import (
+    motoboys_no_raio,
+    motoboys_mais_proximos,
+    posicao_mais_recente
 )
-from services.dispatch_service import get_courier_current_batch, get_batch_orders
-from services.auth_service import hash_password, verify_password, get_current_user
 from slowapi import Limiter
 from slowapi.util import get_remote_address
 
@@ -39,15 +56,15 @@ def conditional_rate_limit(limit_string):
 
 @router.post("/login", response_model=CourierLoginResponse)
 @conditional_rate_limit("10/minute")  # Máximo 10 tentativas de login por minuto
-def courier_login(
+async def courier_login(
     request: Request,
     data: CourierLoginRequest,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Login do motoboy
     
-    Busca pelo celular e valida a senha.
+    Busca pelo celular e valida a senha (bcrypt esperado com await).
     Retorna dados do motoboy e do restaurante.
     """
     
@@ -61,9 +78,9 @@ def courier_login(
         )
     
     # Busca motoboy pelo telefone
-    courier = session.exec(
+    courier = (await session.exec(
         select(Courier).where(Courier.phone == phone_clean)
-    ).first()
+    )).first()
     
     if not courier:
         return CourierLoginResponse(
@@ -78,20 +95,25 @@ def courier_login(
             message="Conta sem senha. Entre em contato com o restaurante."
         )
     
-    if not verify_password(data.password, courier.password_hash):
+    valid, new_hash = await verify_password_and_update_async(data.password, courier.password_hash)
+    if not valid:
         return CourierLoginResponse(
             success=False,
             message="Senha incorreta"
         )
     
+    # Custo do bcrypt aumentou desde o cadastro: refaz o hash
+    if new_hash:
+        courier.password_hash = new_hash
+    
     # Atualiza último login
     courier.last_login = datetime.now()
     session.add(courier)
-    session.commit()
-    session.refresh(courier)
+    await session.commit()
+    await session.refresh(courier)
     
     # Busca nome do restaurante
-    restaurant = session.get(Restaurant, courier.restaurant_id) if courier.restaurant_id else None
+    restaurant = await session.get(Restaurant, courier.restaurant_id) if courier.restaurant_id else None
     
     return CourierLoginResponse(
         success=True,
@@ -136,8 +158,8 @@ def create_courier(courier_data: CourierCreate, session: Session = Depends(get_s
 @router.get("", response_model=List[CourierResponse])
 def list_couriers(
     status: CourierStatus = None,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    session: Session = Depends(get_read_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Lista motoqueiros do restaurante do usuário logado
@@ -156,22 +178,67 @@ def list_couriers(
     return couriers
 
 
+@router.get("/nearby", response_model=List[NearbyCourier])
+def list_nearby_couriers(
+    lat: float,
+    lng: float,
+    radius_km: float = 2.0,
+    k: Optional[int] = None,
+    status: CourierStatus = None,
+    session: Session = Depends(get_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """
+    📍 Motoqueiros perto de um ponto (restaurante, pedido...), do mais perto ao mais longe
+    
+    - Sem `k`: todos a até `radius_km`
+    - Com `k`: os `k` mais próximos (sem limite de raio)
+    
+    Responde do índice espacial em memória (sem varrer a tabela de motoqueiros).
+    
+    🔒 PROTEÇÃO: Só motoqueiros do restaurante do usuário logado
+    """
+    if k is not None:
+        proximos = motoboys_mais_proximos(session, current_user.restaurant_id, lat, lng, k, status)
+    else:
+        proximos = motoboys_no_raio(session, current_user.restaurant_id, lat, lng, radius_km, status)
+    
+    return [
+        NearbyCourier(
+            id=m.courier_id,
+            status=m.status,
+            lat=m.lat,
+            lng=m.lng,
+            distance_km=round(m.distancia_km, 3),
+            available_since=m.available_since,
+            updated_at=m.atualizado_em
+        )
+        for m in proximos
+    ]
+
+
 @router.get("/{courier_id}", response_model=CourierResponse)
 def get_courier(courier_id: str, session: Session = Depends(get_session)):
     """
     Busca um motoqueiro pelo ID
+    
+    A posição vem do índice espacial quando é mais nova que a gravada
+    (pings ainda no buffer de GPS).
     """
     courier = session.get(Courier, courier_id)
     if not courier:
         raise HTTPException(status_code=404, detail="Motoqueiro não encontrado")
-    return courier
+    
+    response = CourierResponse.model_validate(courier)
+    response.last_lat, response.last_lng, response.updated_at = posicao_mais_recente(courier)
+    return response
 
 
 @router.delete("/{courier_id}")
 def delete_courier(
     courier_id: str,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Exclui um motoqueiro
@@ -213,6 +280,7 @@ def delete_courier(
     # Exclui o motoboy
     session.delete(courier)
     session.commit()
+    esquecer_motoboy(courier_id)
     
     return {"success": True, "message": f"Motoboy {get_courier_full_name(courier)} excluído com sucesso"}
 
@@ -268,49 +336,20 @@ def set_courier_offline(courier_id: str, session: Session = Depends(get_session)
 
 
 @router.get("/{courier_id}/current-batch", response_model=Optional[BatchResponse])
-def get_current_batch(courier_id: str, session: Session = Depends(get_session)):
+async def get_current_batch(courier_id: str, session: AsyncSession = Depends(get_async_session)):
     """
     Retorna o lote atual do motoqueiro (entregas pendentes)
     
     Se não tiver entregas, retorna null.
     """
-    courier = session.get(Courier, courier_id)
-    if not courier:
-        raise HTTPException(status_code=404, detail="Motoqueiro não encontrado")
+    # Lote + motoboy + pedidos já carregados juntos
+    lotes = await session.run_sync(load_active_batches, courier_id=courier_id)
+    if lotes:
+        return build_batch_response(*lotes[0])
     
-    batch = get_courier_current_batch(session, courier_id)
-    
-    if not batch:
-        return None
-    
-    # Busca os pedidos do lote
-    orders = get_batch_orders(session, batch.id)
-    
-    return BatchResponse(
-        id=batch.id,
-        courier_id=batch.courier_id,
-        courier_name=get_courier_full_name(courier),
-        status=batch.status,
-        created_at=batch.created_at,
-        orders=[
-            {
-                "id": o.id,
-                "short_id": o.short_id,
-                "tracking_code": o.tracking_code,
-                "customer_name": o.customer_name,
-                "address_text": o.address_text,
-                "lat": o.lat,
-                "lng": o.lng,
-                "prep_type": o.prep_type,
-                "status": o.status,
-                "created_at": o.created_at,
-                "ready_at": o.ready_at,
-                "batch_id": o.batch_id,
-                "stop_order": o.stop_order
-            }
-            for o in orders
-        ]
-    )
+    if not await session.get(Courier, courier_id):
+        raise HTTPException(status_code=404, detail="Motoqueiro não encontrado")
+    return None
 
 
 @router.post("/{courier_id}/complete-batch", response_model=CourierResponse)
@@ -357,29 +396,48 @@ def complete_current_batch(courier_id: str, session: Session = Depends(get_sessi
 
 
 @router.put("/{courier_id}/location")
-def update_location(
+async def update_location(
     courier_id: str,
     lat: float,
     lng: float,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
-    Atualiza a localização do motoqueiro
+    Atualiza a localização do motoqueiro (um ponto)
     
-    Usado para cálculos de proximidade.
+    Usado para cálculos de proximidade. Vai para o buffer de GPS:
+    o banco é atualizado em lote pela descarga periódica.
     """
-    courier = session.get(Courier, courier_id)
-    if not courier:
+    try:
+        await session.run_sync(registrar_pings, courier_id, [(None, lat, lng)])
+    except KeyError:
         raise HTTPException(status_code=404, detail="Motoqueiro não encontrado")
     
-    courier.last_lat = lat
-    courier.last_lng = lng
-    courier.updated_at = datetime.now()
+    return {"message": "Localização atualizada"}
+
+
+@router.post("/{courier_id}/locations")
+async def ingest_locations(
+    courier_id: str,
+    data: LocationBatchRequest,
+    session: AsyncSession = Depends(get_async_session)
+):
+    """
+    📍 Recebe VÁRIOS pontos de GPS de uma vez
     
-    session.add(courier)
-    session.commit()
+    O app acumula as leituras do GPS e manda junto. Os pontos vão para
+    o trajeto do motoboy e só a posição mais recente vira last_lat/last_lng.
+    """
+    try:
+        aceitos = await session.run_sync(
+            registrar_pings,
+            courier_id,
+            [(ping.timestamp, ping.lat, ping.lng) for ping in data.pings]
+        )
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Motoqueiro não encontrado")
     
-    return {"message": "Localização atualizada"}
+    return {"accepted": aceitos}
 
 
 class PushTokenRequest(SQLModel):
@@ -548,17 +606,17 @@ def validate_password_reset(code: str, session: Session = Depends(get_session)):
 
 
 @router.post("/password-reset/{code}/use")
-def use_password_reset(
+async def use_password_reset(
     code: str,
     new_password: str,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Usa o link para redefinir a senha (público)
     """
-    reset = session.exec(
+    reset = (await session.exec(
         select(PasswordReset).where(PasswordReset.code == code)
-    ).first()
+    )).first()
     
     if not reset:
         raise HTTPException(status_code=404, detail="Link inválido")
@@ -573,12 +631,12 @@ def use_password_reset(
         raise HTTPException(status_code=400, detail="Senha deve ter pelo menos 4 caracteres")
     
     # Busca o motoboy
-    courier = session.get(Courier, reset.courier_id)
+    courier = await session.get(Courier, reset.courier_id)
     if not courier:
         raise HTTPException(status_code=404, detail="Motoboy não encontrado")
     
     # Atualiza a senha
-    courier.password_hash = hash_password(new_password)
+    courier.password_hash = await hash_password_async(new_password)
     courier.updated_at = datetime.now()
     session.add(courier)
     
@@ -587,7 +645,7 @@ def use_password_reset(
     reset.used_at = datetime.now()
     session.add(reset)
     
-    session.commit()
+    await session.commit()
     
     return {
         "success": True,
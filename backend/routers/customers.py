@@ -8,12 +8,14 @@ Rotas de Clientes
 from datetime import datetime
 from typing import List
 import unicodedata
-from fastapi import APIRouter, Depends, HTTPException
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException
 from sqlmodel import Session, select
 
-from database import get_session
-from models import Customer, CustomerCreate, CustomerUpdate, CustomerResponse, User
-from services.auth_service import get_current_user
+from database import get_session, get_read_session
+from models import Customer, CustomerCreate, CustomerUpdate, CustomerResponse
+from services.auth_service import get_current_user, AuthenticatedUser
+from services.customer_service import resolver_coordenadas
+from services.writer_service import Escritor, get_escritor
 
 
 def normalize_text(text: str) -> str:
@@ -34,13 +36,17 @@ router = APIRouter(prefix="/customers", tags=["Clientes"])
 @router.post("", response_model=CustomerResponse)
 def create_customer(
     data: CustomerCreate, 
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    escritor: Escritor = Depends(get_escritor),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Cadastra um novo cliente
     
     🔒 O cliente é vinculado automaticamente ao restaurante do usuário logado
+    📍 As coordenadas do endereço são buscadas depois da resposta (lat/lng
+    chegam vazios e ficam no cadastro para os próximos pedidos)
     """
     
     # Verifica se já existe cliente com esse telefone NO MESMO RESTAURANTE
@@ -72,6 +78,8 @@ def create_customer(
     session.add(customer)
     session.commit()
     session.refresh(customer)
+
+    background_tasks.add_task(resolver_coordenadas, escritor, customer.id, customer.address)
     
     return CustomerResponse(
         id=customer.id,
@@ -91,8 +99,8 @@ def create_customer(
 @router.get("", response_model=List[CustomerResponse])
 def list_customers(
     search: str = None,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    session: Session = Depends(get_read_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Lista clientes do restaurante do usuário logado
@@ -139,7 +147,7 @@ def list_customers(
 def get_customer_by_phone(
     phone: str, 
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Busca cliente pelo telefone (apenas do próprio restaurante)
@@ -177,7 +185,7 @@ def get_customer_by_phone(
 def get_customer(
     customer_id: str, 
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """Busca cliente pelo ID (apenas do próprio restaurante)"""
     
@@ -209,13 +217,16 @@ def get_customer(
 def update_customer(
     customer_id: str,
     data: CustomerUpdate,
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    escritor: Escritor = Depends(get_escritor),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Atualiza dados do cliente (apenas do próprio restaurante)
     
     🔒 Verifica se o cliente pertence ao restaurante
+    📍 Endereço novo: coordenadas limpas e buscadas de novo depois da resposta
     """
     
     customer = session.get(Customer, customer_id)
@@ -232,8 +243,11 @@ def update_customer(
         customer.phone = data.phone
     if data.name is not None:
         customer.name = data.name
-    if data.address is not None:
+    endereco_mudou = data.address is not None and data.address != customer.address
+    if endereco_mudou:
         customer.address = data.address
+        customer.lat = None
+        customer.lng = None
     if data.complement is not None:
         customer.complement = data.complement
     if data.reference is not None:
@@ -244,6 +258,9 @@ def update_customer(
     session.add(customer)
     session.commit()
     session.refresh(customer)
+
+    if endereco_mudou:
+        background_tasks.add_task(resolver_coordenadas, escritor, customer.id, customer.address)
     
     return CustomerResponse(
         id=customer.id,
@@ -264,7 +281,7 @@ def update_customer(
 def delete_customer(
     customer_id: str, 
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """Remove um cliente (apenas do próprio restaurante)"""
     
@@ -6,17 +6,22 @@ Rotas de Dispatch (Despacho/Distribuição)
 - Stats, Alerts, Metrics filtram por restaurant_id
 - Batches são vinculados ao restaurant_id
 """
+from datetime import datetime
 from typing import List
-from fastapi import APIRouter, Depends
+from fastapi import APIRouter, Depends, HTTPException
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database import get_session
+from database import get_session, get_read_session, get_async_session
 from models import (
-    Batch, BatchResponse, BatchStatus, Order, Courier, DispatchResult,
-    User, OrderStatus, CourierStatus, get_courier_full_name
+    Batch, BatchResponse, BatchTrackResponse,
+    DispatchResult, Restaurant, TrackPoint
 )
-from services.dispatch_service import run_dispatch, get_batch_orders
-from services.auth_service import get_current_user
+from services.dispatch_service import run_dispatch, load_active_batches, build_batch_response
+from services.auth_service import get_current_user, get_current_user_async, AuthenticatedUser
+from services.live_state_service import obter_foto_operacional
+from services.location_service import trajeto_do_lote, duracao_rota_medida
+from services.track_service import distancia_percorrida_km
 from services.prediction_service import (
     calcular_previsao_hibrida,
     atualizar_padroes_historicos,
@@ -29,7 +34,7 @@ router = APIRouter(prefix="/dispatch", tags=["Despacho"])
 @router.post("/run", response_model=DispatchResult)
 def execute_dispatch(
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Executa o algoritmo de dispatch
@@ -41,9 +46,9 @@ def execute_dispatch(
 
 
 @router.get("/batches", response_model=List[BatchResponse])
-def list_active_batches(
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+async def list_active_batches(
+    session: AsyncSession = Depends(get_async_session),
+    current_user: AuthenticatedUser = Depends(get_current_user_async)
 ):
     """
     Lista todos os lotes ativos do restaurante
@@ -51,51 +56,50 @@ def list_active_batches(
     🔒 Filtra por restaurant_id
     """
     # 🔒 PROTEÇÃO: filtra batches pelo restaurant_id
-    batches = session.exec(
-        select(Batch)
-        .where(Batch.status.in_([BatchStatus.ASSIGNED, BatchStatus.IN_PROGRESS]))
-        .where(Batch.restaurant_id == current_user.restaurant_id)
-        .order_by(Batch.created_at.desc())
-    ).all()
+    lotes = await session.run_sync(load_active_batches, restaurant_id=current_user.restaurant_id)
+    return [build_batch_response(batch, courier) for batch, courier in lotes]
+
+
+@router.get("/batches/{batch_id}/track", response_model=BatchTrackResponse)
+def get_batch_track(
+    batch_id: str,
+    session: Session = Depends(get_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """
+    🗺️ Caminho REAL percorrido pelo motoboy durante o lote (replay)
     
-    result = []
-    for batch in batches:
-        courier = session.get(Courier, batch.courier_id)
-        orders = get_batch_orders(session, batch.id)
-        
-        result.append(BatchResponse(
-            id=batch.id,
-            courier_id=batch.courier_id,
-            courier_name=get_courier_full_name(courier) if courier else None,
-            status=batch.status,
-            created_at=batch.created_at,
-            orders=[
-                {
-                    "id": o.id,
-                    "short_id": o.short_id,
-                    "tracking_code": o.tracking_code,
-                    "customer_name": o.customer_name,
-                    "address_text": o.address_text,
-                    "lat": o.lat,
-                    "lng": o.lng,
-                    "prep_type": o.prep_type,
-                    "status": o.status,
-                    "created_at": o.created_at,
-                    "ready_at": o.ready_at,
-                    "batch_id": o.batch_id,
-                    "stop_order": o.stop_order
-                }
-                for o in orders
-            ]
-        ))
+    Vem do histórico de GPS (não do Google): do momento em que o lote foi
+    criado até ser finalizado (ou até agora, se ainda está em rota).
     
-    return result
+    🔒 Filtra por restaurant_id
+    """
+    batch = session.get(Batch, batch_id)
+    if not batch or batch.restaurant_id != current_user.restaurant_id:
+        raise HTTPException(status_code=404, detail="Lote não encontrado")
+    
+    pontos = trajeto_do_lote(batch)
+    
+    duracao = None
+    restaurante = session.get(Restaurant, batch.restaurant_id)
+    if pontos and restaurante and restaurante.lat is not None and restaurante.lng is not None:
+        duracao = duracao_rota_medida(batch, restaurante.lat, restaurante.lng)
+    
+    return BatchTrackResponse(
+        batch_id=batch.id,
+        courier_id=batch.courier_id,
+        start=batch.created_at,
+        end=batch.completed_at or datetime.now(),
+        points=[TrackPoint(timestamp=t, lat=lat, lng=lng) for t, lat, lng in pontos],
+        distance_km=round(distancia_percorrida_km(pontos), 2),
+        route_duration_min=round(duracao, 1) if duracao is not None else None
+    )
 
 
 @router.get("/stats")
 def get_dispatch_stats(
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Retorna estatísticas do sistema
@@ -104,37 +108,23 @@ def get_dispatch_stats(
     """
     restaurant_id = current_user.restaurant_id
     
-    # Conta pedidos por status (do restaurante)
-    orders_by_status = {}
-    for status in OrderStatus:
-        count = session.exec(
-            select(Order)
-            .where(Order.status == status)
-            .where(Order.restaurant_id == restaurant_id)  # 🔒
-        ).all()
-        orders_by_status[status.value] = len(count)
+    # Contadores em memória (reconciliados periodicamente com o banco) 🔒
+    foto = obter_foto_operacional(session, restaurant_id)
     
-    # Conta motoqueiros por status (do restaurante)
-    couriers_by_status = {}
-    for status in CourierStatus:
-        count = session.exec(
-            select(Courier)
-            .where(Courier.status == status)
-            .where(Courier.restaurant_id == restaurant_id)  # 🔒
-        ).all()
-        couriers_by_status[status.value] = len(count)
+    orders_by_status = {
+        status.value: total for status, total in foto.pedidos_por_status.items()
+    }
+    couriers_by_status = {
+        status.value: total for status, total in foto.motoboys_por_status.items()
+    }
     
     # Lotes ativos (do restaurante)
-    active_batches = session.exec(
-        select(Batch)
-        .where(Batch.status.in_([BatchStatus.ASSIGNED, BatchStatus.IN_PROGRESS]))
-        .where(Batch.restaurant_id == restaurant_id)  # 🔒
-    ).all()
+    active_batches = foto.batches_ativos
     
     return {
         "orders": orders_by_status,
         "couriers": couriers_by_status,
-        "active_batches": len(active_batches),
+        "active_batches": active_batches,
         "pending_orders": orders_by_status.get("ready", 0),
         "available_couriers": couriers_by_status.get("available", 0)
     }
@@ -143,39 +133,24 @@ def get_dispatch_stats(
 @router.get("/alerts")
 def get_alerts(
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     🚨 Retorna alertas em tempo real
     
     🔒 Filtra por restaurant_id
     """
-    from services.alerts_service import gerar_alertas
+    from services.alerts_service import gerar_alertas, alertas_para_dict
     
     resultado = gerar_alertas(session, restaurant_id=current_user.restaurant_id)
     
-    return {
-        "status_geral": resultado.status_geral.value,
-        "motoboys_sugeridos": resultado.motoboys_sugeridos,
-        "alertas": [
-            {
-                "tipo": a.tipo.value,
-                "titulo": a.titulo,
-                "mensagem": a.mensagem,
-                "icone": a.icone,
-                "acao_sugerida": a.acao_sugerida,
-                "valor": a.valor
-            }
-            for a in resultado.alertas
-        ],
-        "timestamp": resultado.timestamp.isoformat()
-    }
+    return alertas_para_dict(resultado)
 
 
 @router.get("/metrics")
 def get_metrics(
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    session: Session = Depends(get_read_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     📊 Retorna métricas detalhadas do sistema
@@ -215,8 +190,8 @@ def get_metrics(
 
 @router.get("/recommendation")
 def get_motoboy_recommendation(
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    session: Session = Depends(get_read_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     💡 Retorna recomendação de quantos motoboys são necessários
@@ -300,8 +275,8 @@ def test_google_optimization():
 
 @router.get("/previsao")
 def get_previsao_hibrida(
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    session: Session = Depends(get_read_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     🔮 Previsão Híbrida de Motoboys
@@ -375,7 +350,8 @@ def get_previsao_hibrida(
 @router.post("/atualizar-padroes")
 def atualizar_padroes(
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    leitura: Session = Depends(get_read_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     📚 Atualiza Padrões Históricos
@@ -394,7 +370,9 @@ def atualizar_padroes(
     - Quantidade de padrões atualizados
     - Quantidade de pedidos analisados
     """
-    resultado = atualizar_padroes_historicos(session, restaurant_id=current_user.restaurant_id)
+    resultado = atualizar_padroes_historicos(
+        session, restaurant_id=current_user.restaurant_id, sessao_leitura=leitura
+    )
 
     return {
         "sucesso": True,
@@ -406,8 +384,8 @@ def atualizar_padroes(
 
 @router.get("/padroes")
 def listar_padroes(
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    session: Session = Depends(get_read_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     📊 Lista Padrões Históricos
@@ -0,0 +1,95 @@
+"""
+Rotas de Eventos em Tempo Real (Server-Sent Events)
+
+Substituem o polling do dashboard e do app do motoboy:
+- GET /events/restaurant?token=...   → eventos do restaurante do usuário logado
+- GET /events/couriers/{courier_id}  → eventos do motoboy (novo lote, status)
+
+O token vai na query string porque o EventSource do navegador não
+permite mandar header Authorization.
+"""
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.responses import StreamingResponse
+from sqlmodel import Session
+
+from database import get_session
+from models import Courier
+from services.auth_service import get_user_from_token
+from services.events_service import (
+    barramento,
+    canal_restaurante,
+    canal_motoboy,
+    formatar_sse,
+    HEARTBEAT_SEGUNDOS
+)
+
+router = APIRouter(prefix="/events", tags=["Tempo Real"])
+
+
+# Cabeçalhos para o stream não ficar preso em cache/buffer de proxy (nginx)
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    "X-Accel-Buffering": "no",
+}
+
+
+async def _stream(request: Request, canal: str):
+    """Gera o text/event-stream de um canal até o cliente desconectar"""
+    assinatura = barramento.assinar(canal)
+    try:
+        # Reconexão do EventSource em 3s se a conexão cair
+        yield "retry: 3000\n\n"
+        while not await request.is_disconnected():
+            evento = await assinatura.proximo(timeout=HEARTBEAT_SEGUNDOS)
+            if evento is None:
+                yield ": ping\n\n"
+            else:
+                yield formatar_sse(evento)
+    finally:
+        barramento.cancelar(assinatura)
+
+
+@router.get("/restaurant")
+def stream_restaurant_events(
+    request: Request,
+    token: str = Query(..., description="JWT do usuário (EventSource não manda header)"),
+    session: Session = Depends(get_session)
+):
+    """
+    📡 Stream de eventos do restaurante (pedidos, lotes, motoboys, alertas)
+
+    🔒 Só recebe eventos do restaurante do usuário dono do token
+    """
+    user = get_user_from_token(session, token)
+    canal = canal_restaurante(user.restaurant_id)
+
+    # Encerra a transação de leitura: o stream pode durar horas e não
+    # deve segurar uma conexão do pool
+    session.commit()
+
+    return StreamingResponse(
+        _stream(request, canal),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+
+@router.get("/couriers/{courier_id}")
+def stream_courier_events(
+    courier_id: str,
+    request: Request,
+    session: Session = Depends(get_session)
+):
+    """
+    📡 Stream de eventos do motoboy (lote novo, lote finalizado, status)
+    """
+    if not session.get(Courier, courier_id):
+        raise HTTPException(status_code=404, detail="Motoqueiro não encontrado")
+
+    session.commit()
+
+    return StreamingResponse(
+        _stream(request, canal_motoboy(courier_id)),
+        media_type="text/event-stream",
+        headers=SSE_HEADERS
+    )
@@ -13,14 +13,20 @@ from datetime import datetime
 from typing import List
 from fastapi import APIRouter, Depends, HTTPException, Request
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database import get_session
+from database import get_session, get_async_session
 from models import (
     Invite, Restaurant, Courier, CourierStatus,
     InviteResponse, InviteUse, InviteValidation,
-    User, get_courier_full_name
+    get_courier_full_name
+)
+from services.auth_service import (
+    get_current_user,
+    get_current_restaurant,
+    hash_password_async,
+    AuthenticatedUser
 )
-from services.auth_service import get_current_user, get_current_restaurant, hash_password
 
 
 router = APIRouter(prefix="/invites", tags=["Convites"])
@@ -45,7 +51,7 @@ def generate_invite_code(length: int = 8) -> str:
 @router.post("", response_model=InviteResponse)
 def create_invite(
     request: Request,
-    user: User = Depends(get_current_user),
+    user: AuthenticatedUser = Depends(get_current_user),
     restaurant: Restaurant = Depends(get_current_restaurant),
     session: Session = Depends(get_session)
 ):
@@ -96,7 +102,7 @@ def create_invite(
 @router.get("", response_model=List[InviteResponse])
 def list_invites(
     request: Request,
-    user: User = Depends(get_current_user),
+    user: AuthenticatedUser = Depends(get_current_user),
     restaurant: Restaurant = Depends(get_current_restaurant),
     session: Session = Depends(get_session)
 ):
@@ -130,7 +136,7 @@ def list_invites(
 @router.delete("/{invite_id}")
 def delete_invite(
     invite_id: str,
-    user: User = Depends(get_current_user),
+    user: AuthenticatedUser = Depends(get_current_user),
     restaurant: Restaurant = Depends(get_current_restaurant),
     session: Session = Depends(get_session)
 ):
@@ -200,10 +206,10 @@ def validate_invite(code: str, session: Session = Depends(get_session)):
 
 
 @router.post("/{code}/use")
-def use_invite(
+async def use_invite(
     code: str,
     data: InviteUse,
-    session: Session = Depends(get_session)
+    session: AsyncSession = Depends(get_async_session)
 ):
     """
     Usa um convite para criar conta de motoboy (público)
@@ -216,9 +222,9 @@ def use_invite(
     """
     
     # 1. Busca o convite
-    invite = session.exec(
+    invite = (await session.exec(
         select(Invite).where(Invite.code == code)
-    ).first()
+    )).first()
     
     if not invite:
         raise HTTPException(status_code=404, detail="Código de convite inválido")
@@ -246,12 +252,12 @@ def use_invite(
         raise HTTPException(status_code=400, detail="Celular inválido")
     
     # 3. Verifica se telefone já existe neste restaurante
-    existing = session.exec(
+    existing = (await session.exec(
         select(Courier).where(
             Courier.phone == phone_clean,
             Courier.restaurant_id == invite.restaurant_id
         )
-    ).first()
+    )).first()
     
     if existing:
         raise HTTPException(
@@ -264,14 +270,14 @@ def use_invite(
         name=data.name.strip(),
         last_name=data.last_name.strip() if data.last_name else None,
         phone=phone_clean,
-        password_hash=hash_password(data.password),
+        password_hash=await hash_password_async(data.password),
         restaurant_id=invite.restaurant_id,
         status=CourierStatus.OFFLINE
     )
     
     session.add(courier)
-    session.commit()
-    session.refresh(courier)
+    await session.commit()
+    await session.refresh(courier)
     
     # 5. Marca convite como usado
     invite.used = True
@@ -279,10 +285,10 @@ def use_invite(
     invite.used_by_courier_id = courier.id
     
     session.add(invite)
-    session.commit()
+    await session.commit()
     
     # 6. Busca nome do restaurante para retorno
-    restaurant = session.get(Restaurant, invite.restaurant_id)
+    restaurant = await session.get(Restaurant, invite.restaurant_id)
     
     return {
         "success": True,
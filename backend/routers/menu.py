@@ -13,10 +13,9 @@ from sqlmodel import Session, select, func
 from database import get_session
 from models import (
     Category, CategoryCreate, CategoryUpdate, CategoryResponse,
-    MenuItem, MenuItemCreate, MenuItemUpdate, MenuItemResponse,
-    User
+    MenuItem, MenuItemCreate, MenuItemUpdate, MenuItemResponse
 )
-from services.auth_service import get_current_user
+from services.auth_service import get_current_user, AuthenticatedUser
 
 router = APIRouter(prefix="/menu", tags=["Cardápio"])
 
@@ -27,7 +26,7 @@ router = APIRouter(prefix="/menu", tags=["Cardápio"])
 def create_category(
     data: CategoryCreate, 
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Cria uma nova categoria
@@ -57,7 +56,7 @@ def create_category(
 def list_categories(
     include_inactive: bool = False,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Lista todas as categorias com contagem de itens
@@ -100,7 +99,7 @@ def list_categories(
 def get_category(
     category_id: str, 
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """Busca uma categoria pelo ID (apenas do próprio restaurante)"""
     category = session.get(Category, category_id)
@@ -128,7 +127,7 @@ def update_category(
     category_id: str,
     data: CategoryUpdate,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """Atualiza uma categoria (apenas do próprio restaurante)"""
     category = session.get(Category, category_id)
@@ -166,7 +165,7 @@ def update_category(
 def delete_category(
     category_id: str, 
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """Remove uma categoria (se não tiver itens) - apenas do próprio restaurante"""
     category = session.get(Category, category_id)
@@ -199,7 +198,7 @@ def delete_category(
 def create_item(
     data: MenuItemCreate, 
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Cria um novo item no cardápio
@@ -247,7 +246,7 @@ def list_items(
     include_inactive: bool = False,
     include_out_of_stock: bool = True,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Lista itens do cardápio, opcionalmente filtrados por categoria
@@ -292,7 +291,7 @@ def list_items(
 def get_item(
     item_id: str, 
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """Busca um item pelo ID (apenas do próprio restaurante)"""
     item = session.get(MenuItem, item_id)
@@ -323,7 +322,7 @@ def update_item(
     item_id: str,
     data: MenuItemUpdate,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """Atualiza um item (apenas do próprio restaurante)"""
     item = session.get(MenuItem, item_id)
@@ -378,7 +377,7 @@ def update_item(
 def delete_item(
     item_id: str, 
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """Remove um item do cardápio (apenas do próprio restaurante)"""
     item = session.get(MenuItem, item_id)
@@ -399,7 +398,7 @@ def delete_item(
 def toggle_stock(
     item_id: str, 
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """Alterna status de estoque (disponível/esgotado) - apenas do próprio restaurante"""
     item = session.get(MenuItem, item_id)
@@ -437,7 +436,7 @@ def toggle_stock(
 @router.get("/full")
 def get_full_menu(
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Retorna cardápio completo organizado por categoria
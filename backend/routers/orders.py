@@ -7,20 +7,38 @@ Rotas de Pedidos (Orders)
 """
 from datetime import datetime, timedelta
 from typing import List, Optional
+import json
 import unicodedata
-from fastapi import APIRouter, Depends, HTTPException, Response
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, Query, Request, Response
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+from sqlalchemy.orm import aliased
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database import get_session
+from database import get_session, get_read_session, get_async_read_session
 from models import (
-    Order, OrderCreate, OrderResponse, OrderTrackingResponse, OrderStatus, User, Restaurant, Customer,
-    Batch, Courier, CourierStatus, OrderTrackingDetails, BatchInfo, CourierInfo, RouteInfo, SimpleOrder, Waypoint
+    Order, OrderCreate, OrderResponse, OrderTrackingResponse, OrderStatus, Restaurant, Customer,
+    OrderBulkItemResult, OrderBulkResponse, Batch, Courier, OrderTrackingDetails, BatchInfo, CourierInfo, RouteInfo, SimpleOrder, Waypoint,
+    OrderEta, QRSheetRequest
 )
-from services.qrcode_service import generate_qrcode_base64, generate_qrcode_bytes
-from services.geocoding_service import geocode_address
-from services.auth_service import get_current_user
-from services.order_service import generate_short_id, ensure_unique_tracking_code
-from services.dispatch_service import get_batch_route_polyline
+from services.qrcode_service import (
+    FORMATOS, etag_qrcode, generate_qrcode_base64, generate_qrcode_bytes, montar_folha_qrcodes,
+    pregerar_qrcodes
+)
+from services.geocoding_service import geocode_address, geocode_addresses_async
+from services.auth_service import get_current_user, get_current_user_async, AuthenticatedUser
+from services.customer_service import (
+    buscar_cliente, coordenadas_de_clientes, coordenadas_do_cliente, mesmo_endereco
+)
+from services.order_service import (
+    gravar_pedidos, data_de_criacao, inserir_pedidos_em_lote,
+    bipar_pedido, iniciar_preparo, coletar_pedido, entregar_pedido, cancelar_pedido
+)
+from services.writer_service import Escritor, get_escritor
+from services.dispatch_service import get_route_origin, get_route_polyline_cached
+from services.spatial_service import posicao_mais_recente
+from services.eta_service import eta_do_pedido
 
 router = APIRouter(prefix="/orders", tags=["Pedidos"])
 
@@ -36,17 +54,34 @@ def normalize_text(text: str) -> str:
     return without_accents.lower()
 
 
+def build_order_eta(session: Session, order: Order) -> Optional[OrderEta]:
+    """ETA do pedido em rota (do cache do eta_service), None se não está em rota"""
+    eta = eta_do_pedido(session, order)
+    if eta is None:
+        return None
+    return OrderEta(
+        eta=eta.chegada,
+        minutes=eta.minutos_restantes(),
+        stops_before=eta.paradas_antes,
+        based_on_gps=eta.baseado_em_gps,
+        updated_at=eta.calculado_em
+    )
+
+
 @router.post("", response_model=OrderResponse)
 def create_order(
     order_data: OrderCreate, 
+    background_tasks: BackgroundTasks,
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Cria um novo pedido
     
     🔒 O pedido é vinculado automaticamente ao restaurante do usuário logado.
-    Se lat/lng não forem informados, usa geocoding automático.
+    Se lat/lng não forem informados, usa as coordenadas do cadastro do
+    cliente (customer_id ou customer_phone, mesmo endereço) e, sem elas,
+    geocoding automático.
     """
     # Verifica se usuário tem restaurante
     if not current_user.restaurant_id:
@@ -56,20 +91,22 @@ def create_order(
         )
     
     # Define a data de criação (simulada ou real)
-    if order_data.simulated_date:
-        try:
-            sim_date = datetime.strptime(order_data.simulated_date, "%Y-%m-%d")
-            now = datetime.now()
-            created_at = sim_date.replace(hour=now.hour, minute=now.minute, second=now.second)
-        except:
-            created_at = datetime.now()
-    else:
-        created_at = datetime.now()
-    
-    # Geocoding automático se lat/lng não informados
+    created_at = data_de_criacao(order_data.simulated_date)
+
     lat = order_data.lat
     lng = order_data.lng
-    
+
+    # Cliente conhecido no mesmo endereço: coordenadas do cadastro (sem geocoding)
+    customer = None
+    if (lat is None or lng is None) and (order_data.customer_id or order_data.customer_phone):
+        customer = buscar_cliente(
+            session, current_user.restaurant_id, order_data.customer_id, order_data.customer_phone
+        )
+        coords = customer and coordenadas_do_cliente(customer, order_data.address_text)
+        if coords:
+            lat, lng = coords
+
+    # Geocoding automático se lat/lng não informados
     if lat is None or lng is None:
         coords = geocode_address(order_data.address_text)
         if coords:
@@ -79,10 +116,11 @@ def create_order(
                 status_code=400,
                 detail=f"Não foi possível encontrar o endereço: {order_data.address_text}"
             )
-    
-    # Gera IDs amigáveis
-    short_id = generate_short_id(current_user.restaurant_id, session)
-    tracking_code = ensure_unique_tracking_code(session)
+        # Cadastro ainda sem coordenadas (background task pendente ou falhou): já guarda
+        if customer and customer.lat is None and mesmo_endereco(order_data.address_text, customer.address):
+            customer.lat, customer.lng = lat, lng
+            session.add(customer)
+            session.commit()
 
     order = Order(
         customer_name=order_data.customer_name,
@@ -92,26 +130,181 @@ def create_order(
         prep_type=order_data.prep_type,
         status=OrderStatus.PREPARING,  # Pedido já inicia em preparo (simplificado)
         created_at=created_at,
-        restaurant_id=current_user.restaurant_id,  # 🔒 PROTEÇÃO: vincula ao restaurante
-        short_id=short_id,
-        tracking_code=tracking_code
+        restaurant_id=current_user.restaurant_id  # 🔒 PROTEÇÃO: vincula ao restaurante
     )
 
-    session.add(order)
-    session.commit()
+    # Gera IDs amigáveis e grava (outro bloco se o tracking_code já existir)
+    gravar_pedidos(session, current_user.restaurant_id, [order])
     session.refresh(order)
+
+    # QR Codes prontos antes de alguém pedir (depois da resposta)
+    background_tasks.add_task(pregerar_qrcodes, [order.id])
     
     return order
 
 
+# Máximo de pedidos por chamada de POST /orders/bulk
+MAX_PEDIDOS_LOTE = 500
+
+# Máximo do corpo de POST /orders/bulk (~2 KB por pedido): conferido antes de parsear
+MAX_CORPO_LOTE_BYTES = 1024 * 1024
+
+
+async def _ler_corpo(request: Request) -> bytes:
+    """
+    Corpo de /orders/bulk com limite de tamanho (413 antes de parsear)
+
+    Content-Length acima do limite é recusado sem ler nada; sem o
+    cabeçalho (chunked), a leitura para assim que passa do limite.
+    """
+    erro = HTTPException(
+        status_code=413,
+        detail=f"Corpo maior que {MAX_CORPO_LOTE_BYTES // 1024} KB (máximo de {MAX_PEDIDOS_LOTE} pedidos)"
+    )
+    tamanho = request.headers.get("content-length", "")
+    if tamanho.isdigit() and int(tamanho) > MAX_CORPO_LOTE_BYTES:
+        raise erro
+
+    partes, total = [], 0
+    async for parte in request.stream():
+        total += len(parte)
+        if total > MAX_CORPO_LOTE_BYTES:
+            raise erro
+        partes.append(parte)
+    return b"".join(partes)
+
+
+def _ler_lote(corpo: bytes, content_type: str) -> List:
+    """
+    Itens do corpo de /orders/bulk: array JSON ou NDJSON (um pedido por linha)
+
+    Linha NDJSON que não é JSON (ou não é UTF-8) vira um item com o erro
+    (não derruba o lote).
+    """
+    if "ndjson" in content_type or "jsonlines" in content_type:
+        itens = []
+        for linha in corpo.splitlines():
+            if not linha.strip():
+                continue
+            try:
+                # UnicodeDecodeError também é ValueError
+                itens.append(json.loads(linha.decode("utf-8")))
+            except ValueError as erro:
+                itens.append(erro)
+        return itens
+
+    try:
+        itens = json.loads(corpo)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Corpo inválido: envie um array JSON ou NDJSON")
+    if not isinstance(itens, list):
+        raise HTTPException(status_code=400, detail="Corpo inválido: envie um array JSON ou NDJSON")
+    return itens
+
+
+@router.post("/bulk", response_model=OrderBulkResponse)
+async def create_orders_bulk(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    escritor: Escritor = Depends(get_escritor),
+    session: AsyncSession = Depends(get_async_read_session),
+    current_user: AuthenticatedUser = Depends(get_current_user_async)
+):
+    """
+    Cria vários pedidos de uma vez (integrações: agregadores, PDV)
+
+    Corpo: array JSON de pedidos (mesmo formato de POST /orders) ou NDJSON
+    (Content-Type: application/x-ndjson, um pedido por linha).
+
+    - Endereços sem lat/lng: coordenadas do cadastro do cliente (customer_id
+      ou customer_phone) e, sem elas, geocoding em paralelo, pelo cache
+    - short_ids e códigos de rastreio reservados em bloco
+    - Todos os pedidos válidos gravados numa transação só (se o banco
+      recusar o lote, um por um)
+    - Corpo acima de MAX_CORPO_LOTE_BYTES: 413 antes de ler/parsear
+
+    Resposta com um resultado por item, na ordem enviada: item inválido,
+    endereço não encontrado ou recusado pelo banco vem com `error` e não
+    impede os demais.
+    🔒 Todos os pedidos são vinculados ao restaurante do usuário logado.
+    """
+    if not current_user.restaurant_id:
+        raise HTTPException(
+            status_code=400,
+            detail="Usuário não está vinculado a nenhum restaurante"
+        )
+
+    itens = _ler_lote(await _ler_corpo(request), request.headers.get("content-type", ""))
+    if len(itens) > MAX_PEDIDOS_LOTE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Máximo de {MAX_PEDIDOS_LOTE} pedidos por chamada (recebidos: {len(itens)})"
+        )
+
+    resultados = [OrderBulkItemResult(index=i, ok=False) for i in range(len(itens))]
+    validos = []  # (posição, dados)
+    for i, item in enumerate(itens):
+        if isinstance(item, ValueError):
+            resultados[i].error = f"JSON inválido: {item}"
+            continue
+        try:
+            validos.append((i, OrderCreate.model_validate(item)))
+        except ValidationError as erro:
+            resultados[i].error = "; ".join(
+                f"{'.'.join(map(str, e['loc'])) or 'pedido'}: {e['msg']}" for e in erro.errors()
+            )
+
+    # Coordenadas do cadastro dos clientes conhecidos (uma query para o lote)
+    faltando = [(i, dados) for i, dados in validos if dados.lat is None or dados.lng is None]
+    do_cadastro = await session.run_sync(
+        coordenadas_de_clientes, current_user.restaurant_id, [dados for _, dados in faltando]
+    )
+    do_cadastro = {faltando[j][0]: coords for j, coords in do_cadastro.items()}
+
+    # Geocoding (em paralelo) só dos que continuam sem coordenadas
+    sem_coordenadas = [dados.address_text for i, dados in faltando if i not in do_cadastro]
+    coordenadas = await geocode_addresses_async(sem_coordenadas) if sem_coordenadas else {}
+
+    para_criar = []  # (posição, (dados, lat, lng))
+    for i, dados in validos:
+        lat, lng = dados.lat, dados.lng
+        if lat is None or lng is None:
+            coords = do_cadastro.get(i) or coordenadas.get(dados.address_text)
+            if not coords:
+                resultados[i].error = f"Não foi possível encontrar o endereço: {dados.address_text}"
+                continue
+            lat, lng = coords
+        para_criar.append((i, (dados, lat, lng)))
+
+    criados = []
+    if para_criar:
+        gravados = await escritor.executar(
+            inserir_pedidos_em_lote, current_user.restaurant_id, [item for _, item in para_criar]
+        )
+        for (i, _), pedido in zip(para_criar, gravados):
+            if isinstance(pedido, str):
+                resultados[i].error = pedido
+                continue
+            resultados[i].ok = True
+            resultados[i].order = OrderResponse.model_validate(pedido)
+            criados.append(pedido.id)
+        background_tasks.add_task(pregerar_qrcodes, criados)
+
+    return OrderBulkResponse(
+        created=len(criados),
+        failed=len(itens) - len(criados),
+        results=resultados
+    )
+
+
 @router.get("", response_model=List[OrderResponse])
 def list_orders(
     status: OrderStatus = None,
     limit: int = 50,
     date_from: str = None,  # Formato: YYYY-MM-DD
     date_to: str = None,    # Formato: YYYY-MM-DD
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    session: Session = Depends(get_read_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Lista pedidos do restaurante do usuário logado
@@ -157,8 +350,8 @@ def list_orders(
 @router.get("/search", response_model=List[OrderResponse])
 def search_orders(
     q: str,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    session: Session = Depends(get_read_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     🔍 Busca pedidos para rastreamento (atendente)
@@ -268,7 +461,7 @@ def search_orders(
 def get_order(
     order_id: str, 
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Busca um pedido pelo ID (apenas do próprio restaurante)
@@ -284,24 +477,53 @@ def get_order(
     return order
 
 
+# O QR de um pedido nunca muda: navegador e impressora podem guardar para sempre
+CACHE_CONTROL_QRCODE = "private, max-age=31536000, immutable"
+
+
+def _pedido_para_qrcode(session: Session, order_id: str, current_user: AuthenticatedUser) -> Order:
+    order = session.get(Order, order_id)
+    if not order:
+        raise HTTPException(status_code=404, detail="Pedido não encontrado")
+
+    # 🔒 PROTEÇÃO
+    if order.restaurant_id != current_user.restaurant_id:
+        raise HTTPException(status_code=404, detail="Pedido não encontrado")
+    return order
+
+
+def _nao_modificado(request: Request, etag: str) -> Optional[Response]:
+    """304 se o cliente já tem essa versão (If-None-Match)"""
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers={"ETag": etag, "Cache-Control": CACHE_CONTROL_QRCODE})
+    return None
+
+
 @router.get("/{order_id}/qrcode")
 def get_order_qrcode(
     order_id: str, 
+    request: Request,
+    response: Response,
+    size: int = Query(200, ge=64, le=2048),
+    format: str = Query("png", pattern="^(png|svg)$"),
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
-    Retorna o QR Code do pedido como base64
+    Retorna o QR Code do pedido como base64 (PNG ou SVG)
+
+    Imagem gerada uma vez e guardada (memória + disco); com ETag.
     """
-    order = session.get(Order, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    # 🔒 PROTEÇÃO
-    if order.restaurant_id != current_user.restaurant_id:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    qr_base64 = generate_qrcode_base64(order_id)
+    _pedido_para_qrcode(session, order_id, current_user)
+
+    etag = etag_qrcode(order_id, size, format, base64=True)
+    nao_modificado = _nao_modificado(request, etag)
+    if nao_modificado:
+        return nao_modificado
+
+    qr_base64 = generate_qrcode_base64(order_id, size, format)
+    response.headers["ETag"] = etag
+    response.headers["Cache-Control"] = CACHE_CONTROL_QRCODE
     
     return {
         "order_id": order_id,
@@ -309,218 +531,186 @@ def get_order_qrcode(
     }
 
 
+def _imagem_qrcode(
+    request: Request,
+    session: Session,
+    current_user: AuthenticatedUser,
+    order_id: str,
+    size: Optional[int],
+    formato: str,
+    disposition: str
+) -> Response:
+    _pedido_para_qrcode(session, order_id, current_user)
+
+    etag = etag_qrcode(order_id, size, formato)
+    nao_modificado = _nao_modificado(request, etag)
+    if nao_modificado:
+        return nao_modificado
+
+    return Response(
+        content=generate_qrcode_bytes(order_id, size, formato),
+        media_type=FORMATOS[formato],
+        headers={
+            "Content-Disposition": f"{disposition}; filename=pedido-{order_id[:8]}.{formato}",
+            "ETag": etag,
+            "Cache-Control": CACHE_CONTROL_QRCODE,
+        }
+    )
+
+
 @router.get("/{order_id}/qrcode.png")
 def download_order_qrcode(
     order_id: str, 
+    request: Request,
+    size: Optional[int] = Query(None, ge=64, le=2048),
     session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    current_user: AuthenticatedUser = Depends(get_current_user)
 ):
     """
     Download do QR Code como imagem PNG
+
+    Sem `size`: tamanho natural (10 px por módulo). Imagem guardada; com ETag.
     """
-    order = session.get(Order, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    # 🔒 PROTEÇÃO
-    if order.restaurant_id != current_user.restaurant_id:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    qr_bytes = generate_qrcode_bytes(order_id)
-    
+    return _imagem_qrcode(request, session, current_user, order_id, size, "png", "attachment")
+
+
+@router.get("/{order_id}/qrcode.svg")
+def get_order_qrcode_svg(
+    order_id: str,
+    request: Request,
+    size: Optional[int] = Query(None, ge=64, le=2048),
+    session: Session = Depends(get_session),
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """
+    QR Code como SVG (vetorial: bem mais barato de gerar que o PNG e nítido
+    em qualquer impressora)
+    """
+    return _imagem_qrcode(request, session, current_user, order_id, size, "svg", "inline")
+
+
+@router.post("/qrcodes/sheet")
+def print_qrcode_sheet(
+    data: QRSheetRequest,
+    session: Session = Depends(get_session),  # Primário: imprime pedidos recém-criados
+    current_user: AuthenticatedUser = Depends(get_current_user)
+):
+    """
+    Folha de etiquetas (QR + número + cliente) de vários pedidos de uma vez
+
+    PDF A4 (várias páginas se preciso) ou PNG, numa requisição só - em vez
+    de um /qrcode.png por pedido na hora do rush. Etiquetas na ordem de
+    `order_ids`.
+
+    Lê do primário, não da réplica: a cozinha imprime logo depois de
+    criar os pedidos (réplica atrasada = 404 na folha inteira).
+
+    🔒 Só pedidos do restaurante do usuário (outro ID = 404)
+    """
+    order_ids = list(dict.fromkeys(data.order_ids))
+    orders = session.exec(
+        select(Order).where(
+            Order.id.in_(order_ids),
+            Order.restaurant_id == current_user.restaurant_id  # 🔒 PROTEÇÃO
+        )
+    ).all()
+    por_id = {order.id: order for order in orders}
+
+    faltando = [order_id for order_id in order_ids if order_id not in por_id]
+    if faltando:
+        raise HTTPException(status_code=404, detail=f"Pedidos não encontrados: {', '.join(faltando)}")
+
+    etiquetas = [
+        (order.id, f"#{order.short_id}" if order.short_id else order.id[:8], order.customer_name or "")
+        for order in (por_id[order_id] for order_id in order_ids)
+    ]
+    folha = montar_folha_qrcodes(etiquetas, data.format, data.columns)
+
     return Response(
-        content=qr_bytes,
-        media_type="image/png",
-        headers={"Content-Disposition": f"attachment; filename=pedido-{order_id[:8]}.png"}
+        content=folha,
+        media_type="application/pdf" if data.format == "pdf" else "image/png",
+        headers={"Content-Disposition": f"inline; filename=etiquetas.{data.format}"}
     )
 
 
+async def executar_transicao(
+    escritor: Escritor,
+    transicao,
+    order_id: str,
+    current_user: AuthenticatedUser
+) -> Order:
+    """Roda a transição de status pela fila de escrita, traduzindo os erros para HTTP"""
+    try:
+        return await escritor.executar(transicao, order_id, current_user.restaurant_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Pedido não encontrado")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
 @router.post("/{order_id}/scan", response_model=OrderResponse)
-def scan_order(
+async def scan_order(
     order_id: str, 
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    escritor: Escritor = Depends(get_escritor),
+    current_user: AuthenticatedUser = Depends(get_current_user_async)
 ):
     """
     Marca o pedido como PRONTO (QR Code foi bipado)
     """
-    order = session.get(Order, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    # 🔒 PROTEÇÃO
-    if order.restaurant_id != current_user.restaurant_id:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    if order.status not in [OrderStatus.CREATED, OrderStatus.PREPARING]:
-        raise HTTPException(
-            status_code=400, 
-            detail=f"Pedido não pode ser bipado (status atual: {order.status})"
-        )
-    
-    order.status = OrderStatus.READY
-    order.ready_at = datetime.now()
-    
-    session.add(order)
-    session.commit()
-    session.refresh(order)
-    
-    return order
+    return await executar_transicao(escritor, bipar_pedido, order_id, current_user)
 
 
 @router.post("/{order_id}/preparing", response_model=OrderResponse)
-def start_preparing(
+async def start_preparing(
     order_id: str, 
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    escritor: Escritor = Depends(get_escritor),
+    current_user: AuthenticatedUser = Depends(get_current_user_async)
 ):
     """
     Marca o pedido como EM PREPARO
     """
-    order = session.get(Order, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    # 🔒 PROTEÇÃO
-    if order.restaurant_id != current_user.restaurant_id:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    if order.status != OrderStatus.CREATED:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Pedido não pode iniciar preparo (status atual: {order.status})"
-        )
-    
-    order.status = OrderStatus.PREPARING
-    
-    session.add(order)
-    session.commit()
-    session.refresh(order)
-    
-    return order
+    return await executar_transicao(escritor, iniciar_preparo, order_id, current_user)
 
 
 @router.post("/{order_id}/pickup", response_model=OrderResponse)
-def pickup_order(
+async def pickup_order(
     order_id: str, 
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    escritor: Escritor = Depends(get_escritor),
+    current_user: AuthenticatedUser = Depends(get_current_user_async)
 ):
     """
     Marca o pedido como COLETADO pelo motoqueiro
     """
-    order = session.get(Order, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    # 🔒 PROTEÇÃO
-    if order.restaurant_id != current_user.restaurant_id:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    if order.status != OrderStatus.ASSIGNED:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Pedido não pode ser coletado (status atual: {order.status})"
-        )
-    
-    order.status = OrderStatus.PICKED_UP
-    
-    session.add(order)
-    session.commit()
-    session.refresh(order)
-    
-    return order
+    return await executar_transicao(escritor, coletar_pedido, order_id, current_user)
 
 
 @router.post("/{order_id}/deliver", response_model=OrderResponse)
-def deliver_order(
+async def deliver_order(
     order_id: str, 
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    escritor: Escritor = Depends(get_escritor),
+    current_user: AuthenticatedUser = Depends(get_current_user_async)
 ):
     """
     Marca o pedido como ENTREGUE
     """
-    order = session.get(Order, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    # 🔒 PROTEÇÃO
-    if order.restaurant_id != current_user.restaurant_id:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-    
-    if order.status != OrderStatus.PICKED_UP:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Pedido não pode ser entregue (status atual: {order.status})"
-        )
-    
-    order.status = OrderStatus.DELIVERED
-    order.delivered_at = datetime.now()
-
-    session.add(order)
-    session.commit()
-    session.refresh(order)
-
-    return order
+    return await executar_transicao(escritor, entregar_pedido, order_id, current_user)
 
 
 @router.post("/{order_id}/cancel", response_model=OrderResponse)
-def cancel_order(
+async def cancel_order(
     order_id: str,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    escritor: Escritor = Depends(get_escritor),
+    current_user: AuthenticatedUser = Depends(get_current_user_async)
 ):
     """
     Cancela um pedido.
     Só pode cancelar pedidos que ainda não foram coletados pelo motoboy.
     """
-    order = session.get(Order, order_id)
-    if not order:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-
-    # 🔒 PROTEÇÃO
-    if order.restaurant_id != current_user.restaurant_id:
-        raise HTTPException(status_code=404, detail="Pedido não encontrado")
-
-    # Só pode cancelar se ainda não foi coletado
-    if order.status in [OrderStatus.PICKED_UP, OrderStatus.DELIVERED, OrderStatus.CANCELLED]:
-        raise HTTPException(
-            status_code=400,
-            detail=f"Pedido não pode ser cancelado (status atual: {order.status})"
-        )
-
-    # Se estava em um batch, verifica se precisa liberar o motoboy
-    if order.batch_id:
-        batch = session.get(Batch, order.batch_id)
-        if batch and batch.courier_id:
-            courier = session.get(Courier, batch.courier_id)
-            if courier and courier.status == CourierStatus.BUSY:
-                # Verifica se não tem outros pedidos ativos no batch
-                other_orders = session.exec(
-                    select(Order).where(
-                        Order.batch_id == batch.id,
-                        Order.id != order.id,
-                        Order.status.in_([OrderStatus.ASSIGNED, OrderStatus.PICKED_UP])
-                    )
-                ).all()
-                if not other_orders:
-                    courier.status = CourierStatus.AVAILABLE
-                    session.add(courier)
-
-    order.status = OrderStatus.CANCELLED
-    order.cancelled_at = datetime.now()
-    order.batch_id = None  # Remove do lote
-
-    session.add(order)
-    session.commit()
-    session.refresh(order)
-
-    return order
+    return await executar_transicao(escritor, cancelar_pedido, order_id, current_user)
 
 
 @router.get("/track/{tracking_code}", response_model=OrderTrackingResponse)
-def track_order(tracking_code: str, session: Session = Depends(get_session)):
+async def track_order(tracking_code: str, session: AsyncSession = Depends(get_async_read_session)):
     """
     🌐 Endpoint PÚBLICO de rastreamento de pedido (sem autenticação)
 
@@ -531,14 +721,14 @@ def track_order(tracking_code: str, session: Session = Depends(get_session)):
         tracking_code: Código de rastreio do pedido (ex: MF-A3B7K9)
 
     Returns:
-        OrderTrackingResponse: Informações básicas do pedido (status, timestamps)
+        OrderTrackingResponse: Informações básicas do pedido (status, timestamps, ETA)
 
     Raises:
         404: Se o código de rastreio não for encontrado
     """
     # Busca o pedido pelo tracking_code
     statement = select(Order).where(Order.tracking_code == tracking_code)
-    order = session.exec(statement).first()
+    order = (await session.exec(statement)).first()
 
     if not order:
         raise HTTPException(
@@ -555,15 +745,16 @@ def track_order(tracking_code: str, session: Session = Depends(get_session)):
         ready_at=order.ready_at,
         delivered_at=order.delivered_at,
         customer_name=order.customer_name,
-        address_text=order.address_text
+        address_text=order.address_text,
+        eta=await session.run_sync(build_order_eta, order)
     )
 
 
 @router.get("/{order_id}/tracking-details", response_model=OrderTrackingDetails)
-def get_order_tracking_details(
+async def get_order_tracking_details(
     order_id: str,
-    session: Session = Depends(get_session),
-    current_user: User = Depends(get_current_user)
+    session: AsyncSession = Depends(get_async_read_session),
+    current_user: AuthenticatedUser = Depends(get_current_user_async)
 ):
     """
     🗺️ Retorna detalhes completos de rastreamento do pedido
@@ -574,14 +765,27 @@ def get_order_tracking_details(
     - Posição na fila (ex: 2º de 3 entregas)
     - Dados do motoboy (nome, GPS)
     - Polyline da rota completa
+    - ETA (previsão de chegada) enquanto o pedido está em rota
 
     🔒 PROTEÇÃO: Retorna apenas pedidos do restaurante do usuário logado
     """
-    # Buscar pedido
-    order = session.get(Order, order_id)
-    if not order:
+    # Pedido + lote + motoboy + restaurante + pedidos do lote em UMA query
+    # (uma linha por pedido do lote; pedido sem lote volta uma linha só)
+    irmao = aliased(Order)
+    linhas = (await session.exec(
+        select(Order, Batch, Courier, Restaurant, irmao)
+        .outerjoin(Batch, Batch.id == Order.batch_id)
+        .outerjoin(Courier, Courier.id == Batch.courier_id)
+        .outerjoin(Restaurant, Restaurant.id == Batch.restaurant_id)
+        .outerjoin(irmao, irmao.batch_id == Batch.id)
+        .where(Order.id == order_id)
+        .order_by(irmao.stop_order)
+    )).all()
+    if not linhas:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
 
+    order, batch, courier, restaurant, _ = linhas[0]
+
     # 🔒 PROTEÇÃO: verifica se pedido é do restaurante do usuário
     if order.restaurant_id != current_user.restaurant_id:
         raise HTTPException(status_code=404, detail="Pedido não encontrado")
@@ -608,88 +812,72 @@ def get_order_tracking_details(
     courier_info = None
     route_info = None
 
-    # Se pedido tem lote, buscar informações do lote
-    if order.batch_id:
-        batch = session.get(Batch, order.batch_id)
-
-        if batch:
-            # Buscar todos os pedidos do lote ordenados
-            batch_orders_statement = select(Order).where(
-                Order.batch_id == order.batch_id
-            ).order_by(Order.stop_order)
-            batch_orders = session.exec(batch_orders_statement).all()
-
-            # Criar lista de SimpleOrder
-            simple_orders = [
-                SimpleOrder(
-                    id=o.id,
-                    short_id=o.short_id,
-                    customer_name=o.customer_name,
-                    address_text=o.address_text,
-                    lat=o.lat,
-                    lng=o.lng,
-                    status=o.status,
-                    stop_order=o.stop_order
-                )
-                for o in batch_orders
-            ]
-
-            # Criar BatchInfo
-            batch_info = BatchInfo(
-                id=batch.id,
-                status=batch.status,
-                position=order.stop_order if order.stop_order else 0,
-                total=len(batch_orders),
-                orders=simple_orders
+    # Se pedido tem lote, montar informações do lote
+    if batch:
+        batch_orders = [linha[4] for linha in linhas if linha[4] is not None]
+
+        # Criar lista de SimpleOrder
+        simple_orders = [
+            SimpleOrder(
+                id=o.id,
+                short_id=o.short_id,
+                customer_name=o.customer_name,
+                address_text=o.address_text,
+                lat=o.lat,
+                lng=o.lng,
+                status=o.status,
+                stop_order=o.stop_order
             )
+            for o in batch_orders
+        ]
+
+        # Criar BatchInfo
+        batch_info = BatchInfo(
+            id=batch.id,
+            status=batch.status,
+            position=order.stop_order if order.stop_order else 0,
+            total=len(batch_orders),
+            orders=simple_orders
+        )
 
-            # Buscar informações do motoboy
-            if batch.courier_id:
-                courier = session.get(Courier, batch.courier_id)
-                if courier:
-                    courier_info = CourierInfo(
-                        id=courier.id,
-                        name=courier.name if not courier.last_name else f"{courier.name} {courier.last_name}",
-                        phone=courier.phone,
-                        current_lat=courier.last_lat,
-                        current_lng=courier.last_lng,
-                        status=courier.status
-                    )
+        # Informações do motoboy
+        if courier:
+            # Posição mais fresca (índice espacial, antes da descarga do GPS)
+            current_lat, current_lng, _ = posicao_mais_recente(courier)
+            courier_info = CourierInfo(
+                id=courier.id,
+                name=courier.name if not courier.last_name else f"{courier.name} {courier.last_name}",
+                phone=courier.phone,
+                current_lat=current_lat,
+                current_lng=current_lng,
+                status=courier.status
+            )
 
-            # Buscar rota do lote
-            route_data = get_batch_route_polyline(session, order.batch_id)
-            if route_data:
-                # Converter waypoints para o schema Waypoint
-                waypoints = []
-                if "orders" in route_data:
-                    for i, waypoint_data in enumerate(route_data["orders"]):
-                        # Buscar o pedido correspondente para obter mais informações
-                        if i < len(batch_orders):
-                            corresponding_order = batch_orders[i]
-                            waypoints.append(Waypoint(
-                                lat=waypoint_data["lat"],
-                                lng=waypoint_data["lng"],
-                                address=waypoint_data.get("address", ""),
-                                order_id=corresponding_order.id,
-                                customer_name=corresponding_order.customer_name
-                            ))
-                        else:
-                            waypoints.append(Waypoint(
-                                lat=waypoint_data["lat"],
-                                lng=waypoint_data["lng"],
-                                address=waypoint_data.get("address", "")
-                            ))
-
-                route_info = RouteInfo(
-                    polyline=route_data.get("polyline", ""),
-                    start=route_data.get("start", {}),
-                    waypoints=waypoints
-                )
+        # Rota do lote (polyline em cache - Google só quando a rota é nova)
+        if batch_orders:
+            start_lat, start_lng = await session.run_sync(get_route_origin, restaurant)
+            # Rota nova chama o Google (HTTP bloqueante) - fora do event loop
+            polyline = await run_in_threadpool(get_route_polyline_cached, batch_orders, start_lat, start_lng)
+            route_info = RouteInfo(
+                polyline=polyline or "",
+                start={"lat": start_lat, "lng": start_lng},
+                waypoints=[
+                    Waypoint(
+                        lat=o.lat,
+                        lng=o.lng,
+                        address=o.address_text,
+                        order_id=o.id,
+                        customer_name=o.customer_name
+                    )
+                    for o in batch_orders
+                ]
+            )
 
     # Retornar resposta completa
     return OrderTrackingDetails(
         order=order_response,
         batch=batch_info,
         courier=courier_info,
-        route=route_info
+        route=route_info,
+        eta=await session.run_sync(build_order_eta, order)
     )
@@ -8,16 +8,9 @@ from datetime import datetime
 from typing import List, Optional
 from dataclasses import dataclass, field
 from enum import Enum
-from sqlmodel import Session, select
+from sqlmodel import Session
 
-from models import Order, Courier, OrderStatus, CourierStatus
-from services.metrics_service import (
-    calcular_tempo_preparo, 
-    calcular_tempo_rota, 
-    contar_pedidos_hora,
-    contar_motoboys,
-    calcular_motoboys_necessarios
-)
+from services.live_state_service import obter_foto_operacional, FotoOperacional
 
 
 class TipoAlerta(Enum):
@@ -73,19 +66,26 @@ def gerar_alertas(
     - Se tem pedidos prontos e poucos motoboys disponíveis → Alerta
     - Se não tem pedidos prontos → Tudo OK
     """
+    # Foto operacional em memória (já com filtro)
+    return avaliar_alertas(obter_foto_operacional(session, restaurant_id))
+
+
+def avaliar_alertas(foto: FotoOperacional) -> ResultadoAlertas:
+    """
+    Gera os alertas a partir de uma foto operacional (sem acesso ao banco)
+
+    Usado por gerar_alertas e pelo canal de eventos em tempo real.
+    """
     alertas: List[Alerta] = []
     status_geral = StatusGeral.SUCESSO
     
     # ===== Coleta de dados =====
     
     # Pedidos na fila (prontos, aguardando motoboy)
-    query_fila = select(Order).where(Order.status == OrderStatus.READY)
-    if restaurant_id:
-        query_fila = query_fila.where(Order.restaurant_id == restaurant_id)
-    pedidos_fila = len(session.exec(query_fila).all())
+    pedidos_fila = foto.pedidos_fila
     
-    # Motoboys (já com filtro)
-    disponiveis, ocupados = contar_motoboys(session, restaurant_id)
+    # Motoboys
+    disponiveis, ocupados = foto.motoboys_disponiveis, foto.motoboys_ocupados
     total_ativos = disponiveis + ocupados
     
     # ===== CENÁRIO 1: Nenhum motoboy ativo e tem pedidos =====
@@ -147,19 +147,14 @@ def gerar_alertas(
     # ===== CENÁRIO 3: Sem pedidos prontos =====
     else:
         # Verifica se tem pedidos em rota (operação ativa)
-        query_rota = select(Order).where(
-            Order.status.in_([OrderStatus.ASSIGNED, OrderStatus.PICKED_UP])
-        )
-        if restaurant_id:
-            query_rota = query_rota.where(Order.restaurant_id == restaurant_id)
-        pedidos_em_rota = len(session.exec(query_rota).all())
+        em_rota = foto.pedidos_em_rota
         
-        if pedidos_em_rota > 0:
+        if em_rota > 0:
             # Operação ativa, tudo fluindo
             alertas.append(Alerta(
                 tipo=TipoAlerta.SUCESSO,
                 titulo="Operação fluindo bem!",
-                mensagem=f"{pedidos_em_rota} pedido(s) em rota, nenhum acumulado",
+                mensagem=f"{em_rota} pedido(s) em rota, nenhum acumulado",
                 icone="✅",
                 acao_sugerida=None,
                 valor=0
@@ -190,6 +185,26 @@ def gerar_alertas(
     )
 
 
+def alertas_para_dict(resultado: ResultadoAlertas) -> dict:
+    """Formato JSON dos alertas (resposta de /dispatch/alerts e eventos)"""
+    return {
+        "status_geral": resultado.status_geral.value,
+        "motoboys_sugeridos": resultado.motoboys_sugeridos,
+        "alertas": [
+            {
+                "tipo": a.tipo.value,
+                "titulo": a.titulo,
+                "mensagem": a.mensagem,
+                "icone": a.icone,
+                "acao_sugerida": a.acao_sugerida,
+                "valor": a.valor
+            }
+            for a in resultado.alertas
+        ],
+        "timestamp": resultado.timestamp.isoformat()
+    }
+
+
 def calcular_previsao_motoboys(
     session: Session,
     restaurant_id: str = None  # 🔒 PROTEÇÃO
@@ -205,26 +220,17 @@ def calcular_previsao_motoboys(
     - Se disponíveis >= prontos → Adequado
     - Se disponíveis < prontos → Precisa de mais
     """
-    # Dados atuais (com filtro de restaurant_id)
-    tempo_preparo, amostras_preparo = calcular_tempo_preparo(session, None, restaurant_id)
-    tempo_rota, amostras_rota = calcular_tempo_rota(session, restaurant_id)
-    pedidos_hora = contar_pedidos_hora(session, restaurant_id)
-    disponiveis, ocupados = contar_motoboys(session, restaurant_id)
+    # Dados atuais (com filtro de restaurant_id) - foto operacional em memória
+    foto = obter_foto_operacional(session, restaurant_id)
+    tempo_preparo, amostras_preparo = foto.tempos_24h.tempo_preparo()
+    tempo_rota, amostras_rota = foto.tempos_24h.tempo_rota()
+    pedidos_hora = foto.pedidos_ultima_hora
+    disponiveis, ocupados = foto.motoboys_disponiveis, foto.motoboys_ocupados
     total_ativos = disponiveis + ocupados
     
-    # Pedidos na fila (READY esperando)
-    query_fila = select(Order).where(Order.status == OrderStatus.READY)
-    if restaurant_id:
-        query_fila = query_fila.where(Order.restaurant_id == restaurant_id)
-    pedidos_fila = len(session.exec(query_fila).all())
-    
-    # Pedidos em rota
-    query_rota = select(Order).where(
-        Order.status.in_([OrderStatus.ASSIGNED, OrderStatus.PICKED_UP])
-    )
-    if restaurant_id:
-        query_rota = query_rota.where(Order.restaurant_id == restaurant_id)
-    pedidos_em_rota = len(session.exec(query_rota).all())
+    # Pedidos na fila (READY esperando) e em rota
+    pedidos_fila = foto.pedidos_fila
+    em_rota = foto.pedidos_em_rota
     
     # Capacidade por motoboy (se tiver dados)
     capacidade = None
@@ -246,7 +252,7 @@ def calcular_previsao_motoboys(
             "pedidos_por_hora": pedidos_hora,
             "capacidade_por_motoboy": capacidade,
             "pedidos_na_fila": 0,
-            "pedidos_em_rota": pedidos_em_rota,
+            "pedidos_em_rota": em_rota,
             "dados_suficientes": amostras_rota >= 5,
             "timestamp": datetime.now().isoformat()
         }
@@ -290,7 +296,7 @@ def calcular_previsao_motoboys(
         "pedidos_por_hora": pedidos_hora,
         "capacidade_por_motoboy": capacidade,
         "pedidos_na_fila": pedidos_fila,
-        "pedidos_em_rota": pedidos_em_rota,
+        "pedidos_em_rota": em_rota,
         "dados_suficientes": amostras_rota >= 5,
         "timestamp": datetime.now().isoformat()
     }
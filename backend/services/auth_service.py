@@ -7,20 +7,28 @@ EXPLICAÇÃO SIMPLES:
 - bcrypt: Transforma "senha123" em "$2b$12$xyz..." (impossível reverter)
 - JWT: Cria um "crachá digital" que expira em X horas
 """
+import hashlib
 import os
+import threading
+import time
+from dataclasses import dataclass
 from datetime import datetime, timedelta
-from typing import Optional
+from typing import Dict, Optional, Set, Tuple
 import re
 import unicodedata
 
-import bcrypt
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
+from sqlalchemy import event
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 
-from database import get_session
-from models import User, Restaurant
+from database import get_session, get_async_session
+from models import User, UserRole, Restaurant
+from services.credential_service import (
+    gerar_hash, conferir_senha, gerar_hash_async, conferir_e_atualizar_async
+)
 
 
 # ============ CONFIGURAÇÕES ============
@@ -47,6 +55,10 @@ if not SECRET_KEY:
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_HOURS = 24  # Token válido por 24 horas
 
+# Por quanto tempo o usuário de um token fica em cache (sem ir ao banco)
+AUTH_CACHE_SECONDS = float(os.environ.get("AUTH_CACHE_SECONDS", "60"))
+MAX_TOKENS_CACHE = 10000
+
 
 # ============ HASH DE SENHA (bcrypt) ============
 
@@ -58,14 +70,10 @@ def hash_password(password: str) -> str:
     
     Mesmo se alguém roubar o banco, não consegue
     descobrir a senha original!
+    
+    O bcrypt roda no pool de processos do credential_service.
     """
-    # Converte string para bytes
-    password_bytes = password.encode('utf-8')
-    # Gera o salt e faz o hash
-    salt = bcrypt.gensalt()
-    hashed = bcrypt.hashpw(password_bytes, salt)
-    # Retorna como string
-    return hashed.decode('utf-8')
+    return gerar_hash(password)
 
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
@@ -74,9 +82,22 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
     
     verify_password("senha123", "$2b$12$LQv3c1yqBw...") → True ou False
     """
-    password_bytes = plain_password.encode('utf-8')
-    hashed_bytes = hashed_password.encode('utf-8')
-    return bcrypt.checkpw(password_bytes, hashed_bytes)
+    return conferir_senha(plain_password, hashed_password)
+
+
+async def hash_password_async(password: str) -> str:
+    """hash_password para rotas `async def` (espera o pool sem bloquear o event loop)"""
+    return await gerar_hash_async(password)
+
+
+async def verify_password_and_update_async(plain_password: str, hashed_password: str) -> Tuple[bool, Optional[str]]:
+    """
+    Verifica a senha no login e devolve um hash novo se o custo do bcrypt
+    aumentou desde o cadastro (None se não precisa trocar)
+
+    Async: as rotas de login esperam o pool sem bloquear o event loop.
+    """
+    return await conferir_e_atualizar_async(plain_password, hashed_password)
 
 
 # ============ JWT (Token) ============
@@ -122,6 +143,102 @@ def decode_token(token: str) -> dict:
         )
 
 
+# ============ USUÁRIO LOGADO (CACHE) ============
+
+@dataclass(frozen=True)
+class AuthenticatedUser:
+    """
+    Quem está fazendo a requisição - só o que as rotas usam do User
+
+    Imutável e fora da Session: pode ser guardado em cache entre requisições.
+    Para os demais campos (nome, último login...) carregue o User pelo id.
+    """
+    id: str
+    restaurant_id: str
+    role: UserRole
+    email: str
+    active: bool
+
+
+# sha256(token) → (usuário, expira em [time.monotonic])
+_usuarios_por_token: Dict[str, Tuple[AuthenticatedUser, float]] = {}
+# user_id → hashes dos tokens em cache (para invalidar)
+_tokens_do_usuario: Dict[str, Set[str]] = {}
+_cache_lock = threading.Lock()
+
+
+def _hash_token(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+def _usuario_em_cache(chave: str) -> Optional[AuthenticatedUser]:
+    with _cache_lock:
+        em_cache = _usuarios_por_token.get(chave)
+        if em_cache is None:
+            return None
+        if em_cache[1] <= time.monotonic():
+            _esquecer_token(chave)
+            return None
+        return em_cache[0]
+
+
+def _guardar_usuario(chave: str, usuario: AuthenticatedUser, token_expira_em: Optional[float]) -> None:
+    """Guarda por AUTH_CACHE_SECONDS - nunca além da expiração do próprio token"""
+    expira_em = time.monotonic() + AUTH_CACHE_SECONDS
+    if token_expira_em is not None:
+        expira_em = min(expira_em, time.monotonic() + (token_expira_em - time.time()))
+    with _cache_lock:
+        if len(_usuarios_por_token) >= MAX_TOKENS_CACHE:
+            _esquecer_token(next(iter(_usuarios_por_token)))
+        _usuarios_por_token[chave] = (usuario, expira_em)
+        _tokens_do_usuario.setdefault(usuario.id, set()).add(chave)
+
+
+def _esquecer_token(chave: str) -> None:
+    """Remove um token do cache (chamar com _cache_lock)"""
+    usuario, _ = _usuarios_por_token.pop(chave)
+    tokens = _tokens_do_usuario.get(usuario.id)
+    if tokens is not None:
+        tokens.discard(chave)
+        if not tokens:
+            del _tokens_do_usuario[usuario.id]
+
+
+def invalidar_usuario(user_id: str) -> None:
+    """Tira do cache todos os tokens do usuário (desativado, trocou de papel...)"""
+    with _cache_lock:
+        for chave in list(_tokens_do_usuario.get(user_id, ())):
+            _esquecer_token(chave)
+
+
+def limpar_cache_usuarios() -> None:
+    with _cache_lock:
+        _usuarios_por_token.clear()
+        _tokens_do_usuario.clear()
+
+
+_CHAVE_USUARIOS_ALTERADOS = "auth_usuarios_alterados"
+
+
+@event.listens_for(Session, "after_flush")
+def _coletar_usuarios_alterados(session, flush_context):
+    alterados = session.info.setdefault(_CHAVE_USUARIOS_ALTERADOS, set())
+    for obj in list(session.dirty) + list(session.deleted):
+        if isinstance(obj, User):
+            alterados.add(obj.id)
+
+
+@event.listens_for(Session, "after_commit")
+def _invalidar_usuarios_alterados(session):
+    for user_id in session.info.pop(_CHAVE_USUARIOS_ALTERADOS, ()):
+        invalidar_usuario(user_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_usuarios_alterados(session):
+    session.info.pop(_CHAVE_USUARIOS_ALTERADOS, None)
+
+
 # ============ DEPENDÊNCIAS FASTAPI ============
 
 # Extrator de token do header Authorization
@@ -131,16 +248,57 @@ security = HTTPBearer()
 def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(security),
     session: Session = Depends(get_session)
-) -> User:
+) -> AuthenticatedUser:
     """
     Dependência que extrai o usuário do token
     
     Uso nas rotas:
     @app.get("/rota-protegida")
-    def rota(user: User = Depends(get_current_user)):
-        # user é o usuário logado!
+    def rota(current_user: AuthenticatedUser = Depends(get_current_user)):
+        # current_user.restaurant_id é o restaurante do usuário logado!
+    """
+    return get_user_from_token(session, credentials.credentials)
+
+
+def get_user_from_token(session: Session, token: str) -> AuthenticatedUser:
+    """
+    Valida o token e retorna o usuário ativo dono dele
+
+    Separado de get_current_user para rotas que recebem o token fora do
+    header Authorization (ex: EventSource do navegador só manda query string).
+
+    O mesmo token só vai ao banco uma vez a cada AUTH_CACHE_SECONDS; alterar
+    ou desativar o usuário tira seus tokens do cache na hora (após o commit).
+    """
+    chave = _hash_token(token)
+    usuario = _usuario_em_cache(chave)
+    if usuario is not None:
+        return usuario
+
+    payload, user_id = _validar_token(token)
+    return _guardar_usuario_do_banco(chave, payload, session.get(User, user_id))
+
+
+async def get_current_user_async(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    session: AsyncSession = Depends(get_async_session)
+) -> AuthenticatedUser:
     """
-    token = credentials.credentials
+    get_current_user para rotas `async def` (mesmo cache de tokens)
+
+    Com o token em cache não há I/O nenhum; senão o User vem pela AsyncSession.
+    """
+    chave = _hash_token(credentials.credentials)
+    usuario = _usuario_em_cache(chave)
+    if usuario is not None:
+        return usuario
+
+    payload, user_id = _validar_token(credentials.credentials)
+    return _guardar_usuario_do_banco(chave, payload, await session.get(User, user_id))
+
+
+def _validar_token(token: str) -> Tuple[dict, str]:
+    """Decodifica o token → (payload, user_id)"""
     payload = decode_token(token)
     
     user_id = payload.get("user_id")
@@ -149,19 +307,30 @@ def get_current_user(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Token inválido"
         )
-    
-    user = session.get(User, user_id)
+    return payload, user_id
+
+
+def _guardar_usuario_do_banco(chave: str, payload: dict, user: Optional[User]) -> AuthenticatedUser:
+    """Confere se o User carregado está ativo e guarda no cache de tokens"""
     if not user or not user.active:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Usuário não encontrado ou inativo"
         )
     
-    return user
+    usuario = AuthenticatedUser(
+        id=user.id,
+        restaurant_id=user.restaurant_id,
+        role=user.role,
+        email=user.email,
+        active=user.active
+    )
+    _guardar_usuario(chave, usuario, payload.get("exp"))
+    return usuario
 
 
 def get_current_restaurant(
-    user: User = Depends(get_current_user),
+    user: AuthenticatedUser = Depends(get_current_user),
     session: Session = Depends(get_session)
 ) -> Restaurant:
     """
@@ -238,20 +407,27 @@ def generate_unique_slug(session: Session, name: str) -> str:
         slug = f"{base_slug}-{counter}"
 
 
-def authenticate_user(session: Session, email: str, password: str) -> Optional[User]:
+async def authenticate_user_async(session: AsyncSession, email: str, password: str) -> Optional[User]:
     """
     Autentica usuário por email e senha
     
     Retorna o User se credenciais corretas, None se incorretas.
+    Hash com custo desatualizado é refeito (fica pendente na session).
     """
-    user = session.exec(
+    user = (await session.exec(
         select(User).where(User.email == email.lower())
-    ).first()
-    
+    )).first()
+
     if not user:
         return None
-    
-    if not verify_password(password, user.password_hash):
+
+    valid, new_hash = await verify_password_and_update_async(password, user.password_hash)
+    if not valid:
         return None
-    
+
+    if new_hash:
+        # Grava junto com o last_login do endpoint de login
+        user.password_hash = new_hash
+        session.add(user)
+
     return user
\ No newline at end of file
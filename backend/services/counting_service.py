@@ -0,0 +1,80 @@
+"""
+Serviço de Contagem - Contadores agregados direto no banco
+
+Em vez de carregar linhas inteiras só para fazer len(), usa
+COUNT(*) ... GROUP BY status: UMA query por tabela, não importa
+quantos status existam.
+
+🔒 PROTEÇÃO MULTI-TENANT:
+- Todas as contagens filtram por restaurant_id (quando informado)
+"""
+from typing import Dict, Optional
+from sqlmodel import Session, select, func
+
+from models import (
+    Order, Courier, Batch,
+    OrderStatus, CourierStatus, BatchStatus
+)
+
+
+# Status que contam como "em rota" (motoboy já está com o pedido)
+STATUS_EM_ROTA = (OrderStatus.ASSIGNED, OrderStatus.PICKED_UP)
+
+# Status de lote ativo
+STATUS_BATCH_ATIVO = (BatchStatus.ASSIGNED, BatchStatus.IN_PROGRESS)
+
+
+def contar_pedidos_por_status(
+    session: Session,
+    restaurant_id: Optional[str] = None  # 🔒 PROTEÇÃO
+) -> Dict[OrderStatus, int]:
+    """
+    Conta pedidos agrupados por status em uma única query
+
+    Retorna dict com TODOS os status (zerados quando não há pedidos)
+    """
+    query = select(Order.status, func.count()).group_by(Order.status)
+    if restaurant_id:
+        query = query.where(Order.restaurant_id == restaurant_id)
+
+    contagem = {status: 0 for status in OrderStatus}
+    for status, total in session.exec(query).all():
+        contagem[OrderStatus(status)] = total
+    return contagem
+
+
+def contar_motoboys_por_status(
+    session: Session,
+    restaurant_id: Optional[str] = None  # 🔒 PROTEÇÃO
+) -> Dict[CourierStatus, int]:
+    """
+    Conta motoboys agrupados por status em uma única query
+
+    Retorna dict com TODOS os status (zerados quando não há motoboys)
+    """
+    query = select(Courier.status, func.count()).group_by(Courier.status)
+    if restaurant_id:
+        query = query.where(Courier.restaurant_id == restaurant_id)
+
+    contagem = {status: 0 for status in CourierStatus}
+    for status, total in session.exec(query).all():
+        contagem[CourierStatus(status)] = total
+    return contagem
+
+
+def contar_batches_ativos(
+    session: Session,
+    restaurant_id: Optional[str] = None  # 🔒 PROTEÇÃO
+) -> int:
+    """Conta lotes ativos (ASSIGNED ou IN_PROGRESS)"""
+    query = select(func.count()).select_from(Batch).where(
+        Batch.status.in_(STATUS_BATCH_ATIVO)
+    )
+    if restaurant_id:
+        query = query.where(Batch.restaurant_id == restaurant_id)
+    return session.exec(query).one()
+
+
+def pedidos_em_rota(contagem: Dict[OrderStatus, int]) -> int:
+    """Soma pedidos em rota (ASSIGNED + PICKED_UP) a partir da contagem por status"""
+    return sum(contagem[status] for status in STATUS_EM_ROTA)
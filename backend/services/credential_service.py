@@ -0,0 +1,138 @@
+"""
+Serviço de Credenciais - bcrypt fora do worker que atende a requisição
+
+Cada hash/verificação bcrypt custa ~250ms de CPU. Rodando no próprio worker,
+às 19h (100 motoboys fazendo login juntos) os outros endpoints travavam.
+
+AGORA:
+- O bcrypt roda num pool de PROCESSOS limitado (BCRYPT_WORKERS): no máximo
+  N senhas sendo processadas ao mesmo tempo, sem disputar o GIL
+- O endpoint só espera o resultado: rotas de login, convite e troca de
+  senha são async e esperam com await, sem ocupar thread do threadpool
+- Custo configurável (BCRYPT_ROUNDS). Hash antigo com custo menor é
+  refeito no próximo login - única hora em que temos a senha em texto
+
+Este módulo não importa models nem o banco: os processos do pool só
+precisam do bcrypt (e do pacote services, importado junto).
+"""
+import asyncio
+import multiprocessing
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from typing import Optional, Tuple
+
+import bcrypt
+
+
+# ============ CONFIGURAÇÕES ============
+
+# Custo do bcrypt (2^N iterações). 12 ≈ 250ms por senha
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+
+# Processos dedicados ao bcrypt (0 = roda na própria thread, ex: scripts)
+BCRYPT_WORKERS = int(os.environ.get("BCRYPT_WORKERS", str(max(1, (os.cpu_count() or 2) // 2))))
+
+
+# ============ TRABALHO (roda nos processos do pool) ============
+
+def _gerar_hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(password.encode("utf-8"), bcrypt.gensalt(rounds)).decode("utf-8")
+
+
+def _conferir(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(password.encode("utf-8"), hashed.encode("utf-8"))
+    except ValueError:
+        # Hash corrompido/formato desconhecido = senha não confere
+        return False
+
+
+# ============ POOL ============
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _executor() -> Optional[Executor]:
+    """Pool criado no primeiro uso (None = sem pool, roda na thread atual)"""
+    global _pool
+    if BCRYPT_WORKERS <= 0:
+        return None
+    with _pool_lock:
+        if _pool is None:
+            # spawn: o app tem threads (event loop, descarga de GPS) - fork não é seguro
+            _pool = ProcessPoolExecutor(
+                max_workers=BCRYPT_WORKERS,
+                mp_context=multiprocessing.get_context("spawn")
+            )
+        return _pool
+
+
+def encerrar_pool() -> None:
+    """Desliga os processos do pool (shutdown do app)"""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown(wait=False, cancel_futures=True)
+            _pool = None
+
+
+def _executar(funcao, *args):
+    executor = _executor()
+    if executor is None:
+        return funcao(*args)
+    return executor.submit(funcao, *args).result()
+
+
+async def _executar_async(funcao, *args):
+    return await asyncio.get_running_loop().run_in_executor(_executor(), funcao, *args)
+
+
+# ============ API ============
+
+def custo_do_hash(hashed: str) -> Optional[int]:
+    """Custo gravado no hash: "$2b$12$..." → 12 (None se não é bcrypt)"""
+    partes = hashed.split("$")
+    if len(partes) < 4 or not partes[2].isdigit():
+        return None
+    return int(partes[2])
+
+
+def precisa_rehash(hashed: str) -> bool:
+    """Hash feito com custo menor que o configurado hoje"""
+    custo = custo_do_hash(hashed)
+    return custo is not None and custo < BCRYPT_ROUNDS
+
+
+def gerar_hash(password: str) -> str:
+    """Hash bcrypt da senha, calculado no pool"""
+    return _executar(_gerar_hash, password, BCRYPT_ROUNDS)
+
+
+def conferir_senha(password: str, hashed: str) -> bool:
+    """Confere a senha contra o hash, no pool"""
+    return _executar(_conferir, password, hashed)
+
+
+async def gerar_hash_async(password: str) -> str:
+    """gerar_hash para rotas async (não bloqueia o event loop)"""
+    return await _executar_async(_gerar_hash, password, BCRYPT_ROUNDS)
+
+
+async def conferir_senha_async(password: str, hashed: str) -> bool:
+    """conferir_senha para rotas async (não bloqueia o event loop)"""
+    return await _executar_async(_conferir, password, hashed)
+
+
+async def conferir_e_atualizar_async(password: str, hashed: str) -> Tuple[bool, Optional[str]]:
+    """
+    Confere a senha e, se o hash está desatualizado, já gera o novo
+
+    Retorna (senha confere, novo hash ou None se não precisa trocar).
+    """
+    if not await conferir_senha_async(password, hashed):
+        return False, None
+    if precisa_rehash(hashed):
+        return True, await gerar_hash_async(password)
+    return True, None
@@ -0,0 +1,131 @@
+"""
+Serviço de Clientes - coordenadas do endereço do cliente
+
+A maioria dos pedidos é de cliente que já pediu antes. Em vez de
+geocodificar o endereço a cada pedido:
+- Cadastro / troca de endereço do cliente: o geocoding roda DEPOIS da
+  resposta (background task) e as coordenadas ficam no cadastro
+- Pedido com customer_id (ou telefone) e o mesmo endereço do cadastro:
+  usa as coordenadas guardadas - nenhuma chamada externa
+
+🔒 PROTEÇÃO MULTI-TENANT:
+- Cliente só é encontrado no restaurante do usuário
+"""
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import or_
+from sqlmodel import Session, select
+
+from models import Customer, OrderCreate
+from services.geocode_cache_service import normalizar_endereco
+from services.geocoding_service import geocode_address_async
+from services.writer_service import Escritor
+
+
+def buscar_cliente(
+    session: Session,
+    restaurant_id: str,
+    customer_id: Optional[str] = None,
+    phone: Optional[str] = None
+) -> Optional[Customer]:
+    """Cliente do restaurante pelo ID ou, sem ID, pelo telefone"""
+    if customer_id:
+        customer = session.get(Customer, customer_id)
+        return customer if customer and customer.restaurant_id == restaurant_id else None
+    if phone:
+        return session.exec(
+            select(Customer).where(
+                Customer.phone == phone,
+                Customer.restaurant_id == restaurant_id
+            )
+        ).first()
+    return None
+
+
+def mesmo_endereco(endereco_pedido: str, endereco_cliente: str) -> bool:
+    """
+    O pedido vai para o endereço do cadastro?
+
+    O pedido pode vir com o complemento: "Rua A, 10 - apto 3" é o mesmo
+    endereço (e as mesmas coordenadas) de "Rua A, 10".
+    """
+    cadastro = normalizar_endereco(endereco_cliente)
+    return cadastro in (
+        normalizar_endereco(endereco_pedido),
+        normalizar_endereco(endereco_pedido.split(" - ")[0])
+    )
+
+
+def coordenadas_do_cliente(customer: Customer, endereco_pedido: str) -> Optional[Tuple[float, float]]:
+    """lat/lng do cadastro, se já resolvidas e o pedido vai para o mesmo endereço"""
+    if customer.lat is None or customer.lng is None:
+        return None
+    if not mesmo_endereco(endereco_pedido, customer.address):
+        return None
+    return customer.lat, customer.lng
+
+
+def gravar_coordenadas(
+    session: Session,
+    customer_id: str,
+    endereco: str,
+    coords: Optional[Tuple[float, float]]
+) -> bool:
+    """
+    Guarda as coordenadas do endereço no cadastro do cliente
+
+    Não grava se o endereço mudou enquanto o geocoding rodava (o geocoding
+    do endereço novo já foi agendado).
+    """
+    customer = session.get(Customer, customer_id)
+    if customer is None or customer.address != endereco:
+        return False
+    customer.lat, customer.lng = coords if coords else (None, None)
+    session.add(customer)
+    session.commit()
+    return True
+
+
+async def resolver_coordenadas(escritor: Escritor, customer_id: str, endereco: str) -> None:
+    """
+    Background task: geocodifica o endereço do cliente e grava no cadastro
+
+    Endereço não encontrado deixa lat/lng vazios - o pedido desse cliente
+    cai no geocoding normal (e no cache negativo).
+    """
+    coords = await geocode_address_async(endereco)
+    if coords:
+        await escritor.executar(gravar_coordenadas, customer_id, endereco, coords)
+
+
+def coordenadas_de_clientes(
+    session: Session,
+    restaurant_id: str,
+    pedidos: List[OrderCreate]
+) -> Dict[int, Tuple[float, float]]:
+    """
+    Para o lote de pedidos: {posição: coordenadas do cadastro do cliente}
+
+    Uma query para todos os clientes citados (por customer_id ou telefone).
+    """
+    ids = {p.customer_id for p in pedidos if p.customer_id}
+    telefones = {p.customer_phone for p in pedidos if p.customer_phone and not p.customer_id}
+    if not ids and not telefones:
+        return {}
+
+    clientes = session.exec(
+        select(Customer).where(
+            Customer.restaurant_id == restaurant_id,
+            or_(Customer.id.in_(ids), Customer.phone.in_(telefones))
+        )
+    ).all()
+    por_id = {c.id: c for c in clientes}
+    por_telefone = {c.phone: c for c in clientes}
+
+    encontrados = {}
+    for i, pedido in enumerate(pedidos):
+        customer = por_id.get(pedido.customer_id) if pedido.customer_id else por_telefone.get(pedido.customer_phone)
+        coords = customer and coordenadas_do_cliente(customer, pedido.address_text)
+        if coords:
+            encontrados[i] = coords
+    return encontrados
@@ -13,6 +13,7 @@ Versão V0.9 - Adiciona polyline da rota real (Google)
 """
 from datetime import datetime, timedelta
 from typing import List, Tuple, Optional, Dict
+from sqlalchemy.orm import selectinload
 from sqlmodel import Session, select
 from math import radians, sin, cos, sqrt, atan2
 import httpx
@@ -21,9 +22,10 @@ import os
 from models import (
     Order, Courier, Batch, 
     OrderStatus, CourierStatus, BatchStatus,
-    DispatchResult
+    DispatchResult, BatchResponse, OrderResponse, get_courier_full_name
 )
 from services.push_service import notify_new_batch
+from services.spatial_service import motoboys_para_dispatch
 
 
 # ============ CONFIGURAÇÕES DO DISPATCH V0.9 ============
@@ -283,6 +285,58 @@ def get_route_polyline(
         return None
 
 
+# Polylines já obtidas do Google. A chave tem as coordenadas da origem e
+# das paradas, então mudou a rota → mudou a chave (não precisa invalidar).
+# Falha do Google fica em cache só por pouco tempo (tenta de novo depois).
+MAX_POLYLINES_CACHE = 2000
+POLYLINE_FALHA_TTL_SEGUNDOS = 60
+_polylines: Dict[tuple, Tuple[Optional[str], Optional[datetime]]] = {}
+
+
+def get_route_polyline_cached(
+    orders: List[Order],
+    start_lat: float,
+    start_lng: float
+) -> Optional[str]:
+    """get_route_polyline com cache - refresh da tela de rastreio não chama o Google"""
+    if not orders:
+        return None
+    
+    chave = (
+        round(start_lat, 6), round(start_lng, 6),
+        tuple((round(o.lat, 6), round(o.lng, 6)) for o in orders)
+    )
+    agora = datetime.now()
+    em_cache = _polylines.get(chave)
+    if em_cache and (em_cache[1] is None or em_cache[1] > agora):
+        return em_cache[0]
+    
+    polyline = get_route_polyline(orders, start_lat, start_lng)
+    
+    if chave not in _polylines and len(_polylines) >= MAX_POLYLINES_CACHE:
+        _polylines.pop(next(iter(_polylines)))
+    expira_em = None if polyline else agora + timedelta(seconds=POLYLINE_FALHA_TTL_SEGUNDOS)
+    _polylines[chave] = (polyline, expira_em)
+    return polyline
+
+
+def get_route_origin(session: Session, restaurant) -> Tuple[float, float]:
+    """Coordenadas de saída da rota (restaurante), com os fallbacks antigos"""
+    from models import Restaurant
+    
+    if restaurant and restaurant.lat and restaurant.lng:
+        return restaurant.lat, restaurant.lng
+    
+    # Fallback: busca primeiro restaurante (compatibilidade)
+    restaurant = session.exec(select(Restaurant)).first()
+    if restaurant and restaurant.lat and restaurant.lng:
+        return restaurant.lat, restaurant.lng
+    
+    # Último fallback: coordenadas hardcoded
+    print("⚠️ Usando coordenadas hardcoded - configure o restaurante!")
+    return -21.2020, -47.8130
+
+
 def get_batch_route_polyline(session: Session, batch_id: str) -> Optional[dict]:
     """
     NOVO V0.9: Endpoint helper para obter a polyline de um batch
@@ -311,26 +365,10 @@ def get_batch_route_polyline(session: Session, batch_id: str) -> Optional[dict]:
     
     # Busca coordenadas do restaurante vinculado ao batch
     restaurant = session.get(Restaurant, batch.restaurant_id) if batch.restaurant_id else None
+    start_lat, start_lng = get_route_origin(session, restaurant)
     
-    if restaurant and restaurant.lat and restaurant.lng:
-        start_lat = restaurant.lat
-        start_lng = restaurant.lng
-    else:
-        # Fallback: busca primeiro restaurante (compatibilidade)
-        restaurant = session.exec(select(Restaurant)).first()
-        if restaurant and restaurant.lat and restaurant.lng:
-            start_lat = restaurant.lat
-            start_lng = restaurant.lng
-        else:
-            # Último fallback: coordenadas hardcoded
-            print("⚠️ Usando coordenadas hardcoded - configure o restaurante!")
-            start_lat = -21.2020
-            start_lng = -47.8130
-    
-    print(f"🏪 Coordenadas do restaurante: {start_lat}, {start_lng}")
-    
-    # Obtém a polyline
-    polyline = get_route_polyline(list(orders), start_lat, start_lng)
+    # Obtém a polyline (cache → Google só quando a rota é nova)
+    polyline = get_route_polyline_cached(list(orders), start_lat, start_lng)
     
     return {
         "polyline": polyline,
@@ -606,16 +644,10 @@ def run_dispatch(session: Session, restaurant_id: str = None) -> DispatchResult:
             message="Nenhum pedido pronto aguardando"
         )
     
-    # 2. Busca motoqueiros disponíveis
-    courier_query = select(Courier).where(
-        Courier.status == CourierStatus.AVAILABLE
-    ).order_by(Courier.available_since)
-    
-    # 🔒 Filtra por restaurante se informado
-    if restaurant_id:
-        courier_query = courier_query.where(Courier.restaurant_id == restaurant_id)
-    
-    available_couriers = session.exec(courier_query).all()
+    # 2. Motoqueiros disponíveis (do banco: vale o que outros workers gravaram),
+    # na ordem de prioridade - quem está no restaurante primeiro, por ordem
+    # de chegada; depois quem ainda está voltando, do mais perto ao mais longe
+    available_couriers = motoboys_para_dispatch(session, restaurant_id, start_lat, start_lng)
     
     if not available_couriers:
         return DispatchResult(
@@ -776,6 +808,44 @@ def get_courier_current_batch(session: Session, courier_id: str) -> Optional[Bat
     return batch
 
 
+def load_active_batches(
+    session: Session,
+    restaurant_id: Optional[str] = None,  # 🔒 PROTEÇÃO
+    courier_id: Optional[str] = None
+) -> List[Tuple[Batch, Optional[Courier]]]:
+    """
+    Lotes ativos com motoboy (JOIN) e pedidos (selectinload) já carregados
+    
+    Duas queries no total, qualquer que seja a quantidade de lotes
+    (antes: 1 + 2 por lote).
+    """
+    query = (
+        select(Batch, Courier)
+        .join(Courier, Courier.id == Batch.courier_id, isouter=True)
+        .where(Batch.status.in_([BatchStatus.ASSIGNED, BatchStatus.IN_PROGRESS]))
+        .options(selectinload(Batch.orders))
+        .order_by(Batch.created_at.desc())
+    )
+    if restaurant_id:
+        query = query.where(Batch.restaurant_id == restaurant_id)
+    if courier_id:
+        query = query.where(Batch.courier_id == courier_id)
+    
+    return list(session.exec(query).all())
+
+
+def build_batch_response(batch: Batch, courier: Optional[Courier]) -> BatchResponse:
+    """Monta a resposta do lote a partir do que load_active_batches carregou"""
+    return BatchResponse(
+        id=batch.id,
+        courier_id=batch.courier_id,
+        courier_name=get_courier_full_name(courier) if courier else None,
+        status=batch.status,
+        created_at=batch.created_at,
+        orders=[OrderResponse.model_validate(o) for o in batch.orders]
+    )
+
+
 def get_batch_orders(session: Session, batch_id: str) -> List[Order]:
     """Retorna os pedidos de um lote, ordenados pela rota"""
     orders = session.exec(
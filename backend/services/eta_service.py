@@ -0,0 +1,350 @@
+"""
+Serviço de ETA - Previsão de chegada de cada pedido em rota
+
+Antes o rastreamento mostrava a posição no lote e o GPS do motoboy, mas
+nenhum horário: o atendente ligava para o motoboy para perguntar.
+
+COMO CALCULA (por lote ativo):
+1. Paradas restantes do lote (ASSIGNED/PICKED_UP), na ordem do stop_order
+2. Trechos parada → parada: distância por rota estimada (linha reta × FATOR_ROTA),
+   em cache por par de coordenadas - não muda enquanto o lote não muda
+3. Velocidade da hora: VELOCIDADE_BASE_KMH ajustada pelo histórico do
+   restaurante (PadraoDemanda.media_tempo_rota da hora vs média do dia)
+4. Só o PRIMEIRO trecho (motoboy → próxima parada) depende do GPS: a cada
+   ping recalculamos apenas ele e somamos aos acumulados já prontos
+
+Lote ASSIGNED (motoboy ainda não saiu): se ele está longe do restaurante,
+soma o trecho até o restaurante antes da primeira parada.
+
+As rotas em memória são descartadas quando um pedido/lote muda (hooks da
+Session, só após o commit) e remontadas do banco na próxima consulta.
+
+🔒 PROTEÇÃO MULTI-TENANT:
+- Velocidade histórica é por restaurant_id
+"""
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import event, inspect
+from sqlmodel import Session, select, func
+
+from models import (
+    Order, Batch, Courier, Restaurant, PadraoDemanda,
+    OrderStatus, BatchStatus
+)
+from services.live_state_service import normalizar, campo_mudou
+from services.spatial_service import distancia_km, posicao_mais_recente
+
+
+# ============ CONFIGURAÇÕES ============
+
+# Velocidade média do motoboy na cidade, sem ajuste histórico (km/h)
+VELOCIDADE_BASE_KMH = float(os.environ.get("ETA_BASE_SPEED_KMH", "25"))
+
+# Ruas não são linha reta (mesmo fator do fallback do dispatch)
+FATOR_ROTA = 1.4
+
+# Tempo para estacionar, entregar e voltar para a moto (min)
+TEMPO_POR_PARADA_MIN = float(os.environ.get("ETA_STOP_MINUTES", "2"))
+
+# Ajuste histórico limitado a metade/dobro da velocidade base
+FATOR_HORA_MIN = 0.5
+FATOR_HORA_MAX = 2.0
+
+# Velocidade da hora é consultada no banco no máximo a cada X segundos
+CACHE_VELOCIDADE_SEGUNDOS = 600
+
+# Abaixo disso o motoboy já está no restaurante (km)
+RAIO_RESTAURANTE_KM = 0.15
+
+# Coordenadas arredondadas na chave do cache de trechos (4 casas ≈ 11m)
+PRECISAO_TRECHO = 4
+MAX_TRECHOS_CACHE = 20000
+
+STATUS_EM_ROTA = (OrderStatus.ASSIGNED, OrderStatus.PICKED_UP)
+
+
+# ============ ESTRUTURAS ============
+
+@dataclass
+class EtaPedido:
+    """Previsão de chegada de um pedido"""
+    order_id: str
+    chegada: datetime
+    paradas_antes: int
+    calculado_em: datetime
+    baseado_em_gps: bool
+
+    def minutos_restantes(self, agora: Optional[datetime] = None) -> int:
+        segundos = (self.chegada - (agora or datetime.now())).total_seconds()
+        return max(0, round(segundos / 60))
+
+
+@dataclass
+class Parada:
+    order_id: str
+    lat: float
+    lng: float
+
+
+@dataclass
+class RotaLote:
+    """Paradas restantes de um lote e os ETAs calculados"""
+    batch_id: str
+    courier_id: str
+    restaurant_id: Optional[str]
+    origem_lat: float
+    origem_lng: float
+    buscar_no_restaurante: bool   # Lote ASSIGNED: motoboy ainda sai do restaurante
+    velocidade_kmh: float
+    paradas: List[Parada]
+    # Minutos da 1ª parada até a chegada na parada i (trechos + entregas anteriores)
+    acumulado_min: List[float] = field(default_factory=list)
+    etas: Dict[str, EtaPedido] = field(default_factory=dict)
+
+
+_rotas: Dict[str, RotaLote] = {}            # batch_id → rota
+_lote_do_motoboy: Dict[str, str] = {}       # courier_id → batch_id
+_trechos_km: Dict[Tuple[float, float, float, float], float] = {}
+_velocidades: Dict[Tuple[Optional[str], int, int], Tuple[float, datetime]] = {}
+_lock = threading.Lock()
+
+
+# ============ TRECHOS E VELOCIDADE ============
+
+def distancia_trecho_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distância estimada por rota entre dois pontos, em cache"""
+    chave = (
+        round(lat1, PRECISAO_TRECHO), round(lng1, PRECISAO_TRECHO),
+        round(lat2, PRECISAO_TRECHO), round(lng2, PRECISAO_TRECHO)
+    )
+    km = _trechos_km.get(chave)
+    if km is None:
+        km = distancia_km(lat1, lng1, lat2, lng2) * FATOR_ROTA
+        if len(_trechos_km) >= MAX_TRECHOS_CACHE:
+            _trechos_km.pop(next(iter(_trechos_km)))
+        _trechos_km[chave] = km
+    return km
+
+
+def _minutos(km: float, velocidade_kmh: float) -> float:
+    return km / velocidade_kmh * 60
+
+
+def velocidade_da_hora(
+    session: Session,
+    restaurant_id: Optional[str],  # 🔒 PROTEÇÃO
+    quando: Optional[datetime] = None
+) -> float:
+    """
+    Velocidade esperada (km/h) para o dia da semana/hora
+
+    Hora com rota historicamente mais lenta que a média do restaurante
+    (trânsito) → velocidade menor, na mesma proporção.
+    """
+    quando = quando or datetime.now()
+    chave = (restaurant_id, quando.weekday(), quando.hour)
+    em_cache = _velocidades.get(chave)
+    if em_cache and em_cache[1] > quando:
+        return em_cache[0]
+
+    velocidade = VELOCIDADE_BASE_KMH
+    if restaurant_id:
+        tempo_hora = session.exec(
+            select(PadraoDemanda.media_tempo_rota).where(
+                PadraoDemanda.restaurant_id == restaurant_id,
+                PadraoDemanda.dia_semana == quando.weekday(),
+                PadraoDemanda.hora == quando.hour,
+                PadraoDemanda.amostras > 0
+            )
+        ).first()
+        tempo_medio = session.exec(
+            select(func.avg(PadraoDemanda.media_tempo_rota)).where(
+                PadraoDemanda.restaurant_id == restaurant_id,
+                PadraoDemanda.amostras > 0
+            )
+        ).one()
+        if tempo_hora and tempo_medio:
+            fator = min(max(tempo_medio / tempo_hora, FATOR_HORA_MIN), FATOR_HORA_MAX)
+            velocidade = VELOCIDADE_BASE_KMH * fator
+
+    _velocidades[chave] = (velocidade, quando + timedelta(seconds=CACHE_VELOCIDADE_SEGUNDOS))
+    return velocidade
+
+
+# ============ CÁLCULO ============
+
+def _preparar_acumulados(rota: RotaLote) -> None:
+    """Parte fixa do ETA: trechos entre paradas + tempo de cada entrega"""
+    acumulado = 0.0
+    rota.acumulado_min = []
+    for i, parada in enumerate(rota.paradas):
+        if i > 0:
+            anterior = rota.paradas[i - 1]
+            km = distancia_trecho_km(anterior.lat, anterior.lng, parada.lat, parada.lng)
+            acumulado += TEMPO_POR_PARADA_MIN + _minutos(km, rota.velocidade_kmh)
+        rota.acumulado_min.append(acumulado)
+
+
+def _recalcular(
+    rota: RotaLote,
+    lat: Optional[float],
+    lng: Optional[float],
+    quando: datetime
+) -> None:
+    """Recalcula só o trecho motoboy → próxima parada e reaplica os acumulados"""
+    baseado_em_gps = lat is not None and lng is not None
+    if not baseado_em_gps:
+        lat, lng = rota.origem_lat, rota.origem_lng
+
+    # Trechos a partir do GPS mudam a cada ping: não vão para o cache
+    minutos = 0.0
+    ate_restaurante = distancia_km(lat, lng, rota.origem_lat, rota.origem_lng)
+    if rota.buscar_no_restaurante and ate_restaurante > RAIO_RESTAURANTE_KM:
+        minutos += _minutos(ate_restaurante * FATOR_ROTA, rota.velocidade_kmh)
+        lat, lng = rota.origem_lat, rota.origem_lng
+
+    primeira = rota.paradas[0]
+    minutos += _minutos(
+        distancia_km(lat, lng, primeira.lat, primeira.lng) * FATOR_ROTA, rota.velocidade_kmh
+    )
+
+    rota.etas = {
+        parada.order_id: EtaPedido(
+            order_id=parada.order_id,
+            chegada=quando + timedelta(minutes=minutos + rota.acumulado_min[i]),
+            paradas_antes=i,
+            calculado_em=quando,
+            baseado_em_gps=baseado_em_gps
+        )
+        for i, parada in enumerate(rota.paradas)
+    }
+
+
+def _montar_rota(session: Session, batch: Batch) -> Optional[RotaLote]:
+    """Carrega do banco as paradas restantes do lote e calcula os ETAs"""
+    if not batch.courier_id or normalizar(BatchStatus, batch.status) == BatchStatus.DONE:
+        return None
+
+    pedidos = session.exec(
+        select(Order.id, Order.lat, Order.lng)
+        .where(Order.batch_id == batch.id, Order.status.in_(STATUS_EM_ROTA))
+        .order_by(Order.stop_order)
+    ).all()
+    if not pedidos:
+        return None
+
+    restaurant = session.get(Restaurant, batch.restaurant_id) if batch.restaurant_id else None
+    if restaurant and restaurant.lat and restaurant.lng:
+        origem_lat, origem_lng = restaurant.lat, restaurant.lng
+    else:
+        # Sem coordenadas do restaurante: conta a partir da 1ª parada
+        origem_lat, origem_lng = pedidos[0][1], pedidos[0][2]
+
+    agora = datetime.now()
+    rota = RotaLote(
+        batch_id=batch.id,
+        courier_id=batch.courier_id,
+        restaurant_id=batch.restaurant_id,
+        origem_lat=origem_lat,
+        origem_lng=origem_lng,
+        buscar_no_restaurante=normalizar(BatchStatus, batch.status) == BatchStatus.ASSIGNED,
+        velocidade_kmh=velocidade_da_hora(session, batch.restaurant_id, agora),
+        paradas=[Parada(order_id, lat, lng) for order_id, lat, lng in pedidos]
+    )
+    _preparar_acumulados(rota)
+
+    courier = session.get(Courier, batch.courier_id)
+    lat, lng, _ = posicao_mais_recente(courier) if courier else (None, None, None)
+    _recalcular(rota, lat, lng, agora)
+    return rota
+
+
+# ============ LEITURA ============
+
+def eta_do_pedido(session: Session, order: Order) -> Optional[EtaPedido]:
+    """
+    ETA do pedido, do cache (banco só na primeira consulta do lote)
+
+    None se o pedido não está em rota.
+    """
+    if not order.batch_id or normalizar(OrderStatus, order.status) not in STATUS_EM_ROTA:
+        return None
+
+    with _lock:
+        rota = _rotas.get(order.batch_id)
+        if rota is not None:
+            return rota.etas.get(order.id)
+
+    batch = session.get(Batch, order.batch_id)
+    rota = _montar_rota(session, batch) if batch else None
+    if rota is None:
+        return None
+
+    with _lock:
+        _rotas[rota.batch_id] = rota
+        _lote_do_motoboy[rota.courier_id] = rota.batch_id
+        return rota.etas.get(order.id)
+
+
+def limpar_etas() -> None:
+    """Descarta rotas e caches (próxima consulta recarrega do banco)"""
+    with _lock:
+        _rotas.clear()
+        _lote_do_motoboy.clear()
+        _trechos_km.clear()
+        _velocidades.clear()
+
+
+# ============ ATUALIZAÇÃO ============
+
+def atualizar_posicao(courier_id: str, lat: float, lng: float, quando: datetime) -> None:
+    """Chamado pela ingestão de GPS: recalcula os ETAs do lote do motoboy"""
+    with _lock:
+        batch_id = _lote_do_motoboy.get(courier_id)
+        rota = _rotas.get(batch_id) if batch_id else None
+        if rota is None:
+            return
+        # Ping atrasado não volta o ETA para trás
+        if rota.etas and quando < next(iter(rota.etas.values())).calculado_em:
+            return
+        _recalcular(rota, lat, lng, quando)
+
+
+_CHAVE_PENDENTES = "eta_lotes_alterados"
+
+
+@event.listens_for(Session, "after_flush")
+def _coletar_lotes_alterados(session, flush_context):
+    """Lotes cujas paradas mudaram - descartados após o commit"""
+    alterados = session.info.setdefault(_CHAVE_PENDENTES, set())
+    for colecao, novo in ((session.new, True), (session.dirty, False), (session.deleted, False)):
+        for obj in colecao:
+            if isinstance(obj, Batch):
+                alterados.add(obj.id)
+            elif isinstance(obj, Order):
+                if novo or any(campo_mudou(obj, c) for c in ("status", "batch_id", "stop_order", "lat", "lng")):
+                    # Lote atual e, se trocou de lote, também o anterior
+                    alterados.add(obj.batch_id)
+                    alterados.update(inspect(obj).attrs["batch_id"].history.deleted)
+    alterados.discard(None)
+
+
+@event.listens_for(Session, "after_commit")
+def _descartar_rotas(session):
+    alterados = session.info.pop(_CHAVE_PENDENTES, None)
+    if not alterados:
+        return
+    with _lock:
+        for batch_id in alterados:
+            rota = _rotas.pop(batch_id, None)
+            if rota is not None and _lote_do_motoboy.get(rota.courier_id) == batch_id:
+                del _lote_do_motoboy[rota.courier_id]
+
+
+@event.listens_for(Session, "after_rollback")
+def _ignorar_lotes_alterados(session):
+    session.info.pop(_CHAVE_PENDENTES, None)
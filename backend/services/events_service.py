@@ -0,0 +1,333 @@
+"""
+Serviço de Eventos em Tempo Real - Pub/Sub em memória para o canal SSE
+
+O dashboard e o app do motoboy faziam polling (5s / 10s) de vários
+endpoints. Agora eles assinam um canal e recebem as mudanças na hora:
+- pedido_status: transição de status de um pedido (inclusive pedido novo)
+- lote_novo / lote_status: lote criado pelo dispatch ou mudou de status
+- motoboy_status: motoboy ficou disponível, ocupado, offline...
+- motoboy_localizacao: nova posição GPS do motoboy (publicada pela ingestão de GPS)
+- alertas: os alertas do dashboard mudaram
+
+CANAIS:
+- restaurante:{restaurant_id} → dashboard do restaurante
+- motoboy:{courier_id}        → app do motoboy
+
+COMO OS EVENTOS NASCEM:
+Hooks da Session (after_flush/after_commit), os mesmos do estado ao vivo -
+qualquer endpoint que commita uma transição publica sozinho. Só publica
+depois do COMMIT; rollback descarta. A posição GPS é a exceção: não passa
+pela Session a cada ping, então location_service publica direto.
+
+BACKPRESSURE:
+Cada assinante tem uma fila limitada (TAMANHO_FILA). Se o cliente não
+consome rápido o bastante, os eventos mais antigos são descartados e o
+cliente recebe um evento "resync" - sinal para recarregar tudo via REST.
+Quem publica nunca bloqueia esperando um cliente lento.
+
+🔒 PROTEÇÃO MULTI-TENANT:
+- Um canal por restaurant_id / courier_id
+"""
+import asyncio
+import json
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime
+from itertools import count
+from typing import Dict, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlmodel import Session
+
+from models import Order, Courier, Batch, OrderStatus, CourierStatus, BatchStatus
+from services.live_state_service import foto_em_memoria, status_antes_depois
+from services.alerts_service import avaliar_alertas, alertas_para_dict
+
+
+# ============ CONFIGURAÇÕES ============
+
+# Eventos guardados por assinante antes de começar a descartar
+TAMANHO_FILA = int(os.environ.get("EVENTS_QUEUE_SIZE", "100"))
+
+# Intervalo do comentário de keep-alive no stream SSE
+HEARTBEAT_SEGUNDOS = 15
+
+
+# ============ ESTRUTURAS ============
+
+@dataclass
+class Evento:
+    """Um evento publicado em um canal"""
+    id: int
+    tipo: str
+    dados: dict
+    timestamp: datetime = field(default_factory=datetime.now)
+
+
+def canal_restaurante(restaurant_id: str) -> str:
+    return f"restaurante:{restaurant_id}"
+
+
+def canal_motoboy(courier_id: str) -> str:
+    return f"motoboy:{courier_id}"
+
+
+class Assinatura:
+    """
+    Fila de eventos de UM cliente conectado
+
+    Vive no event loop de quem assinou; a entrega vinda de outras threads
+    (endpoints síncronos rodam no threadpool) passa por call_soon_threadsafe.
+    """
+
+    def __init__(self, canal: str, tamanho: int):
+        self.canal = canal
+        self.descartados = 0
+        self._loop = asyncio.get_running_loop()
+        self._fila: asyncio.Queue = asyncio.Queue(maxsize=tamanho)
+        self._precisa_resync = False
+
+    def _entregar(self, evento: Evento) -> None:
+        """Enfileira o evento (no loop do assinante) descartando o mais antigo se cheia"""
+        if self._fila.full():
+            self._fila.get_nowait()
+            self.descartados += 1
+            self._precisa_resync = True
+        self._fila.put_nowait(evento)
+
+    async def proximo(self, timeout: Optional[float] = None) -> Optional[Evento]:
+        """
+        Próximo evento da fila (None se passar `timeout` sem nada)
+
+        Se houve descarte, devolve antes um evento "resync".
+        """
+        if self._precisa_resync:
+            self._precisa_resync = False
+            return Evento(id=0, tipo="resync", dados={"descartados": self.descartados})
+        try:
+            return await asyncio.wait_for(self._fila.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class BarramentoEventos:
+    """Pub/Sub em memória: canal → assinaturas conectadas"""
+
+    def __init__(self, tamanho_fila: int = TAMANHO_FILA):
+        self.tamanho_fila = tamanho_fila
+        self._assinaturas: Dict[str, Set[Assinatura]] = {}
+        self._lock = threading.Lock()
+        self._ids = count(1)
+
+    def assinar(self, canal: str) -> Assinatura:
+        """Cria uma assinatura (chamar de dentro do event loop)"""
+        assinatura = Assinatura(canal, self.tamanho_fila)
+        with self._lock:
+            self._assinaturas.setdefault(canal, set()).add(assinatura)
+        return assinatura
+
+    def cancelar(self, assinatura: Assinatura) -> None:
+        with self._lock:
+            assinantes = self._assinaturas.get(assinatura.canal)
+            if assinantes is not None:
+                assinantes.discard(assinatura)
+                if not assinantes:
+                    del self._assinaturas[assinatura.canal]
+
+    def tem_assinantes(self, canal: str) -> bool:
+        with self._lock:
+            return bool(self._assinaturas.get(canal))
+
+    def publicar(self, canal: str, tipo: str, dados: dict) -> int:
+        """
+        Publica um evento no canal (pode ser chamado de qualquer thread)
+
+        Retorna quantos assinantes receberam.
+        """
+        with self._lock:
+            assinantes = list(self._assinaturas.get(canal, ()))
+        if not assinantes:
+            return 0
+
+        evento = Evento(id=next(self._ids), tipo=tipo, dados=dados)
+        entregues = 0
+        for assinatura in assinantes:
+            try:
+                assinatura._loop.call_soon_threadsafe(assinatura._entregar, evento)
+                entregues += 1
+            except RuntimeError:
+                # Loop do cliente já foi fechado - conexão morta
+                self.cancelar(assinatura)
+        return entregues
+
+
+barramento = BarramentoEventos()
+
+
+def formatar_sse(evento: Evento) -> str:
+    """Serializa o evento no formato text/event-stream"""
+    dados = json.dumps(
+        {**evento.dados, "timestamp": evento.timestamp.isoformat()},
+        ensure_ascii=False,
+        default=str
+    )
+    return f"id: {evento.id}\nevent: {evento.tipo}\ndata: {dados}\n\n"
+
+
+def publicar_localizacao(
+    restaurant_id: Optional[str],
+    courier_id: str,
+    lat: float,
+    lng: float
+) -> None:
+    """
+    Publica a posição do motoboy no canal do restaurante
+
+    Chamado direto pela ingestão de GPS (location_service): a posição não
+    passa pela Session a cada ping, então não há hook para capturá-la.
+    """
+    if restaurant_id:
+        barramento.publicar(canal_restaurante(restaurant_id), "motoboy_localizacao", {
+            "courier_id": courier_id,
+            "lat": lat,
+            "lng": lng
+        })
+
+
+# ============ ALERTAS ============
+
+# Últimos alertas publicados por restaurante (só publica quando mudam)
+_ultimos_alertas: Dict[str, Tuple] = {}
+_lock_alertas = threading.Lock()
+
+
+def _publicar_alertas_se_mudaram(restaurant_id: str) -> None:
+    canal = canal_restaurante(restaurant_id)
+    if not barramento.tem_assinantes(canal):
+        return
+
+    foto = foto_em_memoria(restaurant_id)
+    if foto is None:
+        return
+
+    resultado = avaliar_alertas(foto)
+    assinatura = (
+        resultado.status_geral,
+        resultado.motoboys_sugeridos,
+        tuple((a.titulo, a.mensagem) for a in resultado.alertas)
+    )
+    with _lock_alertas:
+        if _ultimos_alertas.get(restaurant_id) == assinatura:
+            return
+        _ultimos_alertas[restaurant_id] = assinatura
+
+    barramento.publicar(canal, "alertas", alertas_para_dict(resultado))
+
+
+# ============ HOOKS DA SESSION ============
+
+# Evento gerado por um objeto: (canais, tipo, dados)
+EventoGerado = Tuple[Tuple[str, ...], str, dict]
+
+# Evento pendente de commit: (restaurant_id, canais, tipo, dados)
+Pendente = Tuple[Optional[str], Tuple[str, ...], str, dict]
+
+_CHAVE_PENDENTES = "eventos_pendentes"
+
+
+def _valor(status) -> Optional[str]:
+    return status.value if status is not None else None
+
+
+def _eventos_order(order: Order, novo: bool, removido: bool) -> List[EventoGerado]:
+    antes, depois = status_antes_depois(order, OrderStatus, novo, removido)
+    if antes == depois or removido:
+        return []
+    return [(
+        (canal_restaurante(order.restaurant_id),),
+        "pedido_status",
+        {
+            "order_id": order.id,
+            "short_id": order.short_id,
+            "status": _valor(depois),
+            "status_anterior": _valor(antes),
+            "batch_id": order.batch_id
+        }
+    )]
+
+
+def _eventos_courier(courier: Courier, novo: bool, removido: bool) -> List[EventoGerado]:
+    antes, depois = status_antes_depois(courier, CourierStatus, novo, removido)
+    if antes == depois or removido:
+        return []
+    canais = (canal_restaurante(courier.restaurant_id), canal_motoboy(courier.id))
+    return [(canais, "motoboy_status", {
+        "courier_id": courier.id,
+        "status": _valor(depois),
+        "status_anterior": _valor(antes)
+    })]
+
+
+def _eventos_batch(batch: Batch, novo: bool, removido: bool) -> List[EventoGerado]:
+    antes, depois = status_antes_depois(batch, BatchStatus, novo, removido)
+    if antes == depois or removido:
+        return []
+    canais = (canal_restaurante(batch.restaurant_id),)
+    if batch.courier_id:
+        canais += (canal_motoboy(batch.courier_id),)
+    return [(canais, "lote_novo" if novo else "lote_status", {
+        "batch_id": batch.id,
+        "courier_id": batch.courier_id,
+        "status": _valor(depois),
+        "status_anterior": _valor(antes)
+    })]
+
+
+_GERADORES = {
+    Order: _eventos_order,
+    Courier: _eventos_courier,
+    Batch: _eventos_batch,
+}
+
+
+@event.listens_for(Session, "after_flush")
+def _coletar_eventos(session, flush_context):
+    """Guarda os eventos do flush - só serão publicados após o commit"""
+    pendentes: List[Pendente] = session.info.setdefault(_CHAVE_PENDENTES, [])
+
+    for colecao, novo, removido in (
+        (session.new, True, False),
+        (session.dirty, False, False),
+        (session.deleted, False, True),
+    ):
+        for obj in colecao:
+            gerador = _GERADORES.get(type(obj))
+            if gerador is None:
+                continue
+            for canais, tipo, dados in gerador(obj, novo, removido):
+                pendentes.append((obj.restaurant_id, canais, tipo, dados))
+
+
+@event.listens_for(Session, "after_commit")
+def _publicar_eventos(session):
+    # Registrado depois do hook do estado ao vivo (import acima), então a
+    # foto em memória já inclui este commit quando os alertas são avaliados
+    pendentes: List[Pendente] = session.info.pop(_CHAVE_PENDENTES, [])
+    if not pendentes:
+        return
+
+    restaurantes = set()
+    for restaurant_id, canais, tipo, dados in pendentes:
+        for canal in canais:
+            barramento.publicar(canal, tipo, dados)
+        if restaurant_id:
+            restaurantes.add(restaurant_id)
+
+    for restaurant_id in restaurantes:
+        _publicar_alertas_se_mudaram(restaurant_id)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_eventos(session):
+    session.info.pop(_CHAVE_PENDENTES, None)
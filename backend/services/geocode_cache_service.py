@@ -0,0 +1,262 @@
+"""
+Serviço de Cache de Geocoding - memória (LRU) + tabela no banco
+
+Antes o cache era um dict sem limite, por processo: sumia a cada deploy,
+cada worker do uvicorn tinha o seu e endereço não encontrado ia de novo ao
+Google a cada tentativa.
+
+AGORA, duas camadas:
+1. Memória: LRU com no máximo GEOCODE_CACHE_SIZE endereços por processo
+2. Tabela geocode_cache: sobrevive a restart e é compartilhada por todos
+   os workers (e servidores, no PostgreSQL)
+
+- Chave normalizada: "Av. Paulista,  1000" e "av paulista 1000" são o
+  mesmo endereço (minúsculas, sem acento, sem pontuação, espaços únicos)
+- Cache negativo: "não encontrado" fica guardado por
+  GEOCODE_NEGATIVE_TTL_HOURS (erro temporário da API não é guardado)
+- Métricas (hits, misses, evictions) em GET /metrics/geocoding
+- No SQLite, a gravação na tabela passa pela fila de escrita (ver
+  writer_service), como as demais escritas do app
+- Negativos vencidos são apagados da tabela uma vez por dia (loop no lifespan)
+
+Falha no banco nunca derruba o geocoding: a consulta segue para a API.
+"""
+import asyncio
+import os
+import re
+import threading
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Dict, Optional, Tuple
+
+from sqlalchemy import delete
+from sqlalchemy.engine import Engine
+from sqlmodel import Session
+
+from database import engine
+from models import GeocodeCache
+from services.writer_service import Escritor, FilaEscrita, escritor
+
+
+# ============ CONFIGURAÇÕES ============
+
+# Endereços guardados na memória de cada processo
+GEOCODE_CACHE_SIZE = int(os.environ.get("GEOCODE_CACHE_SIZE", "10000"))
+
+# Por quanto tempo um "endereço não encontrado" não volta a ser consultado
+GEOCODE_NEGATIVE_TTL_HOURS = float(os.environ.get("GEOCODE_NEGATIVE_TTL_HOURS", "24"))
+
+# De quanto em quanto tempo os negativos vencidos são apagados da tabela
+INTERVALO_LIMPEZA_SEGUNDOS = 24 * 3600
+
+# Retorno de obter() quando o endereço não está em nenhuma camada
+AUSENTE = object()
+
+
+def normalizar_endereco(endereco: str) -> str:
+    """
+    Chave do cache: minúsculas, sem acento, sem pontuação, espaços únicos
+
+    "Rua Visconde de Inhaúma, 2235" → "rua visconde de inhauma 2235"
+    """
+    sem_acento = unicodedata.normalize("NFKD", endereco).encode("ascii", "ignore").decode("ascii")
+    return " ".join(re.sub(r"[\W_]+", " ", sem_acento.lower()).split())
+
+
+class CacheGeocoding:
+    """
+    Cache de geocoding em duas camadas (memória LRU + tabela)
+
+    Valor guardado: (lat, lng), ou None para "não encontrado" (negativo,
+    com validade). Thread-safe.
+
+    Não chamar guardar() de dentro de uma função da fila de escrita: a
+    gravação espera a própria fila.
+    """
+
+    def __init__(
+        self,
+        engine_: Optional[Engine] = None,
+        tamanho: int = GEOCODE_CACHE_SIZE,
+        ttl_negativo_horas: float = GEOCODE_NEGATIVE_TTL_HOURS,
+        escritor_: Optional[Escritor] = None
+    ):
+        self.engine = engine_
+        self.escritor = escritor_
+        self.tamanho = tamanho
+        self.ttl_negativo = timedelta(hours=ttl_negativo_horas)
+        # chave → (coords ou None, expira_em ou None)
+        self._memoria: "OrderedDict[str, Tuple[Optional[Tuple[float, float]], Optional[datetime]]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = dict.fromkeys(
+            ("hits_memoria", "hits_banco", "hits_negativos", "misses", "evictions", "gravacoes", "erros_banco"), 0
+        )
+
+    # ---------- leitura ----------
+
+    def obter(self, chave: str):
+        """
+        (lat, lng), None (não encontrado, ainda válido) ou AUSENTE
+
+        Procura na memória e depois na tabela (que volta para a memória).
+        """
+        agora = datetime.now()
+        with self._lock:
+            item = self._memoria.get(chave)
+            if item is not None:
+                coords, expira_em = item
+                if expira_em is None or expira_em > agora:
+                    self._memoria.move_to_end(chave)
+                    self._contadores["hits_negativos" if coords is None else "hits_memoria"] += 1
+                    return coords
+                del self._memoria[chave]
+
+        linha = self._ler_banco(chave)
+        if linha is not None and (linha.expira_em is None or linha.expira_em > agora):
+            coords = None if linha.lat is None else (linha.lat, linha.lng)
+            self._guardar_memoria(chave, coords, linha.expira_em)
+            self._contar("hits_negativos" if coords is None else "hits_banco")
+            return coords
+
+        self._contar("misses")
+        return AUSENTE
+
+    # ---------- escrita ----------
+
+    def guardar(self, chave: str, coords: Optional[Tuple[float, float]]) -> None:
+        """Guarda nas duas camadas (coords=None = não encontrado, com validade)"""
+        expira_em = None if coords is not None else datetime.now() + self.ttl_negativo
+        self._guardar_memoria(chave, coords, expira_em)
+        self._gravar_banco(chave, coords, expira_em)
+
+    def limpar_memoria(self) -> None:
+        """Esvazia só a camada de memória (a tabela continua)"""
+        with self._lock:
+            self._memoria.clear()
+
+    def apagar_expirados(self, agora: Optional[datetime] = None) -> int:
+        """
+        Apaga da tabela os "não encontrado" vencidos (expira_em no passado)
+
+        Vencido já é ignorado na leitura; sem a limpeza, a tabela só cresce
+        com endereços digitados errado. Retorna quantas linhas saíram.
+        """
+        tabela = GeocodeCache.__table__
+        comando = delete(tabela).where(tabela.c.expira_em < (agora or datetime.now()))
+
+        def apagar(session: Session) -> int:
+            apagadas = session.execute(comando).rowcount
+            session.commit()
+            return apagadas
+
+        return self._escrever(apagar)
+
+    # ---------- métricas ----------
+
+    def tamanho_memoria(self) -> int:
+        return len(self._memoria)
+
+    def metricas(self) -> Dict:
+        """Contadores desde o início do processo + ocupação da memória"""
+        with self._lock:
+            contadores = dict(self._contadores)
+            em_memoria = len(self._memoria)
+        consultas = sum(contadores[c] for c in ("hits_memoria", "hits_banco", "hits_negativos", "misses"))
+        acertos = consultas - contadores["misses"]
+        return {
+            **contadores,
+            "consultas": consultas,
+            "taxa_acerto": round(acertos / consultas, 4) if consultas else None,
+            "em_memoria": em_memoria,
+            "capacidade_memoria": self.tamanho,
+            "ttl_negativo_horas": self.ttl_negativo.total_seconds() / 3600,
+        }
+
+    def zerar_metricas(self) -> None:
+        with self._lock:
+            for nome in self._contadores:
+                self._contadores[nome] = 0
+
+    # ---------- internos ----------
+
+    def _engine(self) -> Engine:
+        return self.engine if self.engine is not None else engine
+
+    def _contar(self, nome: str) -> None:
+        with self._lock:
+            self._contadores[nome] += 1
+
+    def _guardar_memoria(self, chave: str, coords, expira_em: Optional[datetime]) -> None:
+        with self._lock:
+            self._memoria[chave] = (coords, expira_em)
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.tamanho:
+                self._memoria.popitem(last=False)
+                self._contadores["evictions"] += 1
+
+    def _ler_banco(self, chave: str) -> Optional[GeocodeCache]:
+        try:
+            with Session(self._engine(), expire_on_commit=False) as session:
+                return session.get(GeocodeCache, chave)
+        except Exception as erro:
+            self._registrar_erro_banco(erro)
+            return None
+
+    def _gravar_banco(self, chave: str, coords, expira_em: Optional[datetime]) -> None:
+        engine_ = self._engine()
+        if engine_.dialect.name == "postgresql":
+            from sqlalchemy.dialects.postgresql import insert
+        else:
+            from sqlalchemy.dialects.sqlite import insert
+
+        valores = {
+            "chave": chave,
+            "lat": coords[0] if coords else None,
+            "lng": coords[1] if coords else None,
+            "atualizado_em": datetime.now(),
+            "expira_em": expira_em,
+        }
+        comando = insert(GeocodeCache.__table__).values(**valores)
+        comando = comando.on_conflict_do_update(
+            index_elements=["chave"],
+            set_={campo: comando.excluded[campo] for campo in ("lat", "lng", "atualizado_em", "expira_em")}
+        )
+        def gravar(session: Session) -> None:
+            session.execute(comando)
+            session.commit()
+
+        try:
+            self._escrever(gravar)
+            self._contar("gravacoes")
+        except Exception as erro:
+            self._registrar_erro_banco(erro)
+
+    def _escrever(self, funcao):
+        """
+        Roda `funcao(session)` pela fila de escrita do SQLite, se ela grava
+        neste mesmo banco; senão (PostgreSQL, outro banco) numa Session própria
+        """
+        fila = self.escritor if self.escritor is not None else escritor
+        if isinstance(fila, FilaEscrita) and fila.engine is self._engine():
+            return fila.enviar(funcao).result()
+        with Session(self._engine()) as session:
+            return funcao(session)
+
+    def _registrar_erro_banco(self, erro: Exception) -> None:
+        self._contar("erros_banco")
+        print(f"⚠️ Cache de geocoding sem banco: {erro}")
+
+
+# Cache do processo (tabela no banco principal)
+cache_geocoding = CacheGeocoding()
+
+
+async def loop_limpeza_geocode_cache() -> None:
+    """Tarefa de fundo (iniciada no lifespan do app): apaga os negativos vencidos uma vez por dia"""
+    while True:
+        try:
+            await asyncio.to_thread(cache_geocoding.apagar_expirados)
+        except Exception as e:
+            print(f"⚠️ Erro ao limpar o cache de geocoding: {e}")
+        await asyncio.sleep(INTERVALO_LIMPEZA_SEGUNDOS)
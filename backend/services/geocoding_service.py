@@ -1,11 +1,35 @@
 """
 Serviço de Geocoding usando Google Maps API
 Converte endereços em coordenadas com alta precisão
+
+Ordem: base local da cidade, se configurada (local_geocoder_service) →
+cache em memória (LRU) + banco, com cache negativo (geocode_cache_service)
+→ Google
+
+Consultas ao Google (assíncronas, sem prender threads):
+- Single-flight: o mesmo endereço pedido ao mesmo tempo (5 atendentes
+  digitando o endereço popular) vira UMA consulta; os demais esperam ela
+- Um AsyncClient por event loop, com pool de conexões (keep-alive)
+- No máximo GEOCODE_MAX_CONCURRENT consultas simultâneas por API key no
+  processo, somando os dois caminhos (async e síncrono) e todos os loops
+
+Rotas síncronas (rodam em threads do servidor) usam o mesmo caminho via
+event loop; fora do servidor (scripts) a consulta é síncrona.
 """
+import asyncio
 import os
-import urllib.parse
-from typing import Optional, Tuple
+import threading
+import weakref
+from concurrent.futures import Future
+from contextlib import asynccontextmanager
+from typing import Dict, List, Optional, Tuple
+
 import httpx
+from anyio import from_thread
+from fastapi.concurrency import run_in_threadpool
+
+from services.geocode_cache_service import cache_geocoding, normalizar_endereco, AUSENTE
+from services.local_geocoder_service import geocodificar_local
 
 # API Key do Google Maps (carregada de variável de ambiente)
 GOOGLE_API_KEY = os.getenv("GOOGLE_MAPS_API_KEY")
@@ -17,63 +41,331 @@ if not GOOGLE_API_KEY:
         "Obtenha em: https://console.cloud.google.com/apis/credentials"
     )
 
-# Cache local para economizar requests
-_geocode_cache = {}
+GOOGLE_GEOCODING_URL = os.getenv("GOOGLE_GEOCODING_URL", "https://maps.googleapis.com/maps/api/geocode/json")
+
+# Consultas simultâneas ao Google por API key (e conexões no pool)
+GEOCODE_MAX_CONCURRENT = int(os.getenv("GEOCODE_MAX_CONCURRENT", "8"))
+
+# Timeout das consultas (o connect falha rápido; a resposta pode demorar mais)
+TIMEOUT_GEOCODING = httpx.Timeout(10.0, connect=3.0)
+
+
+# ============ SINGLE-FLIGHT ============
+
+# Endereço (chave normalizada) → Future da consulta em andamento
+_em_voo: Dict[str, Future] = {}
+_lock_voo = threading.Lock()
+_contadores = {"hits_local": 0, "consultas_google": 0, "consultas_agrupadas": 0}
+
+
+def _entrar_no_voo(chave: str) -> Tuple[Future, bool]:
+    """Future da consulta do endereço e se quem chamou é quem vai consultar"""
+    with _lock_voo:
+        futuro = _em_voo.get(chave)
+        if futuro is not None:
+            _contadores["consultas_agrupadas"] += 1
+            return futuro, False
+        futuro = _em_voo[chave] = Future()
+        return futuro, True
+
+
+def _sair_do_voo(chave: str, futuro: Future, coords=None, erro: Optional[BaseException] = None) -> None:
+    with _lock_voo:
+        _em_voo.pop(chave, None)
+    if erro is not None:
+        futuro.set_exception(erro)
+    else:
+        futuro.set_result(coords)
+
+
+def _da_base_local(address: str, city: str) -> Optional[Tuple[float, float]]:
+    coords = geocodificar_local(address, city)
+    if coords:
+        with _lock_voo:
+            _contadores["hits_local"] += 1
+    return coords
+
+
+def metricas_consultas() -> Dict:
+    """Achados na base local; consultas feitas ao Google, agrupadas (single-flight) e em andamento"""
+    with _lock_voo:
+        return {**_contadores, "em_andamento": len(_em_voo)}
+
+
+# ============ CLIENTE HTTP ============
+
+class _ClienteLoop:
+    """
+    AsyncClient (pool de conexões) e fila por API key de um event loop
+
+    A fila (asyncio.Semaphore) só organiza a espera dentro do loop, sem
+    threads; o limite de verdade são as vagas do processo (_vaga_async).
+    """
+
+    def __init__(self):
+        self.http = httpx.AsyncClient(
+            timeout=TIMEOUT_GEOCODING,
+            limits=httpx.Limits(
+                max_connections=GEOCODE_MAX_CONCURRENT,
+                max_keepalive_connections=GEOCODE_MAX_CONCURRENT
+            )
+        )
+        self.limites: Dict[str, asyncio.Semaphore] = {}
+
+    def limite(self, api_key: str) -> asyncio.Semaphore:
+        if api_key not in self.limites:
+            self.limites[api_key] = asyncio.Semaphore(GEOCODE_MAX_CONCURRENT)
+        return self.limites[api_key]
+
+
+_clientes: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, _ClienteLoop]" = weakref.WeakKeyDictionary()
+# API key → vagas de consulta ao Google do processo (caminho async e síncrono)
+_vagas: Dict[str, threading.BoundedSemaphore] = {}
+# Consultas em andamento (referência forte: a tarefa não some no meio)
+_tarefas: set = set()
+
+
+def _cliente_do_loop() -> _ClienteLoop:
+    loop = asyncio.get_running_loop()
+    if loop not in _clientes:
+        _clientes[loop] = _ClienteLoop()
+    return _clientes[loop]
+
+
+def _vagas_da_chave(api_key: str) -> threading.BoundedSemaphore:
+    with _lock_voo:
+        if api_key not in _vagas:
+            _vagas[api_key] = threading.BoundedSemaphore(GEOCODE_MAX_CONCURRENT)
+        return _vagas[api_key]
+
+
+@asynccontextmanager
+async def _vaga_async(cliente: _ClienteLoop, api_key: str):
+    """
+    Ocupa uma vaga de consulta sem prender thread
+
+    Normalmente a fila do loop já basta e a vaga sai na hora; só quando
+    consultas síncronas (ou outro loop) tomaram as vagas a espera vira
+    uma checagem periódica - cancelável, nunca deixa vaga presa.
+    """
+    async with cliente.limite(api_key):
+        vagas = _vagas_da_chave(api_key)
+        while not vagas.acquire(blocking=False):
+            await asyncio.sleep(0.02)
+        try:
+            yield
+        finally:
+            vagas.release()
+
+
+async def encerrar_geocoding() -> None:
+    """Fecha as conexões do AsyncClient do event loop atual (desligamento)"""
+    cliente = _clientes.pop(asyncio.get_running_loop(), None)
+    if cliente is not None:
+        await cliente.http.aclose()
+
+
+# ============ GEOCODING ============
+
+async def geocode_address_async(
+    address: str,
+    city: str = "Ribeirão Preto",
+    state: str = "SP"
+) -> Optional[Tuple[float, float]]:
+    """
+    Converte um endereço em coordenadas (lat, lng) - versão async
+
+    Cache primeiro; o que não está no cache vai ao Google uma vez só, mesmo
+    com várias requisições pedindo o mesmo endereço ao mesmo tempo.
+    """
+    local = _da_base_local(address, city)
+    if local:
+        return local
+
+    full_address = f"{address}, {city}, {state}, Brasil"
+    chave = normalizar_endereco(full_address)
+
+    futuro, consultar = _entrar_no_voo(chave)
+    if consultar:
+        # Tarefa própria: se a requisição que abriu a consulta cair, as que
+        # estão esperando o mesmo endereço recebem a resposta mesmo assim
+        tarefa = asyncio.ensure_future(_voar(chave, full_address, futuro))
+        _tarefas.add(tarefa)
+        tarefa.add_done_callback(_tarefas.discard)
+    return await asyncio.wrap_future(futuro)
+
+
+async def _voar(chave: str, full_address: str, futuro: Future) -> None:
+    try:
+        coords = await _resolver_async(chave, full_address)
+    except Exception as erro:
+        _sair_do_voo(chave, futuro, erro=erro)
+    else:
+        _sair_do_voo(chave, futuro, coords)
+
+
+async def _resolver_async(chave: str, full_address: str) -> Optional[Tuple[float, float]]:
+    em_cache = await run_in_threadpool(cache_geocoding.obter, chave)
+    if em_cache is not AUSENTE:
+        print(f"📍 Cache hit: {full_address}")
+        return em_cache
+
+    encontrado, coords = await _consultar_google_async(full_address)
+    if encontrado is not None:
+        # Só guarda resposta definitiva (erro de rede/cota tenta de novo depois)
+        await run_in_threadpool(cache_geocoding.guardar, chave, coords)
+    return coords
 
 
 def geocode_address(address: str, city: str = "Ribeirão Preto", state: str = "SP") -> Optional[Tuple[float, float]]:
     """
     Converte um endereço em coordenadas (lat, lng) usando Google Maps API
+
+    Passa antes pela base local (se configurada) e pelo cache (memória +
+    banco, ver geocode_cache_service): endereço já resolvido - ou já dado
+    como não encontrado - não vai ao Google.
+
+    Numa rota síncrona (thread do servidor) roda no event loop, pelo
+    geocode_address_async; fora do servidor, consulta direto.
     """
-    # Monta o endereço completo
+    local = _da_base_local(address, city)
+    if local:
+        return local
+
+    try:
+        return from_thread.run(geocode_address_async, address, city, state)
+    except RuntimeError:
+        # Não é uma thread do servidor (script, thread própria)
+        pass
+
     full_address = f"{address}, {city}, {state}, Brasil"
-    
-    # Verifica cache primeiro
-    cache_key = full_address.lower().strip()
-    if cache_key in _geocode_cache:
-        print(f"📍 Cache hit: {address}")
-        return _geocode_cache[cache_key]
-    
-    # Chama Google Geocoding API
+    cache_key = normalizar_endereco(full_address)
+
+    futuro, consultar = _entrar_no_voo(cache_key)
+    if not consultar:
+        return futuro.result()
     try:
-        encoded_address = urllib.parse.quote(full_address)
-        url = f"https://maps.googleapis.com/maps/api/geocode/json?address={encoded_address}&key={GOOGLE_API_KEY}"
-        
-        with httpx.Client(timeout=10.0) as client:
-            response = client.get(url)
-            
-            if response.status_code == 200:
-                data = response.json()
-                
-                if data.get("status") == "OK" and data.get("results"):
-                    location = data["results"][0]["geometry"]["location"]
-                    lat = location["lat"]
-                    lng = location["lng"]
-                    
-                    # Salva no cache
-                    _geocode_cache[cache_key] = (lat, lng)
-                    print(f"✅ Google Geocoding: {address} → ({lat}, {lng})")
-                    return (lat, lng)
-                else:
-                    print(f"❌ Google Geocoding falhou: {data.get('status')} - {address}")
-                    return None
-            else:
-                print(f"❌ Erro HTTP {response.status_code}")
-                return None
-                
+        coords = _resolver(cache_key, full_address)
+    except Exception as erro:
+        _sair_do_voo(cache_key, futuro, erro=erro)
+        raise
+    _sair_do_voo(cache_key, futuro, coords)
+    return coords
+
+
+def _resolver(cache_key: str, full_address: str) -> Optional[Tuple[float, float]]:
+    em_cache = cache_geocoding.obter(cache_key)
+    if em_cache is not AUSENTE:
+        print(f"📍 Cache hit: {full_address}")
+        return em_cache
+
+    with _vagas_da_chave(GOOGLE_API_KEY):
+        encontrado, coords = _consultar_google(full_address)
+    if encontrado is not None:
+        cache_geocoding.guardar(cache_key, coords)
+    return coords
+
+
+# ============ GOOGLE GEOCODING API ============
+
+def _parametros(full_address: str) -> Dict[str, str]:
+    return {"address": full_address, "key": GOOGLE_API_KEY}
+
+
+def _interpretar(full_address: str, response: httpx.Response) -> Tuple[Optional[bool], Optional[Tuple[float, float]]]:
+    """
+    Resposta da Google Geocoding API
+
+    Returns:
+        (True, coords) encontrado, (False, None) endereço não existe,
+        (None, None) erro temporário (cota, HTTP)
+    """
+    if response.status_code != 200:
+        print(f"❌ Erro HTTP {response.status_code}")
+        return None, None
+
+    data = response.json()
+
+    if data.get("status") == "OK" and data.get("results"):
+        location = data["results"][0]["geometry"]["location"]
+        lat = location["lat"]
+        lng = location["lng"]
+        print(f"✅ Google Geocoding: {full_address} → ({lat}, {lng})")
+        return True, (lat, lng)
+    elif data.get("status") == "ZERO_RESULTS":
+        print(f"❌ Endereço não encontrado: {full_address}")
+        return False, None
+    else:
+        print(f"❌ Google Geocoding falhou: {data.get('status')} - {full_address}")
+        return None, None
+
+
+async def _consultar_google_async(full_address: str) -> Tuple[Optional[bool], Optional[Tuple[float, float]]]:
+    """Chama a Google Geocoding API pelo AsyncClient do loop (respeitando o limite da API key)"""
+    cliente = _cliente_do_loop()
+    try:
+        async with _vaga_async(cliente, GOOGLE_API_KEY):
+            with _lock_voo:
+                _contadores["consultas_google"] += 1
+            response = await cliente.http.get(GOOGLE_GEOCODING_URL, params=_parametros(full_address))
+        return _interpretar(full_address, response)
+    except Exception as e:
+        print(f"❌ Erro no geocoding: {e}")
+        return None, None
+
+
+def _consultar_google(full_address: str) -> Tuple[Optional[bool], Optional[Tuple[float, float]]]:
+    """
+    Chama a Google Geocoding API (síncrono, fora do servidor)
+
+    Returns:
+        (True, coords) encontrado, (False, None) endereço não existe,
+        (None, None) erro temporário (rede, cota, HTTP)
+    """
+    try:
+        with _lock_voo:
+            _contadores["consultas_google"] += 1
+        with httpx.Client(timeout=TIMEOUT_GEOCODING) as client:
+            return _interpretar(full_address, client.get(GOOGLE_GEOCODING_URL, params=_parametros(full_address)))
     except Exception as e:
         print(f"❌ Erro no geocoding: {e}")
-        return None
+        return None, None
+
+
+async def geocode_addresses_async(
+    addresses: List[str],
+    city: str = "Ribeirão Preto",
+    state: str = "SP"
+) -> Dict[str, Optional[Tuple[float, float]]]:
+    """
+    Geocoding em lote (ex: importação de pedidos)
+
+    Endereços repetidos são consultados uma vez; os que não estão no cache
+    vão à API ao mesmo tempo (até GEOCODE_MAX_CONCURRENT por API key).
+
+    Returns:
+        {endereço: (lat, lng) ou None se não encontrado}
+    """
+    unicos = list(dict.fromkeys(addresses))
+    resultados = await asyncio.gather(*(geocode_address_async(address, city, state) for address in unicos))
+    return dict(zip(unicos, resultados))
+
+
+async def geocode_address_detailed_async(address: str, city: str = "Ribeirão Preto", state: str = "SP") -> dict:
+    """Versão detalhada (async) que retorna mais informações"""
+    return _detalhar(address, city, state, await geocode_address_async(address, city, state))
 
 
 def geocode_address_detailed(address: str, city: str = "Ribeirão Preto", state: str = "SP") -> dict:
     """
     Versão detalhada que retorna mais informações
     """
+    return _detalhar(address, city, state, geocode_address(address, city, state))
+
+
+def _detalhar(address: str, city: str, state: str, coords: Optional[Tuple[float, float]]) -> dict:
     full_address = f"{address}, {city}, {state}, Brasil"
-    
-    coords = geocode_address(address, city, state)
-    
+
     if coords:
         return {
             "found": True,
@@ -90,11 +382,10 @@ def geocode_address_detailed(address: str, city: str = "Ribeirão Preto", state:
 
 
 def clear_cache():
-    """Limpa o cache de geocoding"""
-    global _geocode_cache
-    _geocode_cache = {}
+    """Limpa o cache de geocoding em memória (o do banco continua)"""
+    cache_geocoding.limpar_memoria()
 
 
 def get_cache_size():
-    """Retorna o tamanho do cache"""
-    return len(_geocode_cache)
+    """Retorna o tamanho do cache em memória"""
+    return cache_geocoding.tamanho_memoria()
@@ -0,0 +1,452 @@
+"""
+Serviço de Estado Operacional ao Vivo - Contadores em memória para o dashboard
+
+O dashboard consulta /dispatch/alerts, /metrics, /previsao, /recommendation
+e /stats o tempo todo. Em vez de recontar tudo no banco a cada poll,
+mantemos por restaurante, em memória:
+- Pedidos por status (fila = READY, em rota = ASSIGNED + PICKED_UP)
+- Motoboys por status
+- Lotes ativos
+- Janela das últimas 24h de pedidos (pedidos/hora, tempos de preparo e rota)
+
+COMO SE MANTÉM ATUALIZADO:
+1. Incremental: hooks da Session (after_flush/after_commit) capturam toda
+   transição de status de Order, Courier e Batch feita pelos endpoints
+   (scan, pickup, deliver, cancel, dispatch, complete-batch...). Só é
+   aplicado depois do COMMIT - rollback descarta.
+2. Reconciliação: a cada RECONCILIACAO_SEGUNDOS o estado é recarregado do
+   banco (corrige drift de outros workers/processos e escrita direta no banco).
+
+🔒 PROTEÇÃO MULTI-TENANT:
+- Um estado por restaurant_id
+"""
+import os
+import threading
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, List, Tuple
+
+from sqlalchemy import event, inspect, or_
+from sqlmodel import Session, select
+
+from models import (
+    Order, Courier, Batch, PrepType,
+    OrderStatus, CourierStatus, BatchStatus
+)
+from services.counting_service import (
+    contar_pedidos_por_status,
+    contar_motoboys_por_status,
+    contar_batches_ativos,
+    pedidos_em_rota,
+    STATUS_BATCH_ATIVO
+)
+from services.metrics_service import (
+    TemposAgregados,
+    MAX_TEMPO_PREPARO_MIN,
+    MAX_TEMPO_ROTA_MIN,
+    FATOR_IDA_VOLTA
+)
+
+
+# ============ CONFIGURAÇÕES ============
+
+# De quanto em quanto tempo o estado em memória é recarregado do banco
+RECONCILIACAO_SEGUNDOS = int(os.environ.get("LIVE_STATE_RECONCILE_SECONDS", "60"))
+
+# Janela de pedidos mantida em memória (métricas usam 24h, previsão usa 2h)
+JANELA_HORAS = 24
+
+
+# ============ ESTRUTURAS ============
+
+@dataclass
+class PedidoRecente:
+    """Campos de um pedido da janela que entram no cálculo de tempos"""
+    status: OrderStatus
+    prep_type: PrepType
+    created_at: datetime
+    ready_at: Optional[datetime]
+    delivered_at: Optional[datetime]
+
+
+@dataclass
+class EstadoRestaurante:
+    """Estado vivo (mutável) de um restaurante - acessado sempre sob _lock"""
+    pedidos_por_status: Dict[OrderStatus, int]
+    motoboys_por_status: Dict[CourierStatus, int]
+    batches_ativos: int
+    recentes: Dict[str, PedidoRecente]
+    reconciliado_em: datetime
+
+
+@dataclass
+class FotoOperacional:
+    """
+    Foto (cópia imutável) do estado de um restaurante
+
+    É o que os serviços de dashboard recebem - nenhum acesso ao banco.
+    """
+    pedidos_por_status: Dict[OrderStatus, int]
+    motoboys_por_status: Dict[CourierStatus, int]
+    batches_ativos: int
+    pedidos_ultima_hora: int
+    tempos_24h: TemposAgregados
+    tempos_2h: TemposAgregados
+    reconciliado_em: datetime
+    timestamp: datetime = field(default_factory=datetime.now)
+
+    @property
+    def pedidos_fila(self) -> int:
+        return self.pedidos_por_status[OrderStatus.READY]
+
+    @property
+    def pedidos_em_rota(self) -> int:
+        return pedidos_em_rota(self.pedidos_por_status)
+
+    @property
+    def motoboys_disponiveis(self) -> int:
+        return self.motoboys_por_status[CourierStatus.AVAILABLE]
+
+    @property
+    def motoboys_ocupados(self) -> int:
+        return self.motoboys_por_status[CourierStatus.BUSY]
+
+
+_estados: Dict[Optional[str], EstadoRestaurante] = {}
+_lock = threading.Lock()
+
+
+# ============ LEITURA ============
+
+def obter_foto_operacional(
+    session: Session,
+    restaurant_id: Optional[str] = None  # 🔒 PROTEÇÃO
+) -> FotoOperacional:
+    """
+    Retorna a foto operacional do restaurante
+
+    Só vai ao banco na primeira leitura ou quando o estado está velho
+    (mais de RECONCILIACAO_SEGUNDOS); fora isso, responde da memória.
+    """
+    agora = datetime.now()
+    with _lock:
+        estado = _estados.get(restaurant_id)
+        precisa_reconciliar = (
+            estado is None
+            or (agora - estado.reconciliado_em).total_seconds() > RECONCILIACAO_SEGUNDOS
+        )
+
+    if precisa_reconciliar:
+        from database import engine, sessao_e_replica
+        if sessao_e_replica(session):
+            # Réplica pode estar atrasada: a base dos contadores vem do primário
+            with Session(engine) as primaria:
+                reconciliar_estado(primaria, restaurant_id)
+        else:
+            reconciliar_estado(session, restaurant_id)
+
+    with _lock:
+        return _montar_foto(_estados[restaurant_id], agora)
+
+
+def foto_em_memoria(restaurant_id: Optional[str] = None) -> Optional[FotoOperacional]:
+    """
+    Foto do restaurante SEM ir ao banco (None se o estado ainda não foi carregado)
+
+    Usado por quem não tem Session em mãos (ex: hooks pós-commit).
+    """
+    with _lock:
+        estado = _estados.get(restaurant_id)
+        if estado is None:
+            return None
+        return _montar_foto(estado, datetime.now())
+
+
+def reconciliar_estado(
+    session: Session,
+    restaurant_id: Optional[str] = None  # 🔒 PROTEÇÃO
+) -> None:
+    """Recarrega do banco o estado de um restaurante (contagens + janela de 24h)"""
+    agora = datetime.now()
+    cutoff = agora - timedelta(hours=JANELA_HORAS)
+
+    # Só as colunas necessárias, nunca o objeto Order inteiro
+    query = select(
+        Order.id, Order.status, Order.prep_type,
+        Order.created_at, Order.ready_at, Order.delivered_at
+    ).where(
+        or_(Order.created_at >= cutoff, Order.ready_at >= cutoff)
+    )
+    if restaurant_id:
+        query = query.where(Order.restaurant_id == restaurant_id)
+
+    recentes = {
+        order_id: PedidoRecente(
+            status=normalizar(OrderStatus, status),
+            prep_type=normalizar(PrepType, prep_type),
+            created_at=created_at,
+            ready_at=ready_at,
+            delivered_at=delivered_at
+        )
+        for order_id, status, prep_type, created_at, ready_at, delivered_at
+        in session.exec(query).all()
+    }
+
+    estado = EstadoRestaurante(
+        pedidos_por_status=contar_pedidos_por_status(session, restaurant_id),
+        motoboys_por_status=contar_motoboys_por_status(session, restaurant_id),
+        batches_ativos=contar_batches_ativos(session, restaurant_id),
+        recentes=recentes,
+        reconciliado_em=agora
+    )
+
+    with _lock:
+        _estados[restaurant_id] = estado
+
+
+def limpar_estados() -> None:
+    """Descarta todo o estado em memória (próxima leitura recarrega do banco)"""
+    with _lock:
+        _estados.clear()
+
+
+# ============ CÁLCULOS EM MEMÓRIA ============
+
+def _montar_foto(estado: EstadoRestaurante, agora: datetime) -> FotoOperacional:
+    """Copia o estado vivo para uma FotoOperacional (chamar sob _lock)"""
+    _podar_janela(estado, agora)
+    recentes = list(estado.recentes.values())
+    uma_hora = agora - timedelta(hours=1)
+    return FotoOperacional(
+        pedidos_por_status=dict(estado.pedidos_por_status),
+        motoboys_por_status=dict(estado.motoboys_por_status),
+        batches_ativos=estado.batches_ativos,
+        pedidos_ultima_hora=sum(1 for p in recentes if p.created_at >= uma_hora),
+        tempos_24h=_agregar_tempos(recentes, agora - timedelta(hours=24)),
+        tempos_2h=_agregar_tempos(recentes, agora - timedelta(hours=2)),
+        reconciliado_em=estado.reconciliado_em,
+        timestamp=agora
+    )
+
+
+def _podar_janela(estado: EstadoRestaurante, agora: datetime) -> None:
+    """Remove da janela pedidos que saíram das últimas JANELA_HORAS"""
+    cutoff = agora - timedelta(hours=JANELA_HORAS)
+    vencidos = [
+        order_id for order_id, p in estado.recentes.items()
+        if not _dentro_da_janela(p, cutoff)
+    ]
+    for order_id in vencidos:
+        del estado.recentes[order_id]
+
+
+def _dentro_da_janela(pedido: PedidoRecente, cutoff: datetime) -> bool:
+    return pedido.created_at >= cutoff or (
+        pedido.ready_at is not None and pedido.ready_at >= cutoff
+    )
+
+
+def _agregar_tempos(recentes: List[PedidoRecente], cutoff: datetime) -> TemposAgregados:
+    """
+    Tempos de preparo e rota dos pedidos da janela com referência >= cutoff
+
+    - Preparo: created_at → ready_at (pedidos criados depois do cutoff)
+    - Rota: ready_at → delivered_at * 1.5 (entregues, prontos depois do cutoff)
+    """
+    soma_preparo: Dict[PrepType, float] = {}
+    amostras_preparo: Dict[PrepType, int] = {}
+    soma_rota = 0.0
+    amostras_rota = 0
+
+    for p in recentes:
+        if p.ready_at is None:
+            continue
+
+        if p.created_at >= cutoff:
+            preparo = (p.ready_at - p.created_at).total_seconds() / 60
+            if 0 < preparo < MAX_TEMPO_PREPARO_MIN:
+                soma_preparo[p.prep_type] = soma_preparo.get(p.prep_type, 0.0) + preparo
+                amostras_preparo[p.prep_type] = amostras_preparo.get(p.prep_type, 0) + 1
+
+        if (
+            p.status == OrderStatus.DELIVERED
+            and p.delivered_at is not None
+            and p.ready_at >= cutoff
+        ):
+            rota = (p.delivered_at - p.ready_at).total_seconds() / 60
+            if 0 < rota < MAX_TEMPO_ROTA_MIN:
+                soma_rota += rota
+                amostras_rota += 1
+
+    return TemposAgregados(
+        soma_preparo=soma_preparo,
+        amostras_preparo=amostras_preparo,
+        soma_rota=soma_rota * FATOR_IDA_VOLTA,
+        amostras_rota=amostras_rota
+    )
+
+
+def normalizar(enum_cls, valor):
+    """Converte valor do banco/objeto para o Enum (aceita value ou name)"""
+    if valor is None or isinstance(valor, enum_cls):
+        return valor
+    try:
+        return enum_cls(valor)
+    except ValueError:
+        return enum_cls[valor]
+
+
+# ============ ATUALIZAÇÃO INCREMENTAL (HOOKS DA SESSION) ============
+
+# Delta pendente: (restaurant_id, função que aplica no EstadoRestaurante)
+Delta = Tuple[Optional[str], Callable[[EstadoRestaurante], None]]
+
+_CHAVE_PENDENTES = "live_state_pendentes"
+
+
+def campo_mudou(obj, atributo: str) -> bool:
+    return inspect(obj).attrs[atributo].history.has_changes()
+
+
+def _valor_anterior(obj, atributo: str):
+    """Valor do atributo antes do flush (None se não havia valor)"""
+    historico = inspect(obj).attrs[atributo].history
+    if historico.deleted:
+        return historico.deleted[0]
+    if historico.unchanged:
+        return historico.unchanged[0]
+    return None
+
+
+def status_antes_depois(obj, enum_cls, novo: bool, removido: bool):
+    """(status antes, status depois) do flush - iguais se não houve transição"""
+    if removido:
+        return normalizar(enum_cls, _valor_anterior(obj, "status")), None
+    depois = normalizar(enum_cls, obj.status)
+    if novo:
+        return None, depois
+    if not campo_mudou(obj, "status"):
+        return depois, depois
+    return normalizar(enum_cls, _valor_anterior(obj, "status")), depois
+
+
+def _delta_contador(contador: str, antes, depois) -> Optional[Callable]:
+    """Move 1 unidade do status `antes` para o status `depois`"""
+    if antes == depois:
+        return None
+
+    def aplicar(estado: EstadoRestaurante):
+        contagem = getattr(estado, contador)
+        if antes is not None:
+            contagem[antes] = max(0, contagem[antes] - 1)
+        if depois is not None:
+            contagem[depois] += 1
+    return aplicar
+
+
+# Campos de Order que alteram a janela de tempos
+_CAMPOS_JANELA = ("status", "prep_type", "created_at", "ready_at", "delivered_at")
+
+
+def _deltas_order(order: Order, novo: bool, removido: bool) -> List[Callable]:
+    antes, depois = status_antes_depois(order, OrderStatus, novo, removido)
+    deltas = []
+
+    contador = _delta_contador("pedidos_por_status", antes, depois)
+    if contador:
+        deltas.append(contador)
+
+    order_id = order.id
+    if removido:
+        deltas.append(lambda estado: estado.recentes.pop(order_id, None))
+    elif novo or any(campo_mudou(order, campo) for campo in _CAMPOS_JANELA):
+        recente = PedidoRecente(
+            status=depois,
+            prep_type=normalizar(PrepType, order.prep_type),
+            created_at=order.created_at,
+            ready_at=order.ready_at,
+            delivered_at=order.delivered_at
+        )
+
+        def atualizar_janela(estado: EstadoRestaurante):
+            cutoff = datetime.now() - timedelta(hours=JANELA_HORAS)
+            if _dentro_da_janela(recente, cutoff):
+                estado.recentes[order_id] = recente
+            else:
+                estado.recentes.pop(order_id, None)
+        deltas.append(atualizar_janela)
+
+    return deltas
+
+
+def _deltas_courier(courier: Courier, novo: bool, removido: bool) -> List[Callable]:
+    antes, depois = status_antes_depois(courier, CourierStatus, novo, removido)
+    contador = _delta_contador("motoboys_por_status", antes, depois)
+    return [contador] if contador else []
+
+
+def _deltas_batch(batch: Batch, novo: bool, removido: bool) -> List[Callable]:
+    antes, depois = status_antes_depois(batch, BatchStatus, novo, removido)
+    variacao = int(depois in STATUS_BATCH_ATIVO) - int(antes in STATUS_BATCH_ATIVO)
+    if variacao == 0:
+        return []
+
+    def aplicar(estado: EstadoRestaurante):
+        estado.batches_ativos = max(0, estado.batches_ativos + variacao)
+    return [aplicar]
+
+
+def _carregar_status_anterior(target, value, oldvalue, initiator):
+    return value
+
+
+# active_history: ao trocar o status de um objeto expirado (ex: depois de um
+# commit no meio do dispatch), o SQLAlchemy carrega o valor antigo antes -
+# sem isso não saberíamos de qual status decrementar.
+for _modelo in (Order, Courier, Batch):
+    event.listen(_modelo.status, "set", _carregar_status_anterior, active_history=True, retval=True)
+
+
+_GERADORES = {
+    Order: _deltas_order,
+    Courier: _deltas_courier,
+    Batch: _deltas_batch,
+}
+
+
+@event.listens_for(Session, "after_flush")
+def _coletar_deltas(session, flush_context):
+    """Guarda as transições do flush - só serão aplicadas após o commit"""
+    pendentes: List[Delta] = session.info.setdefault(_CHAVE_PENDENTES, [])
+
+    for colecao, novo, removido in (
+        (session.new, True, False),
+        (session.dirty, False, False),
+        (session.deleted, False, True),
+    ):
+        for obj in colecao:
+            gerador = _GERADORES.get(type(obj))
+            if gerador is None:
+                continue
+            for delta in gerador(obj, novo, removido):
+                pendentes.append((obj.restaurant_id, delta))
+
+
+@event.listens_for(Session, "after_commit")
+def _aplicar_deltas(session):
+    pendentes: List[Delta] = session.info.pop(_CHAVE_PENDENTES, [])
+    if not pendentes:
+        return
+
+    with _lock:
+        for restaurant_id, delta in pendentes:
+            # Aplica no estado do restaurante e no estado "global" (sem filtro)
+            for chave in {restaurant_id, None}:
+                estado = _estados.get(chave)
+                if estado is not None:
+                    delta(estado)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_deltas(session):
+    session.info.pop(_CHAVE_PENDENTES, None)
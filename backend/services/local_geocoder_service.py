@@ -0,0 +1,212 @@
+"""
+Serviço de Geocoding Local - base de ruas/CEPs da cidade, sem rede
+
+Opcional: com LOCAL_GEOCODER_FILE configurado, o geocoding tenta primeiro
+uma base local da cidade atendida (LOCAL_GEOCODER_CITY). Endereço achado
+aqui não vai ao cache nem ao Google: microssegundos, e o cadastro de
+pedidos funciona mesmo sem internet.
+
+Base: CSV com cabeçalho, uma linha por trecho de rua:
+
+    rua,numero_inicio,numero_fim,lat_inicio,lng_inicio,lat_fim,lng_fim,cep
+    Rua Visconde de Inhaúma,2001,2399,-21.1901,-47.8102,-21.1925,-47.8131,14010100
+
+- rua + faixa de números: a posição é interpolada ao longo do trecho
+- cep (opcional): endereço só com CEP usa o meio do primeiro trecho do CEP;
+  linhas sem rua (só cep, lat_inicio, lng_inicio) também valem
+
+Estrutura em memória (compacta, ordenada):
+- nomes de rua normalizados (sem acento, abreviações expandidas) em uma
+  lista ORDENADA: busca exata ou por prefixo com bisect
+- trechos em arrays (números e coordenadas), ordenados por rua e início
+"""
+import csv
+import os
+import re
+import threading
+from array import array
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Optional, Tuple
+
+from services.geocode_cache_service import normalizar_endereco
+
+
+# ============ CONFIGURAÇÕES ============
+
+# CSV da base local (vazio = desligado: tudo vai ao Google)
+LOCAL_GEOCODER_FILE = os.environ.get("LOCAL_GEOCODER_FILE", "")
+
+# Cidade coberta pela base (endereços de outras cidades vão ao Google)
+LOCAL_GEOCODER_CITY = os.environ.get("LOCAL_GEOCODER_CITY", "Ribeirão Preto")
+
+# Abreviações comuns em endereços → palavra completa
+ABREVIACOES = {
+    "r": "rua", "av": "avenida", "al": "alameda", "tv": "travessa", "trav": "travessa",
+    "pc": "praca", "pca": "praca", "rod": "rodovia", "est": "estrada", "lgo": "largo",
+    "dr": "doutor", "prof": "professor", "eng": "engenheiro", "cel": "coronel",
+    "gen": "general", "cap": "capitao", "pres": "presidente", "sta": "santa", "sto": "santo",
+}
+
+_RUA_NUMERO = re.compile(r"^(.*?),\s*(?:n[º°o]?\.?\s*)?(\d+)")
+_RUA_NUMERO_NO_FIM = re.compile(r"^(.*\D)\s+(\d+)\s*$")
+_CEP = re.compile(r"\b(\d{5})-?(\d{3})\b")
+
+
+def normalizar_rua(rua: str) -> str:
+    """
+    Nome da rua para a busca: normalizado e sem abreviações
+
+    "Av. Dr. Francisco Junqueira" → "avenida doutor francisco junqueira"
+    """
+    return " ".join(ABREVIACOES.get(parte, parte) for parte in normalizar_endereco(rua).split())
+
+
+def separar_endereco(endereco: str) -> Tuple[Optional[str], Optional[int], Optional[str]]:
+    """
+    (rua normalizada, número, cep) de um endereço digitado
+
+    "Rua A, 10 - apto 3" → ("rua a", 10, None); o complemento é ignorado.
+    """
+    cep = _CEP.search(endereco)
+    cep = cep.group(1) + cep.group(2) if cep else None
+
+    principal = endereco.split(" - ")[0]
+    encontrado = _RUA_NUMERO.match(principal) or _RUA_NUMERO_NO_FIM.match(principal)
+    if not encontrado:
+        return None, None, cep
+    return normalizar_rua(encontrado.group(1)), int(encontrado.group(2)), cep
+
+
+class GeocodificadorLocal:
+    """
+    Base local de trechos de rua (e CEPs) de uma cidade
+
+    Imutável depois de montada: consultas não precisam de lock.
+    """
+
+    def __init__(self, trechos: List[Tuple[str, int, int, float, float, float, float]], ceps: Dict[str, Tuple[float, float]]):
+        trechos = sorted(trechos)
+        self._ruas: List[str] = []       # nomes únicos, ordenados
+        self._comeco = array("I")        # rua i → trechos [comeco[i], comeco[i + 1])
+        self._inicio = array("i")
+        self._fim = array("i")
+        self._coords = array("d")        # lat_inicio, lng_inicio, lat_fim, lng_fim por trecho
+        for indice, (rua, inicio, fim, *coords) in enumerate(trechos):
+            if not self._ruas or self._ruas[-1] != rua:
+                self._ruas.append(rua)
+                self._comeco.append(indice)
+            self._inicio.append(inicio)
+            self._fim.append(fim)
+            self._coords.extend(coords)
+        self._comeco.append(len(trechos))
+        self._ceps = ceps
+
+    @classmethod
+    def do_csv(cls, caminho: str) -> "GeocodificadorLocal":
+        """Monta a base a partir do CSV (formato no topo do módulo)"""
+        trechos = []
+        ceps: Dict[str, Tuple[float, float]] = {}
+        with open(caminho, newline="", encoding="utf-8") as arquivo:
+            for linha in csv.DictReader(arquivo):
+                cep = re.sub(r"\D", "", linha.get("cep") or "")
+                lat_inicio, lng_inicio = float(linha["lat_inicio"]), float(linha["lng_inicio"])
+                if (linha.get("rua") or "").strip():
+                    lat_fim = float(linha.get("lat_fim") or lat_inicio)
+                    lng_fim = float(linha.get("lng_fim") or lng_inicio)
+                    inicio = int(linha["numero_inicio"])
+                    fim = int(linha.get("numero_fim") or inicio)
+                    trechos.append((normalizar_rua(linha["rua"]), inicio, fim, lat_inicio, lng_inicio, lat_fim, lng_fim))
+                    if cep and cep not in ceps:
+                        ceps[cep] = ((lat_inicio + lat_fim) / 2, (lng_inicio + lng_fim) / 2)
+                elif cep:
+                    ceps[cep] = (lat_inicio, lng_inicio)
+        return cls(trechos, ceps)
+
+    def __len__(self) -> int:
+        return len(self._inicio)
+
+    # ---------- consulta ----------
+
+    def geocodificar(self, endereco: str) -> Optional[Tuple[float, float]]:
+        """(lat, lng) pela rua + número ou, sem isso, pelo CEP; None se a base não cobre"""
+        rua, numero, cep = separar_endereco(endereco)
+        if rua is not None:
+            coords = self.por_rua(rua, numero)
+            if coords:
+                return coords
+        if cep is not None:
+            return self._ceps.get(cep)
+        return None
+
+    def por_rua(self, rua: str, numero: int) -> Optional[Tuple[float, float]]:
+        """Posição do número na rua (interpolada no trecho que contém o número)"""
+        i = self._buscar_rua(rua)
+        if i is None:
+            return None
+
+        comeco, fim_rua = self._comeco[i], self._comeco[i + 1]
+        # Último trecho que começa até o número (trechos podem se sobrepor: lados par/ímpar)
+        j = bisect_right(self._inicio, numero, comeco, fim_rua) - 1
+        while j >= comeco:
+            if self._inicio[j] <= numero <= self._fim[j]:
+                return self._interpolar(j, numero)
+            j -= 1
+        return None
+
+    def _buscar_rua(self, rua: str) -> Optional[int]:
+        """
+        Índice da rua: nome exato ou, senão, o ÚNICO nome que começa com ele
+
+        "rua visconde" acha "rua visconde de inhauma" se não houver outra
+        rua "visconde..."; prefixo ambíguo = não encontrado (vai ao Google).
+        """
+        i = bisect_left(self._ruas, rua)
+        if i < len(self._ruas) and self._ruas[i] == rua:
+            return i
+        prefixo = rua + " "
+        i = bisect_left(self._ruas, prefixo, i)
+        if i < len(self._ruas) and self._ruas[i].startswith(prefixo):
+            if i + 1 < len(self._ruas) and self._ruas[i + 1].startswith(prefixo):
+                return None
+            return i
+        return None
+
+    def _interpolar(self, j: int, numero: int) -> Tuple[float, float]:
+        lat_inicio, lng_inicio, lat_fim, lng_fim = self._coords[4 * j:4 * j + 4]
+        extensao = self._fim[j] - self._inicio[j]
+        fracao = (numero - self._inicio[j]) / extensao if extensao else 0.0
+        return (
+            round(lat_inicio + fracao * (lat_fim - lat_inicio), 7),
+            round(lng_inicio + fracao * (lng_fim - lng_inicio), 7)
+        )
+
+
+# ============ BASE DO PROCESSO ============
+
+_geocodificador: Optional[GeocodificadorLocal] = None
+_carregado = False
+_lock = threading.Lock()
+
+
+def obter_geocodificador_local() -> Optional[GeocodificadorLocal]:
+    """Base local (carregada na primeira consulta) ou None se não configurada"""
+    global _geocodificador, _carregado
+    if not _carregado:
+        with _lock:
+            if not _carregado:
+                if LOCAL_GEOCODER_FILE:
+                    try:
+                        _geocodificador = GeocodificadorLocal.do_csv(LOCAL_GEOCODER_FILE)
+                        print(f"🗺️ Geocoding local: {len(_geocodificador)} trechos de {LOCAL_GEOCODER_FILE}")
+                    except Exception as erro:
+                        print(f"⚠️ Geocoding local desligado: {erro}")
+                _carregado = True
+    return _geocodificador
+
+
+def geocodificar_local(address: str, city: str) -> Optional[Tuple[float, float]]:
+    """(lat, lng) pela base local, se ela existe e cobre a cidade"""
+    geocodificador = obter_geocodificador_local()
+    if geocodificador is None or normalizar_endereco(city) != normalizar_endereco(LOCAL_GEOCODER_CITY):
+        return None
+    return geocodificador.geocodificar(address)
@@ -0,0 +1,309 @@
+"""
+Serviço de Localização - Ingestão de GPS em alta frequência
+
+Antes, cada ping do app do motoboy fazia session.get + UPDATE + COMMIT.
+Com 200 motoboys a cada 5s são 40 commits/s só de posição.
+
+AGORA:
+1. O endpoint só valida e joga os pings num buffer em memória (sem banco)
+2. A cada INTERVALO_DESCARGA_SEGUNDOS uma tarefa de fundo descarrega:
+   - last_lat/last_lng: só a posição MAIS RECENTE de cada motoboy,
+     em um único UPDATE em lote (executemany) - N pings viram 1 linha
+   - Trajeto: todos os pontos vão para o histórico compacto append-only
+     (track_service), um write por motoboy
+3. O dashboard (canal SSE), o índice espacial (spatial_service) e o ETA
+   dos pedidos em rota (eta_service) recebem a posição na hora, sem
+   esperar a descarga
+
+Courier.last_lat/last_lng fica no máximo INTERVALO_DESCARGA_SEGUNDOS
+atrasado em relação ao último ping.
+"""
+import asyncio
+import os
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Dict, List, Optional, Tuple
+
+from sqlalchemy import bindparam, update
+from sqlmodel import Session
+
+from models import Batch, Courier
+from services.events_service import publicar_localizacao
+from services.eta_service import atualizar_posicao as atualizar_eta
+from services.spatial_service import registrar_posicao
+from services.track_service import (
+    anexar_pontos,
+    apagar_dias_antigos,
+    ler_trajeto,
+    medir_duracao_rota,
+    Ponto
+)
+
+
+# ============ CONFIGURAÇÕES ============
+
+# De quanto em quanto tempo o buffer é descarregado no banco/trajetos
+INTERVALO_DESCARGA_SEGUNDOS = float(os.environ.get("GPS_FLUSH_SECONDS", "2"))
+
+# Limite de pontos de trajeto em memória (protege se o disco travar)
+MAX_PONTOS_BUFFER = int(os.environ.get("GPS_MAX_BUFFERED_POINTS", "200000"))
+
+
+# ============ BUFFER ============
+
+@dataclass
+class Posicao:
+    """Última posição conhecida de um motoboy"""
+    lat: float
+    lng: float
+    timestamp: datetime
+
+
+class BufferLocalizacao:
+    """
+    Buffer thread-safe dos pings recebidos
+
+    - ultimas: courier_id → posição mais recente (write-coalescing)
+    - trajeto: courier_id → todos os pontos desde a última descarga
+    """
+
+    def __init__(self, max_pontos: int = MAX_PONTOS_BUFFER):
+        self.max_pontos = max_pontos
+        self.descartados = 0
+        self._ultimas: Dict[str, Posicao] = {}
+        self._trajeto: Dict[str, List[Ponto]] = {}
+        self._total_pontos = 0
+        self._lock = threading.Lock()
+
+    def registrar(self, courier_id: str, pontos: List[Ponto]) -> Posicao:
+        """Guarda os pontos e retorna a posição mais recente do motoboy"""
+        mais_recente = max(pontos, key=lambda p: p[0])
+        with self._lock:
+            atual = self._ultimas.get(courier_id)
+            if atual is None or mais_recente[0] >= atual.timestamp:
+                atual = Posicao(lat=mais_recente[1], lng=mais_recente[2], timestamp=mais_recente[0])
+                self._ultimas[courier_id] = atual
+
+            if self._total_pontos + len(pontos) > self.max_pontos:
+                # Disco/banco não está dando conta: perde trajeto, nunca a última posição
+                self.descartados += len(pontos)
+            else:
+                self._trajeto.setdefault(courier_id, []).extend(pontos)
+                self._total_pontos += len(pontos)
+            return atual
+
+    def ultima_posicao(self, courier_id: str) -> Optional[Posicao]:
+        """Posição ainda não descarregada (None se já foi para o banco)"""
+        with self._lock:
+            return self._ultimas.get(courier_id)
+
+    def pontos_pendentes(self, courier_id: str) -> List[Ponto]:
+        """Pontos do motoboy ainda não gravados no histórico"""
+        with self._lock:
+            return list(self._trajeto.get(courier_id, ()))
+
+    def drenar(self) -> Tuple[Dict[str, Posicao], Dict[str, List[Ponto]]]:
+        """Retira tudo do buffer (troca por estruturas vazias)"""
+        with self._lock:
+            ultimas, trajeto = self._ultimas, self._trajeto
+            self._ultimas, self._trajeto = {}, {}
+            self._total_pontos = 0
+        return ultimas, trajeto
+
+    def devolver(self, ultimas: Dict[str, Posicao]) -> None:
+        """Recoloca posições que falharam ao gravar (sem sobrescrever mais novas)"""
+        with self._lock:
+            for courier_id, posicao in ultimas.items():
+                self._ultimas.setdefault(courier_id, posicao)
+
+    def devolver_trajeto(self, trajeto: Dict[str, List[Ponto]]) -> None:
+        """Recoloca pontos que falharam ao gravar no histórico (antes dos que chegaram depois)"""
+        with self._lock:
+            for courier_id, pontos in trajeto.items():
+                if self._total_pontos + len(pontos) > self.max_pontos:
+                    self.descartados += len(pontos)
+                    continue
+                self._trajeto[courier_id] = pontos + self._trajeto.get(courier_id, [])
+                self._total_pontos += len(pontos)
+
+
+buffer = BufferLocalizacao()
+
+# courier_id → restaurant_id (motoboy não troca de restaurante)
+_restaurante_do_motoboy: Dict[str, Optional[str]] = {}
+
+
+def restaurante_do_motoboy(session: Session, courier_id: str) -> Optional[str]:
+    """
+    restaurant_id do motoboy, com cache - o banco só é consultado
+    no primeiro ping de cada motoboy
+
+    Levanta KeyError se o motoboy não existe.
+    """
+    if courier_id in _restaurante_do_motoboy:
+        return _restaurante_do_motoboy[courier_id]
+
+    courier = session.get(Courier, courier_id)
+    if not courier:
+        raise KeyError(courier_id)
+    _restaurante_do_motoboy[courier_id] = courier.restaurant_id
+    return courier.restaurant_id
+
+
+def esquecer_motoboy(courier_id: str) -> None:
+    """Remove o motoboy do cache (ex: foi excluído)"""
+    _restaurante_do_motoboy.pop(courier_id, None)
+
+
+# ============ INGESTÃO ============
+
+def registrar_pings(
+    session: Session,
+    courier_id: str,
+    pings: List[Tuple[Optional[datetime], float, float]]
+) -> int:
+    """
+    Recebe pings (timestamp, lat, lng) de um motoboy - não escreve no banco
+
+    Levanta KeyError se o motoboy não existe.
+    Retorna quantos pings foram aceitos.
+    """
+    restaurant_id = restaurante_do_motoboy(session, courier_id)
+
+    agora = datetime.now()
+    pontos = [(_hora_local(timestamp) or agora, lat, lng) for timestamp, lat, lng in pings]
+    posicao = buffer.registrar(courier_id, pontos)
+
+    # Índice espacial, ETA e dashboard recebem só a posição mais recente do lote de pings
+    registrar_posicao(restaurant_id, courier_id, posicao.lat, posicao.lng, posicao.timestamp)
+    atualizar_eta(courier_id, posicao.lat, posicao.lng, posicao.timestamp)
+    publicar_localizacao(restaurant_id, courier_id, posicao.lat, posicao.lng)
+    return len(pontos)
+
+
+def _hora_local(timestamp: Optional[datetime]) -> Optional[datetime]:
+    """O resto do sistema usa datetime local sem fuso - normaliza o do app"""
+    if timestamp is None or timestamp.tzinfo is None:
+        return timestamp
+    return timestamp.astimezone().replace(tzinfo=None)
+
+
+def trajeto(courier_id: str, inicio: datetime, fim: datetime) -> List[Ponto]:
+    """Trajeto do motoboy no intervalo: histórico gravado + pontos ainda no buffer"""
+    pontos = ler_trajeto(courier_id, inicio, fim)
+    pendentes = [p for p in buffer.pontos_pendentes(courier_id) if inicio <= p[0] <= fim]
+    if pendentes:
+        pontos = sorted(pontos + pendentes, key=lambda p: p[0])
+    return pontos
+
+
+def trajeto_do_lote(batch: Batch) -> List[Ponto]:
+    """Caminho real percorrido pelo motoboy durante o lote (replay)"""
+    return trajeto(batch.courier_id, batch.created_at, batch.completed_at or datetime.now())
+
+
+# Duração medida de lotes finalizados (não muda mais → cache sem expiração)
+MAX_DURACOES_CACHE = 5000
+_duracoes_medidas: Dict[str, Optional[float]] = {}
+
+
+def duracao_rota_medida(batch: Batch, origem_lat: float, origem_lng: float) -> Optional[float]:
+    """
+    Minutos entre a saída e a volta ao restaurante, medidos pelo GPS
+
+    None se o lote não tem trajeto gravado.
+    """
+    if batch.id in _duracoes_medidas:
+        return _duracoes_medidas[batch.id]
+
+    pontos = trajeto_do_lote(batch)
+    duracao = medir_duracao_rota(pontos, origem_lat, origem_lng) if pontos else None
+
+    if batch.completed_at is not None:
+        if len(_duracoes_medidas) >= MAX_DURACOES_CACHE:
+            _duracoes_medidas.pop(next(iter(_duracoes_medidas)))
+        _duracoes_medidas[batch.id] = duracao
+    return duracao
+
+
+# ============ DESCARGA ============
+
+def descarregar_localizacoes(session: Optional[Session] = None) -> int:
+    """
+    Grava o buffer: UPDATE em lote de last_lat/last_lng + trajeto append-only
+
+    Retorna quantos motoboys tiveram a posição atualizada.
+    Falha em uma das gravações devolve ao buffer o que não foi gravado
+    (a próxima descarga tenta de novo) e levanta o erro.
+    """
+    ultimas, trajeto = buffer.drenar()
+
+    parametros = [
+        {"b_id": courier_id, "b_lat": p.lat, "b_lng": p.lng, "b_updated_at": p.timestamp}
+        for courier_id, p in ultimas.items()
+    ]
+
+    erro_banco = None
+    if parametros:
+        try:
+            if session is None:
+                from database import engine
+                with Session(engine) as nova_sessao:
+                    _atualizar_posicoes(nova_sessao, parametros)
+            else:
+                _atualizar_posicoes(session, parametros)
+        except Exception as erro:
+            buffer.devolver(ultimas)
+            erro_banco = erro
+
+    # Histórico em disco (disco cheio, permissão): os pontos voltam ao buffer.
+    # Se parte dos motoboys já foi gravada, esses pontos podem repetir no
+    # trajeto - melhor que perdê-los.
+    if trajeto:
+        try:
+            anexar_pontos(trajeto)
+        except Exception:
+            buffer.devolver_trajeto(trajeto)
+            raise
+
+    if erro_banco is not None:
+        raise erro_banco
+    return len(parametros)
+
+
+# UPDATE em lote por chave primária (um executemany, sem carregar objetos).
+# Statement Core (não ORM) para não falhar se o motoboy foi excluído no meio.
+_tabela = Courier.__table__
+_UPDATE_POSICAO = (
+    update(_tabela)
+    .where(_tabela.c.id == bindparam("b_id"))
+    .values(
+        last_lat=bindparam("b_lat"),
+        last_lng=bindparam("b_lng"),
+        updated_at=bindparam("b_updated_at")
+    )
+)
+
+
+def _atualizar_posicoes(session: Session, parametros: List[dict]) -> None:
+    session.execute(_UPDATE_POSICAO, parametros)
+    session.commit()
+
+
+async def loop_descarga_localizacoes() -> None:
+    """
+    Tarefa de fundo (iniciada no lifespan do app) que descarrega o buffer
+
+    Uma vez por dia também apaga do histórico os dias além da retenção.
+    """
+    ultima_limpeza = None
+    while True:
+        await asyncio.sleep(INTERVALO_DESCARGA_SEGUNDOS)
+        try:
+            await asyncio.to_thread(descarregar_localizacoes)
+            if ultima_limpeza != date.today():
+                ultima_limpeza = date.today()
+                await asyncio.to_thread(apagar_dias_antigos)
+        except Exception as e:
+            print(f"⚠️ Erro ao descarregar localizações: {e}")
@@ -4,12 +4,12 @@ Serviço de Métricas - Calcula tempos e capacidades
 🔒 PROTEÇÃO MULTI-TENANT:
 - Todas as métricas filtram por restaurant_id
 """
-from datetime import datetime, timedelta
+from datetime import datetime
 from typing import Optional
 from dataclasses import dataclass
-from sqlmodel import Session, select
+from sqlmodel import Session
 
-from models import Order, Courier, OrderStatus, CourierStatus, PrepType
+from models import PrepType
 
 
 @dataclass
@@ -48,118 +48,45 @@ class MetricasCompletas:
     timestamp: datetime
 
 
-# ============ FUNÇÕES DE CÁLCULO ============
+# ============ TEMPOS AGREGADOS ============
 
-def calcular_tempo_preparo(
-    session: Session, 
-    prep_type: Optional[PrepType] = None,
-    restaurant_id: str = None  # 🔒 PROTEÇÃO
-) -> tuple[Optional[float], int]:
-    """
-    Calcula tempo médio de preparo (created_at → ready_at)
-    Retorna (média em minutos, quantidade de amostras)
-    """
-    cutoff = datetime.now() - timedelta(hours=24)
-    
-    query = select(Order).where(
-        Order.ready_at != None,
-        Order.created_at >= cutoff
-    )
-    
-    # 🔒 Filtra por restaurante
-    if restaurant_id:
-        query = query.where(Order.restaurant_id == restaurant_id)
-    
-    if prep_type:
-        query = query.where(Order.prep_type == prep_type)
-    
-    orders = session.exec(query).all()
-    
-    tempos = []
-    for order in orders:
-        if order.ready_at and order.created_at:
-            diff = (order.ready_at - order.created_at).total_seconds() / 60
-            if 0 < diff < 120:  # Entre 0 e 2 horas
-                tempos.append(diff)
-    
-    if len(tempos) < 2:
-        return None, len(tempos)
-    
-    return sum(tempos) / len(tempos), len(tempos)
+# Filtros de outliers (em minutos)
+MAX_TEMPO_PREPARO_MIN = 120  # Entre 0 e 2 horas
+MAX_TEMPO_ROTA_MIN = 180     # Entre 0 e 3 horas
+FATOR_IDA_VOLTA = 1.5        # Tempo de rota * 1.5 para considerar a volta
+MIN_AMOSTRAS_MEDIA = 2       # Menos que isso, a média não é confiável
 
 
-def calcular_tempo_rota(
-    session: Session,
-    restaurant_id: str = None  # 🔒 PROTEÇÃO
-) -> tuple[Optional[float], int]:
-    """
-    Calcula tempo médio de rota (ready_at → delivered_at) * 1.5 para ida+volta
+@dataclass
+class TemposAgregados:
     """
-    cutoff = datetime.now() - timedelta(hours=24)
-    
-    query = select(Order).where(
-        Order.status == OrderStatus.DELIVERED,
-        Order.delivered_at != None,
-        Order.ready_at != None,
-        Order.ready_at >= cutoff
-    )
-    
-    # 🔒 Filtra por restaurante
-    if restaurant_id:
-        query = query.where(Order.restaurant_id == restaurant_id)
-    
-    orders = session.exec(query).all()
-    
-    tempos = []
-    for order in orders:
-        if order.delivered_at and order.ready_at:
-            diff = (order.delivered_at - order.ready_at).total_seconds() / 60
-            if 0 < diff < 180:
-                tempos.append(diff * 1.5)  # Multiplica por 1.5 para considerar volta
-    
-    if len(tempos) < 2:
-        return None, len(tempos)
-    
-    return sum(tempos) / len(tempos), len(tempos)
-
-
-def contar_pedidos_hora(
-    session: Session,
-    restaurant_id: str = None  # 🔒 PROTEÇÃO
-) -> int:
-    """Conta pedidos na última hora"""
-    uma_hora = datetime.now() - timedelta(hours=1)
-    
-    query = select(Order).where(Order.created_at >= uma_hora)
-    
-    # 🔒 Filtra por restaurante
-    if restaurant_id:
-        query = query.where(Order.restaurant_id == restaurant_id)
-    
-    orders = session.exec(query).all()
-    return len(orders)
+    Somas e contagens de tempos por tipo de preparo (janela do live_state_service)
 
+    Guardamos SOMA + QUANTIDADE (e não a média) para poder combinar
+    os grupos sem perder precisão (média geral = soma total / total).
+    """
+    soma_preparo: dict[PrepType, float]
+    amostras_preparo: dict[PrepType, int]
+    soma_rota: float
+    amostras_rota: int
+
+    def tempo_preparo(self, prep_type: Optional[PrepType] = None) -> tuple[Optional[float], int]:
+        """Retorna (média em minutos, amostras) - geral se prep_type for None"""
+        tipos = [prep_type] if prep_type else list(PrepType)
+        soma = sum(self.soma_preparo.get(t, 0.0) for t in tipos)
+        amostras = sum(self.amostras_preparo.get(t, 0) for t in tipos)
+        if amostras < MIN_AMOSTRAS_MEDIA:
+            return None, amostras
+        return soma / amostras, amostras
+
+    def tempo_rota(self) -> tuple[Optional[float], int]:
+        """Retorna (média ida+volta em minutos, amostras)"""
+        if self.amostras_rota < MIN_AMOSTRAS_MEDIA:
+            return None, self.amostras_rota
+        return self.soma_rota / self.amostras_rota, self.amostras_rota
 
-def contar_motoboys(
-    session: Session,
-    restaurant_id: str = None  # 🔒 PROTEÇÃO
-) -> tuple[int, int]:
-    """Retorna (disponíveis, ocupados)"""
-    
-    # Query disponíveis
-    query_disp = select(Courier).where(Courier.status == CourierStatus.AVAILABLE)
-    if restaurant_id:
-        query_disp = query_disp.where(Courier.restaurant_id == restaurant_id)
-    disponiveis = len(session.exec(query_disp).all())
-    
-    # Query ocupados
-    query_ocup = select(Courier).where(Courier.status == CourierStatus.BUSY)
-    if restaurant_id:
-        query_ocup = query_ocup.where(Courier.restaurant_id == restaurant_id)
-    ocupados = len(session.exec(query_ocup).all())
-    
-    return disponiveis, ocupados
 
+# ============ FUNÇÕES DE CÁLCULO ============
 
 def calcular_motoboys_necessarios(pedidos_hora: float, tempo_rota_min: float) -> int:
     """
@@ -181,19 +108,27 @@ def obter_metricas_completas(
     session: Session,
     restaurant_id: str = None  # 🔒 PROTEÇÃO
 ) -> MetricasCompletas:
-    """Retorna todas as métricas consolidadas"""
+    """
+    Retorna todas as métricas consolidadas
+
+    Lê da foto operacional em memória (live_state_service) - o banco
+    só é consultado quando o estado precisa ser reconciliado.
+    """
+    from services.live_state_service import obter_foto_operacional
+    foto = obter_foto_operacional(session, restaurant_id)
     
-    # Preparo
-    media_short, amostras_short = calcular_tempo_preparo(session, PrepType.SHORT, restaurant_id)
-    media_long, amostras_long = calcular_tempo_preparo(session, PrepType.LONG, restaurant_id)
-    media_geral, _ = calcular_tempo_preparo(session, None, restaurant_id)
+    # Preparo e rota (janela de 24h)
+    tempos = foto.tempos_24h
+    media_short, amostras_short = tempos.tempo_preparo(PrepType.SHORT)
+    media_long, amostras_long = tempos.tempo_preparo(PrepType.LONG)
+    media_geral, _ = tempos.tempo_preparo()
     
     # Rota
-    tempo_rota, amostras_rota = calcular_tempo_rota(session, restaurant_id)
+    tempo_rota, amostras_rota = tempos.tempo_rota()
     
     # Capacidade
-    pedidos_hora = contar_pedidos_hora(session, restaurant_id)
-    disponiveis, ocupados = contar_motoboys(session, restaurant_id)
+    pedidos_hora = foto.pedidos_ultima_hora
+    disponiveis, ocupados = foto.motoboys_disponiveis, foto.motoboys_ocupados
     total_ativos = disponiveis + ocupados
     
     # Capacidade por motoboy (entregas/hora)
@@ -206,10 +141,7 @@ def obter_metricas_completas(
     deficit = max(0, motoboys_necessarios - total_ativos)
     
     # Pedidos aguardando
-    query_aguardando = select(Order).where(Order.status == OrderStatus.READY)
-    if restaurant_id:
-        query_aguardando = query_aguardando.where(Order.restaurant_id == restaurant_id)
-    aguardando = len(session.exec(query_aguardando).all())
+    aguardando = foto.pedidos_fila
     
     return MetricasCompletas(
         preparo=MetricasPreparo(
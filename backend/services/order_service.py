@@ -1,81 +1,369 @@
 """
 Serviço de Pedidos
-Helper functions para geração de IDs amigáveis
+Helper functions para geração de IDs amigáveis e transições de status
+
+short_id e tracking_code saem do contador do restaurante (contadores_pedidos)
+num único UPDATE ... RETURNING - sem MAX(), sem SELECT de conferência e sem
+colisão entre pedidos simultâneos.
+
+As transições recebem a Session como primeiro argumento e fazem o próprio
+commit - rodam pela fila de escrita (writer_service).
 """
-import random
+import hashlib
+import hmac
+import os
 import string
+from datetime import datetime
+from typing import Iterable, List, Optional, Tuple, Union
+from sqlalchemy import literal, update
+from sqlalchemy.exc import IntegrityError
 from sqlmodel import Session, select, func
-from models import Order
+from models import Order, OrderCreate, OrderStatus, Batch, Courier, CourierStatus, ContadorPedidos
 
 
-def generate_short_id(restaurant_id: str, session: Session) -> int:
-    """
-    Gera um short_id sequencial para o restaurante
+# Primeiro short_id de um restaurante
+SHORT_ID_INICIAL = 1001
 
-    Exemplo: 1001, 1002, 1003...
+# Chave da permutação dos códigos de rastreio - própria, separada da
+# SECRET_KEY (trocar a chave dos tokens não pode mudar os códigos).
+# NÃO troque depois de ter pedidos: com outra chave, códigos novos podem
+# repetir os antigos (gravar_pedidos contorna, mas queima short_ids).
+TRACKING_CODE_KEY = os.environ.get("TRACKING_CODE_KEY")
 
-    Args:
-        restaurant_id: ID do restaurante
-        session: Sessão do banco de dados
+# ⚠️ APENAS PARA DESENVOLVIMENTO LOCAL - NUNCA USE EM PRODUÇÃO!
+if not TRACKING_CODE_KEY:
+    import sys
+    print("⚠️  TRACKING_CODE_KEY não configurada! Códigos de rastreio com chave de desenvolvimento.", file=sys.stderr)
+    print("   Em PRODUÇÃO, gere uma chave própria (não reaproveite a SECRET_KEY).", file=sys.stderr)
+    TRACKING_CODE_KEY = "DEV-ONLY-motoflash-tracking-key"
+
+TRACKING_CODE_KEY = TRACKING_CODE_KEY.encode("utf-8")
+
+ALFABETO_RASTREIO = string.digits + string.ascii_uppercase  # Base 36
+TAMANHO_RASTREIO = 6      # MF-XXXXXX (cresce para 7+ só quando o par não cabe)
+RODADAS_FEISTEL = 8
+
+# Tentativas de gravar pedidos quando um tracking_code já existe
+TENTATIVAS_RASTREIO = 3
+
+
+def _reservar(session: Session, restaurant_id: str, quantidade: int) -> Tuple[int, int]:
+    """
+    Avança o contador do restaurante em `quantidade` - um UPDATE ... RETURNING
+
+    Atômico (dois pedidos simultâneos nunca recebem o mesmo número) e O(1),
+    sem MAX() sobre os pedidos. A linha fica travada até o commit da
+    transação de quem pediu.
 
     Returns:
-        int: Próximo short_id disponível para o restaurante
+        (número do restaurante, último short_id reservado)
     """
-    # Busca o maior short_id do restaurante
-    statement = select(func.max(Order.short_id)).where(
-        Order.restaurant_id == restaurant_id
+    if quantidade < 1:
+        raise ValueError("quantidade deve ser >= 1")
+
+    tabela = ContadorPedidos.__table__
+    reserva = (
+        update(tabela)
+        .where(tabela.c.restaurant_id == restaurant_id)
+        .values(ultimo_short_id=tabela.c.ultimo_short_id + quantidade)
+        .returning(tabela.c.numero, tabela.c.ultimo_short_id)
     )
-    max_short_id = session.exec(statement).first()
 
-    # Se não houver pedidos, começa em 1001
-    # Se houver, incrementa o último
-    if max_short_id is None or max_short_id == 0:
-        return 1001
-    else:
-        return max_short_id + 1
+    for _ in range(3):
+        linha = session.execute(reserva).one_or_none()
+        if linha is not None:
+            return linha.numero, linha.ultimo_short_id
+        # Primeiro pedido desde o contador: cria e tenta de novo
+        _criar_contador(session, restaurant_id)
+
+    raise RuntimeError(f"Não foi possível criar o contador de pedidos do restaurante {restaurant_id}")
 
 
-def generate_tracking_code() -> str:
+def _criar_contador(session: Session, restaurant_id: str) -> None:
     """
-    Gera um código de rastreio único alfanumérico
+    Contador começando no maior short_id já existente (ou antes do SHORT_ID_INICIAL)
+
+    O número do restaurante é o próximo livre. Se outro pedido criou o
+    contador junto (mesmo restaurante ou mesmo número), o INSERT não faz
+    nada e _reservar tenta de novo.
+    """
+    if session.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+
+    tabela = ContadorPedidos.__table__
+    proximo_numero = select(func.coalesce(func.max(tabela.c.numero), 0) + 1).scalar_subquery()
+    maior_existente = select(
+        literal(restaurant_id),
+        func.coalesce(func.max(Order.short_id), SHORT_ID_INICIAL - 1),
+        proximo_numero
+    ).where(Order.restaurant_id == restaurant_id)
+
+    session.execute(
+        insert(tabela)
+        .from_select(["restaurant_id", "ultimo_short_id", "numero"], maior_existente)
+        .on_conflict_do_nothing()
+    )
 
-    Formato: MF-XXXXXX (6 caracteres aleatórios)
-    Exemplo: MF-A3B7K9, MF-X2Y8Z5
+
+def reservar_short_ids(session: Session, restaurant_id: str, quantidade: int = 1) -> range:
+    """
+    Reserva `quantidade` short_ids seguidos para o restaurante
 
     Returns:
-        str: Código de rastreio único
+        range: os short_ids reservados (ex: range(1001, 1051))
     """
-    # Gera 6 caracteres aleatórios (letras maiúsculas + números)
-    random_part = ''.join(
-        random.choices(string.ascii_uppercase + string.digits, k=6)
-    )
+    _, ultimo = _reservar(session, restaurant_id, quantidade)
+    return range(ultimo - quantidade + 1, ultimo + 1)
+
+
+def reservar_identificadores(session: Session, restaurant_id: str, quantidade: int = 1) -> List[Tuple[int, str]]:
+    """
+    Reserva `quantidade` pedidos: [(short_id, tracking_code), ...]
+
+    Importação em lote: peça o bloco inteiro de uma vez - uma única query
+    para todos os short_ids e códigos de rastreio.
+    """
+    numero, ultimo = _reservar(session, restaurant_id, quantidade)
+    return [
+        (short_id, codigo_rastreio(numero, short_id))
+        for short_id in range(ultimo - quantidade + 1, ultimo + 1)
+    ]
+
+
+def codigo_rastreio(numero_restaurante: int, short_id: int) -> str:
+    """
+    Código de rastreio do pedido (MF-XXXXXX), único por construção
+
+    1. (número do restaurante, short_id) vira um inteiro só (par de
+       Szudzik): pares diferentes, inteiros diferentes
+    2. O inteiro é embaralhado por uma permutação com chave (rede de
+       Feistel sobre [0, 36^L)): inteiros diferentes, códigos diferentes -
+       e sem a chave não dá para deduzir o código do pedido vizinho
+    3. Escrito em base 36 com L dígitos: 6 enquanto restaurante e short_id
+       forem < 46.656 (36^3); depois 7, 8...
+
+    Sem SELECT para conferir: o índice único de tracking_code fica só como
+    rede de segurança (ex: códigos aleatórios de antes desta versão, ou
+    TRACKING_CODE_KEY trocada) - ver gravar_pedidos.
+    """
+    valor = _par_szudzik(numero_restaurante, short_id)
+
+    tamanho = TAMANHO_RASTREIO
+    while valor >= len(ALFABETO_RASTREIO) ** tamanho:
+        tamanho += 1
+
+    valor = _permutar(valor, tamanho)
 
-    return f"MF-{random_part}"
+    digitos = []
+    for _ in range(tamanho):
+        valor, resto = divmod(valor, len(ALFABETO_RASTREIO))
+        digitos.append(ALFABETO_RASTREIO[resto])
+    return "MF-" + "".join(reversed(digitos))
 
 
-def ensure_unique_tracking_code(session: Session) -> str:
+def _par_szudzik(a: int, b: int) -> int:
+    """Bijeção N x N -> N; o resultado é < (max(a, b) + 1)^2"""
+    return a * a + a + b if a >= b else b * b + a
+
+
+def _permutar(valor: int, tamanho: int) -> int:
+    """
+    Permutação com chave de [0, 36^tamanho)
+
+    36^L = (6^L)^2: o valor se divide em duas metades em [0, 6^L) e cada
+    rodada de Feistel troca as metades, somando à nova metade um HMAC da
+    outra (mod 6^L). Cada rodada é inversível, então o todo é uma bijeção.
+    """
+    metade = 6 ** tamanho
+    esquerda, direita = divmod(valor, metade)
+    for rodada in range(RODADAS_FEISTEL):
+        mistura = hmac.new(TRACKING_CODE_KEY, f"{tamanho}:{rodada}:{direita}".encode(), hashlib.sha256)
+        esquerda, direita = direita, (esquerda + int.from_bytes(mistura.digest()[:8], "big")) % metade
+    return esquerda * metade + direita
+
+
+# ============ CRIAÇÃO ============
+
+def data_de_criacao(simulated_date: Optional[str]) -> datetime:
+    """created_at do pedido: agora, ou o horário de agora na data simulada ("2025-01-14")"""
+    now = datetime.now()
+    if simulated_date:
+        try:
+            sim_date = datetime.strptime(simulated_date, "%Y-%m-%d")
+            return sim_date.replace(hour=now.hour, minute=now.minute, second=now.second)
+        except ValueError:
+            pass
+    return now
+
+
+def inserir_pedidos_em_lote(
+    session: Session,
+    restaurant_id: str,
+    itens: List[Tuple[OrderCreate, float, float]]
+) -> List[Union[Order, str]]:
     """
-    Garante que o tracking_code gerado seja único
+    Cria vários pedidos (já com coordenadas) numa transação só
+
+    - short_ids e códigos de rastreio reservados em bloco (uma query)
+    - Um único flush: o SQLAlchemy envia todos os INSERTs num executemany,
+      e os hooks da Session (estado ao vivo, eventos) veem cada pedido
+    - Se o lote esbarra numa restrição do banco (IntegrityError), cada
+      pedido é gravado sozinho: só o que falhar fica de fora
 
     Args:
-        session: Sessão do banco de dados
+        itens: [(dados do pedido, lat, lng), ...] na ordem de criação
 
     Returns:
-        str: Código de rastreio único garantido
+        Na mesma ordem: o Order criado ou a mensagem de erro do item
     """
-    max_attempts = 10
+    pedidos = [
+        Order(
+            customer_name=dados.customer_name,
+            address_text=dados.address_text,
+            lat=lat,
+            lng=lng,
+            prep_type=dados.prep_type,
+            status=OrderStatus.PREPARING,
+            created_at=data_de_criacao(dados.simulated_date),
+            restaurant_id=restaurant_id
+        )
+        for dados, lat, lng in itens
+    ]
+    try:
+        return gravar_pedidos(session, restaurant_id, pedidos)
+    except IntegrityError:
+        pass  # gravar_pedidos já fez o rollback
+
+    resultados: List[Union[Order, str]] = []
+    for pedido in pedidos:
+        try:
+            gravar_pedidos(session, restaurant_id, [pedido])
+            # Fora da Session: o rollback de um item seguinte não expira este
+            session.expunge(pedido)
+            resultados.append(pedido)
+        except IntegrityError as erro:
+            resultados.append(f"Erro ao gravar o pedido: {erro.orig}")
+    return resultados
+
+
+def gravar_pedidos(session: Session, restaurant_id: str, pedidos: List[Order]) -> List[Order]:
+    """
+    Reserva short_id/tracking_code para os pedidos e grava (commit)
+
+    Se um tracking_code já existe no banco (códigos antigos, chave
+    trocada), o bloco de short_ids é descartado - fica um buraco na
+    numeração - e os pedidos vão com o bloco seguinte.
+    """
+    for tentativa in range(TENTATIVAS_RASTREIO):
+        identificadores = reservar_identificadores(session, restaurant_id, len(pedidos))
+        for pedido, (short_id, tracking_code) in zip(pedidos, identificadores):
+            pedido.short_id, pedido.tracking_code = short_id, tracking_code
+        session.add_all(pedidos)
+        try:
+            session.commit()
+            return pedidos
+        except IntegrityError as erro:
+            session.rollback()
+            if "tracking_code" not in str(erro.orig):
+                raise
+            # O rollback desfez a reserva: queima o bloco para não repetir os códigos
+            _reservar(session, restaurant_id, len(pedidos))
+            session.commit()
+            if tentativa == TENTATIVAS_RASTREIO - 1:
+                raise
+
 
-    for _ in range(max_attempts):
-        code = generate_tracking_code()
+# ============ TRANSIÇÕES DE STATUS ============
+# Levantam KeyError (pedido não existe / é de outro restaurante)
+# ou ValueError (status atual não permite a transição)
 
-        # Verifica se já existe no banco
-        statement = select(Order).where(Order.tracking_code == code)
-        existing = session.exec(statement).first()
+def _pedido_do_restaurante(session: Session, order_id: str, restaurant_id: str) -> Order:
+    order = session.get(Order, order_id)
+    # 🔒 PROTEÇÃO: pedido de outro restaurante = não encontrado
+    if not order or order.restaurant_id != restaurant_id:
+        raise KeyError(order_id)
+    return order
+
+
+def _exigir_status(order: Order, permitidos: Iterable[OrderStatus], acao: str) -> None:
+    if order.status not in permitidos:
+        raise ValueError(f"Pedido não pode {acao} (status atual: {order.status})")
+
+
+def _gravar(session: Session, order: Order) -> Order:
+    session.add(order)
+    session.commit()
+    return order
+
+
+def bipar_pedido(session: Session, order_id: str, restaurant_id: str) -> Order:
+    """Marca o pedido como PRONTO (QR Code foi bipado)"""
+    order = _pedido_do_restaurante(session, order_id, restaurant_id)
+    _exigir_status(order, [OrderStatus.CREATED, OrderStatus.PREPARING], "ser bipado")
+    order.status = OrderStatus.READY
+    order.ready_at = datetime.now()
+    return _gravar(session, order)
+
+
+def iniciar_preparo(session: Session, order_id: str, restaurant_id: str) -> Order:
+    """Marca o pedido como EM PREPARO"""
+    order = _pedido_do_restaurante(session, order_id, restaurant_id)
+    _exigir_status(order, [OrderStatus.CREATED], "iniciar preparo")
+    order.status = OrderStatus.PREPARING
+    return _gravar(session, order)
+
+
+def coletar_pedido(session: Session, order_id: str, restaurant_id: str) -> Order:
+    """Marca o pedido como COLETADO pelo motoqueiro"""
+    order = _pedido_do_restaurante(session, order_id, restaurant_id)
+    _exigir_status(order, [OrderStatus.ASSIGNED], "ser coletado")
+    order.status = OrderStatus.PICKED_UP
+    return _gravar(session, order)
+
+
+def entregar_pedido(session: Session, order_id: str, restaurant_id: str) -> Order:
+    """Marca o pedido como ENTREGUE"""
+    order = _pedido_do_restaurante(session, order_id, restaurant_id)
+    _exigir_status(order, [OrderStatus.PICKED_UP], "ser entregue")
+    order.status = OrderStatus.DELIVERED
+    order.delivered_at = datetime.now()
+    return _gravar(session, order)
+
+
+def cancelar_pedido(session: Session, order_id: str, restaurant_id: str) -> Order:
+    """
+    Cancela o pedido (só se ainda não foi coletado)
+
+    Se era o último pedido ativo do lote, libera o motoboy.
+    """
+    order = _pedido_do_restaurante(session, order_id, restaurant_id)
+    _exigir_status(
+        order,
+        [s for s in OrderStatus if s not in (OrderStatus.PICKED_UP, OrderStatus.DELIVERED, OrderStatus.CANCELLED)],
+        "ser cancelado"
+    )
 
-        if not existing:
-            return code
+    # Se estava em um batch, verifica se precisa liberar o motoboy
+    if order.batch_id:
+        batch = session.get(Batch, order.batch_id)
+        if batch and batch.courier_id:
+            courier = session.get(Courier, batch.courier_id)
+            if courier and courier.status == CourierStatus.BUSY:
+                # Verifica se não tem outros pedidos ativos no batch
+                other_orders = session.exec(
+                    select(Order).where(
+                        Order.batch_id == batch.id,
+                        Order.id != order.id,
+                        Order.status.in_([OrderStatus.ASSIGNED, OrderStatus.PICKED_UP])
+                    )
+                ).all()
+                if not other_orders:
+                    courier.status = CourierStatus.AVAILABLE
+                    session.add(courier)
 
-    # Se após 10 tentativas não conseguiu gerar único, adiciona timestamp
-    import time
-    timestamp_suffix = str(int(time.time()))[-4:]  # Últimos 4 dígitos do timestamp
-    return f"MF-{timestamp_suffix}{random.choice(string.ascii_uppercase)}{random.choice(string.digits)}"
+    order.status = OrderStatus.CANCELLED
+    order.cancelled_at = datetime.now()
+    order.batch_id = None  # Remove do lote
+    return _gravar(session, order)
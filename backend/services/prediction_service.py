@@ -12,12 +12,15 @@ MODELO HÍBRIDO:
 from datetime import datetime, timedelta
 from typing import Optional, Dict, List, Tuple
 from collections import defaultdict
-from sqlmodel import Session, select, func
+from sqlmodel import Session, select
 
 from models import (
-    Order, Courier, OrderStatus, CourierStatus,
+    Order, Batch, Restaurant, OrderStatus, BatchStatus,
     PadraoDemanda, PrevisaoHibrida
 )
+from services.metrics_service import MIN_AMOSTRAS_MEDIA
+from services.live_state_service import obter_foto_operacional, RECONCILIACAO_SEGUNDOS
+from services.location_service import duracao_rota_medida
 
 
 # ============ CONSTANTES ============
@@ -26,18 +29,28 @@ SEMANAS_HISTORICO = 4          # Quantas semanas analisar
 MIN_AMOSTRAS_CONFIAVEL = 3     # Mínimo de amostras para considerar confiável
 FATOR_SEGURANCA = 1.2          # Margem de segurança (20% a mais)
 
+# Tempo de ciclo medido por restaurante: (calculado em, (média, lotes)).
+# Recalculado no mesmo ritmo da reconciliação do estado ao vivo - o trajeto
+# de um lote só chega ao disco na descarga do GPS, então não há ganho em
+# medir a cada poll de /dispatch/previsao
+_ciclos_medidos: Dict[str, Tuple[datetime, Tuple[Optional[float], int]]] = {}
+
 
 # ============ FUNÇÕES DE APRENDIZADO ============
 
 def atualizar_padroes_historicos(
     session: Session,
-    restaurant_id: str
+    restaurant_id: str,
+    sessao_leitura: Optional[Session] = None
 ) -> Dict[str, int]:
     """
     Analisa pedidos das últimas N semanas e atualiza padrões.
 
     🔒 Filtra por restaurant_id
 
+    A varredura do histórico (a parte pesada) pode ir para `sessao_leitura`
+    (réplica); os padrões são gravados em `session` (primário).
+
     Retorna:
         {"padroes_atualizados": N, "amostras_analisadas": M}
     """
@@ -51,7 +64,7 @@ def atualizar_padroes_historicos(
         Order.delivered_at != None,
         Order.ready_at != None
     )
-    orders = session.exec(query).all()
+    orders = (sessao_leitura or session).exec(query).all()
 
     if not orders:
         return {"padroes_atualizados": 0, "amostras_analisadas": 0}
@@ -181,122 +194,58 @@ def obter_padrao_atual(
     ).first()
 
 
-# ============ FUNÇÕES DE TEMPO REAL ============
-
-def contar_motoboys_tempo_real(
-    session: Session,
-    restaurant_id: str
-) -> Tuple[int, int]:
-    """Retorna (disponíveis, ocupados)"""
-    query_disp = select(Courier).where(
-        Courier.restaurant_id == restaurant_id,
-        Courier.status == CourierStatus.AVAILABLE
-    )
-    disponiveis = len(session.exec(query_disp).all())
-
-    query_ocup = select(Courier).where(
-        Courier.restaurant_id == restaurant_id,
-        Courier.status == CourierStatus.BUSY
-    )
-    ocupados = len(session.exec(query_ocup).all())
-
-    return disponiveis, ocupados
-
+# ============ FUNÇÕES DE BALANCEAMENTO ============
 
-def contar_pedidos_tempo_real(
+def calcular_tempo_ciclo_medido(
     session: Session,
-    restaurant_id: str
-) -> Dict[str, int]:
-    """
-    Conta pedidos em diferentes estados.
-    Retorna: {fila, em_rota, ultima_hora}
+    restaurant_id: str,  # 🔒 PROTEÇÃO
+    horas: int = 2
+) -> Tuple[Optional[float], int]:
     """
-    # Pedidos na fila (READY)
-    query_fila = select(Order).where(
-        Order.restaurant_id == restaurant_id,
-        Order.status == OrderStatus.READY
-    )
-    fila = len(session.exec(query_fila).all())
-
-    # Pedidos em rota (ASSIGNED ou PICKED_UP)
-    query_rota = select(Order).where(
-        Order.restaurant_id == restaurant_id,
-        Order.status.in_([OrderStatus.ASSIGNED, OrderStatus.PICKED_UP])
-    )
-    em_rota = len(session.exec(query_rota).all())
-
-    # Pedidos na última hora
-    uma_hora = datetime.now() - timedelta(hours=1)
-    query_hora = select(Order).where(
-        Order.restaurant_id == restaurant_id,
-        Order.created_at >= uma_hora
-    )
-    ultima_hora = len(session.exec(query_hora).all())
-
-    return {
-        "fila": fila,
-        "em_rota": em_rota,
-        "ultima_hora": ultima_hora
-    }
+    Tempo de ciclo REAL (saída → volta ao restaurante) medido pelo trajeto GPS
+    dos lotes finalizados nas últimas `horas`
 
+    Substitui a estimativa (entrega - pronto) × FATOR_IDA_VOLTA quando há
+    lotes suficientes com trajeto gravado.
 
-def calcular_tempos_tempo_real(
+    Retorna (média em minutos ou None, quantidade de lotes medidos)
+    """
+    restaurante = session.get(Restaurant, restaurant_id)
+    if not restaurante or restaurante.lat is None or restaurante.lng is None:
+        return None, 0
+
+    lotes = session.exec(
+        select(Batch)
+        .where(Batch.restaurant_id == restaurant_id)
+        .where(Batch.status == BatchStatus.DONE)
+        .where(Batch.completed_at >= datetime.now() - timedelta(hours=horas))
+    ).all()
+
+    duracoes = [
+        d for d in (duracao_rota_medida(lote, restaurante.lat, restaurante.lng) for lote in lotes)
+        if d is not None and d > 0
+    ]
+    if len(duracoes) < MIN_AMOSTRAS_MEDIA:
+        return None, len(duracoes)
+    return sum(duracoes) / len(duracoes), len(duracoes)
+
+
+def tempo_ciclo_medido(
     session: Session,
-    restaurant_id: str
-) -> Dict[str, Optional[float]]:
+    restaurant_id: str  # 🔒 PROTEÇÃO
+) -> Tuple[Optional[float], int]:
     """
-    Calcula tempos médios das últimas 2 horas.
-    Retorna: {preparo, rota}
+    calcular_tempo_ciclo_medido com cache de RECONCILIACAO_SEGUNDOS por restaurante
     """
-    cutoff = datetime.now() - timedelta(hours=2)
-
-    # Tempo de preparo
-    query_preparo = select(Order).where(
-        Order.restaurant_id == restaurant_id,
-        Order.ready_at != None,
-        Order.created_at >= cutoff
-    )
-    orders_preparo = session.exec(query_preparo).all()
-
-    tempos_preparo = []
-    for order in orders_preparo:
-        if order.ready_at and order.created_at:
-            diff = (order.ready_at - order.created_at).total_seconds() / 60
-            if 0 < diff < 120:
-                tempos_preparo.append(diff)
-
-    tempo_preparo = None
-    if len(tempos_preparo) >= 2:
-        tempo_preparo = sum(tempos_preparo) / len(tempos_preparo)
-
-    # Tempo de rota
-    query_rota = select(Order).where(
-        Order.restaurant_id == restaurant_id,
-        Order.status == OrderStatus.DELIVERED,
-        Order.delivered_at != None,
-        Order.ready_at != None,
-        Order.ready_at >= cutoff
-    )
-    orders_rota = session.exec(query_rota).all()
-
-    tempos_rota = []
-    for order in orders_rota:
-        if order.delivered_at and order.ready_at:
-            diff = (order.delivered_at - order.ready_at).total_seconds() / 60
-            if 0 < diff < 180:
-                tempos_rota.append(diff * 1.5)  # Ida + volta
-
-    tempo_rota = None
-    if len(tempos_rota) >= 2:
-        tempo_rota = sum(tempos_rota) / len(tempos_rota)
-
-    return {
-        "preparo": tempo_preparo,
-        "rota": tempo_rota
-    }
+    agora = datetime.now()
+    em_cache = _ciclos_medidos.get(restaurant_id)
+    if em_cache is not None and (agora - em_cache[0]).total_seconds() <= RECONCILIACAO_SEGUNDOS:
+        return em_cache[1]
 
+    resultado = calcular_tempo_ciclo_medido(session, restaurant_id)
+    _ciclos_medidos[restaurant_id] = (agora, resultado)
+    return resultado
 
-# ============ FUNÇÕES DE BALANCEAMENTO ============
 
 def calcular_motoboys_necessarios(pedidos_hora: float, tempo_rota_min: float) -> int:
     """
@@ -386,11 +335,21 @@ def calcular_previsao_hibrida(
     historico_disponivel = padrao is not None and padrao.amostras >= MIN_AMOSTRAS_CONFIAVEL
 
     # ===== 2. DADOS EM TEMPO REAL =====
-    disponiveis, ocupados = contar_motoboys_tempo_real(session, restaurant_id)
+    # Foto operacional em memória (contadores + janela de tempos)
+    foto = obter_foto_operacional(session, restaurant_id)
+
+    disponiveis, ocupados = foto.motoboys_disponiveis, foto.motoboys_ocupados
     total_ativos = disponiveis + ocupados
 
-    pedidos = contar_pedidos_tempo_real(session, restaurant_id)
-    tempos = calcular_tempos_tempo_real(session, restaurant_id)
+    pedidos = {
+        "fila": foto.pedidos_fila,
+        "em_rota": foto.pedidos_em_rota,
+        "ultima_hora": foto.pedidos_ultima_hora
+    }
+    tempos = {
+        "preparo": foto.tempos_2h.tempo_preparo()[0],
+        "rota": foto.tempos_2h.tempo_rota()[0]
+    }
 
     # ===== 3. COMPARAÇÃO HISTÓRICO vs ATUAL =====
     variacao_demanda = None
@@ -405,8 +364,11 @@ def calcular_previsao_hibrida(
     # Usamos pedidos na última hora como proxy
     taxa_saida = float(pedidos["ultima_hora"])
 
-    # Tempo de ciclo: usa tempo real se disponível, senão histórico, senão default
-    tempo_ciclo = tempos["rota"]
+    # Tempo de ciclo: medido pelo GPS se disponível, senão estimado pelos
+    # pedidos, senão histórico, senão default
+    tempo_ciclo, _ = tempo_ciclo_medido(session, restaurant_id)
+    if tempo_ciclo is None:
+        tempo_ciclo = tempos["rota"]
     if tempo_ciclo is None and historico_disponivel:
         tempo_ciclo = padrao.media_tempo_rota
     if tempo_ciclo is None:
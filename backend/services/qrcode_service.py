@@ -1,70 +1,397 @@
 """
 Serviço de geração de QR Code
+
+O QR do pedido só depende do ID: é gerado UMA vez por tamanho/formato e
+reaproveitado (a impressora da cozinha e o dashboard pedem o mesmo QR
+várias vezes).
+
+- Memória: LRU com no máximo QRCODE_CACHE_SIZE imagens por processo
+- Disco: {QRCODE_DIR}/{order_id}-{tamanho}-v{versão}.{png|svg} (sobrevive
+  a restart e é compartilhado pelos workers); arquivos com mais de
+  QRCODE_RETENTION_DAYS são apagados uma vez por dia (pedido velho que
+  voltar a ser pedido tem o QR gerado de novo)
+- Pedido novo já sai com os QR mais pedidos gerados (depois da resposta)
+- ETag fixo por pedido/tamanho/formato: as rotas respondem 304 e mandam
+  Cache-Control immutable
+- SVG: texto montado direto da matriz do QR, bem mais barato que o PNG
+- Folha de etiquetas: N pedidos numa página A4 (PDF ou PNG), QR desenhados
+  em paralelo - uma requisição por impressão na hora do rush
 """
-import qrcode
-import io
+import asyncio
 import base64
-from typing import Optional
+import io
+import os
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import qrcode
+from PIL import Image, ImageDraw, ImageFont
+
+
+# ============ CONFIGURAÇÕES ============
+
+# Pasta dos QR Codes gerados (mesmo DATA_DIR do banco SQLite / uploads)
+QRCODE_DIR = Path(
+    os.environ.get("QRCODE_DIR")
+    or os.path.join(os.environ.get("DATA_DIR", "."), "qrcodes")
+)
+
+# Imagens guardadas na memória de cada processo
+QRCODE_CACHE_SIZE = int(os.environ.get("QRCODE_CACHE_SIZE", "512"))
+
+# Dias que um QR fica no disco (o pedido já foi entregue há muito tempo)
+QRCODE_RETENCAO_DIAS = int(os.environ.get("QRCODE_RETENTION_DAYS", "30"))
+
+# De quanto em quanto tempo a pasta é varrida
+INTERVALO_LIMPEZA_SEGUNDOS = 24 * 3600
+
+# Pixels por módulo quando o tamanho não é pedido (imagem "natural" do QR)
+PIXELS_POR_MODULO = 10
 
+# Muda se o desenho mudar: invalida ETags e arquivos antigos
+VERSAO_DESENHO = 1
 
-def generate_qrcode_base64(order_id: str, size: int = 200) -> str:
+FORMATOS = {"png": "image/png", "svg": "image/svg+xml"}
+
+# Gera os QR na criação do pedido (0 = só quando pedirem)
+QRCODE_PREGERAR = os.environ.get("QRCODE_PREGENERATE", "1") != "0"
+
+# (tamanho, formato) gerados já na criação do pedido
+QRCODES_PREGERADOS = [(200, "png"), (None, "png")]
+
+# Threads que desenham os QR de uma folha de etiquetas
+QRCODE_WORKERS = int(os.environ.get("QRCODE_WORKERS", "4"))
+
+# Folha de etiquetas: A4 a 150 dpi
+FOLHA_DPI = 150
+FOLHA_LARGURA, FOLHA_ALTURA = 1240, 1754
+FOLHA_MARGEM = 40
+ALTURA_TEXTO_ETIQUETA = 70
+
+
+# ============ DESENHO ============
+
+def matriz_qrcode(order_id: str) -> List[List[bool]]:
     """
-    Gera QR Code do pedido e retorna como base64
-    
-    Args:
-        order_id: ID do pedido
-        size: Tamanho do QR em pixels
-        
-    Returns:
-        String base64 da imagem PNG
+    Módulos do QR (com a borda) - True = preto
+
+    O conteúdo do QR é apenas o ID do pedido.
+    Quando bipado, o app faz POST /orders/{id}/scan
     """
-    # Cria o QR Code
     qr = qrcode.QRCode(
-        version=1,
         error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
         border=2,
     )
-    
-    # O conteúdo do QR é apenas o ID do pedido
-    # Quando bipado, o app faz POST /orders/{id}/scan
     qr.add_data(order_id)
     qr.make(fit=True)
-    
-    # Gera imagem
-    img = qr.make_image(fill_color="black", back_color="white")
-    
-    # Redimensiona se necessário
-    img = img.resize((size, size))
-    
-    # Converte para base64
+    return qr.get_matrix()
+
+
+def imagem_qrcode(matriz: List[List[bool]], lado: Optional[int] = None) -> Image.Image:
+    """Imagem preto e branco: um pixel por módulo, ampliada sem suavização"""
+    modulos = len(matriz)
+    img = Image.new("1", (modulos, modulos))
+    img.putdata([0 if preto else 1 for linha in matriz for preto in linha])
+    lado = lado or modulos * PIXELS_POR_MODULO
+    return img.resize((lado, lado), Image.NEAREST)
+
+
+def desenhar_png(matriz: List[List[bool]], tamanho: Optional[int] = None) -> bytes:
+    """PNG do QR (tamanho natural: PIXELS_POR_MODULO por módulo)"""
+    img = imagem_qrcode(matriz, tamanho)
+
     buffer = io.BytesIO()
     img.save(buffer, format="PNG")
-    buffer.seek(0)
-    
-    img_base64 = base64.b64encode(buffer.getvalue()).decode()
-    
-    return f"data:image/png;base64,{img_base64}"
+    return buffer.getvalue()
+
+
+def desenhar_svg(matriz: List[List[bool]], tamanho: Optional[int] = None) -> bytes:
+    """SVG com um único path (módulos pretos seguidos viram um retângulo só)"""
+    modulos = len(matriz)
+    lado = tamanho or modulos * PIXELS_POR_MODULO
+    trechos = []
+    for y, linha in enumerate(matriz):
+        x = 0
+        while x < modulos:
+            if not linha[x]:
+                x += 1
+                continue
+            inicio = x
+            while x < modulos and linha[x]:
+                x += 1
+            trechos.append(f"M{inicio} {y}h{x - inicio}v1h-{x - inicio}z")
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" width="{lado}" height="{lado}" '
+        f'viewBox="0 0 {modulos} {modulos}" shape-rendering="crispEdges">'
+        f'<rect width="{modulos}" height="{modulos}" fill="#fff"/>'
+        f'<path d="{"".join(trechos)}" fill="#000"/></svg>'
+    ).encode()
 
 
-def generate_qrcode_bytes(order_id: str) -> bytes:
+_DESENHOS = {"png": desenhar_png, "svg": desenhar_svg}
+
+
+# ============ CACHE ============
+
+class CacheQRCode:
     """
-    Gera QR Code e retorna como bytes (para download direto)
+    QR Codes prontos em duas camadas (memória LRU + disco)
+
+    Chave: (order_id, tamanho, formato). Thread-safe.
     """
-    qr = qrcode.QRCode(
-        version=1,
-        error_correction=qrcode.constants.ERROR_CORRECT_L,
-        box_size=10,
-        border=2,
-    )
-    
-    qr.add_data(order_id)
-    qr.make(fit=True)
-    
-    img = qr.make_image(fill_color="black", back_color="white")
-    
+
+    def __init__(self, pasta: Path = QRCODE_DIR, tamanho: int = QRCODE_CACHE_SIZE):
+        self.pasta = Path(pasta)
+        self.tamanho = tamanho
+        self._memoria: "OrderedDict[tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._contadores = dict.fromkeys(("hits_memoria", "hits_disco", "geradas", "erros_disco"), 0)
+
+    def obter(
+        self,
+        order_id: str,
+        tamanho: Optional[int] = None,
+        formato: str = "png",
+        matriz: Optional[List[List[bool]]] = None
+    ) -> bytes:
+        """Imagem do QR: da memória, do disco ou gerada agora (e guardada)"""
+        chave = (order_id, tamanho or 0, formato)
+        with self._lock:
+            imagem = self._memoria.get(chave)
+            if imagem is not None:
+                self._memoria.move_to_end(chave)
+                self._contadores["hits_memoria"] += 1
+                return imagem
+
+        arquivo = self._arquivo(*chave)
+        try:
+            imagem = arquivo.read_bytes()
+            self._guardar_memoria(chave, imagem, "hits_disco")
+            return imagem
+        except FileNotFoundError:
+            pass
+        except OSError as erro:
+            self._erro_disco(erro)
+
+        imagem = _DESENHOS[formato](matriz or matriz_qrcode(order_id), tamanho)
+        self._guardar_memoria(chave, imagem, "geradas")
+        self._gravar_disco(arquivo, imagem)
+        return imagem
+
+    def limpar_memoria(self) -> None:
+        """Esvazia só a camada de memória (o disco continua)"""
+        with self._lock:
+            self._memoria.clear()
+
+    def apagar_antigos(self, manter_dias: int = QRCODE_RETENCAO_DIAS, agora: Optional[float] = None) -> int:
+        """
+        Apaga do disco os QR gravados há mais de `manter_dias`
+
+        Também vão embora os de outra VERSAO_DESENHO (nunca mais lidos) e
+        temporários órfãos (worker que morreu no meio da gravação).
+        """
+        if not self.pasta.exists():
+            return 0
+        agora = agora or time.time()
+        limite = agora - manter_dias * 86400
+        sufixos = tuple(f"-v{VERSAO_DESENHO}.{formato}" for formato in FORMATOS)
+        apagados = 0
+        for arquivo in self.pasta.iterdir():
+            try:
+                if arquivo.name.endswith(sufixos):
+                    if arquivo.stat().st_mtime >= limite:
+                        continue
+                elif arquivo.name.endswith(".tmp"):
+                    # Pode ser uma gravação em andamento agora
+                    if arquivo.stat().st_mtime >= agora - 3600:
+                        continue
+                arquivo.unlink()
+                apagados += 1
+            except FileNotFoundError:
+                pass  # Outro worker apagou antes
+            except OSError as erro:
+                self._erro_disco(erro)
+        return apagados
+
+    def metricas(self) -> Dict:
+        with self._lock:
+            return {**self._contadores, "em_memoria": len(self._memoria), "capacidade_memoria": self.tamanho}
+
+    # ---------- internos ----------
+
+    def _arquivo(self, order_id: str, tamanho: int, formato: str) -> Path:
+        # order_id vem do banco (UUID); o nome não sai da pasta mesmo assim
+        nome = "".join(c for c in order_id if c.isalnum() or c == "-")
+        return self.pasta / f"{nome}-{tamanho}-v{VERSAO_DESENHO}.{formato}"
+
+    def _guardar_memoria(self, chave: tuple, imagem: bytes, contador: str) -> None:
+        with self._lock:
+            self._contadores[contador] += 1
+            self._memoria[chave] = imagem
+            self._memoria.move_to_end(chave)
+            while len(self._memoria) > self.tamanho:
+                self._memoria.popitem(last=False)
+
+    def _gravar_disco(self, arquivo: Path, imagem: bytes) -> None:
+        # Arquivo temporário + rename: outro worker nunca lê um QR pela metade
+        temporario = arquivo.with_name(f"{arquivo.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        try:
+            arquivo.parent.mkdir(parents=True, exist_ok=True)
+            temporario.write_bytes(imagem)
+            os.replace(temporario, arquivo)
+        except OSError as erro:
+            self._erro_disco(erro)
+
+    def _erro_disco(self, erro: Exception) -> None:
+        with self._lock:
+            self._contadores["erros_disco"] += 1
+        print(f"⚠️ Cache de QR Code sem disco: {erro}")
+
+
+# Cache do processo
+cache_qrcode = CacheQRCode()
+
+
+def etag_qrcode(order_id: str, tamanho: Optional[int] = None, formato: str = "png", base64: bool = False) -> str:
+    """
+    ETag da imagem (o QR de um pedido nunca muda: não precisa gerar para saber)
+
+    base64=True: a mesma imagem dentro do JSON (outra representação, outro ETag)
+    """
+    return f'"qr-{order_id}-{tamanho or 0}-{formato}{"-b64" if base64 else ""}-v{VERSAO_DESENHO}"'
+
+
+def pregerar_qrcodes(order_ids: Iterable[str]) -> None:
+    """
+    Gera os QR Codes de pedidos recém-criados (background task depois da resposta)
+
+    Os que as telas pedem: o do dashboard (200 px) e o da impressão (natural).
+    """
+    if not QRCODE_PREGERAR:
+        return
+    for order_id in order_ids:
+        matriz = matriz_qrcode(order_id)
+        for tamanho, formato in QRCODES_PREGERADOS:
+            cache_qrcode.obter(order_id, tamanho, formato, matriz)
+
+
+def apagar_qrcodes_antigos(manter_dias: int = QRCODE_RETENCAO_DIAS) -> int:
+    """Apaga do disco os QR com mais de `manter_dias` (ver CacheQRCode.apagar_antigos)"""
+    return cache_qrcode.apagar_antigos(manter_dias)
+
+
+async def loop_limpeza_qrcodes() -> None:
+    """Tarefa de fundo (iniciada no lifespan do app): limpa a pasta uma vez por dia"""
+    while True:
+        try:
+            await asyncio.to_thread(apagar_qrcodes_antigos)
+        except Exception as e:
+            print(f"⚠️ Erro ao limpar QR Codes antigos: {e}")
+        await asyncio.sleep(INTERVALO_LIMPEZA_SEGUNDOS)
+
+
+def generate_qrcode_base64(order_id: str, size: int = 200, formato: str = "png") -> str:
+    """
+    QR Code do pedido como data URI base64
+
+    Args:
+        order_id: ID do pedido
+        size: Tamanho do QR em pixels
+        formato: "png" ou "svg"
+
+    Returns:
+        String "data:image/...;base64,..."
+    """
+    imagem = cache_qrcode.obter(order_id, size, formato)
+    return f"data:{FORMATOS[formato]};base64,{base64.b64encode(imagem).decode()}"
+
+
+def generate_qrcode_bytes(order_id: str, size: Optional[int] = None, formato: str = "png") -> bytes:
+    """
+    QR Code como bytes (para download direto)
+    """
+    return cache_qrcode.obter(order_id, size, formato)
+
+
+# ============ FOLHA DE ETIQUETAS ============
+
+# Etiqueta: (order_id, título - ex: "#1042", texto - ex: nome do cliente)
+Etiqueta = Tuple[str, str, str]
+
+
+def _fonte(tamanho: int):
+    try:
+        return ImageFont.load_default(size=tamanho)
+    except (TypeError, OSError):
+        # Pillow sem FreeType: fonte bitmap (tamanho fixo)
+        return ImageFont.load_default()
+
+
+def _cortar(texto: str, fonte, largura: int) -> str:
+    """Texto que cabe na largura da etiqueta (com reticências)"""
+    if fonte.getlength(texto) <= largura:
+        return texto
+    while texto and fonte.getlength(texto + "…") > largura:
+        texto = texto[:-1]
+    return texto + "…"
+
+
+def montar_folha_qrcodes(etiquetas: List[Etiqueta], formato: str = "pdf", colunas: int = 4) -> bytes:
+    """
+    Folha de etiquetas da cozinha: QR + número do pedido + cliente
+
+    Os QR são desenhados em paralelo (QRCODE_WORKERS threads, mesma
+    configuração de QR); a montagem da folha e os textos ficam na thread
+    de quem chamou.
+
+    Args:
+        etiquetas: uma por pedido, na ordem de impressão
+        formato: "pdf" (A4, quantas páginas precisar) ou "png" (uma folha
+            com a largura do A4 e a altura necessária)
+        colunas: etiquetas por linha
+    """
+    largura = (FOLHA_LARGURA - 2 * FOLHA_MARGEM) // colunas
+    lado_qr = largura - 20
+    altura = lado_qr + ALTURA_TEXTO_ETIQUETA
+    linhas_por_pagina = max(1, (FOLHA_ALTURA - 2 * FOLHA_MARGEM) // altura)
+
+    def desenhar(etiqueta: Etiqueta) -> Image.Image:
+        return imagem_qrcode(matriz_qrcode(etiqueta[0]), lado_qr)
+
+    with ThreadPoolExecutor(max_workers=max(1, min(QRCODE_WORKERS, len(etiquetas)))) as pool:
+        qrcodes = list(pool.map(desenhar, etiquetas))
+
+    por_pagina = colunas * linhas_por_pagina if formato == "pdf" else len(etiquetas)
+    fonte_titulo, fonte_texto = _fonte(28), _fonte(20)
+    paginas = []
+    for comeco in range(0, len(etiquetas), por_pagina):
+        grupo = list(zip(etiquetas[comeco:comeco + por_pagina], qrcodes[comeco:comeco + por_pagina]))
+        linhas = -(-len(grupo) // colunas)
+        altura_pagina = FOLHA_ALTURA if formato == "pdf" else 2 * FOLHA_MARGEM + linhas * altura
+        # Preto e branco (1 bit): impressora da cozinha e PDF ~20x menor
+        pagina = Image.new("1", (FOLHA_LARGURA, altura_pagina), 1)
+        desenho = ImageDraw.Draw(pagina)
+
+        for posicao, ((_, titulo, texto), qr) in enumerate(grupo):
+            x = FOLHA_MARGEM + (posicao % colunas) * largura
+            y = FOLHA_MARGEM + (posicao // colunas) * altura
+            desenho.rectangle((x, y, x + largura - 1, y + altura - 1), outline=0)  # Linha de corte
+            pagina.paste(qr, (x + 10, y + 4))
+            centro = x + largura // 2
+            desenho.text((centro, y + lado_qr + 8), titulo, fill=0, font=fonte_titulo, anchor="mt")
+            desenho.text(
+                (centro, y + lado_qr + 40), _cortar(texto, fonte_texto, largura - 16),
+                fill=0, font=fonte_texto, anchor="mt"
+            )
+        paginas.append(pagina)
+
     buffer = io.BytesIO()
-    img.save(buffer, format="PNG")
-    buffer.seek(0)
-    
+    if formato == "pdf":
+        paginas[0].save(buffer, format="PDF", save_all=True, append_images=paginas[1:], resolution=FOLHA_DPI)
+    else:
+        paginas[0].save(buffer, format="PNG")
     return buffer.getvalue()
@@ -0,0 +1,470 @@
+"""
+Serviço de Índice Espacial - Posição ao vivo dos motoboys em memória
+
+Perguntas como "quais motoboys DISPONÍVEIS estão a até 2km do restaurante?"
+ou "quem está mais perto deste pedido?" faziam um SELECT em todos os
+motoboys e calculavam a distância de um por um.
+
+AGORA, por restaurante, um índice em GRADE (células de ~1km):
+- Cada motoboy com posição conhecida fica na célula da sua lat/lng
+- Consulta por raio só olha as células que cruzam o raio
+- K mais próximos expande anel por anel a partir da célula do ponto
+
+COMO SE MANTÉM ATUALIZADO:
+1. Posição: a ingestão de GPS (location_service) atualiza a cada ping,
+   antes mesmo da descarga no banco - é a posição mais fresca que existe
+2. Status: hooks da Session (after_flush/after_commit) capturam transições
+   de status de Courier (disponível, ocupado, offline, excluído)
+3. Reconciliação: a cada RECONCILIACAO_SEGUNDOS recarrega do banco
+
+O índice pode ficar até RECONCILIACAO_SEGUNDOS atrasado quanto ao que
+OUTROS workers gravaram: por isso o dispatch tira do banco QUEM está
+disponível e usa o índice só para a posição (ordem da fila).
+
+🔒 PROTEÇÃO MULTI-TENANT:
+- Um índice por restaurant_id
+"""
+import math
+import os
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from models import Courier, CourierStatus
+from services.live_state_service import normalizar, status_antes_depois
+
+
+# ============ CONFIGURAÇÕES ============
+
+# Tamanho da célula da grade (0.01° ≈ 1,1km de latitude)
+TAMANHO_CELULA_GRAUS = 0.01
+
+# De quanto em quanto tempo o índice é recarregado do banco
+RECONCILIACAO_SEGUNDOS = int(os.environ.get("SPATIAL_INDEX_RECONCILE_SECONDS", "300"))
+
+# GPS mais velho que isso não é considerado posição atual
+POSICAO_VALIDA_MINUTOS = 15
+
+# Motoboy disponível a até essa distância conta como "no restaurante" no dispatch
+RAIO_DISPATCH_KM = 2.0
+
+_KM_POR_GRAU = 111.32
+
+
+# ============ ESTRUTURAS ============
+
+@dataclass
+class PosicaoMotoboy:
+    """Entrada do índice: status e última posição de um motoboy"""
+    courier_id: str
+    status: CourierStatus
+    available_since: Optional[datetime] = None
+    lat: Optional[float] = None
+    lng: Optional[float] = None
+    atualizado_em: Optional[datetime] = None  # Quando o GPS leu a posição
+
+    def posicao_valida(self, agora: datetime) -> bool:
+        return (
+            self.lat is not None
+            and self.atualizado_em is not None
+            and agora - self.atualizado_em <= timedelta(minutes=POSICAO_VALIDA_MINUTOS)
+        )
+
+
+@dataclass
+class MotoboyProximo:
+    """Resultado de consulta espacial"""
+    courier_id: str
+    status: CourierStatus
+    lat: float
+    lng: float
+    distancia_km: float
+    available_since: Optional[datetime] = None
+    atualizado_em: Optional[datetime] = None
+
+
+def distancia_km(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distância em km entre dois pontos (Haversine)"""
+    R = 6371
+    dlat = math.radians(lat2 - lat1)
+    dlng = math.radians(lng2 - lng1)
+    a = (
+        math.sin(dlat / 2) ** 2
+        + math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(dlng / 2) ** 2
+    )
+    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+class IndiceMotoboys:
+    """
+    Grade espacial dos motoboys de UM restaurante
+
+    Não é thread-safe sozinho: o módulo acessa sempre sob _lock.
+    """
+
+    def __init__(self, tamanho_celula: float = TAMANHO_CELULA_GRAUS):
+        self.tamanho_celula = tamanho_celula
+        self.reconciliado_em: Optional[datetime] = None
+        self._motoboys: Dict[str, PosicaoMotoboy] = {}
+        self._celulas: Dict[Tuple[int, int], Set[str]] = {}
+
+    def __len__(self) -> int:
+        return len(self._motoboys)
+
+    def _celula(self, lat: float, lng: float) -> Tuple[int, int]:
+        return (math.floor(lat / self.tamanho_celula), math.floor(lng / self.tamanho_celula))
+
+    def _tirar_da_grade(self, entrada: PosicaoMotoboy) -> None:
+        if entrada.lat is None:
+            return
+        celula = self._celula(entrada.lat, entrada.lng)
+        ocupantes = self._celulas.get(celula)
+        if ocupantes is not None:
+            ocupantes.discard(entrada.courier_id)
+            if not ocupantes:
+                del self._celulas[celula]
+
+    # ----- Escrita -----
+
+    def obter(self, courier_id: str) -> Optional[PosicaoMotoboy]:
+        return self._motoboys.get(courier_id)
+
+    def atualizar_posicao(self, courier_id: str, lat: float, lng: float, quando: datetime) -> None:
+        entrada = self._motoboys.get(courier_id)
+        if entrada is None:
+            # Status desconhecido até a reconciliação/hook informar
+            entrada = PosicaoMotoboy(courier_id=courier_id, status=CourierStatus.OFFLINE)
+            self._motoboys[courier_id] = entrada
+        elif entrada.atualizado_em is not None and quando < entrada.atualizado_em:
+            return  # Ping atrasado: já temos posição mais nova
+
+        self._tirar_da_grade(entrada)
+        entrada.lat, entrada.lng, entrada.atualizado_em = lat, lng, quando
+        self._celulas.setdefault(self._celula(lat, lng), set()).add(courier_id)
+
+    def atualizar_status(
+        self,
+        courier_id: str,
+        status: CourierStatus,
+        available_since: Optional[datetime]
+    ) -> None:
+        entrada = self._motoboys.setdefault(
+            courier_id, PosicaoMotoboy(courier_id=courier_id, status=status)
+        )
+        entrada.status = status
+        entrada.available_since = available_since
+
+    def remover(self, courier_id: str) -> None:
+        entrada = self._motoboys.pop(courier_id, None)
+        if entrada is not None:
+            self._tirar_da_grade(entrada)
+
+    # ----- Consultas -----
+
+    def _candidatos_no_anel(self, centro: Tuple[int, int], anel: int) -> Iterable[str]:
+        """Motoboys das células na borda do quadrado de 'raio' `anel` células"""
+        ci, cj = centro
+        for i in range(ci - anel, ci + anel + 1):
+            for j in range(cj - anel, cj + anel + 1):
+                if max(abs(i - ci), abs(j - cj)) == anel:
+                    yield from self._celulas.get((i, j), ())
+
+    def _proximo(self, entrada: PosicaoMotoboy, lat: float, lng: float) -> MotoboyProximo:
+        return MotoboyProximo(
+            courier_id=entrada.courier_id,
+            status=entrada.status,
+            lat=entrada.lat,
+            lng=entrada.lng,
+            distancia_km=distancia_km(lat, lng, entrada.lat, entrada.lng),
+            available_since=entrada.available_since,
+            atualizado_em=entrada.atualizado_em
+        )
+
+    def _aceita(self, entrada: PosicaoMotoboy, status: Optional[CourierStatus], agora: datetime) -> bool:
+        return (status is None or entrada.status == status) and entrada.posicao_valida(agora)
+
+    def no_raio(
+        self,
+        lat: float,
+        lng: float,
+        raio_km: float,
+        status: Optional[CourierStatus] = None
+    ) -> List[MotoboyProximo]:
+        """Motoboys a até `raio_km` do ponto, do mais perto ao mais longe"""
+        agora = datetime.now()
+        # Células necessárias: a de longitude encolhe com cos(lat)
+        passo_lat = raio_km / _KM_POR_GRAU
+        passo_lng = raio_km / (_KM_POR_GRAU * max(math.cos(math.radians(lat)), 0.01))
+        i_min, j_min = self._celula(lat - passo_lat, lng - passo_lng)
+        i_max, j_max = self._celula(lat + passo_lat, lng + passo_lng)
+
+        resultado = []
+        for i in range(i_min, i_max + 1):
+            for j in range(j_min, j_max + 1):
+                for courier_id in self._celulas.get((i, j), ()):
+                    entrada = self._motoboys[courier_id]
+                    if not self._aceita(entrada, status, agora):
+                        continue
+                    proximo = self._proximo(entrada, lat, lng)
+                    if proximo.distancia_km <= raio_km:
+                        resultado.append(proximo)
+
+        resultado.sort(key=lambda m: m.distancia_km)
+        return resultado
+
+    def mais_proximos(
+        self,
+        lat: float,
+        lng: float,
+        k: int,
+        status: Optional[CourierStatus] = None
+    ) -> List[MotoboyProximo]:
+        """Os `k` motoboys mais perto do ponto (anel a anel de células)"""
+        agora = datetime.now()
+        if not self._celulas or k <= 0:
+            return []
+
+        centro = self._celula(lat, lng)
+        anel_maximo = max(
+            max(abs(i - centro[0]), abs(j - centro[1])) for i, j in self._celulas
+        )
+        # Qualquer ponto fora do quadrado de `anel` células está a pelo menos
+        # `anel` células de distância (em latitude, o lado mais curto em km)
+        km_por_anel = self.tamanho_celula * _KM_POR_GRAU * max(math.cos(math.radians(lat)), 0.01)
+
+        encontrados: List[MotoboyProximo] = []
+        for anel in range(anel_maximo + 1):
+            for courier_id in self._candidatos_no_anel(centro, anel):
+                entrada = self._motoboys[courier_id]
+                if self._aceita(entrada, status, agora):
+                    encontrados.append(self._proximo(entrada, lat, lng))
+            encontrados.sort(key=lambda m: m.distancia_km)
+            if len(encontrados) >= k and encontrados[k - 1].distancia_km <= anel * km_por_anel:
+                break
+
+        return encontrados[:k]
+
+    def todos(self, status: Optional[CourierStatus] = None) -> List[PosicaoMotoboy]:
+        """Todas as entradas (com ou sem posição), filtradas por status"""
+        return [e for e in self._motoboys.values() if status is None or e.status == status]
+
+
+_indices: Dict[Optional[str], IndiceMotoboys] = {}
+_lock = threading.Lock()
+
+
+# ============ LEITURA ============
+
+def _indice_atualizado(session: Session, restaurant_id: Optional[str]) -> IndiceMotoboys:
+    """Índice do restaurante, recarregando do banco se nunca carregado ou velho"""
+    agora = datetime.now()
+    with _lock:
+        indice = _indices.get(restaurant_id)
+        precisa_reconciliar = (
+            indice is None
+            or indice.reconciliado_em is None
+            or (agora - indice.reconciliado_em).total_seconds() > RECONCILIACAO_SEGUNDOS
+        )
+    if precisa_reconciliar:
+        reconciliar_indice(session, restaurant_id)
+    return _indices[restaurant_id]
+
+
+def reconciliar_indice(
+    session: Session,
+    restaurant_id: Optional[str] = None  # 🔒 PROTEÇÃO
+) -> None:
+    """
+    Recarrega do banco status e posição dos motoboys do restaurante
+
+    Posições em memória mais novas que as do banco (pings ainda não
+    descarregados) são mantidas.
+    """
+    query = select(
+        Courier.id, Courier.status, Courier.available_since,
+        Courier.last_lat, Courier.last_lng, Courier.updated_at
+    )
+    if restaurant_id:
+        query = query.where(Courier.restaurant_id == restaurant_id)
+    linhas = session.exec(query).all()
+
+    with _lock:
+        antigo = _indices.get(restaurant_id)
+        novo = IndiceMotoboys()
+        for courier_id, status, available_since, lat, lng, updated_at in linhas:
+            novo.atualizar_status(courier_id, normalizar(CourierStatus, status), available_since)
+            em_memoria = antigo.obter(courier_id) if antigo else None
+            if em_memoria is not None and em_memoria.lat is not None and (
+                lat is None or updated_at is None or em_memoria.atualizado_em >= updated_at
+            ):
+                novo.atualizar_posicao(courier_id, em_memoria.lat, em_memoria.lng, em_memoria.atualizado_em)
+            elif lat is not None and lng is not None:
+                novo.atualizar_posicao(courier_id, lat, lng, updated_at)
+        novo.reconciliado_em = datetime.now()
+        _indices[restaurant_id] = novo
+
+
+def motoboys_no_raio(
+    session: Session,
+    restaurant_id: Optional[str],  # 🔒 PROTEÇÃO
+    lat: float,
+    lng: float,
+    raio_km: float,
+    status: Optional[CourierStatus] = None
+) -> List[MotoboyProximo]:
+    """Motoboys do restaurante a até `raio_km` do ponto (mais perto primeiro)"""
+    indice = _indice_atualizado(session, restaurant_id)
+    with _lock:
+        return indice.no_raio(lat, lng, raio_km, status)
+
+
+def motoboys_mais_proximos(
+    session: Session,
+    restaurant_id: Optional[str],  # 🔒 PROTEÇÃO
+    lat: float,
+    lng: float,
+    k: int,
+    status: Optional[CourierStatus] = None
+) -> List[MotoboyProximo]:
+    """Os `k` motoboys do restaurante mais perto do ponto"""
+    indice = _indice_atualizado(session, restaurant_id)
+    with _lock:
+        return indice.mais_proximos(lat, lng, k, status)
+
+
+def motoboys_para_dispatch(
+    session: Session,
+    restaurant_id: Optional[str],  # 🔒 PROTEÇÃO
+    origem_lat: float,
+    origem_lng: float
+) -> List[Courier]:
+    """
+    Motoboys DISPONÍVEIS na ordem em que devem receber lote
+
+    Quem está disponível vem do BANCO (com vários workers, o índice deste
+    processo só vê as transições feitas aqui até a próxima reconciliação);
+    o índice entra só com a posição mais fresca (pings não descarregados).
+
+    1. Quem está no restaurante (até RAIO_DISPATCH_KM) ou sem GPS recente,
+       por ordem de chegada (available_since) - fila justa como antes
+    2. Depois, quem ainda está longe (voltando de entrega), do mais perto
+       ao mais longe
+    """
+    query = select(Courier).where(Courier.status == CourierStatus.AVAILABLE)
+    if restaurant_id:
+        query = query.where(Courier.restaurant_id == restaurant_id)
+    disponiveis = session.exec(query).all()
+
+    agora = datetime.now()
+    na_fila, longe = [], []
+    for courier in disponiveis:
+        lat, lng, atualizado_em = posicao_mais_recente(courier)
+        if lat is not None and atualizado_em is not None and (
+            agora - atualizado_em <= timedelta(minutes=POSICAO_VALIDA_MINUTOS)
+        ):
+            distancia = distancia_km(origem_lat, origem_lng, lat, lng)
+            if distancia > RAIO_DISPATCH_KM:
+                longe.append((distancia, courier.id, courier))
+                continue
+        na_fila.append(courier)
+
+    na_fila.sort(key=lambda c: (c.available_since is None, c.available_since or agora, c.id))
+    longe.sort(key=lambda item: item[:2])
+    return na_fila + [courier for _, _, courier in longe]
+
+
+def posicao_ao_vivo(
+    restaurant_id: Optional[str],
+    courier_id: str
+) -> Optional[PosicaoMotoboy]:
+    """Posição mais fresca conhecida do motoboy, sem ir ao banco (None se não há)"""
+    with _lock:
+        indice = _indices.get(restaurant_id)
+        entrada = indice.obter(courier_id) if indice else None
+        if entrada is None or entrada.lat is None:
+            return None
+        return PosicaoMotoboy(**vars(entrada))
+
+
+def posicao_mais_recente(courier: Courier) -> Tuple[Optional[float], Optional[float], Optional[datetime]]:
+    """
+    (lat, lng, quando) mais fresco entre o índice (pings ainda não
+    descarregados) e o que está gravado no Courier
+    """
+    ao_vivo = posicao_ao_vivo(courier.restaurant_id, courier.id)
+    if ao_vivo and (
+        courier.last_lat is None
+        or courier.updated_at is None
+        or ao_vivo.atualizado_em > courier.updated_at
+    ):
+        return ao_vivo.lat, ao_vivo.lng, ao_vivo.atualizado_em
+    return courier.last_lat, courier.last_lng, courier.updated_at
+
+
+def limpar_indices() -> None:
+    """Descarta todos os índices (próxima consulta recarrega do banco)"""
+    with _lock:
+        _indices.clear()
+
+
+# ============ ATUALIZAÇÃO ============
+
+def registrar_posicao(
+    restaurant_id: Optional[str],
+    courier_id: str,
+    lat: float,
+    lng: float,
+    quando: datetime
+) -> None:
+    """Chamado pela ingestão de GPS a cada lote de pings"""
+    with _lock:
+        for chave in {restaurant_id, None}:
+            _indices.setdefault(chave, IndiceMotoboys()).atualizar_posicao(courier_id, lat, lng, quando)
+
+
+_CHAVE_PENDENTES = "spatial_index_pendentes"
+
+
+@event.listens_for(Session, "after_flush")
+def _coletar_status(session, flush_context):
+    """Guarda as transições de status de motoboys - aplicadas após o commit"""
+    pendentes = session.info.setdefault(_CHAVE_PENDENTES, [])
+    for colecao, novo, removido in (
+        (session.new, True, False),
+        (session.dirty, False, False),
+        (session.deleted, False, True),
+    ):
+        for obj in colecao:
+            if not isinstance(obj, Courier):
+                continue
+            antes, depois = status_antes_depois(obj, CourierStatus, novo, removido)
+            if removido:
+                pendentes.append((obj.restaurant_id, obj.id, None, None))
+            elif novo or antes != depois:
+                pendentes.append((obj.restaurant_id, obj.id, depois, obj.available_since))
+
+
+@event.listens_for(Session, "after_commit")
+def _aplicar_status(session):
+    pendentes = session.info.pop(_CHAVE_PENDENTES, [])
+    if not pendentes:
+        return
+    with _lock:
+        for restaurant_id, courier_id, status, available_since in pendentes:
+            for chave in {restaurant_id, None}:
+                indice = _indices.get(chave)
+                if indice is None:
+                    continue
+                if status is None:
+                    indice.remover(courier_id)
+                else:
+                    indice.atualizar_status(courier_id, status, available_since)
+
+
+@event.listens_for(Session, "after_rollback")
+def _descartar_status(session):
+    session.info.pop(_CHAVE_PENDENTES, None)
@@ -0,0 +1,268 @@
+"""
+Serviço de Trajetos - Histórico compacto dos pontos de GPS dos motoboys
+
+Antes só guardávamos a ÚLTIMA posição do motoboy (Courier.last_lat/lng).
+Agora todo ponto recebido vai para o histórico, fora do banco principal,
+particionado por dia:
+
+    {TRACKS_DIR}/{AAAA-MM-DD}/{courier_id}.trk
+
+FORMATO (append-only, um bloco por descarga do buffer de GPS):
+- Coordenadas viram int32 em micrograus (graus × 1.000.000 → ~11cm)
+- Timestamps viram uint32 (segundos unix)
+- Cabeçalho do bloco: quantidade, início, fim, primeiro ponto inteiro e
+  tamanho do corpo - dá para pular blocos fora do intervalo sem decodificar
+- Corpo: só as DIFERENÇAS para o ponto anterior (dt, dlat, dlng), em
+  zigzag + varint. Um motoboy a 40km/h pingando a cada 5s anda ~50m
+  (~500 micrograus) → cada ponto ocupa ~5 bytes em vez de 12.
+
+Meses de histórico de 500 motoboys cabem em poucos GB de disco, e dias
+antigos são apagados inteiros (rm da pasta) após RETENCAO_DIAS.
+"""
+import os
+import shutil
+import struct
+import threading
+from datetime import date, datetime, timedelta
+from math import radians, sin, cos, sqrt, atan2
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+# Pasta dos trajetos (mesmo DATA_DIR do banco SQLite / uploads)
+TRACKS_DIR = Path(
+    os.environ.get("TRACKS_DIR")
+    or os.path.join(os.environ.get("DATA_DIR", "."), "tracks")
+)
+
+# Dias de histórico mantidos em disco
+RETENCAO_DIAS = int(os.environ.get("TRACK_RETENTION_DAYS", "180"))
+
+# Graus → inteiro (6 casas decimais)
+ESCALA_COORDENADA = 1_000_000
+
+# Cabeçalho do bloco: marcador, quantidade, ts início, ts fim, lat0, lng0, tamanho do corpo
+_CABECALHO = struct.Struct("<BHIIiiI")
+_MARCADOR = 0xD7
+_MAX_PONTOS_BLOCO = 0xFFFF
+
+# Ponto de trajeto: (timestamp, lat, lng)
+Ponto = Tuple[datetime, float, float]
+
+_lock = threading.Lock()
+
+
+def caminho_segmento(courier_id: str, dia: date) -> Path:
+    """Arquivo do trajeto de um motoboy em um dia"""
+    return TRACKS_DIR / dia.strftime("%Y-%m-%d") / f"{courier_id}.trk"
+
+
+# ============ CODIFICAÇÃO ============
+
+def _zigzag(n: int) -> int:
+    return (n << 1) ^ (n >> 63)
+
+
+def _unzigzag(n: int) -> int:
+    return (n >> 1) ^ -(n & 1)
+
+
+def _varint(n: int, saida: bytearray) -> None:
+    while n >= 0x80:
+        saida.append((n & 0x7F) | 0x80)
+        n >>= 7
+    saida.append(n)
+
+
+def _para_inteiros(ponto: Ponto) -> Tuple[int, int, int]:
+    timestamp, lat, lng = ponto
+    return (
+        int(timestamp.timestamp()),
+        round(lat * ESCALA_COORDENADA),
+        round(lng * ESCALA_COORDENADA)
+    )
+
+
+def codificar_bloco(pontos: List[Ponto]) -> bytes:
+    """Codifica pontos (já em ordem de tempo) em um bloco delta + varint"""
+    inteiros = [_para_inteiros(p) for p in pontos]
+    ts0, lat0, lng0 = inteiros[0]
+
+    corpo = bytearray()
+    anterior = inteiros[0]
+    for atual in inteiros[1:]:
+        for valor, valor_anterior in zip(atual, anterior):
+            _varint(_zigzag(valor - valor_anterior), corpo)
+        anterior = atual
+
+    cabecalho = _CABECALHO.pack(
+        _MARCADOR, len(inteiros), ts0, inteiros[-1][0], lat0, lng0, len(corpo)
+    )
+    return cabecalho + bytes(corpo)
+
+
+def _decodificar_corpo(n: int, ts: int, lat: int, lng: int, corpo: bytes) -> Iterator[Tuple[int, int, int]]:
+    yield ts, lat, lng
+    valores = [ts, lat, lng]
+    pos = 0
+    for _ in range(n - 1):
+        for i in range(3):
+            deslocamento = 0
+            bruto = 0
+            while True:
+                byte = corpo[pos]
+                pos += 1
+                bruto |= (byte & 0x7F) << deslocamento
+                if byte < 0x80:
+                    break
+                deslocamento += 7
+            valores[i] += _unzigzag(bruto)
+        yield tuple(valores)
+
+
+def decodificar_segmento(
+    dados: bytes,
+    inicio: Optional[int] = None,
+    fim: Optional[int] = None
+) -> Iterator[Tuple[int, int, int]]:
+    """
+    Percorre os blocos de um segmento devolvendo (ts, lat, lng) inteiros
+
+    Blocos inteiramente fora de [inicio, fim] são pulados pelo cabeçalho.
+    """
+    pos = 0
+    while pos + _CABECALHO.size <= len(dados):
+        marcador, n, ts0, ts_fim, lat0, lng0, tamanho = _CABECALHO.unpack_from(dados, pos)
+        pos += _CABECALHO.size
+        if marcador != _MARCADOR or pos + tamanho > len(dados):
+            # Bloco truncado (ex: queda no meio da escrita) - ignora o resto
+            return
+        corpo = dados[pos:pos + tamanho]
+        pos += tamanho
+
+        if (inicio is not None and ts_fim < inicio) or (fim is not None and ts0 > fim):
+            continue
+        yield from _decodificar_corpo(n, ts0, lat0, lng0, corpo)
+
+
+# ============ ESCRITA ============
+
+def anexar_pontos(pontos_por_motoboy: Dict[str, List[Ponto]]) -> int:
+    """
+    Acrescenta pontos aos segmentos do dia de cada motoboy
+
+    Um open/write por (motoboy, dia) - não um por ponto.
+    Retorna quantos pontos foram gravados.
+    """
+    gravados = 0
+    with _lock:
+        for courier_id, pontos in pontos_por_motoboy.items():
+            for caminho, do_segmento in _agrupar_por_dia(courier_id, pontos):
+                caminho.parent.mkdir(parents=True, exist_ok=True)
+                blocos = [
+                    codificar_bloco(do_segmento[i:i + _MAX_PONTOS_BLOCO])
+                    for i in range(0, len(do_segmento), _MAX_PONTOS_BLOCO)
+                ]
+                with open(caminho, "ab") as arquivo:
+                    arquivo.write(b"".join(blocos))
+                gravados += len(do_segmento)
+    return gravados
+
+
+def _agrupar_por_dia(courier_id: str, pontos: Iterable[Ponto]):
+    segmentos: Dict[Path, List[Ponto]] = {}
+    for ponto in sorted(pontos, key=lambda p: p[0]):
+        segmentos.setdefault(caminho_segmento(courier_id, ponto[0].date()), []).append(ponto)
+    return segmentos.items()
+
+
+def apagar_dias_antigos(manter_dias: int = RETENCAO_DIAS, hoje: Optional[date] = None) -> int:
+    """Apaga as partições (pastas de dia) mais velhas que `manter_dias`"""
+    if not TRACKS_DIR.exists():
+        return 0
+    limite = (hoje or date.today()) - timedelta(days=manter_dias)
+    apagados = 0
+    for pasta in TRACKS_DIR.iterdir():
+        try:
+            dia = datetime.strptime(pasta.name, "%Y-%m-%d").date()
+        except ValueError:
+            continue
+        if dia < limite:
+            shutil.rmtree(pasta, ignore_errors=True)
+            apagados += 1
+    return apagados
+
+
+# ============ CONSULTA ============
+
+def ler_trajeto(courier_id: str, inicio: datetime, fim: datetime) -> List[Ponto]:
+    """
+    Pontos gravados de um motoboy entre `inicio` e `fim`, em ordem de tempo
+
+    Só abre os arquivos dos dias do intervalo.
+    """
+    ts_inicio, ts_fim = int(inicio.timestamp()), int(fim.timestamp())
+    pontos: List[Ponto] = []
+
+    dia = inicio.date()
+    while dia <= fim.date():
+        caminho = caminho_segmento(courier_id, dia)
+        if caminho.exists():
+            for ts, lat, lng in decodificar_segmento(caminho.read_bytes(), ts_inicio, ts_fim):
+                if ts_inicio <= ts <= ts_fim:
+                    pontos.append((
+                        datetime.fromtimestamp(ts),
+                        lat / ESCALA_COORDENADA,
+                        lng / ESCALA_COORDENADA
+                    ))
+        dia += timedelta(days=1)
+
+    pontos.sort(key=lambda p: p[0])
+    return pontos
+
+
+# ============ MEDIÇÕES ============
+
+# Distância do restaurante a partir da qual o motoboy "saiu" / "voltou"
+RAIO_RESTAURANTE_M = 150
+
+
+def distancia_m(lat1: float, lng1: float, lat2: float, lng2: float) -> float:
+    """Distância em metros entre dois pontos (Haversine)"""
+    R = 6_371_000
+    dlat = radians(lat2 - lat1)
+    dlng = radians(lng2 - lng1)
+    a = sin(dlat / 2) ** 2 + cos(radians(lat1)) * cos(radians(lat2)) * sin(dlng / 2) ** 2
+    return R * 2 * atan2(sqrt(a), sqrt(1 - a))
+
+
+def distancia_percorrida_km(pontos: List[Ponto]) -> float:
+    """Soma das distâncias entre pontos consecutivos"""
+    return sum(
+        distancia_m(a[1], a[2], b[1], b[2]) for a, b in zip(pontos, pontos[1:])
+    ) / 1000
+
+
+def medir_duracao_rota(
+    pontos: List[Ponto],
+    origem_lat: float,
+    origem_lng: float
+) -> Optional[float]:
+    """
+    Duração REAL da rota em minutos: da saída do restaurante até a volta
+
+    Saída = primeiro ponto fora do RAIO_RESTAURANTE_M; volta = primeiro
+    ponto depois disso de novo dentro do raio (ou o último ponto, se o
+    motoboy não voltou ao restaurante). None se nunca saiu.
+    """
+    saida = None
+    for timestamp, lat, lng in pontos:
+        dentro = distancia_m(lat, lng, origem_lat, origem_lng) <= RAIO_RESTAURANTE_M
+        if saida is None:
+            if not dentro:
+                saida = timestamp
+        elif dentro:
+            return (timestamp - saida).total_seconds() / 60
+
+    if saida is None:
+        return None
+    return (pontos[-1][0] - saida).total_seconds() / 60
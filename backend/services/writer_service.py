@@ -0,0 +1,129 @@
+"""
+Serviço de Escrita - Escritor único para o SQLite
+
+No SQLite só UMA conexão escreve por vez. Com várias threads/conexões
+gravando juntas (bipagens no horário de pico), as que perdem a disputa
+esperam o busy_timeout e, se não der, falham com "database is locked".
+
+AGORA (modo SQLite):
+- As escritas quentes (transições de status do pedido) vão para uma FILA
+- Uma thread dedicada, com sua própria Session, executa uma por vez, em
+  ordem de chegada: ninguém disputa o lock do arquivo, ninguém refaz nada
+- Quem pediu a escrita só espera o resultado (com await, nas rotas async)
+
+No PostgreSQL (que aceita escritas concorrentes) não há fila: cada escrita
+roda numa AsyncSession própria, como as demais rotas async.
+
+A função de escrita recebe a Session como primeiro argumento e faz o
+próprio commit - a mesma função serve para os dois modos.
+"""
+import asyncio
+import os
+import queue
+import threading
+from abc import ABC, abstractmethod
+from concurrent.futures import Future
+from typing import Any, Callable, Optional
+
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.asyncio import AsyncEngine
+from sqlmodel import Session
+from sqlmodel.ext.asyncio.session import AsyncSession
+
+from database import engine, async_engine
+
+
+# Fila de escrita no SQLite (0 = desliga: cada requisição grava na sua conexão)
+FILA_ESCRITA_SQLITE = os.environ.get("SQLITE_WRITE_QUEUE", "1") != "0"
+
+
+class Escritor(ABC):
+    """Executa funções de escrita `funcao(session, *args)`"""
+
+    @abstractmethod
+    async def executar(self, funcao: Callable[..., Any], *args, **kwargs) -> Any:
+        """Roda `funcao(session, *args, **kwargs)` e devolve o resultado"""
+
+    def encerrar(self) -> None:
+        pass
+
+
+class FilaEscrita(Escritor):
+    """
+    Escritor único: uma thread dedicada executa as escritas em ordem
+
+    A thread é criada na primeira escrita. Os objetos devolvidos já vêm
+    carregados (expire_on_commit=False) e desligados da Session.
+    """
+
+    def __init__(self, engine_: Engine):
+        self.engine = engine_
+        self.executadas = 0
+        self._fila: "queue.Queue[Optional[tuple]]" = queue.Queue()
+        self._thread: Optional[threading.Thread] = None
+        self._lock = threading.Lock()
+
+    def enviar(self, funcao: Callable[..., Any], *args, **kwargs) -> Future:
+        """Enfileira a escrita e devolve o Future com o resultado"""
+        futuro: Future = Future()
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="fila-escrita-sqlite", daemon=True)
+                self._thread.start()
+            self._fila.put((funcao, args, kwargs, futuro))
+        return futuro
+
+    async def executar(self, funcao: Callable[..., Any], *args, **kwargs) -> Any:
+        return await asyncio.wrap_future(self.enviar(funcao, *args, **kwargs))
+
+    def pendentes(self) -> int:
+        """Escritas esperando na fila"""
+        return self._fila.qsize()
+
+    def encerrar(self) -> None:
+        """Termina as escritas já enfileiradas e para a thread"""
+        with self._lock:
+            thread, self._thread = self._thread, None
+            if thread is None:
+                return
+            self._fila.put(None)
+        thread.join()
+
+    def _loop(self) -> None:
+        while True:
+            item = self._fila.get()
+            if item is None:
+                return
+            funcao, args, kwargs, futuro = item
+            if not futuro.set_running_or_notify_cancel():
+                continue
+            try:
+                with Session(self.engine, expire_on_commit=False) as session:
+                    resultado = funcao(session, *args, **kwargs)
+            except BaseException as erro:
+                futuro.set_exception(erro)
+            else:
+                futuro.set_result(resultado)
+            self.executadas += 1
+
+
+class EscritaDireta(Escritor):
+    """Sem fila: cada escrita numa AsyncSession própria (PostgreSQL)"""
+
+    def __init__(self, engine_: AsyncEngine):
+        self.engine = engine_
+
+    async def executar(self, funcao: Callable[..., Any], *args, **kwargs) -> Any:
+        async with AsyncSession(self.engine, expire_on_commit=False) as session:
+            return await session.run_sync(funcao, *args, **kwargs)
+
+
+if engine.dialect.name == "sqlite" and FILA_ESCRITA_SQLITE:
+    escritor: Escritor = FilaEscrita(engine)
+else:
+    escritor = EscritaDireta(async_engine)
+
+
+def get_escritor() -> Escritor:
+    """Dependency das rotas que gravam pela fila de escrita"""
+    return escritor
@@ -94,11 +94,53 @@ function MotoFlashApp() {
         }
     }, [playNotificationSound]);
     
+    // Tempo real (SSE): os eventos disparam o refresh e o polling vira
+    // só rede de segurança (30s conectado, 5s se o stream cair)
+    const [liveConnected, setLiveConnected] = useState(false);
+    const fetchAllRef = useRef(fetchAll);
+    const refreshTimerRef = useRef(null);
+    fetchAllRef.current = fetchAll;
+
+    useEffect(() => {
+        const token = getToken();
+        if (!token || !window.EventSource) return;
+
+        // Agrupa rajadas de eventos (ex: dispatch) em um único refresh
+        const scheduleRefresh = () => {
+            if (refreshTimerRef.current) return;
+            refreshTimerRef.current = setTimeout(() => {
+                refreshTimerRef.current = null;
+                fetchAllRef.current();
+            }, 300);
+        };
+
+        const source = new EventSource(`${API_URL}/events/restaurant?token=${encodeURIComponent(token)}`);
+        source.onopen = () => setLiveConnected(true);
+        source.onerror = () => setLiveConnected(false);
+
+        ['pedido_status', 'lote_novo', 'lote_status', 'motoboy_status', 'resync'].forEach(tipo =>
+            source.addEventListener(tipo, scheduleRefresh)
+        );
+        source.addEventListener('alertas', (e) => setAlerts(JSON.parse(e.data)));
+        source.addEventListener('motoboy_localizacao', (e) => {
+            const { courier_id, lat, lng } = JSON.parse(e.data);
+            setCouriers(prev => prev.map(c =>
+                c.id === courier_id ? { ...c, last_lat: lat, last_lng: lng } : c
+            ));
+        });
+
+        return () => {
+            source.close();
+            clearTimeout(refreshTimerRef.current);
+            refreshTimerRef.current = null;
+        };
+    }, []);
+
     useEffect(() => {
         fetchAll();
-        const interval = setInterval(fetchAll, 5000);
+        const interval = setInterval(fetchAll, liveConnected ? 30000 : 5000);
         return () => clearInterval(interval);
-    }, [fetchAll]);
+    }, [fetchAll, liveConnected]);
     
     // Dados do restaurante (para mapa)
     const [restaurantData, setRestaurantData] = useState(() => {
@@ -510,6 +510,9 @@ const NewOrderForm = ({ onOrderCreated, simulatedDate }) => {
                     item: selectedItem ? selectedItem.name : 'Pedido',
                     prep_type: 'short',
                     simulated_date: simulatedDate,
+                    // Cliente conhecido: o backend reaproveita as coordenadas do cadastro
+                    customer_id: foundCustomer?.id || null,
+                    customer_phone: phone.replace(/\D/g, '') || null,
                 }),
             });
             
@@ -2,10 +2,18 @@
 Configuração de fixtures para testes do MotoFlash
 """
 import pytest
+import json
 import os
+import tempfile
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
 from fastapi.testclient import TestClient
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import NullPool
 from sqlmodel import Session, SQLModel, create_engine
-from sqlmodel.pool import StaticPool
+from sqlmodel.ext.asyncio.session import AsyncSession
 
 # Configura variáveis de ambiente para testes ANTES de importar módulos
 os.environ["TESTING"] = "true"  # Desabilita rate limiting durante testes
@@ -14,39 +22,96 @@ os.environ["FIREBASE_PRIVATE_KEY_ID"] = "test_key_id"
 os.environ["FIREBASE_PRIVATE_KEY"] = "test_private_key"
 os.environ["FIREBASE_CLIENT_EMAIL"] = "test@test.com"
 os.environ["FIREBASE_PROJECT_ID"] = "test_project"
+os.environ["TRACKS_DIR"] = tempfile.mkdtemp(prefix="motoflash-tracks-")  # Trajetos GPS fora do repo
+os.environ["QRCODE_DIR"] = tempfile.mkdtemp(prefix="motoflash-qrcodes-")  # QR Codes gerados fora do repo
+os.environ["BCRYPT_ROUNDS"] = "4"  # Custo mínimo do bcrypt (testes rápidos)
 
 from main import app
-from database import get_session
+from database import (
+    get_session, get_read_session, get_async_session, get_async_read_session, configurar_sqlite
+)
+from services.writer_service import FilaEscrita, get_escritor
+from services.geocode_cache_service import cache_geocoding
+from services.live_state_service import limpar_estados
 from models import Restaurant, User, Courier
 
 
+@pytest.fixture(name="db_path")
+def db_path_fixture(tmp_path):
+    """
+    Banco SQLite em arquivo temporário (um por teste)
+
+    Arquivo e não :memory: porque as rotas async e a fila de escrita usam
+    outras conexões, que precisam enxergar os mesmos dados. Mesmos PRAGMAs
+    da aplicação (WAL: leitura de uma conexão não bloqueia a escrita da outra).
+    """
+    return tmp_path / "test.db"
+
+
 @pytest.fixture(name="session")
-def session_fixture():
+def session_fixture(db_path):
     """
-    Cria uma sessão de banco de dados em memória para testes
+    Cria a sessão de banco de dados dos testes (compartilhada com as rotas síncronas)
     """
     engine = create_engine(
-        "sqlite:///:memory:",
+        f"sqlite:///{db_path}",
         connect_args={"check_same_thread": False},
-        poolclass=StaticPool,
     )
+    configurar_sqlite(engine)
     SQLModel.metadata.create_all(engine)
     with Session(engine) as session:
         yield session
+    engine.dispose()
+
+
+@pytest.fixture(name="async_engine")
+def async_engine_fixture(db_path, session: Session):
+    """
+    Engine aiosqlite das rotas async, no mesmo arquivo da sessão de teste
+
+    NullPool: cada requisição abre sua conexão (o TestClient pode usar
+    event loops diferentes entre requisições).
+    """
+    engine = create_async_engine(f"sqlite+aiosqlite:///{db_path}", poolclass=NullPool)
+    configurar_sqlite(engine.sync_engine)
+    return engine
 
 
 @pytest.fixture(name="client")
-def client_fixture(session: Session):
+def client_fixture(session: Session, async_engine):
     """
     Cria um cliente de teste do FastAPI
+
+    Rotas síncronas usam a própria sessão do teste; rotas async e a fila
+    de escrita abrem sessões próprias no mesmo banco (dados commitados pelo
+    teste ficam visíveis - e o que a rota grava, o teste vê com session.refresh).
     """
     def get_session_override():
         return session
 
+    async def get_async_session_override():
+        async with AsyncSession(async_engine, expire_on_commit=False) as async_session:
+            yield async_session
+
     app.dependency_overrides[get_session] = get_session_override
+    app.dependency_overrides[get_read_session] = get_session_override
+    app.dependency_overrides[get_async_session] = get_async_session_override
+    app.dependency_overrides[get_async_read_session] = get_async_session_override
+    escritor = FilaEscrita(session.get_bind())
+    app.dependency_overrides[get_escritor] = lambda: escritor
+    # Cache de geocoding na tabela do banco de teste, começando vazio
+    cache_geocoding.engine = session.get_bind()
+    cache_geocoding.escritor = escritor
+    cache_geocoding.limpar_memoria()
+    cache_geocoding.zerar_metricas()
     client = TestClient(app)
     yield client
     app.dependency_overrides.clear()
+    escritor.encerrar()
+    cache_geocoding.engine = None
+    cache_geocoding.escritor = None
+    cache_geocoding.limpar_memoria()
+    limpar_estados()  # Contadores ao vivo não passam de um teste para o outro
 
 
 @pytest.fixture(name="test_restaurant")
@@ -287,3 +352,73 @@ def test_couriers_available_fixture(session: Session, test_restaurant: Restauran
         session.refresh(courier)
 
     return couriers
+
+
+class GoogleFalso:
+    """
+    Servidor HTTP local no formato da Google Geocoding API
+
+    Endereço (o que vem antes de ", Ribeirão Preto") em `conhecidos` → OK,
+    em `instaveis` → erro HTTP 500, outro → ZERO_RESULTS. Registra as
+    consultas e quantas ficaram abertas ao mesmo tempo.
+    """
+
+    def __init__(self):
+        self.conhecidos = {}
+        self.instaveis = set()
+        self.atraso = 0.0
+        self.consultas = []
+        self.simultaneas = 0
+        self.max_simultaneas = 0
+        self._lock = threading.Lock()
+
+    def responder(self, full_address: str):
+        endereco = full_address.split(", Ribeirão Preto")[0]
+        with self._lock:
+            self.consultas.append(endereco)
+            self.simultaneas += 1
+            self.max_simultaneas = max(self.max_simultaneas, self.simultaneas)
+        try:
+            time.sleep(self.atraso)
+            if endereco in self.instaveis:
+                return 500, {}
+            if endereco in self.conhecidos:
+                lat, lng = self.conhecidos[endereco]
+                return 200, {"status": "OK", "results": [{"geometry": {"location": {"lat": lat, "lng": lng}}}]}
+            return 200, {"status": "ZERO_RESULTS", "results": []}
+        finally:
+            with self._lock:
+                self.simultaneas -= 1
+
+
+@pytest.fixture(name="google")
+def google_fixture(monkeypatch):
+    """Geocoding apontado para um GoogleFalso (servidor local, porta livre)"""
+    from services import geocoding_service
+
+    google = GoogleFalso()
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            full_address = parse_qs(urlparse(self.path).query)["address"][0]
+            status_code, corpo = google.responder(full_address)
+            dados = json.dumps(corpo).encode()
+            self.send_response(status_code)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(dados)))
+            self.end_headers()
+            self.wfile.write(dados)
+
+        def log_message(self, *args):
+            pass
+
+    servidor = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    servidor.daemon_threads = True
+    threading.Thread(target=servidor.serve_forever, daemon=True).start()
+    monkeypatch.setattr(
+        geocoding_service, "GOOGLE_GEOCODING_URL",
+        f"http://127.0.0.1:{servidor.server_address[1]}/maps/api/geocode/json"
+    )
+    yield google
+    servidor.shutdown()
+    servidor.server_close()
@@ -125,3 +125,81 @@ def test_me_endpoint_token_invalido(client: TestClient):
         headers={"Authorization": "Bearer token_invalido"}
     )
     assert response.status_code == 401
+
+
+def test_usuario_do_token_em_cache(client: TestClient, auth_headers: dict, session, test_user: User):
+    """
+    Testa o cache do usuário logado
+
+    Resultado esperado: requisições seguintes com o mesmo token não
+    consultam a tabela users; desativar o usuário vale na hora
+    """
+    from sqlalchemy import event
+
+    def queries_em_users() -> int:
+        queries = []
+        contar = lambda conn, cursor, sql, *args: queries.append(sql)
+        event.listen(session.get_bind(), "before_cursor_execute", contar)
+        try:
+            response = client.get("/orders", headers=auth_headers)
+        finally:
+            event.remove(session.get_bind(), "before_cursor_execute", contar)
+        assert response.status_code == 200
+        return sum("FROM users" in q for q in queries)
+
+    client.get("/orders", headers=auth_headers)
+    assert queries_em_users() == 0
+
+    test_user.active = False
+    session.add(test_user)
+    session.commit()
+
+    response = client.get("/orders", headers=auth_headers)
+    assert response.status_code == 401
+
+
+def test_rota_async_autentica_pela_async_session(client: TestClient, auth_headers: dict, session, test_user: User):
+    """
+    Testa a autenticação das rotas async (get_current_user_async)
+
+    Resultado esperado: token válido passa (User lido pela AsyncSession);
+    usuário desativado é barrado também nas rotas async
+    """
+    from services.auth_service import limpar_cache_usuarios
+
+    limpar_cache_usuarios()
+    response = client.get("/dispatch/batches", headers=auth_headers)
+    assert response.status_code == 200
+
+    test_user.active = False
+    session.add(test_user)
+    session.commit()
+
+    response = client.get("/dispatch/batches", headers=auth_headers)
+    assert response.status_code == 401
+
+
+def test_login_refaz_hash_com_custo_desatualizado(
+    client: TestClient, session, test_user: User, monkeypatch
+):
+    """
+    Testa a troca transparente do custo do bcrypt
+
+    Resultado esperado: login continua funcionando e o hash gravado passa
+    a usar o custo configurado; senha errada não mexe no hash
+    """
+    from services import credential_service
+
+    custo_antigo = credential_service.custo_do_hash(test_user.password_hash)
+    monkeypatch.setattr(credential_service, "BCRYPT_ROUNDS", custo_antigo + 1)
+
+    response = client.post("/auth/login", json={"email": test_user.email, "password": "errada"})
+    assert response.status_code == 401
+    session.refresh(test_user)
+    assert credential_service.custo_do_hash(test_user.password_hash) == custo_antigo
+
+    response = client.post("/auth/login", json={"email": test_user.email, "password": "senha123"})
+    assert response.status_code == 200
+    session.refresh(test_user)
+    assert credential_service.custo_do_hash(test_user.password_hash) == custo_antigo + 1
+    assert credential_service.conferir_senha("senha123", test_user.password_hash)
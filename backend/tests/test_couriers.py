@@ -2,13 +2,16 @@
 Testes para endpoints de Motoboys (Couriers)
 """
 from datetime import datetime, timedelta
+import pytest
 from fastapi.testclient import TestClient
 from sqlmodel import Session, select
 
 from models import (
     Courier, CourierStatus, Order, OrderStatus, Batch, BatchStatus,
-    PrepType, Restaurant, PasswordReset
+    PrepType, Restaurant, PasswordReset, Invite
 )
+from services.location_service import descarregar_localizacoes
+from services.track_service import caminho_segmento, ler_trajeto
 
 
 # ============ AUTENTICAÇÃO ============
@@ -570,12 +573,225 @@ def test_atualizar_localizacao(client: TestClient, session: Session, test_courie
     )
     assert response.status_code == 200
 
+    # Posição fica no buffer até a descarga periódica
+    descarregar_localizacoes(session)
+
     # Verifica no banco
     session.refresh(test_courier)
     assert test_courier.last_lat == lat
     assert test_courier.last_lng == lng
 
 
+def test_receber_lote_de_localizacoes(client: TestClient, session: Session, test_courier: Courier):
+    """
+    Testa ingestão de vários pings em um request
+
+    Resultado esperado: banco fica só com o ping mais recente (mesmo fora
+    de ordem) e todos os pontos vão para o trajeto
+    """
+    agora = datetime.now().replace(microsecond=0)
+    pings = [
+        {"lat": -23.5600, "lng": -46.6500, "timestamp": (agora - timedelta(seconds=10)).isoformat()},
+        {"lat": -23.5620, "lng": -46.6520, "timestamp": agora.isoformat()},
+        {"lat": -23.5610, "lng": -46.6510, "timestamp": (agora - timedelta(seconds=5)).isoformat()},
+    ]
+
+    response = client.post(f"/couriers/{test_courier.id}/locations", json={"pings": pings})
+    assert response.status_code == 200
+    assert response.json()["accepted"] == 3
+
+    # Nada foi para o banco ainda
+    session.refresh(test_courier)
+    assert test_courier.last_lat is None
+
+    assert descarregar_localizacoes(session) == 1
+
+    session.refresh(test_courier)
+    assert test_courier.last_lat == -23.5620
+    assert test_courier.last_lng == -46.6520
+    assert test_courier.updated_at == agora
+
+    # Todos os pontos no histórico, em ordem de tempo
+    pontos = ler_trajeto(test_courier.id, agora - timedelta(minutes=1), agora)
+    assert [(lat, lng) for _, lat, lng in pontos] == [
+        (-23.5600, -46.6500), (-23.5610, -46.6510), (-23.5620, -46.6520)
+    ]
+    assert pontos[-1][0] == agora
+
+
+def test_falha_no_trajeto_nao_perde_pontos(
+    client: TestClient, session: Session, test_courier: Courier, monkeypatch
+):
+    """
+    Testa descarga com erro ao gravar o histórico (ex.: disco cheio)
+
+    Resultado esperado: a posição vai para o banco mesmo assim, os pontos
+    voltam ao buffer e entram no trajeto na descarga seguinte
+    """
+    import services.location_service as location_service
+
+    def disco_cheio(trajeto):
+        raise OSError("No space left on device")
+
+    agora = datetime.now().replace(microsecond=0)
+    pings = [
+        {"lat": -23.5600, "lng": -46.6500, "timestamp": (agora - timedelta(seconds=5)).isoformat()},
+        {"lat": -23.5620, "lng": -46.6520, "timestamp": agora.isoformat()},
+    ]
+    response = client.post(f"/couriers/{test_courier.id}/locations", json={"pings": pings})
+    assert response.status_code == 200
+
+    monkeypatch.setattr(location_service, "anexar_pontos", disco_cheio)
+    with pytest.raises(OSError):
+        descarregar_localizacoes(session)
+
+    session.refresh(test_courier)
+    assert test_courier.last_lat == -23.5620
+    assert len(location_service.buffer.pontos_pendentes(test_courier.id)) == 2
+
+    monkeypatch.undo()
+    assert descarregar_localizacoes(session) == 0
+    assert location_service.buffer.pontos_pendentes(test_courier.id) == []
+    pontos = ler_trajeto(test_courier.id, agora - timedelta(minutes=1), agora)
+    assert [(lat, lng) for _, lat, lng in pontos] == [(-23.5600, -46.6500), (-23.5620, -46.6520)]
+
+
+def test_trajeto_compacto_por_dia():
+    """
+    Testa o histórico de GPS: delta + varint, partição por dia e consulta por intervalo
+
+    Resultado esperado: pontos voltam iguais (precisão de 6 casas), consulta
+    só devolve o intervalo pedido e cada ponto ocupa bem menos que 12 bytes
+    """
+    from services.track_service import anexar_pontos, apagar_dias_antigos
+
+    courier_id = "motoboy-trajeto"
+    inicio = datetime(2026, 3, 10, 23, 0, 0)
+    # Ponto a cada 5s andando ~50m, atravessando a meia-noite
+    pontos = [
+        (inicio + timedelta(seconds=5 * i), -23.550520 + i * 0.00045, -46.633308 - i * 0.0002)
+        for i in range(1000)
+    ]
+
+    # Duas descargas (dois blocos por arquivo)
+    anexar_pontos({courier_id: pontos[:400]})
+    anexar_pontos({courier_id: pontos[400:]})
+
+    lidos = ler_trajeto(courier_id, pontos[0][0], pontos[-1][0])
+    assert len(lidos) == 1000
+    for (t1, lat1, lng1), (t2, lat2, lng2) in zip(pontos, lidos):
+        assert t1 == t2
+        assert abs(lat1 - lat2) < 1e-6 and abs(lng1 - lng2) < 1e-6
+
+    # Consulta só de um pedaço
+    parte = ler_trajeto(courier_id, pontos[100][0], pontos[199][0])
+    assert [p[0] for p in parte] == [p[0] for p in pontos[100:200]]
+
+    # Particionado por dia e compacto
+    dia_1 = caminho_segmento(courier_id, inicio.date())
+    dia_2 = caminho_segmento(courier_id, (inicio + timedelta(days=1)).date())
+    assert dia_1.exists() and dia_2.exists()
+    assert dia_1.stat().st_size + dia_2.stat().st_size < 1000 * 6
+
+    # Retenção apaga dias inteiros
+    assert apagar_dias_antigos(manter_dias=30, hoje=inicio.date() + timedelta(days=31)) == 1
+    assert not dia_1.exists() and dia_2.exists()
+
+
+def test_indice_espacial_raio_e_mais_proximos():
+    """
+    Testa a grade de motoboys: busca por raio, k mais próximos e ping atrasado
+
+    Resultado esperado: mesmas respostas de uma varredura completa, mais
+    perto primeiro; ping mais velho não sobrescreve posição
+    """
+    from services.spatial_service import IndiceMotoboys, distancia_km
+
+    agora = datetime.now()
+    indice = IndiceMotoboys()
+    posicoes = {
+        f"m{i}": (-23.55 + (i % 20) * 0.004, -46.63 + (i // 20) * 0.004)
+        for i in range(400)
+    }
+    for courier_id, (lat, lng) in posicoes.items():
+        indice.atualizar_status(courier_id, CourierStatus.AVAILABLE, agora)
+        indice.atualizar_posicao(courier_id, lat, lng, agora)
+
+    centro = (-23.52, -46.59)
+    distancias = sorted(
+        (distancia_km(*centro, lat, lng), courier_id) for courier_id, (lat, lng) in posicoes.items()
+    )
+
+    no_raio = indice.no_raio(*centro, 1.5)
+    assert [m.courier_id for m in no_raio] == [c for d, c in distancias if d <= 1.5]
+
+    mais_proximos = indice.mais_proximos(*centro, 5)
+    assert [round(m.distancia_km, 9) for m in mais_proximos] == [round(d, 9) for d, _ in distancias[:5]]
+
+    # Ping atrasado é ignorado
+    indice.atualizar_posicao("m0", 0.0, 0.0, agora - timedelta(seconds=30))
+    assert indice.obter("m0").lat == posicoes["m0"][0]
+
+    # Filtro de status
+    indice.atualizar_status(mais_proximos[0].courier_id, CourierStatus.BUSY, None)
+    livres = indice.mais_proximos(*centro, 5, CourierStatus.AVAILABLE)
+    assert mais_proximos[0].courier_id not in [m.courier_id for m in livres]
+
+
+def test_motoboys_proximos(
+    client: TestClient,
+    auth_headers: dict,
+    session: Session,
+    test_restaurant: Restaurant,
+    test_couriers_available: list
+):
+    """
+    Testa a busca de motoboys perto de um ponto
+
+    Resultado esperado: usa a posição recém-recebida (antes da descarga),
+    mais perto primeiro, sem motoboys de outro restaurante
+    """
+    perto, longe, sem_gps = test_couriers_available
+    client.put(f"/couriers/{perto.id}/location", params={"lat": test_restaurant.lat + 0.001, "lng": test_restaurant.lng})
+    client.put(f"/couriers/{longe.id}/location", params={"lat": test_restaurant.lat + 0.05, "lng": test_restaurant.lng})
+
+    outro = Restaurant(
+        name="Outro", slug="outro-proximos", cnpj="99999999000198",
+        email="outro-proximos@teste.com", phone="11911111112", address="Rua Y"
+    )
+    session.add(outro)
+    session.commit()
+    intruso = Courier(name="Intruso", phone="11977770000", restaurant_id=outro.id, status=CourierStatus.AVAILABLE)
+    session.add(intruso)
+    session.commit()
+    client.put(f"/couriers/{intruso.id}/location", params={"lat": test_restaurant.lat, "lng": test_restaurant.lng})
+
+    params = {"lat": test_restaurant.lat, "lng": test_restaurant.lng}
+    response = client.get("/couriers/nearby", params={**params, "radius_km": 2}, headers=auth_headers)
+    assert response.status_code == 200
+    assert [m["id"] for m in response.json()] == [perto.id]
+    assert response.json()[0]["distance_km"] < 0.2
+
+    response = client.get("/couriers/nearby", params={**params, "k": 5}, headers=auth_headers)
+    assert [m["id"] for m in response.json()] == [perto.id, longe.id]
+
+    # Detalhe do motoboy já mostra a posição ainda não descarregada
+    response = client.get(f"/couriers/{perto.id}")
+    assert response.json()["last_lat"] == test_restaurant.lat + 0.001
+
+    response = client.get("/couriers/nearby", params=params)
+    assert response.status_code == 401
+
+
+def test_receber_localizacoes_motoboy_inexistente(client: TestClient):
+    """Testa ingestão de GPS para motoboy que não existe"""
+    response = client.post(
+        "/couriers/nao-existe/locations",
+        json={"pings": [{"lat": -23.56, "lng": -46.65}]}
+    )
+    assert response.status_code == 404
+
+
 def test_atualizar_push_token(client: TestClient, session: Session, test_courier: Courier):
     """Testa salvar token de push notification"""
     token = "fake-fcm-token-12345"
@@ -738,6 +954,32 @@ def test_usar_codigo_para_redefinir_senha(
     assert login_response.json()["success"] is True
 
 
+def test_usar_convite_cria_motoboy_com_senha(
+    client: TestClient,
+    session: Session,
+    test_restaurant: Restaurant
+):
+    """Testa POST /invites/{code}/use: cria o motoboy (senha pelo pool) e já permite login"""
+    session.add(Invite(code="convite-789", restaurant_id=test_restaurant.id))
+    session.commit()
+
+    response = client.post(
+        "/invites/convite-789/use",
+        json={"name": "Novo", "phone": "(16) 98888-1234", "password": "senha789"}
+    )
+    assert response.status_code == 200
+    assert response.json()["courier"]["restaurant_id"] == test_restaurant.id
+
+    login_response = client.post("/couriers/login", json={"phone": "16988881234", "password": "senha789"})
+    assert login_response.json()["success"] is True
+
+    response = client.post(
+        "/invites/convite-789/use",
+        json={"name": "Outro", "phone": "16977775555", "password": "senha789"}
+    )
+    assert response.status_code == 400
+
+
 # ============ ROTAS DE ENTREGA (SEM JWT) ============
 
 def test_coletar_pedido_sucesso(
@@ -0,0 +1,119 @@
+"""
+Testes de clientes: coordenadas resolvidas em background e reaproveitadas nos pedidos
+"""
+import pytest
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from models import Customer
+
+
+@pytest.fixture(name="google")
+def google_fixture(google):
+    """Google falso (servidor local) com os endereços dos testes"""
+    google.conhecidos.update({
+        "Rua das Flores, 10": (-21.20, -47.80),
+        "Av. Brasil, 500": (-21.18, -47.81),
+    })
+    return google
+
+
+def _cadastrar(client: TestClient, auth_headers: dict, address: str = "Rua das Flores, 10") -> dict:
+    response = client.post(
+        "/customers",
+        json={"phone": "16999990000", "name": "Ana", "address": address},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    return response.json()
+
+
+def test_cadastro_resolve_coordenadas_em_background(
+    client: TestClient, auth_headers: dict, session: Session, google
+):
+    """
+    Testa POST/PUT /customers
+
+    Resultado esperado: a resposta não espera o geocoding; depois dela as
+    coordenadas estão no cadastro; trocar o endereço refaz a busca
+    """
+    cadastro = _cadastrar(client, auth_headers)
+    assert cadastro["lat"] is None
+
+    customer = session.get(Customer, cadastro["id"])
+    session.refresh(customer)
+    assert (customer.lat, customer.lng) == (-21.20, -47.80)
+
+    response = client.put(
+        f"/customers/{cadastro['id']}", json={"address": "Av. Brasil, 500"}, headers=auth_headers
+    )
+    assert response.status_code == 200
+    session.refresh(customer)
+    assert (customer.lat, customer.lng) == (-21.18, -47.81)
+
+    # Mesmo endereço: nada a refazer
+    client.put(f"/customers/{cadastro['id']}", json={"address": "Av. Brasil, 500"}, headers=auth_headers)
+    assert google.consultas == ["Rua das Flores, 10", "Av. Brasil, 500"]
+
+
+def test_pedido_de_cliente_conhecido_sem_geocoding(
+    client: TestClient, auth_headers: dict, session: Session, google
+):
+    """
+    Testa POST /orders com customer_id / customer_phone
+
+    Resultado esperado: mesmo endereço do cadastro (com ou sem complemento)
+    usa as coordenadas guardadas, sem consultar o geocoding; outro
+    endereço é geocodificado normalmente
+    """
+    cadastro = _cadastrar(client, auth_headers)
+    # Cadastro "velho": as coordenadas ficaram no banco, o cache de geocoding não vale
+    customer = session.get(Customer, cadastro["id"])
+    customer.lat, customer.lng = -21.25, -47.85
+    session.add(customer)
+    session.commit()
+    google.consultas.clear()
+
+    pedidos = [
+        {"customer_name": "Ana", "address_text": "Rua das Flores, 10", "customer_id": cadastro["id"]},
+        {"customer_name": "Ana", "address_text": "Rua das Flores, 10 - apto 3", "customer_phone": "16999990000"},
+    ]
+    for pedido in pedidos:
+        response = client.post("/orders", json=pedido, headers=auth_headers)
+        assert response.status_code == 200
+        assert (response.json()["lat"], response.json()["lng"]) == (-21.25, -47.85)
+
+    response = client.post("/orders/bulk", json=pedidos, headers=auth_headers)
+    assert response.json()["created"] == 2
+    assert all(r["order"]["lat"] == -21.25 for r in response.json()["results"])
+    assert google.consultas == []
+
+    response = client.post(
+        "/orders",
+        json={"customer_name": "Ana", "address_text": "Av. Brasil, 500", "customer_id": cadastro["id"]},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["lat"] == -21.18
+    assert google.consultas == ["Av. Brasil, 500"]
+
+
+def test_pedido_nao_usa_cliente_de_outro_restaurante(
+    client: TestClient, auth_headers: dict, session: Session, google
+):
+    """customer_id de outro restaurante é ignorado: o endereço vai para o geocoding"""
+    outro = Customer(
+        restaurant_id="outro-restaurante", phone="16988887777", name="Zé",
+        address="Rua das Flores, 10", lat=0.0, lng=0.0
+    )
+    session.add(outro)
+    session.commit()
+
+    response = client.post(
+        "/orders",
+        json={"customer_name": "Zé", "address_text": "Rua das Flores, 10", "customer_id": outro.id},
+        headers=auth_headers
+    )
+    assert response.status_code == 200
+    assert response.json()["lat"] == -21.20
+    assert google.consultas == ["Rua das Flores, 10"]
@@ -0,0 +1,88 @@
+"""
+Testes do banco: migrações (Alembic) e índices das consultas quentes
+"""
+from datetime import datetime, timedelta
+
+from alembic import command
+from alembic.autogenerate import compare_metadata
+from alembic.config import Config
+from alembic.migration import MigrationContext
+from alembic.script import ScriptDirectory
+from sqlalchemy import text
+from sqlmodel import Session, SQLModel, create_engine, select
+
+from database import PASTA_BACKEND, aplicar_migracoes
+from models import Order, OrderStatus, PadraoDemanda
+
+
+def _plano(session: Session, statement) -> str:
+    """EXPLAIN QUERY PLAN do SQLite para a consulta (com os valores embutidos)"""
+    sql = str(statement.compile(session.get_bind(), compile_kwargs={"literal_binds": True}))
+    linhas = session.connection().exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}").all()
+    return "\n".join(linha[-1] for linha in linhas)
+
+
+def test_migracoes_geram_o_schema_dos_models(tmp_path):
+    """Banco novo pelas migrações = schema dos models (nenhuma migração faltando)"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'migrado.db'}")
+    aplicar_migracoes(engine)
+
+    with engine.connect() as conexao:
+        diferencas = compare_metadata(MigrationContext.configure(conexao), SQLModel.metadata)
+    assert diferencas == []
+    engine.dispose()
+
+
+def test_migracao_adota_banco_criado_sem_versao(tmp_path):
+    """Banco antigo (create_all, sem alembic_version) só recebe as migrações novas"""
+    engine = create_engine(f"sqlite:///{tmp_path / 'legado.db'}")
+    config = Config(f"{PASTA_BACKEND}/alembic.ini")
+    with engine.begin() as conexao:
+        config.attributes["connection"] = conexao
+        command.upgrade(config, "0001")
+        conexao.execute(text("DROP TABLE alembic_version"))
+
+    # Padrão duplicado (antes não havia índice único): fica o mais recente
+    agora = datetime.now()
+    with Session(engine) as session:
+        session.add(PadraoDemanda(restaurant_id="r1", dia_semana=4, hora=20, amostras=1,
+                                  ultima_atualizacao=agora - timedelta(days=7)))
+        session.add(PadraoDemanda(restaurant_id="r1", dia_semana=4, hora=20, amostras=2,
+                                  ultima_atualizacao=agora))
+        session.commit()
+
+    aplicar_migracoes(engine)
+
+    ultima_revisao = ScriptDirectory.from_config(config).get_current_head()
+    with Session(engine) as session:
+        assert session.connection().exec_driver_sql("SELECT version_num FROM alembic_version").scalar() == ultima_revisao
+        padroes = session.exec(select(PadraoDemanda)).all()
+        assert [p.amostras for p in padroes] == [2]
+    engine.dispose()
+
+
+def test_dispatch_usa_indice_composto(session: Session):
+    """Pedidos READY sem lote do restaurante: busca e ordem pelo índice (sem ordenar em memória)"""
+    statement = select(Order).where(
+        Order.status == OrderStatus.READY,
+        Order.batch_id == None
+    ).order_by(Order.ready_at).where(Order.restaurant_id == "r1")
+
+    plano = _plano(session, statement)
+    assert "ix_orders_restaurant_status_batch_ready (restaurant_id=? AND status=? AND batch_id=?)" in plano
+    assert "TEMP B-TREE" not in plano
+
+
+def test_listagem_usa_indice_composto(session: Session):
+    """Listagem de pedidos (mais recentes primeiro) sem varrer nem ordenar a tabela"""
+    statement = select(Order).where(
+        Order.restaurant_id == "r1"
+    ).order_by(Order.created_at.desc()).limit(50)
+
+    plano = _plano(session, statement)
+    assert "ix_orders_restaurant_created (restaurant_id=?)" in plano
+    assert "TEMP B-TREE" not in plano
+
+    paradas = _plano(session, select(Order).where(Order.batch_id == "b1").order_by(Order.stop_order))
+    assert "ix_orders_batch_stop (batch_id=?)" in paradas
+    assert "TEMP B-TREE" not in paradas
@@ -7,10 +7,14 @@ Cobre:
 - Atribuição de motoboys
 - Isolamento multi-tenant
 """
+from datetime import datetime, timedelta
 from fastapi.testclient import TestClient
 from sqlmodel import Session, select
 
-from models import Order, Courier, Batch, OrderStatus, CourierStatus, BatchStatus
+from models import (
+    Order, Courier, Batch, OrderStatus, CourierStatus, BatchStatus,
+    PrepType, Restaurant
+)
 
 
 # ============ TESTES DE EXECUÇÃO BÁSICA ============
@@ -202,6 +206,80 @@ def test_respeita_maximo_de_pedidos_por_lote(
 
 # ============ TESTES DE ATRIBUIÇÃO ============
 
+def test_dispatch_prefere_motoboy_no_restaurante(
+    client: TestClient,
+    auth_headers: dict,
+    session: Session,
+    test_restaurant: Restaurant,
+    test_order: Order,
+    test_couriers_available: list
+):
+    """
+    Testa que o motoboy ainda longe do restaurante fica para o fim da fila
+
+    Resultado esperado: mesmo disponível há mais tempo, quem está a 5km
+    perde o lote para quem já está no restaurante
+    """
+    longe, perto, _ = test_couriers_available
+    longe.available_since = datetime.now() - timedelta(minutes=30)
+    session.add(longe)
+    session.commit()
+
+    client.put(f"/couriers/{longe.id}/location", params={"lat": test_restaurant.lat + 0.045, "lng": test_restaurant.lng})
+    client.put(f"/couriers/{perto.id}/location", params={"lat": test_restaurant.lat, "lng": test_restaurant.lng})
+    client.post(f"/orders/{test_order.id}/scan", headers=auth_headers)
+
+    response = client.post("/dispatch/run", headers=auth_headers)
+    assert response.status_code == 200
+
+    batch = session.exec(select(Batch)).one()
+    assert batch.courier_id == perto.id
+
+
+def test_dispatch_usa_disponiveis_do_banco_nao_do_indice(
+    client: TestClient,
+    auth_headers: dict,
+    session: Session,
+    test_restaurant: Restaurant,
+    test_orders_ready: list,
+    test_couriers_available: list
+):
+    """
+    Testa o dispatch com o índice do processo atrasado (outro worker gravou)
+
+    Resultado esperado: quem outro processo deixou BUSY não recebe lote e
+    quem outro processo deixou AVAILABLE recebe - sem esperar a
+    reconciliação do índice
+    """
+    from sqlalchemy import update
+    from services.spatial_service import motoboys_para_dispatch
+
+    fila = [c.id for c in motoboys_para_dispatch(session, test_restaurant.id, test_restaurant.lat, test_restaurant.lng)]
+    assert len(fila) == 3
+
+    # Outro processo troca os status (UPDATE direto: os hooks deste processo não veem)
+    session.exec(update(Courier).where(Courier.id.in_(fila)).values(status=CourierStatus.BUSY))
+    novo = Courier(
+        name="Outro Worker", phone="11900001111", status=CourierStatus.OFFLINE,
+        restaurant_id=test_restaurant.id
+    )
+    session.add(novo)
+    session.commit()
+    session.exec(
+        update(Courier).where(Courier.id == novo.id)
+        .values(status=CourierStatus.AVAILABLE, available_since=datetime.now())
+    )
+    session.commit()
+    session.expire_all()
+
+    response = client.post("/dispatch/run", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["orders_assigned"] == len(test_orders_ready)
+
+    batches = session.exec(select(Batch)).all()
+    assert {b.courier_id for b in batches} == {novo.id}
+
+
 def test_motoboy_fica_busy_apos_dispatch(
     client: TestClient,
     auth_headers: dict,
@@ -462,6 +540,59 @@ def test_listar_batches_ativos(
     assert isinstance(batch["orders"], list)
 
 
+def test_listar_batches_quantidade_fixa_de_queries(
+    client: TestClient,
+    auth_headers: dict,
+    session: Session,
+    test_restaurant: Restaurant,
+    test_couriers_available: list,
+    async_engine
+):
+    """
+    Testa que a lista de lotes não faz uma query por lote (N+1)
+
+    Resultado esperado: mesma quantidade de queries com 1 ou 3 lotes,
+    pedidos na ordem da rota e nome do motoboy preenchido
+    """
+    from sqlalchemy import event
+
+    def criar_lote(courier: Courier):
+        batch = Batch(courier_id=courier.id, restaurant_id=test_restaurant.id)
+        session.add(batch)
+        session.commit()
+        for parada in (2, 1):
+            session.add(Order(
+                customer_name=f"Parada {parada}", address_text="Rua X",
+                lat=-23.55, lng=-46.63, status=OrderStatus.ASSIGNED,
+                restaurant_id=test_restaurant.id, batch_id=batch.id, stop_order=parada
+            ))
+        session.commit()
+
+    def contar_queries() -> int:
+        queries = []
+        contar = lambda *args: queries.append(args[2])
+        event.listen(async_engine.sync_engine, "before_cursor_execute", contar)
+        try:
+            response = client.get("/dispatch/batches", headers=auth_headers)
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", contar)
+        assert response.status_code == 200
+        # Autenticação fica fora da conta (usuário do token vai para cache)
+        return sum("FROM users" not in q for q in queries), response.json()
+
+    criar_lote(test_couriers_available[0])
+    com_um, _ = contar_queries()
+
+    criar_lote(test_couriers_available[1])
+    criar_lote(test_couriers_available[2])
+    com_tres, data = contar_queries()
+
+    assert com_um == com_tres
+    assert len(data) == 3
+    assert all(b["courier_name"].startswith("Motoboy") for b in data)
+    assert [o["stop_order"] for o in data[0]["orders"]] == [1, 2]
+
+
 def test_stats_endpoint(
     client: TestClient,
     auth_headers: dict,
@@ -481,3 +612,241 @@ def test_stats_endpoint(
     assert "active_batches" in data
     assert "pending_orders" in data
     assert "available_couriers" in data
+
+
+def test_stats_contagens_por_status(
+    client: TestClient,
+    auth_headers: dict,
+    test_orders_ready: list,
+    test_couriers_available: list
+):
+    """
+    Testa que as contagens agregadas (GROUP BY status) batem com os dados
+    """
+    response = client.get("/dispatch/stats", headers=auth_headers)
+    data = response.json()
+
+    assert data["orders"]["ready"] == 5
+    assert data["orders"]["delivered"] == 0  # Status sem pedidos aparece zerado
+    assert data["couriers"]["available"] == 3
+    assert data["couriers"]["offline"] == 0
+    assert data["active_batches"] == 0
+    assert data["pending_orders"] == 5
+    assert data["available_couriers"] == 3
+
+    # Após dispatch, contagens refletem os lotes criados
+    client.post("/dispatch/run", headers=auth_headers)
+    data = client.get("/dispatch/stats", headers=auth_headers).json()
+
+    assert data["orders"]["ready"] == 0
+    assert data["orders"]["assigned"] == 5
+    assert data["active_batches"] >= 1
+    assert data["couriers"]["busy"] == data["active_batches"]
+
+
+def test_metrics_tempos_agregados_no_banco(
+    client: TestClient,
+    auth_headers: dict,
+    session: Session,
+    test_restaurant: Restaurant
+):
+    """
+    Testa médias de preparo/rota calculadas via SQL (por prep_type + outliers)
+    """
+    agora = datetime.now()
+    # (prep_type, minutos de preparo, minutos de rota ou None)
+    cenarios = [
+        (PrepType.SHORT, 10, 20),
+        (PrepType.SHORT, 20, 40),
+        (PrepType.LONG, 30, None),
+        (PrepType.LONG, 50, None),
+        (PrepType.LONG, 300, None),  # Outlier de preparo (> 120 min) - ignorado
+    ]
+    for i, (prep_type, preparo, rota) in enumerate(cenarios):
+        created_at = agora - timedelta(minutes=preparo + (rota or 0) + 1)
+        ready_at = created_at + timedelta(minutes=preparo)
+        session.add(Order(
+            customer_name=f"Cliente {i}",
+            address_text=f"Rua {i}",
+            lat=-23.55,
+            lng=-46.63,
+            prep_type=prep_type,
+            status=OrderStatus.DELIVERED if rota else OrderStatus.READY,
+            created_at=created_at,
+            ready_at=ready_at,
+            delivered_at=ready_at + timedelta(minutes=rota) if rota else None,
+            restaurant_id=test_restaurant.id,
+        ))
+    session.commit()
+
+    data = client.get("/dispatch/metrics", headers=auth_headers).json()
+
+    assert data["preparo"]["media_short_min"] == 15.0
+    assert data["preparo"]["media_long_min"] == 40.0
+    assert data["preparo"]["media_geral_min"] == 27.5
+    assert data["preparo"]["amostras_short"] == 2
+    assert data["preparo"]["amostras_long"] == 2
+    # Rota: média (20 + 40) / 2 = 30 * 1.5 (ida + volta)
+    assert data["rota"]["media_minutos"] == 45.0
+    assert data["rota"]["amostras"] == 2
+
+
+def test_estado_ao_vivo_acompanha_transicoes(
+    client: TestClient,
+    auth_headers: dict,
+    session: Session,
+    test_restaurant: Restaurant,
+    test_order: Order,
+    test_orders_ready: list,
+    test_couriers_available: list
+):
+    """
+    Testa que os contadores em memória acompanham as transições sem ir ao banco
+    """
+    from services.live_state_service import obter_foto_operacional, reconciliar_estado
+
+    # Primeira leitura carrega o estado do banco
+    client.get("/dispatch/stats", headers=auth_headers)
+
+    # Transições pelos endpoints (atualizam o estado incrementalmente)
+    client.post(f"/orders/{test_order.id}/scan", headers=auth_headers)
+    client.post("/dispatch/run", headers=auth_headers)
+    batch = session.exec(select(Batch)).first()
+    client.post(f"/couriers/{batch.courier_id}/complete-batch")
+
+    # Rollback não pode vazar para o estado
+    test_order.status = OrderStatus.CANCELLED
+    session.add(test_order)
+    session.flush()
+    session.rollback()
+
+    incremental = obter_foto_operacional(session, test_restaurant.id)
+    reconciliar_estado(session, test_restaurant.id)
+    do_banco = obter_foto_operacional(session, test_restaurant.id)
+
+    assert incremental.pedidos_por_status[OrderStatus.DELIVERED] > 0
+    assert incremental.pedidos_por_status == do_banco.pedidos_por_status
+    assert incremental.motoboys_por_status == do_banco.motoboys_por_status
+    assert incremental.batches_ativos == do_banco.batches_ativos
+    assert incremental.pedidos_ultima_hora == do_banco.pedidos_ultima_hora
+    assert incremental.tempos_24h == do_banco.tempos_24h
+
+
+def test_estado_ao_vivo_nao_reconcilia_pela_replica(
+    session: Session,
+    test_restaurant: Restaurant,
+    test_order: Order,
+    monkeypatch
+):
+    """
+    Testa a leitura das métricas por uma sessão da réplica
+
+    Resultado esperado: a base dos contadores ao vivo vem do primário,
+    mesmo com a réplica atrasada (aqui: vazia)
+    """
+    from sqlmodel import SQLModel, create_engine
+    import database
+    from services.live_state_service import obter_foto_operacional
+
+    monkeypatch.setattr(database, "engine", session.get_bind())
+    replica = create_engine("sqlite://")
+    SQLModel.metadata.create_all(replica)
+
+    with Session(replica, info={database.SESSAO_REPLICA: True}) as sessao_replica:
+        foto = obter_foto_operacional(sessao_replica, test_restaurant.id)
+
+    assert foto.pedidos_por_status[OrderStatus.PREPARING] == 1
+
+
+def test_metricas_do_pool_de_conexoes(client: TestClient, auth_headers: dict):
+    """
+    Testa o endpoint de métricas do pool do banco
+
+    Resultado esperado: exige login; mostra a configuração e o pool de cada engine
+    """
+    assert client.get("/metrics/db").status_code in (401, 403)
+
+    response = client.get("/metrics/db", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert data["config"]["replica"] is False
+    assert {"primario", "primario_async"} <= set(data)
+    assert "pool" in data["primario"]
+
+
+# ============ TESTES DE TRAJETO REAL (GPS) ============
+
+def _pings_ida_e_volta(restaurante: Restaurant, inicio: datetime, minutos_fora: int) -> list:
+    """Pings a cada minuto: parado no restaurante, sai ~1km, volta"""
+    pings = [{"lat": restaurante.lat, "lng": restaurante.lng, "timestamp": inicio.isoformat()}]
+    for i in range(1, minutos_fora):
+        pings.append({
+            "lat": restaurante.lat + 0.009,
+            "lng": restaurante.lng,
+            "timestamp": (inicio + timedelta(minutes=i)).isoformat()
+        })
+    pings.append({
+        "lat": restaurante.lat,
+        "lng": restaurante.lng,
+        "timestamp": (inicio + timedelta(minutes=minutos_fora)).isoformat()
+    })
+    return pings
+
+
+def test_replay_trajeto_do_lote(
+    client: TestClient,
+    auth_headers: dict,
+    session: Session,
+    test_restaurant: Restaurant,
+    test_courier: Courier
+):
+    """
+    Testa o replay do caminho real do lote e a duração medida pelo GPS
+    """
+    from services.location_service import descarregar_localizacoes
+
+    inicio = datetime.now().replace(microsecond=0) - timedelta(minutes=40)
+    batch = Batch(
+        courier_id=test_courier.id,
+        restaurant_id=test_restaurant.id,
+        status=BatchStatus.DONE,
+        created_at=inicio,
+        completed_at=inicio + timedelta(minutes=30)
+    )
+    session.add(batch)
+    session.commit()
+
+    # Ponto antes do lote não entra no replay
+    pings = [{"lat": 0.0, "lng": 0.0, "timestamp": (inicio - timedelta(minutes=5)).isoformat()}]
+    pings += _pings_ida_e_volta(test_restaurant, inicio + timedelta(minutes=2), 20)
+    client.post(f"/couriers/{test_courier.id}/locations", json={"pings": pings})
+    descarregar_localizacoes(session)
+
+    response = client.get(f"/dispatch/batches/{batch.id}/track", headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+
+    assert len(data["points"]) == 21
+    assert data["route_duration_min"] == 19.0  # Saiu no minuto 1, voltou no 20
+    assert 1.5 < data["distance_km"] < 2.5
+
+
+def test_replay_trajeto_lote_de_outro_restaurante(
+    client: TestClient,
+    auth_headers: dict,
+    session: Session,
+    test_courier: Courier
+):
+    """Testa que não dá para ver o trajeto de lote de outro restaurante"""
+    outro = Restaurant(
+        name="Outro", slug="outro-trajeto", cnpj="99999999000199",
+        email="outro-trajeto@teste.com", phone="11911111111", address="Rua X"
+    )
+    session.add(outro)
+    session.commit()
+    batch = Batch(courier_id=test_courier.id, restaurant_id=outro.id)
+    session.add(batch)
+    session.commit()
+
+    response = client.get(f"/dispatch/batches/{batch.id}/track", headers=auth_headers)
+    assert response.status_code == 404
@@ -0,0 +1,148 @@
+"""
+Testes do Canal de Eventos em Tempo Real (SSE)
+
+Cobre:
+- Pub/Sub em memória com backpressure (descarte + resync)
+- Eventos publicados pelos hooks da Session só após o commit
+- Autenticação/validação das rotas de stream
+"""
+import asyncio
+import threading
+
+from fastapi.testclient import TestClient
+from sqlmodel import Session, select
+
+from models import Order, Batch, OrderStatus, Restaurant
+from services.events_service import (
+    BarramentoEventos,
+    barramento,
+    canal_restaurante,
+    canal_motoboy,
+    formatar_sse
+)
+
+
+async def _drenar(assinatura) -> list:
+    """Coleta tudo que já chegou na fila da assinatura"""
+    await asyncio.sleep(0.05)
+    eventos = []
+    while True:
+        evento = await assinatura.proximo(timeout=0.05)
+        if evento is None:
+            return eventos
+        eventos.append(evento)
+
+
+def test_barramento_descarta_antigos_e_pede_resync():
+    """
+    Testa que um cliente lento não trava quem publica
+
+    Resultado esperado: fila fica com os mais recentes e chega um "resync"
+    """
+    async def cenario():
+        bus = BarramentoEventos(tamanho_fila=3)
+        assinatura = bus.assinar("canal")
+
+        # Publica de outra thread, como fazem os endpoints síncronos
+        publicador = threading.Thread(
+            target=lambda: [bus.publicar("canal", "teste", {"n": n}) for n in range(10)]
+        )
+        publicador.start()
+        publicador.join()
+
+        eventos = await _drenar(assinatura)
+        bus.cancelar(assinatura)
+        return eventos, bus.tem_assinantes("canal")
+
+    eventos, ainda_assinado = asyncio.run(cenario())
+
+    assert eventos[0].tipo == "resync"
+    assert eventos[0].dados["descartados"] == 7
+    assert [e.dados["n"] for e in eventos[1:]] == [7, 8, 9]
+    assert not ainda_assinado
+
+
+def test_formatar_sse():
+    """Testa o formato text/event-stream"""
+    bus = BarramentoEventos()
+
+    async def cenario():
+        assinatura = bus.assinar("canal")
+        bus.publicar("canal", "pedido_status", {"status": "ready"})
+        return (await _drenar(assinatura))[0]
+
+    texto = formatar_sse(asyncio.run(cenario()))
+
+    assert texto.startswith("id: 1\nevent: pedido_status\ndata: {")
+    assert '"status": "ready"' in texto
+    assert texto.endswith("\n\n")
+
+
+def test_eventos_das_transicoes_apos_commit(
+    client: TestClient,
+    auth_headers: dict,
+    session: Session,
+    test_restaurant: Restaurant,
+    test_order: Order,
+    test_couriers_available: list
+):
+    """
+    Testa que scan, dispatch e GPS publicam nos canais certos
+
+    Resultado esperado: restaurante recebe pedido/lote/alertas/localização,
+    motoboy recebe o lote novo; rollback não publica nada
+    """
+    async def cenario():
+        # Dashboard aberto: estado e alertas iniciais já carregados
+        client.get("/dispatch/alerts", headers=auth_headers)
+        restaurante = barramento.assinar(canal_restaurante(test_restaurant.id))
+        motoboys = {c.id: barramento.assinar(canal_motoboy(c.id)) for c in test_couriers_available}
+
+        # Rollback não pode publicar
+        test_order.status = OrderStatus.CANCELLED
+        session.add(test_order)
+        session.flush()
+        session.rollback()
+
+        client.post(f"/orders/{test_order.id}/scan", headers=auth_headers)
+        client.post("/dispatch/run", headers=auth_headers)
+        batch = session.exec(select(Batch)).first()
+        client.put(f"/couriers/{batch.courier_id}/location?lat=-23.55&lng=-46.63")
+
+        eventos_restaurante = await _drenar(restaurante)
+        eventos_motoboy = await _drenar(motoboys[batch.courier_id])
+        barramento.cancelar(restaurante)
+        for assinatura in motoboys.values():
+            barramento.cancelar(assinatura)
+        return batch, eventos_restaurante, eventos_motoboy
+
+    batch, eventos_restaurante, eventos_motoboy = asyncio.run(cenario())
+    tipos = [e.tipo for e in eventos_restaurante]
+
+    pedidos = [e.dados for e in eventos_restaurante if e.tipo == "pedido_status"]
+    assert pedidos[0]["status"] == "ready"
+    assert pedidos[0]["status_anterior"] == "preparing"
+    assert all(p["status"] != "cancelled" for p in pedidos)
+
+    assert "lote_novo" in tipos
+    assert "alertas" in tipos
+    localizacao = next(e.dados for e in eventos_restaurante if e.tipo == "motoboy_localizacao")
+    assert localizacao == {"courier_id": batch.courier_id, "lat": -23.55, "lng": -46.63}
+
+    lote = next(e.dados for e in eventos_motoboy if e.tipo == "lote_novo")
+    assert lote["batch_id"] == batch.id
+    assert all(e.tipo != "motoboy_localizacao" for e in eventos_motoboy)
+
+
+def test_stream_restaurante_exige_token_valido(client: TestClient):
+    """Testa que o stream do restaurante recusa token inválido"""
+    response = client.get("/events/restaurant?token=invalido")
+
+    assert response.status_code == 401
+
+
+def test_stream_motoboy_inexistente(client: TestClient):
+    """Testa que o stream de motoboy inexistente retorna 404"""
+    response = client.get("/events/couriers/nao-existe")
+
+    assert response.status_code == 404
@@ -0,0 +1,268 @@
+"""
+Testes do geocoding e do seu cache (memória LRU + tabela)
+"""
+import asyncio
+import threading
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.concurrency import run_in_threadpool
+from fastapi.testclient import TestClient
+from sqlmodel import Session
+
+from services import geocoding_service, local_geocoder_service
+from services.geocode_cache_service import AUSENTE, CacheGeocoding, normalizar_endereco
+from services.local_geocoder_service import GeocodificadorLocal
+
+
+def test_normalizar_endereco():
+    """Mesma chave para o mesmo endereço escrito de jeitos diferentes"""
+    assert normalizar_endereco("Rua Visconde de Inhaúma, 2235") == "rua visconde de inhauma 2235"
+    assert normalizar_endereco("  AV. Paulista ,1000 - apto 3 ") == normalizar_endereco("av paulista, 1000 apto 3")
+
+
+def test_cache_lru_com_evictions(session: Session):
+    """Memória limitada: o menos usado sai primeiro, mas continua na tabela"""
+    cache = CacheGeocoding(session.get_bind(), tamanho=2)
+    cache.guardar("a", (1.0, 1.0))
+    cache.guardar("b", (2.0, 2.0))
+    assert cache.obter("a") == (1.0, 1.0)  # "a" vira o mais recente
+    cache.guardar("c", (3.0, 3.0))         # sai "b"
+
+    metricas = cache.metricas()
+    assert metricas["evictions"] == 1
+    assert metricas["em_memoria"] == 2
+    assert metricas["hits_memoria"] == 1
+
+    # "b" saiu da memória, mas vem da tabela
+    assert cache.obter("b") == (2.0, 2.0)
+    assert cache.metricas()["hits_banco"] == 1
+    assert cache.obter("z") is AUSENTE
+    assert cache.metricas()["misses"] == 1
+
+
+def test_cache_compartilhado_entre_processos(session: Session):
+    """Outro worker (outra instância, mesma tabela) aproveita o que já foi geocodificado"""
+    worker_1 = CacheGeocoding(session.get_bind())
+    worker_2 = CacheGeocoding(session.get_bind())
+
+    worker_1.guardar("rua a, 1", (-21.2, -47.8))
+    worker_1.guardar("rua a, 1", (-21.3, -47.9))  # Regravar atualiza (upsert)
+
+    assert worker_2.obter("rua a, 1") == (-21.3, -47.9)
+    assert worker_2.metricas()["hits_banco"] == 1
+    assert worker_2.obter("rua a, 1") == (-21.3, -47.9)
+    assert worker_2.metricas()["hits_memoria"] == 1
+
+
+def test_cache_negativo_com_validade(session: Session):
+    """Endereço não encontrado fica guardado só até o TTL"""
+    cache = CacheGeocoding(session.get_bind(), ttl_negativo_horas=1)
+    cache.guardar("rua inexistente, 0", None)
+    assert cache.obter("rua inexistente, 0") is None
+    assert cache.metricas()["hits_negativos"] == 1
+
+    vencido = CacheGeocoding(session.get_bind(), ttl_negativo_horas=0)
+    vencido.guardar("rua sumida, 0", None)
+    assert vencido.obter("rua sumida, 0") is AUSENTE
+    assert CacheGeocoding(session.get_bind()).obter("rua sumida, 0") is AUSENTE
+
+
+def test_negativos_vencidos_saem_da_tabela(session: Session):
+    """
+    A limpeza apaga só os "não encontrado" vencidos, gravando pela fila de escrita
+
+    Coordenadas encontradas (sem validade) e negativos ainda válidos ficam
+    """
+    from models import GeocodeCache
+    from services.writer_service import FilaEscrita
+
+    fila = FilaEscrita(session.get_bind())
+    cache = CacheGeocoding(session.get_bind(), ttl_negativo_horas=1, escritor_=fila)
+    try:
+        cache.guardar("rua a, 1", (-21.2, -47.8))
+        cache.guardar("rua inexistente, 0", None)
+
+        assert cache.apagar_expirados() == 0
+        assert cache.apagar_expirados(agora=datetime.now() + timedelta(hours=2)) == 1
+    finally:
+        fila.encerrar()
+
+    assert fila.executadas == 4
+    assert session.get(GeocodeCache, "rua a, 1") is not None
+    assert session.get(GeocodeCache, "rua inexistente, 0") is None
+
+
+def test_geocoding_consulta_o_google_uma_vez(client: TestClient, auth_headers: dict, monkeypatch):
+    """
+    Testa geocode_address com o cache do app
+
+    Resultado esperado: encontrado e não encontrado vão ao Google uma vez;
+    erro temporário (rede, cota) não fica no cache
+    """
+    chamadas = []
+    respostas = {
+        "Rua das Flores, 10": (True, (-21.2, -47.8)),
+        "Rua Inexistente, 0": (False, None),
+        "Rua Instável, 5": (None, None),
+    }
+
+    def google_falso(full_address):
+        endereco = full_address.split(", Ribeirão Preto")[0]
+        chamadas.append(endereco)
+        return respostas[endereco]
+
+    monkeypatch.setattr(geocoding_service, "_consultar_google", google_falso)
+
+    for _ in range(2):
+        assert geocoding_service.geocode_address("Rua das Flores, 10") == (-21.2, -47.8)
+        assert geocoding_service.geocode_address("rua das flores 10") == (-21.2, -47.8)
+        assert geocoding_service.geocode_address("Rua Inexistente, 0") is None
+        assert geocoding_service.geocode_address("Rua Instável, 5") is None
+
+    assert chamadas == ["Rua das Flores, 10", "Rua Inexistente, 0", "Rua Instável, 5", "Rua Instável, 5"]
+
+    response = client.get("/metrics/geocoding", headers=auth_headers)
+    assert response.status_code == 200
+    metricas = response.json()
+    assert metricas["misses"] == 4
+    assert metricas["hits_memoria"] == 3
+    assert metricas["hits_negativos"] == 1
+    assert metricas["gravacoes"] == 2
+    assert metricas["erros_banco"] == 0
+
+
+def test_consultas_simultaneas_do_mesmo_endereco_viram_uma(client: TestClient, google):
+    """
+    Testa o single-flight contra um Google falso (servidor local, lento)
+
+    Resultado esperado: 5 pedidos ao mesmo tempo do mesmo endereço (async e
+    de rotas síncronas, escrito de jeitos diferentes) fazem UMA consulta
+    """
+    google.conhecidos["Rua das Flores, 10"] = (-21.2, -47.8)
+    google.atraso = 0.2
+
+    async def atendentes():
+        return await asyncio.gather(
+            geocoding_service.geocode_address_async("Rua das Flores, 10"),
+            geocoding_service.geocode_address_async("rua das flores 10"),
+            geocoding_service.geocode_address_async("RUA DAS FLORES, 10"),
+            run_in_threadpool(geocoding_service.geocode_address, "Rua das Flores, 10"),
+            run_in_threadpool(geocoding_service.geocode_address, "Rua das Flores 10"),
+        )
+
+    antes = geocoding_service.metricas_consultas()
+    assert asyncio.run(atendentes()) == [(-21.2, -47.8)] * 5
+    assert google.consultas == ["Rua das Flores, 10"]
+
+    depois = geocoding_service.metricas_consultas()
+    assert depois["consultas_google"] - antes["consultas_google"] == 1
+    assert depois["consultas_agrupadas"] - antes["consultas_agrupadas"] == 4
+    assert depois["em_andamento"] == 0
+
+
+def test_limite_de_consultas_por_api_key(client: TestClient, google, monkeypatch):
+    """
+    Testa GEOCODE_MAX_CONCURRENT com endereços diferentes
+
+    Resultado esperado: nunca mais de 2 consultas abertas no Google ao
+    mesmo tempo; erro do Google (HTTP 500) não fica no cache
+    """
+    monkeypatch.setattr(geocoding_service, "GEOCODE_MAX_CONCURRENT", 2)
+    google.atraso = 0.05
+    google.instaveis.add("Rua 5, 5")
+    enderecos = [f"Rua {i}, {i}" for i in range(6)]
+    google.conhecidos.update({e: (-21.0 - i, -47.0) for i, e in enumerate(enderecos) if i != 5})
+
+    resultado = asyncio.run(geocoding_service.geocode_addresses_async(enderecos + enderecos[:2]))
+    assert resultado["Rua 1, 1"] == (-22.0, -47.0)
+    assert resultado["Rua 5, 5"] is None
+    assert sorted(google.consultas) == sorted(enderecos)
+    assert google.max_simultaneas == 2
+
+    asyncio.run(geocoding_service.geocode_addresses_async(enderecos))
+    assert google.consultas.count("Rua 5, 5") == 2
+    assert len(google.consultas) == 7
+
+
+def test_limite_compartilhado_entre_caminhos_async_e_sincrono(client: TestClient, google, monkeypatch):
+    """
+    Testa que consultas síncronas (scripts, threads de fora do servidor)
+    e async dividem as mesmas GEOCODE_MAX_CONCURRENT vagas
+
+    Resultado esperado: com 1 vaga ocupada por uma consulta síncrona,
+    as async nunca passam de 1 ao mesmo tempo
+    """
+    monkeypatch.setattr(geocoding_service, "GEOCODE_MAX_CONCURRENT", 2)
+    monkeypatch.setattr(geocoding_service, "_vagas", {})
+    google.atraso = 0.3
+    enderecos = [f"Rua {i}, {i}" for i in range(5)]
+    google.conhecidos.update({e: (-21.0, -47.0 - i) for i, e in enumerate(enderecos)})
+
+    # Thread comum (sem event loop do servidor): cai no caminho síncrono
+    sincrona = threading.Thread(target=geocoding_service.geocode_address, args=(enderecos[0],))
+    sincrona.start()
+    while google.simultaneas == 0:
+        time.sleep(0.01)
+
+    resultado = asyncio.run(geocoding_service.geocode_addresses_async(enderecos[1:]))
+    sincrona.join()
+    assert all(resultado[e] == (-21.0, -47.0 - i) for i, e in enumerate(enderecos) if i)
+    assert google.max_simultaneas == 2
+
+
+BASE_LOCAL = """rua,numero_inicio,numero_fim,lat_inicio,lng_inicio,lat_fim,lng_fim,cep
+Rua Visconde de Inhaúma,2001,2399,-21.1900,-47.8100,-21.1940,-47.8140,14010100
+Rua Visconde de Inhaúma,1,1999,-21.1800,-47.8000,-21.1900,-47.8100,
+Av. Presidente Vargas,1000,2000,-21.2000,-47.8000,-21.2100,-47.8000,14020260
+Rua São José,1,500,-21.1700,-47.8000,-21.1700,-47.8050,
+Rua São Sebastião,1,500,-21.1600,-47.8000,-21.1600,-47.8050,
+,,,-21.1500,-47.7900,,,14090000
+"""
+
+
+def _base_local(tmp_path) -> GeocodificadorLocal:
+    caminho = tmp_path / "ruas.csv"
+    caminho.write_text(BASE_LOCAL, encoding="utf-8")
+    return GeocodificadorLocal.do_csv(str(caminho))
+
+
+def test_geocodificador_local(tmp_path):
+    """Rua + número interpolado no trecho, abreviações, prefixo único e CEP"""
+    base = _base_local(tmp_path)
+    assert len(base) == 5
+
+    # Meio do trecho 2001-2399 (interpolação linear)
+    assert base.geocodificar("Rua Visconde de Inhaúma, 2200") == pytest.approx((-21.19199, -47.81199), abs=1e-4)
+    assert base.geocodificar("R. Visconde de Inhauma 1") == (-21.18, -47.80)
+    # Prefixo único (e complemento ignorado)
+    assert base.geocodificar("Rua Visconde, 2001 - apto 3") == (-21.19, -47.81)
+    assert base.geocodificar("Avenida Pres. Vargas, nº 1500") == (-21.205, -47.80)
+    # Prefixo ambíguo (São José / São Sebastião) e número fora das faixas: não cobre
+    assert base.geocodificar("Rua São, 10") is None
+    assert base.geocodificar("Rua Visconde de Inhaúma, 5000") is None
+    # Sem rua conhecida: CEP
+    assert base.geocodificar("Rua Nova, 10 - CEP 14020-260") == (-21.205, -47.80)
+    assert base.geocodificar("CEP 14090-000") == (-21.15, -47.79)
+
+
+def test_geocoding_local_antes_do_google(client: TestClient, google, tmp_path, monkeypatch):
+    """
+    Testa geocode_address com a base local configurada
+
+    Resultado esperado: endereço coberto pela base não vai ao cache nem ao
+    Google; o que a base não cobre (ou de outra cidade) segue para o Google
+    """
+    base = _base_local(tmp_path)
+    monkeypatch.setattr(local_geocoder_service, "obter_geocodificador_local", lambda: base)
+    google.conhecidos["Rua Nova, 10"] = (-21.3, -47.9)
+
+    antes = geocoding_service.metricas_consultas()
+    assert geocoding_service.geocode_address("Rua Visconde de Inhaúma, 2001") == (-21.19, -47.81)
+    assert asyncio.run(geocoding_service.geocode_address_async("Av. Presidente Vargas, 1000")) == (-21.2, -47.8)
+    assert asyncio.run(geocoding_service.geocode_address_async("Rua Nova, 10")) == (-21.3, -47.9)
+    asyncio.run(geocoding_service.geocode_address_async("Rua Visconde de Inhaúma, 2001", city="Sertãozinho"))
+
+    assert google.consultas == ["Rua Nova, 10", "Rua Visconde de Inhaúma, 2001, Sertãozinho, SP, Brasil"]
+    assert geocoding_service.metricas_consultas()["hits_local"] - antes["hits_local"] == 2
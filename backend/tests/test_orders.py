@@ -3,8 +3,8 @@ Testes para endpoints de pedidos (orders)
 """
 import pytest
 from fastapi.testclient import TestClient
-from sqlmodel import Session
-from models import Order, Restaurant, User
+from sqlmodel import Session, select, func
+from models import Order, Restaurant, User, Batch, Courier, OrderStatus, BatchStatus
 
 
 def test_criar_pedido_com_coordenadas(client: TestClient, auth_headers: dict):
@@ -265,6 +265,158 @@ def test_gerar_qrcode(client: TestClient, auth_headers: dict, test_order: Order)
     assert len(data["qrcode"]) > 0
 
 
+def test_qrcode_gerado_uma_vez_com_etag(client: TestClient, auth_headers: dict, test_order: Order):
+    """
+    Testa o cache dos QR Codes (memória + disco) e os cabeçalhos HTTP
+
+    Resultado esperado: PNG gerado uma vez e servido da memória/disco;
+    If-None-Match com o ETag responde 304; SVG disponível
+    """
+    from services.qrcode_service import cache_qrcode
+
+    antes = cache_qrcode.metricas()
+    respostas = [client.get(f"/orders/{test_order.id}/qrcode.png", headers=auth_headers) for _ in range(3)]
+    assert all(r.status_code == 200 for r in respostas)
+    assert respostas[0].content.startswith(b"\x89PNG")
+    assert respostas[0].content == respostas[2].content
+    assert "immutable" in respostas[0].headers["cache-control"]
+    assert cache_qrcode.metricas()["geradas"] - antes["geradas"] == 1
+
+    etag = respostas[0].headers["etag"]
+    response = client.get(
+        f"/orders/{test_order.id}/qrcode.png", headers={**auth_headers, "If-None-Match": etag}
+    )
+    assert response.status_code == 304
+    assert response.content == b""
+
+    # Outro processo (memória vazia): vem do disco
+    cache_qrcode.limpar_memoria()
+    response = client.get(f"/orders/{test_order.id}/qrcode.png", headers=auth_headers)
+    assert response.content == respostas[0].content
+    depois = cache_qrcode.metricas()
+    assert depois["hits_disco"] - antes["hits_disco"] == 1
+    assert depois["geradas"] - antes["geradas"] == 1
+
+    response = client.get(f"/orders/{test_order.id}/qrcode.svg?size=300", headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("image/svg+xml")
+    assert response.text.startswith('<svg xmlns="http://www.w3.org/2000/svg" width="300" height="300"')
+    assert response.headers["etag"] != etag
+
+    response = client.get(f"/orders/{test_order.id}/qrcode?format=svg", headers=auth_headers)
+    assert response.json()["qrcode"].startswith("data:image/svg+xml;base64,")
+
+
+def test_qrcode_antigo_sai_do_disco(tmp_path):
+    """
+    Testa a limpeza diária da pasta de QR Codes
+
+    Resultado esperado: saem os arquivos além da retenção, os de outra
+    versão do desenho e temporários órfãos; os recentes (e uma gravação
+    em andamento) ficam
+    """
+    import os
+    import time
+    from services.qrcode_service import CacheQRCode, VERSAO_DESENHO
+
+    cache = CacheQRCode(pasta=tmp_path)
+    cache.obter("pedido-novo", 200)
+    cache.obter("pedido-velho", 200)
+    dias_atras = time.time() - 40 * 86400
+    os.utime(tmp_path / f"pedido-velho-200-v{VERSAO_DESENHO}.png", (dias_atras, dias_atras))
+    (tmp_path / f"pedido-novo-200-v{VERSAO_DESENHO - 1}.png").write_bytes(b"desenho antigo")
+    orfao = tmp_path / f"pedido-novo-0-v{VERSAO_DESENHO}.png.123.456.tmp"
+    orfao.write_bytes(b"pela metade")
+    os.utime(orfao, (dias_atras, dias_atras))
+    (tmp_path / f"pedido-novo-0-v{VERSAO_DESENHO}.png.123.789.tmp").write_bytes(b"gravando agora")
+
+    assert cache.apagar_antigos(manter_dias=30) == 3
+    assert sorted(arquivo.name for arquivo in tmp_path.iterdir()) == [
+        f"pedido-novo-0-v{VERSAO_DESENHO}.png.123.789.tmp", f"pedido-novo-200-v{VERSAO_DESENHO}.png"
+    ]
+
+
+def test_qrcode_pregerado_na_criacao(client: TestClient, auth_headers: dict):
+    """Pedido novo já sai com o QR do dashboard e o da impressão prontos"""
+    from services.qrcode_service import cache_qrcode
+
+    response = client.post(
+        "/orders",
+        json={"customer_name": "Ana", "address_text": "Rua A, 1", "lat": -21.2, "lng": -47.8},
+        headers=auth_headers
+    )
+    order_id = response.json()["id"]
+
+    antes = cache_qrcode.metricas()
+    client.get(f"/orders/{order_id}/qrcode", headers=auth_headers)
+    client.get(f"/orders/{order_id}/qrcode.png", headers=auth_headers)
+    depois = cache_qrcode.metricas()
+    assert depois["geradas"] == antes["geradas"]
+    assert depois["hits_memoria"] - antes["hits_memoria"] == 2
+
+
+def test_folha_de_etiquetas_qrcode(client: TestClient, auth_headers: dict, session: Session, test_restaurant: Restaurant):
+    """
+    Testa POST /orders/qrcodes/sheet
+
+    Resultado esperado: 50 etiquetas numa requisição (PDF com as páginas
+    necessárias, ou um PNG); pedido de outro restaurante = 404
+    """
+    import io
+    from PIL import Image
+
+    pedidos = [
+        Order(customer_name=f"Cliente {i}", address_text="Rua A, 1", lat=-21.2, lng=-47.8,
+              restaurant_id=test_restaurant.id, short_id=1001 + i)
+        for i in range(50)
+    ]
+    outro = Order(customer_name="Outro", address_text="Rua B, 2", lat=-21.2, lng=-47.8, restaurant_id="outro")
+    session.add_all(pedidos + [outro])
+    session.commit()
+    ids = [p.id for p in pedidos]
+
+    response = client.post("/orders/qrcodes/sheet", json={"order_ids": ids}, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.headers["content-type"] == "application/pdf"
+    # 4 colunas x 4 linhas por página A4
+    assert response.content.startswith(b"%PDF")
+    assert response.content.count(b"/Type /Page\n") == 4
+    assert len(response.content) < 200_000
+
+    response = client.post(
+        "/orders/qrcodes/sheet", json={"order_ids": ids[:6], "format": "png", "columns": 3}, headers=auth_headers
+    )
+    assert response.headers["content-type"] == "image/png"
+    largura, altura = Image.open(io.BytesIO(response.content)).size
+    assert largura == 1240 and altura < 1240  # 2 linhas de 3
+
+    response = client.post("/orders/qrcodes/sheet", json={"order_ids": [ids[0], outro.id]}, headers=auth_headers)
+    assert response.status_code == 404
+    assert outro.id in response.json()["detail"]
+
+    response = client.post("/orders/qrcodes/sheet", json={"order_ids": [], "format": "pdf"}, headers=auth_headers)
+    assert response.status_code == 422
+
+
+def test_folha_de_etiquetas_le_do_primario(
+    client: TestClient, auth_headers: dict, session: Session, test_order: Order
+):
+    """Réplica atrasada (sem o pedido recém-criado) não derruba a impressão: a folha lê do primário"""
+    from database import get_read_session
+    from main import app
+
+    def replica_sem_o_pedido():
+        raise AssertionError("folha de etiquetas não deve ler da réplica")
+
+    anterior = app.dependency_overrides[get_read_session]
+    app.dependency_overrides[get_read_session] = replica_sem_o_pedido
+    try:
+        response = client.post("/orders/qrcodes/sheet", json={"order_ids": [test_order.id]}, headers=auth_headers)
+    finally:
+        app.dependency_overrides[get_read_session] = anterior
+    assert response.status_code == 200
+
+
 def test_pedido_ja_inicia_em_preparing(client: TestClient, auth_headers: dict, test_order: Order):
     """
     Testa que pedido já inicia em status PREPARING (fluxo simplificado)
@@ -364,6 +516,56 @@ def test_transicao_pickup_requer_assigned(
     assert "não pode ser coletado" in response.json()["detail"]
 
 
+def test_bipagens_concorrentes_pela_fila_de_escrita(
+    session: Session,
+    test_restaurant: Restaurant
+):
+    """
+    Testa várias bipagens ao mesmo tempo (pico da cozinha) no SQLite
+
+    Resultado esperado: todas gravadas, uma por vez, sem "database is
+    locked"; erro de validação volta para quem pediu a escrita
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from sqlalchemy import text
+    from services.order_service import bipar_pedido
+    from services.writer_service import FilaEscrita
+
+    pedidos = [
+        Order(customer_name=f"Cliente {i}", address_text="Rua X", lat=-23.55, lng=-46.63,
+              status=OrderStatus.PREPARING, restaurant_id=test_restaurant.id)
+        for i in range(30)
+    ]
+    session.add_all(pedidos)
+    session.commit()
+    ids = [p.id for p in pedidos]
+
+    fila = FilaEscrita(session.get_bind())
+    try:
+        with ThreadPoolExecutor(max_workers=10) as pool:
+            futuros = list(pool.map(lambda i: fila.enviar(bipar_pedido, i, test_restaurant.id), ids))
+        resultados = [f.result(timeout=10) for f in futuros]
+
+        # Pedido já pronto não pode ser bipado de novo
+        with pytest.raises(ValueError):
+            fila.enviar(bipar_pedido, ids[0], test_restaurant.id).result(timeout=10)
+        # 🔒 Pedido de outro restaurante = não encontrado
+        with pytest.raises(KeyError):
+            fila.enviar(bipar_pedido, ids[0], "outro-restaurante").result(timeout=10)
+    finally:
+        fila.encerrar()
+
+    assert all(r.status == OrderStatus.READY for r in resultados)
+    assert fila.executadas == 32
+    session.expire_all()
+    assert all(session.get(Order, i).status == OrderStatus.READY for i in ids)
+
+    # PRAGMAs do modo SQLite aplicados na conexão
+    assert session.exec(text("PRAGMA journal_mode")).one()[0] == "wal"
+    assert session.exec(text("PRAGMA synchronous")).one()[0] == 1  # NORMAL
+    assert session.exec(text("PRAGMA busy_timeout")).one()[0] == 5000
+
+
 def test_pedido_criado_com_short_id(client: TestClient, auth_headers: dict):
     """
     Testa se o pedido é criado com short_id sequencial
@@ -443,6 +645,52 @@ def test_short_id_sequencial_por_restaurante(client: TestClient, auth_headers: d
     assert short_id2 == short_id1 + 1
 
 
+def test_short_id_concorrente_sem_colisao(session: Session, test_restaurant: Restaurant):
+    """
+    Testa criação simultânea de pedidos (cada um na sua conexão)
+
+    Resultado esperado: short_ids todos diferentes e sem buracos
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from services.order_service import reservar_short_ids
+
+    def criar_pedido(i: int) -> int:
+        with Session(session.get_bind()) as outra_sessao:
+            short_id = reservar_short_ids(outra_sessao, test_restaurant.id).start
+            outra_sessao.add(Order(customer_name=f"Cliente {i}", address_text="Rua X", lat=-23.55, lng=-46.63,
+                                   restaurant_id=test_restaurant.id, short_id=short_id))
+            outra_sessao.commit()
+            return short_id
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        short_ids = list(pool.map(criar_pedido, range(20)))
+
+    assert sorted(short_ids) == list(range(1001, 1021))
+
+
+def test_reserva_de_bloco_de_short_ids(session: Session, test_restaurant: Restaurant):
+    """
+    Testa a reserva de short_ids em bloco (importação em lote)
+
+    O contador nasce do maior short_id já existente; cada reserva é um
+    intervalo seguido, e o restaurante vizinho tem a sua própria sequência
+    """
+    from services.order_service import reservar_short_ids
+
+    session.add(Order(customer_name="Antigo", address_text="Rua X", lat=-23.55, lng=-46.63,
+                      restaurant_id=test_restaurant.id, short_id=1500))
+    session.commit()
+
+    assert reservar_short_ids(session, test_restaurant.id) == range(1501, 1502)
+    assert reservar_short_ids(session, test_restaurant.id, 50) == range(1502, 1552)
+    assert reservar_short_ids(session, test_restaurant.id) == range(1552, 1553)
+    session.commit()
+
+    assert reservar_short_ids(session, "outro-restaurante") == range(1001, 1002)
+    with pytest.raises(ValueError):
+        reservar_short_ids(session, test_restaurant.id, 0)
+
+
 def test_tracking_code_unico(client: TestClient, auth_headers: dict):
     """
     Testa se cada pedido tem tracking_code único
@@ -476,6 +724,261 @@ def test_tracking_code_unico(client: TestClient, auth_headers: dict):
     assert tracking1 != tracking2
 
 
+def test_criar_pedidos_em_lote(client: TestClient, auth_headers: dict, session: Session, google):
+    """
+    Testa POST /orders/bulk com array JSON
+
+    Resultado esperado: um resultado por item, na ordem; itens inválidos
+    e endereços não encontrados não impedem os demais; geocoding uma vez
+    por endereço; todos os pedidos num único INSERT (executemany)
+    """
+    from sqlalchemy import event
+
+    google.conhecidos["Rua das Flores, 10"] = (-23.56, -46.64)
+
+    lote = [
+        {"customer_name": "Ana", "address_text": "Av. Paulista, 1", "lat": -23.5, "lng": -46.6},
+        {"customer_name": "Bruno", "address_text": "Rua das Flores, 10"},
+        {"customer_name": "Carla"},  # Sem endereço
+        {"customer_name": "Davi", "address_text": "Rua Inexistente, 0"},
+        {"customer_name": "Eva", "address_text": "Rua das Flores, 10", "prep_type": "long"},
+    ]
+
+    inserts = []
+    contar = lambda conn, cursor, sql, *args: sql.startswith("INSERT INTO orders") and inserts.append(sql)
+    event.listen(session.get_bind(), "before_cursor_execute", contar)
+    try:
+        response = client.post("/orders/bulk", json=lote, headers=auth_headers)
+    finally:
+        event.remove(session.get_bind(), "before_cursor_execute", contar)
+
+    assert response.status_code == 200
+    data = response.json()
+    assert data["created"] == 3
+    assert data["failed"] == 2
+    assert [r["ok"] for r in data["results"]] == [True, True, False, False, True]
+    assert "address_text" in data["results"][2]["error"]
+    assert "Rua Inexistente" in data["results"][3]["error"]
+
+    criados = [r["order"] for r in data["results"] if r["ok"]]
+    assert [o["customer_name"] for o in criados] == ["Ana", "Bruno", "Eva"]
+    assert [o["short_id"] for o in criados] == [1001, 1002, 1003]
+    assert criados[1]["lat"] == -23.56
+    assert criados[2]["prep_type"] == "long"
+    assert all(o["status"] == "preparing" for o in criados)
+
+    assert sorted(google.consultas) == ["Rua Inexistente, 0", "Rua das Flores, 10"]
+    assert len(inserts) == 1
+
+    response = client.get("/orders", headers=auth_headers)
+    assert len(response.json()) == 3
+
+
+def test_criar_pedidos_em_lote_ndjson(client: TestClient, auth_headers: dict):
+    """
+    Testa POST /orders/bulk com NDJSON (um pedido por linha)
+
+    Linha quebrada vira erro só daquele item; lote acima do limite (itens
+    ou bytes) = 413
+    """
+    from routers.orders import MAX_PEDIDOS_LOTE, MAX_CORPO_LOTE_BYTES
+
+    linhas = [
+        '{"customer_name": "Ana", "address_text": "Rua A, 1", "lat": -23.5, "lng": -46.6}',
+        '{"customer_name": "Bruno", "address_text": ',
+        '',
+        '{"customer_name": "Carla", "address_text": "Rua C, 3", "lat": -23.5, "lng": -46.6}',
+    ]
+    response = client.post(
+        "/orders/bulk",
+        content="\n".join(linhas),
+        headers={**auth_headers, "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["created"] == 2
+    assert [r["ok"] for r in data["results"]] == [True, False, True]
+    assert data["results"][1]["error"].startswith("JSON inválido")
+
+    response = client.post("/orders/bulk", json={"customer_name": "Ana"}, headers=auth_headers)
+    assert response.status_code == 400
+
+    grande = [{"address_text": "Rua A", "lat": -23.5, "lng": -46.6}] * (MAX_PEDIDOS_LOTE + 1)
+    response = client.post("/orders/bulk", json=grande, headers=auth_headers)
+    assert response.status_code == 413
+
+    # Corpo acima do limite em bytes: recusado pelo Content-Length ou, sem ele, na leitura
+    enorme = '[{"customer_name": "' + "x" * MAX_CORPO_LOTE_BYTES + '"}]'
+    response = client.post(
+        "/orders/bulk", content=enorme, headers={**auth_headers, "Content-Type": "application/json"}
+    )
+    assert response.status_code == 413
+    assert "KB" in response.json()["detail"]
+
+    def em_partes():
+        for inicio in range(0, len(enorme), 64 * 1024):
+            yield enorme[inicio:inicio + 64 * 1024].encode()
+
+    response = client.post(
+        "/orders/bulk", content=em_partes(), headers={**auth_headers, "Content-Type": "application/json"}
+    )
+    assert response.status_code == 413
+
+
+
+def test_lote_com_bytes_invalidos_nao_derruba_requisicao(client: TestClient, auth_headers: dict):
+    """
+    Testa POST /orders/bulk com bytes que não são UTF-8
+
+    Resultado esperado: no NDJSON só a linha corrompida vira erro; no
+    array JSON o corpo inteiro é recusado com 400 (nunca 500)
+    """
+    corpo = (
+        b'{"customer_name": "Ana", "address_text": "Rua A, 1", "lat": -23.5, "lng": -46.6}\n'
+        b'{"customer_name": "Jo\xe3o", "address_text": "Rua B, 2", "lat": -23.5, "lng": -46.6}\n'
+        b'{"customer_name": "Carla", "address_text": "Rua C, 3", "lat": -23.5, "lng": -46.6}\n'
+    )
+    response = client.post(
+        "/orders/bulk", content=corpo, headers={**auth_headers, "Content-Type": "application/x-ndjson"}
+    )
+    assert response.status_code == 200
+    data = response.json()
+    assert data["created"] == 2
+    assert [r["ok"] for r in data["results"]] == [True, False, True]
+    assert data["results"][1]["error"].startswith("JSON inválido")
+
+    response = client.post(
+        "/orders/bulk",
+        content=b'[{"customer_name": "Jo\xe3o", "address_text": "Rua B, 2"}]',
+        headers={**auth_headers, "Content-Type": "application/json"}
+    )
+    assert response.status_code == 400
+
+def test_tracking_code_unico_por_construcao():
+    """
+    Testa o código de rastreio derivado de (restaurante, short_id)
+
+    Resultado esperado: formato MF-XXXXXX, nenhum código repetido, e
+    7 caracteres só quando o par não cabe mais em 6
+    """
+    import re
+    from services.order_service import codigo_rastreio
+
+    codigos = {codigo_rastreio(numero, short_id) for numero in range(1, 41) for short_id in range(1001, 1501)}
+    assert len(codigos) == 40 * 500
+    assert all(re.fullmatch(r"MF-[0-9A-Z]{6}", c) for c in codigos)
+
+    # Mesmo par = mesmo código (determinístico)
+    assert codigo_rastreio(3, 1001) == codigo_rastreio(3, 1001)
+    assert len(codigo_rastreio(1, 46655)) == 9
+    assert len(codigo_rastreio(1, 46656)) == 10
+
+
+def test_tracking_code_existente_usa_proximo_bloco(client: TestClient, auth_headers: dict, session: Session):
+    """
+    Testa colisão com um tracking_code já gravado (ex: chave trocada)
+
+    Resultado esperado: POST /orders e /orders/bulk não dão 500; o bloco de
+    short_ids que colidiu é pulado e os pedidos saem com o bloco seguinte
+    """
+    from models import ContadorPedidos
+    from services.order_service import codigo_rastreio
+
+    def ocupar(numero: int, short_id: int):
+        session.add(Order(
+            customer_name="Antigo", address_text="Rua A, 1", lat=-23.5, lng=-46.6,
+            restaurant_id="outro-restaurante", tracking_code=codigo_rastreio(numero, short_id)
+        ))
+        session.commit()
+
+    pedido = {"customer_name": "Cliente", "address_text": "Rua A, 1", "lat": -23.5, "lng": -46.6}
+    primeiro = client.post("/orders", json=pedido, headers=auth_headers).json()
+    contador = session.exec(select(ContadorPedidos)).one()
+    numero, short_id = contador.numero, primeiro["short_id"]
+
+    ocupar(numero, short_id + 1)
+    response = client.post("/orders", json=pedido, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["short_id"] == short_id + 2
+    assert response.json()["tracking_code"] == codigo_rastreio(numero, short_id + 2)
+
+    # Lote de 3 colidindo no segundo: o lote inteiro vai para o bloco seguinte
+    ocupar(numero, short_id + 4)
+    response = client.post("/orders/bulk", json=[pedido] * 3, headers=auth_headers)
+    assert response.status_code == 200
+    assert response.json()["created"] == 3
+    assert [r["order"]["short_id"] for r in response.json()["results"]] == [
+        short_id + 6, short_id + 7, short_id + 8
+    ]
+
+
+def test_lote_recusado_pelo_banco_grava_item_a_item(
+    client: TestClient, auth_headers: dict, session: Session, monkeypatch
+):
+    """
+    Testa POST /orders/bulk quando o banco recusa o lote (IntegrityError)
+
+    Resultado esperado: sem 500; os pedidos são gravados um a um e só o
+    que o banco recusou volta com `error`
+    """
+    from models import ContadorPedidos
+    from services import order_service
+
+    pedido = {"customer_name": "Cliente", "address_text": "Rua A, 1", "lat": -23.5, "lng": -46.6}
+    short_id = client.post("/orders", json=pedido, headers=auth_headers).json()["short_id"]
+    numero = session.exec(select(ContadorPedidos)).one().numero
+
+    # Sem nova tentativa com outro bloco: o conflito derruba a transação do lote
+    monkeypatch.setattr(order_service, "TENTATIVAS_RASTREIO", 1)
+    for ocupado in (short_id + 2, short_id + 5):
+        session.add(Order(
+            customer_name="Antigo", address_text="Rua A, 1", lat=-23.5, lng=-46.6,
+            restaurant_id="outro-restaurante", tracking_code=order_service.codigo_rastreio(numero, ocupado)
+        ))
+    session.commit()
+
+    response = client.post("/orders/bulk", json=[pedido] * 3, headers=auth_headers)
+    assert response.status_code == 200
+    data = response.json()
+    assert (data["created"], data["failed"]) == (2, 1)
+    # Lote: short_id+1..+3 colide no +2 (bloco queimado); um a um: +4 ok, +5 colide, +6 ok
+    assert [r["ok"] for r in data["results"]] == [True, False, True]
+    assert "tracking_code" in data["results"][1]["error"]
+    assert [data["results"][i]["order"]["short_id"] for i in (0, 2)] == [short_id + 4, short_id + 6]
+    assert session.exec(select(func.count()).select_from(Order).where(Order.customer_name == "Cliente")).one() == 3
+
+
+def test_criar_pedido_sem_select_de_rastreio(client: TestClient, auth_headers: dict, session: Session):
+    """
+    Testa que criar pedido não consulta o banco para conferir o tracking_code
+
+    short_id e tracking_code saem do mesmo UPDATE ... RETURNING do contador
+    """
+    from sqlalchemy import event
+
+    def criar_pedido(i: int):
+        response = client.post(
+            "/orders",
+            json={"customer_name": f"Cliente {i}", "address_text": "Rua A, 1", "lat": -23.5, "lng": -46.6},
+            headers=auth_headers
+        )
+        assert response.status_code == 200
+
+    criar_pedido(0)  # Primeiro pedido também cria o contador do restaurante
+
+    queries = []
+    contar = lambda conn, cursor, sql, *args: queries.append(sql)
+    event.listen(session.get_bind(), "before_cursor_execute", contar)
+    try:
+        for i in range(1, 4):
+            criar_pedido(i)
+    finally:
+        event.remove(session.get_bind(), "before_cursor_execute", contar)
+
+    assert not any("orders.tracking_code =" in q for q in queries)
+    assert sum(q.startswith("UPDATE contadores_pedidos") for q in queries) == 3
+
+
 def test_endpoint_rastreio_publico(client: TestClient, auth_headers: dict):
     """
     Testa endpoint público de rastreio (sem autenticação)
@@ -505,6 +1008,119 @@ def test_endpoint_rastreio_publico(client: TestClient, auth_headers: dict):
     assert "short_id" in track_data
 
 
+def test_eta_pedidos_em_rota(
+    client: TestClient,
+    session: Session,
+    test_restaurant: Restaurant,
+    test_courier: Courier
+):
+    """
+    Testa o ETA no rastreio público
+
+    Resultado esperado: 2ª parada chega depois da 1ª, ping do GPS perto
+    da 1ª parada adianta o ETA, entrega da 1ª faz a 2ª virar a próxima
+    """
+    batch = Batch(courier_id=test_courier.id, restaurant_id=test_restaurant.id, status=BatchStatus.IN_PROGRESS)
+    session.add(batch)
+    session.commit()
+    pedidos = [
+        Order(
+            customer_name=f"Cliente {i}", address_text=f"Rua {i}",
+            lat=test_restaurant.lat + 0.02 * i, lng=test_restaurant.lng,
+            status=OrderStatus.PICKED_UP, restaurant_id=test_restaurant.id,
+            batch_id=batch.id, stop_order=i, tracking_code=f"MF-ETA00{i}"
+        )
+        for i in (1, 2)
+    ]
+    session.add_all(pedidos)
+    session.commit()
+
+    primeiro = client.get("/orders/track/MF-ETA001").json()["eta"]
+    segundo = client.get("/orders/track/MF-ETA002").json()["eta"]
+    assert primeiro["stops_before"] == 0 and segundo["stops_before"] == 1
+    assert primeiro["based_on_gps"] is False
+    assert 0 < primeiro["minutes"] < segundo["minutes"]
+
+    # GPS perto da 1ª parada: recalculado na hora, sem descarga
+    client.put(
+        f"/couriers/{test_courier.id}/location",
+        params={"lat": pedidos[0].lat - 0.001, "lng": pedidos[0].lng}
+    )
+    com_gps = client.get("/orders/track/MF-ETA001").json()["eta"]
+    assert com_gps["based_on_gps"] is True
+    assert com_gps["minutes"] < primeiro["minutes"]
+
+    response = client.post(f"/couriers/{test_courier.id}/orders/{pedidos[0].id}/deliver")
+    assert response.status_code == 200
+
+    assert client.get("/orders/track/MF-ETA001").json()["eta"] is None
+    assert client.get("/orders/track/MF-ETA002").json()["eta"]["stops_before"] == 0
+
+
+def test_tracking_details_uma_query_e_polyline_em_cache(
+    client: TestClient,
+    auth_headers: dict,
+    session: Session,
+    test_restaurant: Restaurant,
+    test_courier: Courier,
+    monkeypatch,
+    async_engine
+):
+    """
+    Testa o refresh da tela de rastreio
+
+    Resultado esperado: lote, motoboy e rota completos; no 2º refresh uma
+    única query (fora a autenticação) e nenhuma chamada ao Google
+    """
+    from sqlalchemy import event
+    from services import dispatch_service
+
+    chamadas_google = []
+    monkeypatch.setattr(
+        dispatch_service, "get_route_polyline",
+        lambda orders, lat, lng: chamadas_google.append(len(orders)) or "polyline_teste"
+    )
+
+    batch = Batch(courier_id=test_courier.id, restaurant_id=test_restaurant.id, status=BatchStatus.IN_PROGRESS)
+    session.add(batch)
+    session.commit()
+    pedidos = [
+        Order(
+            customer_name=f"Cliente {i}", address_text=f"Rua {i}",
+            lat=test_restaurant.lat + 0.01 * i, lng=test_restaurant.lng,
+            status=OrderStatus.PICKED_UP, restaurant_id=test_restaurant.id,
+            batch_id=batch.id, stop_order=i
+        )
+        for i in (2, 1, 3)
+    ]
+    session.add_all(pedidos)
+    session.commit()
+    ids = [p.id for p in pedidos]
+
+    def abrir_rastreio():
+        queries = []
+        contar = lambda conn, cursor, sql, *args: queries.append(sql)
+        event.listen(async_engine.sync_engine, "before_cursor_execute", contar)
+        try:
+            response = client.get(f"/orders/{ids[0]}/tracking-details", headers=auth_headers)
+        finally:
+            event.remove(async_engine.sync_engine, "before_cursor_execute", contar)
+        assert response.status_code == 200
+        return [q for q in queries if "FROM users" not in q], response.json()
+
+    abrir_rastreio()
+    queries, data = abrir_rastreio()
+
+    assert len(queries) == 1
+    assert chamadas_google == [3]
+    assert data["batch"]["position"] == 2
+    assert [o["stop_order"] for o in data["batch"]["orders"]] == [1, 2, 3]
+    assert data["route"]["polyline"] == "polyline_teste"
+    assert [w["order_id"] for w in data["route"]["waypoints"]] == [ids[1], ids[0], ids[2]]
+    assert data["route"]["start"] == {"lat": test_restaurant.lat, "lng": test_restaurant.lng}
+    assert data["courier"]["id"] == test_courier.id
+
+
 def test_endpoint_rastreio_codigo_invalido(client: TestClient):
     """
     Testa endpoint de rastreio com código inexistente
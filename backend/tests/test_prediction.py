@@ -503,3 +503,92 @@ def test_variacao_demanda_abaixo_normal(
     # Deve detectar variação negativa (demanda abaixo do normal)
     if data["comparacao"]["variacao_demanda_pct"]:
         assert data["comparacao"]["variacao_demanda_pct"] < 0
+
+
+# ============ TESTES DE TEMPO DE CICLO MEDIDO (GPS) ============
+
+def test_tempo_ciclo_medido_pelo_trajeto(
+    client: TestClient,
+    session: Session,
+    test_restaurant: Restaurant,
+    test_courier: Courier
+):
+    """
+    Testa que o tempo de ciclo vem do trajeto GPS dos lotes finalizados
+
+    Resultado esperado: média das durações saída → volta (10 e 20 min)
+    """
+    from models import Batch, BatchStatus
+    from services.location_service import descarregar_localizacoes
+    from services.prediction_service import calcular_tempo_ciclo_medido
+
+    # Sem trajeto: sem medição
+    assert calcular_tempo_ciclo_medido(session, test_restaurant.id) == (None, 0)
+
+    agora = datetime.now().replace(microsecond=0)
+    for minutos_fora, inicio in ((10, agora - timedelta(minutes=90)), (20, agora - timedelta(minutes=60))):
+        batch = Batch(
+            courier_id=test_courier.id,
+            restaurant_id=test_restaurant.id,
+            status=BatchStatus.DONE,
+            created_at=inicio,
+            completed_at=inicio + timedelta(minutes=minutos_fora + 2)
+        )
+        session.add(batch)
+        pings = [{"lat": test_restaurant.lat, "lng": test_restaurant.lng, "timestamp": inicio.isoformat()}]
+        pings += [
+            {
+                "lat": test_restaurant.lat + 0.01,
+                "lng": test_restaurant.lng,
+                "timestamp": (inicio + timedelta(minutes=m)).isoformat()
+            }
+            for m in range(1, minutos_fora + 1)
+        ]
+        pings.append({
+            "lat": test_restaurant.lat,
+            "lng": test_restaurant.lng,
+            "timestamp": (inicio + timedelta(minutes=minutos_fora + 1)).isoformat()
+        })
+        client.post(f"/couriers/{test_courier.id}/locations", json={"pings": pings})
+    session.commit()
+    descarregar_localizacoes(session)
+
+    media, lotes = calcular_tempo_ciclo_medido(session, test_restaurant.id)
+
+    assert lotes == 2
+    assert media == 15.0
+
+
+def test_tempo_ciclo_medido_nao_recalcula_a_cada_poll(
+    client: TestClient,
+    auth_headers: dict,
+    test_restaurant: Restaurant,
+    monkeypatch
+):
+    """
+    Testa que polls seguidos de /dispatch/previsao reaproveitam o tempo de ciclo
+
+    Resultado esperado: uma medição por RECONCILIACAO_SEGUNDOS, não uma por poll
+    """
+    from services import prediction_service
+
+    medicoes = []
+
+    def medir(session, restaurant_id, horas=2):
+        medicoes.append(restaurant_id)
+        return 12.0, 3
+
+    monkeypatch.setattr(prediction_service, "calcular_tempo_ciclo_medido", medir)
+
+    for _ in range(3):
+        response = client.get("/dispatch/previsao", headers=auth_headers)
+        assert response.status_code == 200
+    assert medicoes == [test_restaurant.id]
+
+    # Passado o intervalo, mede de novo
+    calculado_em, resultado = prediction_service._ciclos_medidos[test_restaurant.id]
+    prediction_service._ciclos_medidos[test_restaurant.id] = (
+        calculado_em - timedelta(seconds=prediction_service.RECONCILIACAO_SEGUNDOS + 1), resultado
+    )
+    client.get("/dispatch/previsao", headers=auth_headers)
+    assert len(medicoes) == 2